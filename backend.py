@@ -2,19 +2,46 @@
 import json
 import os
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
-from geopy.geocoders import Nominatim
-from geopy.distance import geodesic
-import requests
 import re
 import hashlib
 import base64
-from PIL import Image
 from io import BytesIO
 import sqlite3
+import threading
+import math
+import time
+from contextlib import contextmanager
+from flask import g, Response
+import metrics
+import migrations
+import profiler
+import read_model
+import risk_profile
+import gazetteer
+import clusters
+import upstream
+import responses
+import projections
+import sync
+import bundle
+import dedup
+import verifier
+import content_filter
+import ratelimit
+import incident_zones
+import jobs
+import trips
+from projections import Field
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 app = Flask(__name__)
+app.json = responses.FastJSONProvider(app)
 CORS(app, resources={r"/api/*": {
     "origins": "*", 
     "methods": ["GET", "POST", "PUT", "DELETE"], 
@@ -23,160 +50,83 @@ CORS(app, resources={r"/api/*": {
 
 # Configuración
 NOMINATIM_USER_AGENT = "ZetaPro_v1.0_Navigation"
-DB_FILE = 'zeta_pro.db'
+NOMINATIM_DOMAIN = os.environ.get('NOMINATIM_DOMAIN', 'nominatim.openstreetmap.org')
+NOMINATIM_SCHEME = os.environ.get('NOMINATIM_SCHEME', 'https')
+OSRM_URL = os.environ.get('OSRM_URL', 'http://router.project-osrm.org')
+DB_FILE = os.environ.get('ZETA_DB_FILE', 'zeta_pro.db')
 IMAGES_DIR = 'uploads/images'
+BUNDLE_DIR = os.environ.get('ZETA_BUNDLE_DIR', 'uploads/offline')
 MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
+RATELIMIT_FILE = os.environ.get('ZETA_RATELIMIT_FILE', f"{DB_FILE}.ratelimit")
+# Proxies delante de la app (Render, nginx): cuántos X-Forwarded-For confiar
+PROXY_HOPS = int(os.environ.get('ZETA_PROXY_HOPS', '0'))
 
-# Crear directorio de imágenes
-os.makedirs(IMAGES_DIR, exist_ok=True)
+NOMINATIM_TIMEOUT = float(os.environ.get('ZETA_NOMINATIM_TIMEOUT', '5'))
+OSRM_TIMEOUT = float(os.environ.get('ZETA_OSRM_TIMEOUT', '8'))
 
-try:
-    geolocator = Nominatim(user_agent=NOMINATIM_USER_AGENT, timeout=10)
-except:
-    geolocator = None
+# Clientes HTTP de las dependencias externas (pool, reintentos y breaker)
+nominatim = upstream.Dependency(
+    'nominatim', f"{NOMINATIM_SCHEME}://{NOMINATIM_DOMAIN}",
+    timeout=(2.0, NOMINATIM_TIMEOUT),
+    headers={'User-Agent': NOMINATIM_USER_AGENT, 'Accept-Language': 'es'}
+)
+osrm = upstream.Dependency('osrm', OSRM_URL, timeout=(2.0, OSRM_TIMEOUT))
+
+# PIL y geopy se importan en el primer uso para que el arranque de cada
+# worker no pague por módulos que quizá no necesite
+def geo_distance_km(point_a, point_b):
+    """Distancia geodésica en km entre dos tuplas (lat, lon)"""
+    from geopy.distance import geodesic
+    return geodesic(point_a, point_b).kilometers
 
 # ==================== BASE DE DATOS SQL ====================
+def get_db(**kwargs):
+    """Conexión SQLite con consultas instrumentadas por sitio"""
+    return sqlite3.connect(DB_FILE, factory=metrics.TimedConnection, **kwargs)
+
+# Versiones de data_versions, compartidas por los índices en memoria
+data_watcher = read_model.DataVersionWatcher(get_db)
+
+# Zonas, reportes recientes y desastres activos en memoria (ver read_model.py)
+risk_snapshot = read_model.ActiveRiskSnapshot(get_db, data_watcher)
+
+# Riesgo histórico por celda y hora de la semana (ver risk_profile.py)
+risk_profiles = risk_profile.RiskProfileCache(get_db, data_watcher)
+
+# Grupos de marcadores del mapa por zoom (ver clusters.py)
+map_clusters = clusters.MapClusters(get_db, data_watcher)
+
+# Paquete offline vigente en disco (ver bundle.py)
+offline_bundles = bundle.BundleStore(BUNDLE_DIR, get_db)
+
+# Token buckets por cliente y endpoint, compartidos entre workers (ver ratelimit.py)
+rate_limiter = ratelimit.RateLimiter(RATELIMIT_FILE)
+if PROXY_HOPS:
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS)
+
+# Calificación automática de reportes pendientes (ver verifier.py)
+verification_worker = verifier.VerificationWorker(
+    get_db, lambda cursor, report_ids, verified_by: approve_reports(cursor, report_ids, verified_by),
+    lock_path=f"{DB_FILE}.verifier.lock"
+)
+
+# Compresión de imágenes y direcciones fuera del request (ver jobs.py)
+job_worker = jobs.JobWorker(get_db)
+
+# Calles, colonias y lugares del extracto OSM importado (ver gazetteer.py)
+local_geocoder = gazetteer.LocalGeocoder(get_db, data_watcher)
+
 def init_database():
-    """Inicializar base de datos SQLite profesional"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # Tabla de usuarios
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id TEXT PRIMARY KEY,
-            email TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            photo TEXT,
-            phone TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP,
-            reports_count INTEGER DEFAULT 0,
-            verified BOOLEAN DEFAULT 0,
-            rating REAL DEFAULT 5.0
-        )
-    ''')
-    
-    # Tabla de reportes con sistema de verificación
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reports (
-            id TEXT PRIMARY KEY,
-            user_id TEXT,
-            description TEXT NOT NULL,
-            category TEXT NOT NULL,
-            severity TEXT NOT NULL,
-            lat REAL NOT NULL,
-            lon REAL NOT NULL,
-            address TEXT,
-            images TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            verified BOOLEAN DEFAULT 0,
-            verified_by TEXT,
-            verified_at TIMESTAMP,
-            status TEXT DEFAULT 'pending',
-            upvotes INTEGER DEFAULT 0,
-            downvotes INTEGER DEFAULT 0,
-            news_source TEXT,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-    
-    # Tabla de lugares (restaurantes, museos, etc.)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS places (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            type TEXT NOT NULL,
-            lat REAL NOT NULL,
-            lon REAL NOT NULL,
-            address TEXT,
-            phone TEXT,
-            website TEXT,
-            description TEXT,
-            images TEXT,
-            rating REAL DEFAULT 0,
-            total_reviews INTEGER DEFAULT 0,
-            price_level INTEGER DEFAULT 2,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Tabla de reseñas de lugares
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reviews (
-            id TEXT PRIMARY KEY,
-            place_id TEXT NOT NULL,
-            user_id TEXT NOT NULL,
-            rating INTEGER NOT NULL,
-            comment TEXT,
-            images TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            helpful_count INTEGER DEFAULT 0,
-            FOREIGN KEY (place_id) REFERENCES places(id),
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-    
-    # Tabla de zonas de riesgo dinámicas
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS risk_zones (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            lat REAL NOT NULL,
-            lon REAL NOT NULL,
-            radius_km REAL NOT NULL,
-            level TEXT NOT NULL,
-            type TEXT NOT NULL,
-            color TEXT NOT NULL,
-            active BOOLEAN DEFAULT 1,
-            expires_at TIMESTAMP,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            source TEXT,
-            description TEXT
-        )
-    ''')
-    
-    # Tabla de desastres naturales
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS natural_disasters (
-            id TEXT PRIMARY KEY,
-            type TEXT NOT NULL,
-            lat REAL NOT NULL,
-            lon REAL NOT NULL,
-            radius_km REAL NOT NULL,
-            severity TEXT NOT NULL,
-            description TEXT,
-            active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            expires_at TIMESTAMP,
-            source TEXT
-        )
-    ''')
-    
-    # Tabla de votos en reportes
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS report_votes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            report_id TEXT NOT NULL,
-            user_id TEXT NOT NULL,
-            vote_type TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(report_id, user_id),
-            FOREIGN KEY (report_id) REFERENCES reports(id),
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-    
-    conn.commit()
+    """Inicializar base de datos SQLite profesional (migraciones pendientes)"""
+    conn = get_db()
+    migrations.migrate(conn)
     conn.close()
 
-# Inicializar DB al arrancar
-init_database()
-
 # ==================== DATOS INICIALES ====================
 def seed_initial_data():
     """Poblar datos iniciales de restaurantes y museos de Chihuahua"""
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     cursor = conn.cursor()
     
     # Verificar si ya hay datos
@@ -353,8 +303,56 @@ def seed_initial_data():
     conn.commit()
     conn.close()
 
-# Poblar datos iniciales
-seed_initial_data()
+# ==================== ARRANQUE ====================
+_setup_done = False
+_setup_lock = threading.Lock()
+
+@contextmanager
+def _file_lock(path):
+    """Lock exclusivo entre procesos (no-op donde no hay fcntl)"""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def setup():
+    """Crear directorios, esquema y datos iniciales una sola vez
+
+    El lock de archivo evita que varios workers escriban el esquema a la
+    vez. Con `gunicorn --preload 'backend:create_app()'` corre una sola
+    vez en el master y los workers heredan el estado.
+    """
+    global _setup_done
+    if _setup_done:
+        return
+    with _setup_lock:
+        if _setup_done:
+            return
+        os.makedirs(IMAGES_DIR, exist_ok=True)
+        with _file_lock(f"{DB_FILE}.lock"):
+            init_database()
+            seed_initial_data()
+        _setup_done = True
+
+def create_app():
+    """App factory: `gunicorn 'backend:create_app()'`"""
+    setup()
+    return app
+
+@app.before_request
+def ensure_setup():
+    # Respaldo para `gunicorn backend:app` sin factory
+    if not _setup_done:
+        setup()
+    # Por proceso: con --preload el hilo no sobrevive al fork del master
+    if verifier.ENABLED:
+        verification_worker.ensure_running()
+    job_worker.ensure_running()
 
 # ==================== UTILIDADES ====================
 def generate_id(prefix=''):
@@ -375,21 +373,11 @@ def validate_text(text, min_length=10, max_length=1000):
     if len(text) > max_length:
         return False, f"El texto no debe exceder {max_length} caracteres"
     
-    # Patrones de spam mejorados
-    spam_patterns = [
-        r'https?://',
-        r'www\.',
-        r'\b(viagra|casino|lottery|prize|winner|congratulations)\b',
-        r'[A-Z]{15,}',
-        r'(.)\1{7,}',
-        r'\$\$\$',
-        r'!!!{5,}',
-        r'\b(click|here|now)\b.*\b(buy|win|free)\b'
-    ]
-    
-    for pattern in spam_patterns:
-        if re.search(pattern, text, re.IGNORECASE):
-            return False, "Contenido sospechoso detectado"
+    # Patrones de spam compilados en un solo filtro (ver content_filter.py)
+    rule = content_filter.SPAM_FILTER.match(text)
+    if rule:
+        metrics.CONTENT_REJECTED.inc(rule)
+        return False, "Contenido sospechoso detectado"
     
     words = text.split()
     if len(words) < 3:
@@ -407,20 +395,23 @@ def compress_image(base64_string, max_size=(800, 800), quality=85):
         header, data = base64_string.split(',', 1)
         image_data = base64.b64decode(data)
         
-        # Abrir y comprimir
-        img = Image.open(BytesIO(image_data))
+        from PIL import Image
         
-        # Convertir a RGB si es necesario
-        if img.mode in ('RGBA', 'P'):
-            img = img.convert('RGB')
-        
-        # Redimensionar manteniendo aspecto
-        img.thumbnail(max_size, Image.Resampling.LANCZOS)
-        
-        # Guardar comprimida
-        output = BytesIO()
-        img.save(output, format='JPEG', quality=quality, optimize=True)
-        compressed_data = output.getvalue()
+        with metrics.IMAGE_COMPRESS_SECONDS.time():
+            # Abrir y comprimir
+            img = Image.open(BytesIO(image_data))
+            
+            # Convertir a RGB si es necesario
+            if img.mode in ('RGBA', 'P'):
+                img = img.convert('RGB')
+            
+            # Redimensionar manteniendo aspecto
+            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+            
+            # Guardar comprimida
+            output = BytesIO()
+            img.save(output, format='JPEG', quality=quality, optimize=True)
+            compressed_data = output.getvalue()
         
         # Convertir de vuelta a base64
         compressed_base64 = base64.b64encode(compressed_data).decode()
@@ -430,6 +421,38 @@ def compress_image(base64_string, max_size=(800, 800), quality=85):
         print(f"Error comprimiendo imagen: {e}")
         return base64_string
 
+# ==================== TRABAJOS DIFERIDOS ====================
+# Encolados por los endpoints en la misma transacción que sus datos; los
+# corre job_worker (o `python jobs.py work`). Al menos una vez: cada uno
+# recalcula desde el payload y sobrescribe, así repetirlo no cambia nada.
+@job_worker.handler('report_images')
+def compress_report_images(conn, payload):
+    images = [compress_image(img, max_size=(1200, 1200), quality=85) for img in payload['images']]
+    conn.execute("UPDATE reports SET images = ? WHERE id = ?", (json.dumps(images), payload['report_id']))
+
+@job_worker.handler('review_images')
+def compress_review_images(conn, payload):
+    images = [compress_image(img, max_size=(1200, 1200), quality=85) for img in payload['images']]
+    conn.execute("UPDATE reviews SET images = ? WHERE id = ?", (json.dumps(images), payload['review_id']))
+
+@job_worker.handler('user_photo')
+def compress_user_photo(conn, payload):
+    photo = compress_image(payload['photo'], max_size=(400, 400), quality=80)
+    conn.execute("UPDATE users SET photo = ? WHERE id = ?", (photo, payload['user_id']))
+
+@job_worker.handler('report_address')
+def resolve_report_address(conn, payload):
+    """Dirección por Nominatim; UpstreamError se reintenta con backoff"""
+    location = nominatim.get_json('/reverse', {"lat": payload['lat'], "lon": payload['lon'], "format": "json"},
+                                  operation='reverse')
+    addr = (location or {}).get('address', {})
+    address = ", ".join(p for p in [addr.get('road', ''), addr.get('suburb', '')] if p)
+    if not address:
+        metrics.GEOCODE_RESOLVED.inc('reverse', 'unresolved')
+        return
+    metrics.GEOCODE_RESOLVED.inc('reverse', 'nominatim')
+    conn.execute("UPDATE reports SET address = ? WHERE id = ?", (address, payload['report_id']))
+
 def get_coordinates(location_name):
     """Geocodificación mejorada"""
     if not location_name:
@@ -441,12 +464,13 @@ def get_coordinates(location_name):
             parts = location_name.split(',')
             lat, lon = float(parts[0].strip()), float(parts[1].strip())
             if 28.0 <= lat <= 29.0 and -107.0 <= lon <= -106.0:
+                metrics.GEOCODE_RESOLVED.inc('forward', 'coordinates')
                 return lat, lon
         except:
             pass
     
     # Método 2: Buscar en base de datos local
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db()
     cursor = conn.cursor()
     
     location_lower = location_name.lower()
@@ -460,67 +484,45 @@ def get_coordinates(location_name):
     conn.close()
     
     if result:
+        metrics.GEOCODE_RESOLVED.inc('forward', 'places')
         return result[0], result[1]
     
-    # Método 3: Nominatim
-    if geolocator:
-        try:
-            query = f"{location_name}, Chihuahua, Chihuahua, México"
-            location = geolocator.geocode(query, timeout=10)
-            if location:
-                if 28.0 <= location.latitude <= 29.0 and -107.0 <= location.longitude <= -106.0:
-                    return location.latitude, location.longitude
-        except Exception as e:
-            print(f"Geocoding error: {e}")
+    # Método 3: Gazetteer local (calles, colonias, números exteriores)
+    match = local_geocoder.geocode(location_name)
+    if match:
+        metrics.GEOCODE_RESOLVED.inc('forward', 'gazetteer')
+        return match.lat, match.lon
+    
+    # Método 4: Nominatim
+    try:
+        query = f"{location_name}, Chihuahua, Chihuahua, México"
+        results = nominatim.get_json('/search', {"q": query, "format": "json", "limit": 1},
+                                     operation='geocode')
+        if results:
+            lat, lon = float(results[0]['lat']), float(results[0]['lon'])
+            if 28.0 <= lat <= 29.0 and -107.0 <= lon <= -106.0:
+                metrics.GEOCODE_RESOLVED.inc('forward', 'nominatim')
+                return lat, lon
+    except (upstream.UpstreamError, KeyError, ValueError) as e:
+        print(f"Geocoding error: {e}")
     
+    metrics.GEOCODE_RESOLVED.inc('forward', 'unresolved')
     return None, None
 
-def calculate_risk(lat, lon):
-    """Calcular nivel de riesgo basado en reportes y zonas"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    point = (lat, lon)
-    max_risk = "Bajo"
-    risk_scores = {"Crítico": 4, "Alto": 3, "Medio": 2, "Bajo": 1}
-    
-    # Verificar zonas de riesgo activas
-    cursor.execute('''
-        SELECT lat, lon, radius_km, level 
-        FROM risk_zones 
-        WHERE active = 1 AND (expires_at IS NULL OR expires_at > ?)
-    ''', (datetime.now(),))
-    
-    for zone_lat, zone_lon, radius, level in cursor.fetchall():
-        dist = geodesic(point, (zone_lat, zone_lon)).kilometers
-        if dist <= radius:
-            level_spanish = {"critical": "Crítico", "high": "Alto", "medium": "Medio", "low": "Bajo"}
-            zone_level = level_spanish.get(level, "Bajo")
-            if risk_scores[zone_level] > risk_scores[max_risk]:
-                max_risk = zone_level
-    
-    # Verificar reportes recientes cercanos
-    one_week_ago = datetime.now() - timedelta(days=7)
-    cursor.execute('''
-        SELECT lat, lon, severity FROM reports 
-        WHERE verified = 1 AND created_at > ? AND status = 'active'
-    ''', (one_week_ago,))
-    
-    nearby_reports = 0
-    for report_lat, report_lon, severity in cursor.fetchall():
-        dist = geodesic(point, (report_lat, report_lon)).kilometers
-        if dist <= 0.5:  # 500 metros
-            nearby_reports += 1
-            if severity == 'high' and risk_scores["Alto"] > risk_scores[max_risk]:
-                max_risk = "Alto"
-    
-    conn.close()
-    
-    # Ajustar por densidad de reportes
-    if nearby_reports >= 5 and max_risk == "Bajo":
-        max_risk = "Medio"
-    
-    return max_risk
+def calculate_risk(lat, lon, departure=None):
+    """Calcular nivel de riesgo basado en reportes y zonas (desde memoria)
+
+    Con `departure` (epoch) se combinan las zonas vigentes a esa hora con
+    el perfil histórico de la hora de la semana en lugar de los reportes
+    de los últimos 7 días.
+    """
+    if departure is None:
+        return risk_snapshot.current().risk_level(lat, lon)
+    score = risk_snapshot.current().zone_level_score(lat, lon, departure)
+    profile = risk_profiles.current()
+    if profile is not None:
+        score = max(score, profile.risk_score(lat, lon, departure))
+    return read_model.SCORE_LEVELS[score]
 
 # ==================== ENDPOINTS DE AUTENTICACIÓN ====================
 @app.route('/api/auth/register', methods=['POST'])
@@ -540,11 +542,7 @@ def register():
         if not name or len(name) < 2:
             return jsonify({"status": "error", "message": "Nombre inválido"}), 400
         
-        # Comprimir foto si existe
-        if photo:
-            photo = compress_image(photo, max_size=(400, 400), quality=80)
-        
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db()
         cursor = conn.cursor()
         
         # Verificar si ya existe
@@ -567,14 +565,21 @@ def register():
                 "user": user
             })
         
-        # Crear nuevo usuario
+        # Crear nuevo usuario; la foto se comprime en segundo plano
         user_id = generate_id('user_')
+        pending = {}
+        if photo and photo.startswith('data:image'):
+            pending["photo"] = jobs.enqueue(cursor, 'user_photo', {"user_id": user_id, "photo": photo},
+                                            key=f"user_photo:{user_id}")
+            photo = None
         cursor.execute('''
             INSERT INTO users (id, email, name, photo, phone, last_login)
             VALUES (?, ?, ?, ?, ?, ?)
         ''', (user_id, email, name, photo, phone, datetime.now()))
         
         conn.commit()
+        if pending:
+            job_worker.notify()
         
         user = {
             "id": user_id,
@@ -589,12 +594,39 @@ def register():
         
         conn.close()
         
+        if pending:
+            return jsonify({"status": "success", "user": user, "jobs": pending}), 202
         return jsonify({"status": "success", "user": user})
     
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 # ==================== ENDPOINTS DE REPORTES ====================
+# Campos de /api/reports/list (fields=id,lat,... o fields=markers)
+REPORT_FIELDS = projections.Projection({
+    "id": Field("r.id"),
+    "user_id": Field("r.user_id"),
+    "description": Field("r.description"),
+    "category": Field("r.category"),
+    "severity": Field("r.severity"),
+    "lat": Field("r.lat"),
+    "lon": Field("r.lon"),
+    "address": Field("r.address"),
+    "images": Field("r.images", convert=projections.json_list),
+    "created_at": Field("r.created_at"),
+    "verified": Field("r.verified", convert=bool),
+    "status": Field("r.status"),
+    "upvotes": Field("r.upvotes"),
+    "downvotes": Field("r.downvotes"),
+    "duplicate_of": Field("r.duplicate_of"),
+    "verification_score": Field("r.verification_score"),
+    "user_name": Field("u.name", join='users'),
+    "user_photo": Field("u.photo", join='users'),
+}, projections={
+    # Lo mínimo para dibujar marcadores en el mapa
+    "markers": ["id", "lat", "lon", "severity", "category"],
+})
+
 @app.route('/api/reports/submit', methods=['POST'])
 def submit_report():
     """Enviar reporte con sistema de verificación mejorado"""
@@ -619,35 +651,50 @@ def submit_report():
         if not (28.0 <= float(lat) <= 29.0 and -107.0 <= float(lon) <= -106.0):
             return jsonify({"status": "error", "message": "Ubicación fuera del área de servicio"}), 400
         
-        # Comprimir imágenes
-        compressed_images = []
-        for img in images[:3]:  # Máximo 3 imágenes
-            compressed = compress_image(img, max_size=(1200, 1200), quality=85)
-            compressed_images.append(compressed)
+        images = images[:3]  # Máximo 3 imágenes
         
-        # Geocodificación inversa para dirección
+        # Geocodificación inversa: el gazetteer local responde en memoria;
+        # si no tiene la calle, Nominatim se consulta en segundo plano
         address = "Ubicación reportada"
-        if geolocator:
-            try:
-                location = geolocator.reverse(f"{lat}, {lon}", language='es', timeout=5)
-                if location:
-                    addr = location.raw.get('address', {})
-                    parts = [addr.get('road', ''), addr.get('suburb', '')]
-                    address = ", ".join([p for p in parts if p]) or address
-            except:
-                pass
+        local = local_geocoder.reverse(lat, lon)
+        if local and local.road:
+            metrics.GEOCODE_RESOLVED.inc('reverse', 'gazetteer')
+            address = local.label()
         
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db()
         cursor = conn.cursor()
         
+        # ¿Ya hay un reporte del mismo evento? (ver dedup.py)
+        signature = dedup.signature(description)
+        duplicate_of, similarity = dedup.find_duplicate(cursor, float(lat), float(lon), signature,
+                                                          category, severity)
+        
         # Crear reporte
         report_id = generate_id('report_')
         cursor.execute('''
             INSERT INTO reports 
-            (id, user_id, description, category, severity, lat, lon, address, images, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'pending')
+            (id, user_id, description, category, severity, lat, lon, address, images, status, duplicate_of)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (report_id, user_id, description, category, severity, 
-              float(lat), float(lon), address, json.dumps(compressed_images)))
+              float(lat), float(lon), address, json.dumps([]),
+              'duplicate' if duplicate_of else 'pending', duplicate_of))
+        
+        # Imágenes y dirección quedan en la cola de trabajos (ver jobs.py)
+        pending = {}
+        if images:
+            pending["images"] = jobs.enqueue(cursor, 'report_images', {"report_id": report_id, "images": images},
+                                             key=f"report_images:{report_id}")
+        if not (local and local.road):
+            pending["address"] = jobs.enqueue(cursor, 'report_address',
+                                              {"report_id": report_id, "lat": float(lat), "lon": float(lon)},
+                                              key=f"report_address:{report_id}", max_attempts=8)
+        
+        if duplicate_of:
+            # Quien lo envía confirma el reporte original
+            if user_id:
+                dedup.add_vote(cursor, duplicate_of, user_id, 'up')
+        else:
+            dedup.index(cursor, report_id, float(lat), float(lon), signature, time.time())
         
         # Actualizar contador de reportes del usuario
         if user_id:
@@ -659,16 +706,32 @@ def submit_report():
         conn.commit()
         conn.close()
         
-        # Auto-verificación básica con IA (simulada)
-        verification_score = verify_report_with_ai(description, category, severity)
+        # 202 mientras imágenes o dirección sigan en la cola
+        status_code = 202 if pending else 200
+        if pending:
+            job_worker.notify()
+        
+        if duplicate_of:
+            return jsonify({
+                "status": "success",
+                "report_id": report_id,
+                "duplicate_of": duplicate_of,
+                "similarity": round(similarity, 2),
+                "message": "Este incidente ya fue reportado; tu reporte se sumó como confirmación.",
+                "requires_review": False,
+                "jobs": pending
+            }), status_code
+        
+        # La calificación automática corre en segundo plano (ver verifier.py)
+        verification_worker.notify()
         
         return jsonify({
             "status": "success",
             "report_id": report_id,
             "message": "Reporte enviado. Será verificado en breve.",
-            "verification_score": verification_score,
-            "requires_review": verification_score < 0.7
-        })
+            "requires_review": True,
+            "jobs": pending
+        }), status_code
     
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -677,42 +740,74 @@ def verify_report_with_ai(description, category, severity):
     """
     Verificación automática con IA (simulada)
     En producción: integrar con GPT-4, Claude API o modelo local
+    (ver ZETA_VERIFIER_SCORER en verifier.py)
     """
-    score = 0.5
-    
-    # Factores que incrementan confianza
-    keywords_credible = [
-        'policía', 'patrulla', 'ambulancia', 'bomberos', 
-        'accidente', 'choque', 'incendio', 'robo', 'asalto',
-        'inundación', 'bloqueo', 'manifestación'
-    ]
-    
-    # Factores que reducen confianza
-    keywords_suspicious = [
-        'creo', 'tal vez', 'parece', 'supongo', 'dicen que',
-        'me contaron', 'escuché', 'alguien dijo'
-    ]
-    
-    desc_lower = description.lower()
-    
-    for keyword in keywords_credible:
-        if keyword in desc_lower:
-            score += 0.1
-    
-    for keyword in keywords_suspicious:
-        if keyword in desc_lower:
-            score -= 0.15
-    
-    # Longitud detallada aumenta credibilidad
-    if len(description) > 100:
-        score += 0.1
+    return verification_worker.scorer.score(description, category, severity)
+
+def moderate_reports(cursor, decisions, verified_by):
+    """Aprobar o rechazar varios reportes; no hace commit
+
+    decisions: [(report_id, aprobado, news_source)]. Mismo efecto que uno por
+    uno (aprobar suma el reporte a una zona de incidentes si la severidad es
+    media o alta; el perfil histórico cambia si el reporte entra o sale),
+    pero con una sola lectura, un executemany por tipo de cambio y el perfil
+    y las zonas en un solo paso.
+    Devuelve {report_id: {"outcome": "approved"|"rejected"|"not_found", ...}}.
+    """
+    ids = list(dict.fromkeys(report_id for report_id, _, _ in decisions))
+    current = {}
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        cursor.execute(f'''
+            SELECT id, lat, lon, severity, created_at, description, verified = 1 AND status = 'active'
+            FROM reports WHERE id IN ({', '.join('?' * len(chunk))})
+        ''', chunk)
+        for row in cursor.fetchall():
+            current[row[0]] = row[1:]
     
-    # Severidad consistente
-    severe_keywords = ['peligro', 'grave', 'urgente', 'rápido']
-    if severity == 'high' and any(k in desc_lower for k in severe_keywords):
-        score += 0.15
+    now = datetime.now()
+    approvals, rejections, incidents, entering, leaving = [], [], [], [], []
+    results = {}
+    for report_id, approved, news_source in decisions:
+        if report_id in results:
+            continue
+        if report_id not in current:
+            results[report_id] = {"outcome": "not_found"}
+            continue
+        lat, lon, severity, created_at, description, counted = current[report_id]
+        if approved:
+            approvals.append((verified_by, now, news_source, report_id))
+            result = {"outcome": "approved"}
+            # Zona de riesgo temporal (propia o agrupada con las cercanas)
+            if severity in ['high', 'medium']:
+                incidents.append((report_id, lat, lon, severity, description))
+            if not counted:
+                entering.append((lat, lon, severity, created_at))
+        else:
+            rejections.append((report_id,))
+            result = {"outcome": "rejected"}
+            if counted:
+                leaving.append((lat, lon, severity, created_at))
+        results[report_id] = result
     
-    return min(1.0, max(0.0, score))
+    cursor.executemany('''
+        UPDATE reports 
+        SET verified = 1, verified_by = ?, verified_at = ?, 
+            news_source = ?, status = 'active'
+        WHERE id = ?
+    ''', approvals)
+    cursor.executemany("UPDATE reports SET status = 'rejected' WHERE id = ?", rejections)
+    zones = incident_zones.add_reports(cursor, incidents, lambda: generate_id('zone_'), now.timestamp())
+    for report_id, (zone_id, grouped) in zones.items():
+        results[report_id]["zone_id"] = zone_id
+        metrics.INCIDENT_ZONES.inc('grouped' if grouped else 'created')
+    risk_profile.add_reports(cursor, entering)
+    risk_profile.add_reports(cursor, leaving, sign=-1)
+    return results
+
+def approve_reports(cursor, report_ids, verified_by):
+    """Aprobar varios reportes sin fuente (verificador automático); no hace commit"""
+    return moderate_reports(cursor, [(report_id, True, '') for report_id in report_ids], verified_by)
 
 @app.route('/api/reports/verify/<report_id>', methods=['POST'])
 def verify_report(report_id):
@@ -723,37 +818,10 @@ def verify_report(report_id):
         news_source = data.get('news_source', '')
         approved = data.get('approved', True)
         
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db()
         cursor = conn.cursor()
         
-        if approved:
-            cursor.execute('''
-                UPDATE reports 
-                SET verified = 1, verified_by = ?, verified_at = ?, 
-                    news_source = ?, status = 'active'
-                WHERE id = ?
-            ''', (verified_by, datetime.now(), news_source, report_id))
-            
-            # Crear zona de riesgo temporal si es necesario
-            cursor.execute('''
-                SELECT lat, lon, severity, description FROM reports WHERE id = ?
-            ''', (report_id,))
-            
-            report = cursor.fetchone()
-            if report and report[2] in ['high', 'medium']:
-                zone_id = generate_id('zone_')
-                expires = datetime.now() + timedelta(hours=24)
-                
-                cursor.execute('''
-                    INSERT INTO risk_zones 
-                    (id, name, lat, lon, radius_km, level, type, color, expires_at, source)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (zone_id, report[3][:50], report[0], report[1], 0.5, 
-                      report[2], 'incident', '#ef4444', expires, f'report_{report_id}'))
-        else:
-            cursor.execute('''
-                UPDATE reports SET status = 'rejected' WHERE id = ?
-            ''', (report_id,))
+        moderate_reports(cursor, [(report_id, approved, news_source)], verified_by)
         
         conn.commit()
         conn.close()
@@ -766,6 +834,127 @@ def verify_report(report_id):
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+# Orden de la cola de moderación: sin calificar al final (ver migración 9)
+PENDING_ORDER = "r.queue_score"
+PENDING_PAGE_SIZE = 50
+MAX_PENDING_PAGE = 200
+MAX_MODERATION_BATCH = 1000
+
+@app.route('/api/reports/moderate', methods=['POST'])
+def bulk_moderate():
+    """Aprobar o rechazar muchos reportes en una sola transacción (admin)"""
+    try:
+        data = request.json or {}
+        verified_by = data.get('verified_by')
+        decisions = data.get('decisions')
+        
+        if not isinstance(decisions, list) or not decisions:
+            return jsonify({"status": "error", "message": "Se requiere una lista de decisiones"}), 400
+        if len(decisions) > MAX_MODERATION_BATCH:
+            return jsonify({
+                "status": "error",
+                "message": f"Máximo {MAX_MODERATION_BATCH} decisiones por lote"
+            }), 400
+        
+        # Las decisiones mal formadas o repetidas no detienen al resto
+        outcomes, valid, seen = [], [], set()
+        for item in decisions:
+            report_id = item.get('report_id') if isinstance(item, dict) else None
+            if not isinstance(report_id, str) or not report_id:
+                outcomes.append({"report_id": report_id, "outcome": "invalid"})
+            elif report_id in seen:
+                outcomes.append({"report_id": report_id, "outcome": "repeated"})
+            else:
+                seen.add(report_id)
+                valid.append((report_id, bool(item.get('approved', True)), item.get('news_source', '')))
+                outcomes.append({"report_id": report_id})
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        results = moderate_reports(cursor, valid, verified_by)
+        conn.commit()
+        conn.close()
+        
+        counts = {"approved": 0, "rejected": 0, "failed": 0}
+        for outcome in outcomes:
+            if "outcome" not in outcome:
+                outcome.update(results[outcome["report_id"]])
+            key = outcome["outcome"] if outcome["outcome"] in ("approved", "rejected") else "failed"
+            counts[key] += 1
+        
+        return jsonify({"status": "success", "results": outcomes, **counts})
+    
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/reports/pending', methods=['GET'])
+def get_pending_reports():
+    """Cola de moderación ordenada por calificación del verificador
+
+    ?order=desc (más confiables primero, por defecto) o asc; páginas de
+    `limit` con `cursor` = next_cursor de la página anterior.
+    """
+    try:
+        order = request.args.get('order', 'desc').lower()
+        if order not in ('asc', 'desc'):
+            return jsonify({"status": "error", "message": "order debe ser asc o desc"}), 400
+        limit = max(1, min(int(request.args.get('limit') or PENDING_PAGE_SIZE), MAX_PENDING_PAGE))
+        after = None
+        if request.args.get('cursor'):
+            score, _, after_id = request.args['cursor'].partition(':')
+            try:
+                after = (float(score), after_id)
+            except ValueError:
+                return jsonify({"status": "error", "message": "Cursor inválido"}), 400
+        
+        try:
+            fields, _ = REPORT_FIELDS.parse(request.args.get('fields'))
+        except projections.ProjectionError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        
+        query = f'''
+            SELECT {REPORT_FIELDS.columns(fields, always=(PENDING_ORDER, "r.id"))}
+            FROM reports r
+        '''
+        if 'users' in REPORT_FIELDS.joins(fields):
+            query += " LEFT JOIN users u ON r.user_id = u.id"
+        query += " WHERE r.status = 'pending'"
+        params = []
+        if after is not None:
+            query += f" AND ({PENDING_ORDER}, r.id) {'<' if order == 'desc' else '>'} (?, ?)"
+            params.extend(after)
+        query += f" ORDER BY {PENDING_ORDER} {order.upper()}, r.id {order.upper()} LIMIT ?"
+        params.append(limit + 1)
+        
+        cursor.execute(query, params)
+        
+        page = {"last": None, "has_more": False}
+        
+        def rows():
+            for count, row in enumerate(cursor):
+                if count == limit:
+                    page["has_more"] = True
+                    break
+                page["last"] = row
+                yield REPORT_FIELDS.to_dict(fields, row, offset=2)
+        
+        def tail():
+            last = page["last"]
+            next_cursor = f"{last[0]!r}:{last[1]}" if page["has_more"] else None
+            return {"next_cursor": next_cursor, "has_more": page["has_more"]}
+        
+        return responses.stream_json(
+            {"status": "success"}, "reports", rows(), tail=tail,
+            accept_encoding=request.headers.get('Accept-Encoding'),
+            on_close=conn.close
+        )
+    
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 @app.route('/api/reports/list', methods=['GET'])
 def get_reports():
     """Obtener reportes con filtros"""
@@ -774,20 +963,24 @@ def get_reports():
         category = request.args.get('category', None)
         days = int(request.args.get('days', 7))
         
-        conn = sqlite3.connect(DB_FILE)
+        try:
+            fields, _ = REPORT_FIELDS.parse(request.args.get('fields'))
+        except projections.ProjectionError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        conn = get_db()
         cursor = conn.cursor()
         
         cutoff = datetime.now() - timedelta(days=days)
         
-        query = '''
-            SELECT r.id, r.user_id, r.description, r.category, r.severity,
-                   r.lat, r.lon, r.address, r.images, r.created_at,
-                   r.verified, r.status, r.upvotes, r.downvotes,
-                   u.name as user_name, u.photo as user_photo
+        # Solo las columnas pedidas: sin imágenes ni JOIN a users si no hacen falta
+        query = f'''
+            SELECT {REPORT_FIELDS.columns(fields)}
             FROM reports r
-            LEFT JOIN users u ON r.user_id = u.id
-            WHERE r.created_at > ?
         '''
+        if 'users' in REPORT_FIELDS.joins(fields):
+            query += " LEFT JOIN users u ON r.user_id = u.id"
+        query += " WHERE r.created_at > ?"
         
         params = [cutoff]
         
@@ -802,34 +995,20 @@ def get_reports():
         
         cursor.execute(query, params)
         
-        reports = []
-        for row in cursor.fetchall():
-            reports.append({
-                "id": row[0],
-                "user_id": row[1],
-                "description": row[2],
-                "category": row[3],
-                "severity": row[4],
-                "lat": row[5],
-                "lon": row[6],
-                "address": row[7],
-                "images": json.loads(row[8]) if row[8] else [],
-                "created_at": row[9],
-                "verified": bool(row[10]),
-                "status": row[11],
-                "upvotes": row[12],
-                "downvotes": row[13],
-                "user_name": row[14],
-                "user_photo": row[15]
-            })
+        # Las imágenes pueden pesar MBs: se serializa y envía fila por fila
+        count = [0]
         
-        conn.close()
+        def rows():
+            for row in cursor:
+                count[0] += 1
+                yield REPORT_FIELDS.to_dict(fields, row)
         
-        return jsonify({
-            "status": "success",
-            "reports": reports,
-            "total": len(reports)
-        })
+        return responses.stream_json(
+            {"status": "success"}, "reports", rows(),
+            tail=lambda: {"total": count[0]},
+            accept_encoding=request.headers.get('Accept-Encoding'),
+            on_close=conn.close
+        )
     
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -845,9 +1024,12 @@ def vote_report(report_id):
         if vote_type not in ['up', 'down']:
             return jsonify({"status": "error", "message": "Tipo de voto inválido"}), 400
         
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db()
         cursor = conn.cursor()
         
+        # Los votos a un duplicado cuentan en el reporte original
+        report_id = dedup.canonical_of(cursor, report_id) or report_id
+        
         # Verificar si ya votó
         cursor.execute('''
             SELECT vote_type FROM report_votes 
@@ -892,6 +1074,56 @@ def vote_report(report_id):
         
         return jsonify({
             "status": "success",
+            "report_id": report_id,
+            "upvotes": upvotes,
+            "downvotes": downvotes
+        })
+    
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/reports/merge/<report_id>', methods=['POST'])
+def merge_report(report_id):
+    """Marcar un reporte como duplicado de otro y sumarle sus votos (admin)"""
+    try:
+        data = request.json or {}
+        target = data.get('duplicate_of')
+        if not target:
+            return jsonify({"status": "error", "message": "duplicate_of requerido"}), 400
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        
+        canonical_id = dedup.canonical_of(cursor, target)
+        cursor.execute('''
+            SELECT lat, lon, severity, created_at, verified = 1 AND status = 'active'
+            FROM reports WHERE id = ?
+        ''', (report_id,))
+        previous = cursor.fetchone()
+        if not previous or not canonical_id:
+            conn.close()
+            return jsonify({"status": "error", "message": "Reporte no encontrado"}), 404
+        if canonical_id == report_id:
+            conn.close()
+            return jsonify({"status": "error", "message": "Un reporte no puede ser duplicado de sí mismo"}), 400
+        
+        # Si ya estaba verificado deja de contar: mismo evento que el original
+        if previous[4]:
+            risk_profile.add_report(cursor, *previous[:4], sign=-1)
+            incident_zones.remove_report(cursor, report_id)
+        
+        moved = dedup.merge(cursor, report_id, canonical_id)
+        conn.commit()
+        
+        cursor.execute('SELECT upvotes, downvotes FROM reports WHERE id = ?', (canonical_id,))
+        upvotes, downvotes = cursor.fetchone()
+        conn.close()
+        
+        return jsonify({
+            "status": "success",
+            "report_id": report_id,
+            "duplicate_of": canonical_id,
+            "votes_moved": moved,
             "upvotes": upvotes,
             "downvotes": downvotes
         })
@@ -900,6 +1132,34 @@ def vote_report(report_id):
         return jsonify({"status": "error", "message": str(e)}), 500
 
 # ==================== ENDPOINTS DE LUGARES ====================
+# Campos de /api/places/<id>; las reseñas se piden como reviews o reviews.<campo>
+REVIEW_FIELDS = projections.Projection({
+    "id": Field("r.id"),
+    "rating": Field("r.rating"),
+    "comment": Field("r.comment"),
+    "images": Field("r.images", convert=projections.json_list),
+    "created_at": Field("r.created_at"),
+    "helpful_count": Field("r.helpful_count"),
+    "user_name": Field("u.name", join='users'),
+    "user_photo": Field("u.photo", join='users'),
+})
+
+PLACE_FIELDS = projections.Projection({
+    "id": Field("id"),
+    "name": Field("name"),
+    "type": Field("type"),
+    "coords": Field("lat", "lon", convert=lambda lat, lon: [lat, lon]),
+    "address": Field("address"),
+    "phone": Field("phone"),
+    "website": Field("website"),
+    "description": Field("description"),
+    "rating": Field("rating"),
+    "total_reviews": Field("total_reviews"),
+    "price_level": Field("price_level"),
+}, projections={
+    "markers": ["id", "name", "type", "coords", "rating"],
+}, nested={"reviews": REVIEW_FIELDS})
+
 @app.route('/api/places/search', methods=['GET'])
 def search_places():
     """Buscar lugares (restaurantes, museos, etc.)"""
@@ -913,7 +1173,7 @@ def search_places():
         if len(query) < 2:
             return jsonify([])
         
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db()
         cursor = conn.cursor()
         
         sql = '''
@@ -954,7 +1214,7 @@ def search_places():
             # Si hay coordenadas, calcular distancia
             if lat and lon:
                 try:
-                    dist = geodesic((float(lat), float(lon)), (row[3], row[4])).kilometers
+                    dist = geo_distance_km((float(lat), float(lon)), (row[3], row[4]))
                     if dist <= radius:
                         place['distance_km'] = round(dist, 2)
                         places.append(place)
@@ -966,33 +1226,34 @@ def search_places():
         conn.close()
         
         # Si hay pocos resultados, buscar con Nominatim
-        if geolocator and len(places) < 5:
+        if len(places) < 5:
             try:
-                locations = geolocator.geocode(
-                    f"{query}, Chihuahua, México",
-                    exactly_one=False,
-                    limit=5,
-                    addressdetails=True
-                )
+                locations = nominatim.get_json('/search', {
+                    "q": f"{query}, Chihuahua, México",
+                    "format": "json",
+                    "limit": 5,
+                    "addressdetails": 1
+                }, operation='search')
                 
-                if locations:
-                    for loc in locations:
-                        if 28.0 <= loc.latitude <= 29.0 and -107.0 <= loc.longitude <= -106.0:
-                            addr = loc.raw.get('address', {})
-                            name = addr.get('road', addr.get('neighbourhood', loc.address.split(',')[0]))
-                            places.append({
-                                "id": f"osm_{loc.osm_id}",
-                                "name": name,
-                                "type": "Dirección",
-                                "coords": [loc.latitude, loc.longitude],
-                                "lat": loc.latitude,
-                                "lon": loc.longitude,
-                                "address": loc.address,
-                                "rating": 0,
-                                "total_reviews": 0,
-                                "source": "osm"
-                            })
-            except:
+                for loc in locations or []:
+                    loc_lat, loc_lon = float(loc['lat']), float(loc['lon'])
+                    if 28.0 <= loc_lat <= 29.0 and -107.0 <= loc_lon <= -106.0:
+                        addr = loc.get('address', {})
+                        display_name = loc.get('display_name', '')
+                        name = addr.get('road', addr.get('neighbourhood', display_name.split(',')[0]))
+                        places.append({
+                            "id": f"osm_{loc.get('osm_id')}",
+                            "name": name,
+                            "type": "Dirección",
+                            "coords": [loc_lat, loc_lon],
+                            "lat": loc_lat,
+                            "lon": loc_lon,
+                            "address": display_name,
+                            "rating": 0,
+                            "total_reviews": 0,
+                            "source": "osm"
+                        })
+            except (upstream.UpstreamError, KeyError, ValueError):
                 pass
         
         return jsonify(places[:15])
@@ -1004,12 +1265,17 @@ def search_places():
 def get_place_details(place_id):
     """Obtener detalles completos de un lugar"""
     try:
-        conn = sqlite3.connect(DB_FILE)
+        try:
+            fields, nested = PLACE_FIELDS.parse(request.args.get('fields'))
+        except projections.ProjectionError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        conn = get_db()
         cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT id, name, type, lat, lon, address, phone, website,
-                   description, rating, total_reviews, price_level
+        # id siempre se lee para distinguir "no existe" de "sin campos propios"
+        cursor.execute(f'''
+            SELECT {PLACE_FIELDS.columns(fields, always=('id',))}
             FROM places WHERE id = ?
         ''', (place_id,))
         
@@ -1018,45 +1284,22 @@ def get_place_details(place_id):
             conn.close()
             return jsonify({"status": "error", "message": "Lugar no encontrado"}), 404
         
-        place = {
-            "id": row[0],
-            "name": row[1],
-            "type": row[2],
-            "coords": [row[3], row[4]],
-            "address": row[5],
-            "phone": row[6],
-            "website": row[7],
-            "description": row[8],
-            "rating": row[9],
-            "total_reviews": row[10],
-            "price_level": row[11]
-        }
-        
-        # Obtener reseñas
-        cursor.execute('''
-            SELECT r.id, r.rating, r.comment, r.images, r.created_at, r.helpful_count,
-                   u.name, u.photo
-            FROM reviews r
-            LEFT JOIN users u ON r.user_id = u.id
-            WHERE r.place_id = ?
-            ORDER BY r.created_at DESC
-            LIMIT 50
-        ''', (place_id,))
-        
-        reviews = []
-        for rev_row in cursor.fetchall():
-            reviews.append({
-                "id": rev_row[0],
-                "rating": rev_row[1],
-                "comment": rev_row[2],
-                "images": json.loads(rev_row[3]) if rev_row[3] else [],
-                "created_at": rev_row[4],
-                "helpful_count": rev_row[5],
-                "user_name": rev_row[6],
-                "user_photo": rev_row[7]
-            })
-        
-        place['reviews'] = reviews
+        place = PLACE_FIELDS.to_dict(fields, row, offset=1)
+        
+        # Obtener reseñas (solo si se pidieron)
+        review_fields = nested.get('reviews')
+        if review_fields:
+            query = f'''
+                SELECT {REVIEW_FIELDS.columns(review_fields)}
+                FROM reviews r
+            '''
+            if 'users' in REVIEW_FIELDS.joins(review_fields):
+                query += " LEFT JOIN users u ON r.user_id = u.id"
+            query += " WHERE r.place_id = ? ORDER BY r.created_at DESC LIMIT 50"
+            cursor.execute(query, (place_id,))
+            
+            place['reviews'] = [REVIEW_FIELDS.to_dict(review_fields, rev_row)
+                                for rev_row in cursor.fetchall()]
         
         conn.close()
         
@@ -1069,10 +1312,9 @@ def get_place_details(place_id):
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/api/places/<place_id>/reviews', methods=['POST'])
-def add_review():
+def add_review(place_id):
     """Agregar reseña a un lugar"""
     try:
-        place_id = request.view_args['place_id']
         data = request.json
         user_id = data.get('user_id')
         rating = data.get('rating')
@@ -1088,13 +1330,7 @@ def add_review():
             if not valid:
                 return jsonify({"status": "error", "message": msg}), 400
         
-        # Comprimir imágenes
-        compressed_images = []
-        for img in images[:3]:
-            compressed = compress_image(img, max_size=(1200, 1200), quality=85)
-            compressed_images.append(compressed)
-        
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db()
         cursor = conn.cursor()
         
         # Verificar que el lugar existe
@@ -1108,7 +1344,14 @@ def add_review():
         cursor.execute('''
             INSERT INTO reviews (id, place_id, user_id, rating, comment, images)
             VALUES (?, ?, ?, ?, ?, ?)
-        ''', (review_id, place_id, user_id, int(rating), comment, json.dumps(compressed_images)))
+        ''', (review_id, place_id, user_id, int(rating), comment, json.dumps([])))
+        
+        # Las imágenes se comprimen en segundo plano (ver jobs.py)
+        pending = {}
+        if images[:3]:
+            pending["images"] = jobs.enqueue(cursor, 'review_images',
+                                             {"review_id": review_id, "images": images[:3]},
+                                             key=f"review_images:{review_id}")
         
         # Actualizar rating del lugar
         cursor.execute('''
@@ -1122,14 +1365,17 @@ def add_review():
         
         conn.commit()
         conn.close()
+        if pending:
+            job_worker.notify()
         
         return jsonify({
             "status": "success",
             "review_id": review_id,
             "message": "Reseña publicada exitosamente",
             "new_rating": round(avg_rating, 1),
-            "total_reviews": total_reviews
-        })
+            "total_reviews": total_reviews,
+            "jobs": pending
+        }), 202 if pending else 200
     
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -1139,31 +1385,7 @@ def add_review():
 def get_disasters():
     """Obtener desastres naturales activos"""
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, type, lat, lon, radius_km, severity, description, created_at, expires_at
-            FROM natural_disasters
-            WHERE active = 1 AND (expires_at IS NULL OR expires_at > ?)
-            ORDER BY created_at DESC
-        ''', (datetime.now(),))
-        
-        disasters = []
-        for row in cursor.fetchall():
-            disasters.append({
-                "id": row[0],
-                "type": row[1],
-                "lat": row[2],
-                "lon": row[3],
-                "radius_km": row[4],
-                "severity": row[5],
-                "description": row[6],
-                "created_at": row[7],
-                "expires_at": row[8]
-            })
-        
-        conn.close()
+        disasters = [d.to_dict() for d in risk_snapshot.current().active_disasters()]
         
         return jsonify({
             "status": "success",
@@ -1188,7 +1410,7 @@ def report_disaster():
         if disaster_type not in valid_types:
             return jsonify({"status": "error", "message": "Tipo de desastre inválido"}), 400
         
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db()
         cursor = conn.cursor()
         
         disaster_id = generate_id('disaster_')
@@ -1214,6 +1436,28 @@ def report_disaster():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 # ==================== RUTAS AVANZADAS ====================
+def route_alternatives(olat, olon, dlat, dlon):
+    """Hasta 3 rutas de OSRM (geometría GeoJSON completa)"""
+    path = f"/route/v1/driving/{olon},{olat};{dlon},{dlat}"
+    params = {"overview": "full", "geometries": "geojson", "alternatives": "true"}
+    route_data = osrm.get_json(path, params, operation='route')
+    return (route_data or {}).get('routes', [])[:3]
+
+def pick_route(routes, score_point=None):
+    """(ruta, puntajes por muestra) con menor riesgo total
+
+    Sin `score_point` no se califica y gana la primera (avoid_risks=false).
+    """
+    best_route, best_scores = None, None
+    min_risk_score = float('inf')
+    for route in routes:
+        points = trips.sample_points(route['geometry']['coordinates'])
+        scores = [score_point(lat, lon) for lat, lon in points] if score_point else [0] * len(points)
+        if sum(scores) < min_risk_score:
+            min_risk_score = sum(scores)
+            best_route, best_scores = route, scores
+    return best_route, best_scores
+
 @app.route('/api/routes/calculate', methods=['POST'])
 def calculate_route():
     """Calcular ruta óptima evitando zonas de riesgo"""
@@ -1223,6 +1467,11 @@ def calculate_route():
         destination = data.get('destination', '').strip()
         avoid_risks = data.get('avoid_risks', True)
         
+        try:
+            departure = risk_profile.parse_departure(data.get('departure_time'))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
         if not destination:
             return jsonify({"status": "error", "message": "Destino requerido"}), 400
         
@@ -1237,49 +1486,29 @@ def calculate_route():
             return jsonify({"status": "error", "message": "Destino no encontrado"}), 400
         
         # Calcular ruta con OSRM
-        direct_distance = geodesic((olat, olon), (dlat, dlon)).kilometers
+        direct_distance = geo_distance_km((olat, olon), (dlat, dlon))
         geometry = {"type": "LineString", "coordinates": [[olon, olat], [dlon, dlat]]}
         duration_min = direct_distance * 3
         distance_km = direct_distance
         
         try:
-            url = f"http://router.project-osrm.org/route/v1/driving/{olon},{olat};{dlon},{dlat}"
-            params = {"overview": "full", "geometries": "geojson", "alternatives": "true"}
-            response = requests.get(url, params=params, timeout=10)
+            # Evaluar cada ruta alternativa (muestreando cada 10 puntos)
+            score_point = None
+            if avoid_risks:
+                score_point = lambda lat, lon: read_model.RISK_SCORES.get(calculate_risk(lat, lon, departure), 1)
+            best_route, _ = pick_route(route_alternatives(olat, olon, dlat, dlon), score_point)
             
-            if response.status_code == 200:
-                route_data = response.json()
-                if route_data.get('routes'):
-                    best_route = None
-                    min_risk_score = float('inf')
-                    
-                    # Evaluar cada ruta alternativa
-                    for route in route_data['routes'][:3]:
-                        geometry_coords = route['geometry']['coordinates']
-                        risk_score = 0
-                        
-                        if avoid_risks:
-                            # Calcular riesgo de la ruta
-                            for coord in geometry_coords[::10]:  # Muestrear cada 10 puntos
-                                risk_level = calculate_risk(coord[1], coord[0])
-                                risk_scores_map = {"Crítico": 4, "Alto": 3, "Medio": 2, "Bajo": 1}
-                                risk_score += risk_scores_map.get(risk_level, 1)
-                        
-                        if risk_score < min_risk_score:
-                            min_risk_score = risk_score
-                            best_route = route
-                    
-                    if best_route:
-                        geometry = best_route['geometry']
-                        duration_min = best_route['duration'] / 60
-                        distance_km = best_route['distance'] / 1000
+            if best_route:
+                geometry = best_route['geometry']
+                duration_min = best_route['duration'] / 60
+                distance_km = best_route['distance'] / 1000
         
         except Exception as e:
             print(f"OSRM error: {e}")
         
         # Calcular riesgo promedio
         mid_lat, mid_lon = (olat + dlat) / 2, (olon + dlon) / 2
-        risk_level = calculate_risk(mid_lat, mid_lon)
+        risk_level = calculate_risk(mid_lat, mid_lon, departure)
         
         # Factor de ajuste por riesgo
         risk_factors = {"Bajo": 1.0, "Medio": 1.2, "Alto": 1.4, "Crítico": 1.6}
@@ -1335,23 +1564,14 @@ def calculate_route():
             })
         
         # Verificar desastres naturales en la ruta
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT type, description FROM natural_disasters 
-            WHERE active = 1 AND expires_at > ?
-        ''', (datetime.now(),))
-        
-        for disaster_type, desc in cursor.fetchall():
+        for disaster in risk_snapshot.current().active_disasters(require_expiry=True):
             warnings.append({
                 "type": "disaster",
-                "message": f"⚠️ {disaster_type.title()}: {desc}",
+                "message": f"⚠️ {disaster.type.title()}: {disaster.description}",
                 "severity": "critical"
             })
         
-        conn.close()
-        
-        return jsonify({
+        result = {
             "status": "success",
             "origin": {"lat": olat, "lon": olon, "name": origin},
             "destination": {"lat": dlat, "lon": dlon, "name": destination},
@@ -1362,11 +1582,176 @@ def calculate_route():
             "route_geometry": geometry,
             "warnings": warnings,
             "avoid_risks": avoid_risks
-        })
+        }
+        if departure is not None:
+            result["departure_time"] = datetime.fromtimestamp(departure).isoformat()
+        return jsonify(result)
+    
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# ==================== VIAJES EN CURSO ====================
+def route_trip(trip, lat, lon, state, now, fallback=False):
+    """Pedir a OSRM la ruta de (lat, lon) al destino y guardarla en el viaje
+
+    Misma elección que calculate_route, calificada con `state` para que
+    la huella del viaje corresponda a los puntajes. Si OSRM falla, el
+    viaje conserva su ruta (o, con `fallback`, toma la línea recta).
+    """
+    score_point = lambda plat, plon: trips.score_point(state, plat, plon, now)
+    route = None
+    try:
+        routes = route_alternatives(lat, lon, trip.dest_lat, trip.dest_lon)
+        route, scores = pick_route(routes if trip.avoid_risks else routes[:1], score_point)
+    except (upstream.UpstreamError, KeyError, ValueError) as e:
+        print(f"OSRM error: {e}")
+    if route is not None:
+        trips.set_route(trip, route['geometry']['coordinates'], scores, route['duration'], state, now)
+        return True
+    if fallback:
+        coords = [[lon, lat], [trip.dest_lon, trip.dest_lat]]
+        scores = [score_point(plat, plon) for plat, plon in trips.sample_points(coords)]
+        distance_km = geo_distance_km((lat, lon), (trip.dest_lat, trip.dest_lon))
+        trips.set_route(trip, coords, scores, distance_km * 3 * 60, state, now)
+    return False
+
+def trip_response(trip, state, **extra):
+    result = {"status": "success", "trip": trips.summary(trip, state)}
+    result.update(extra)
+    return jsonify(result)
+
+@app.route('/api/trips/start', methods=['POST'])
+def start_trip():
+    """Iniciar un viaje: ruta elegida y calificada una vez, guardada en el servidor"""
+    try:
+        data = request.json
+        destination = data.get('destination', '').strip()
+        avoid_risks = data.get('avoid_risks', True)
+        
+        if not destination:
+            return jsonify({"status": "error", "message": "Destino requerido"}), 400
+        
+        # Origen: la posición del conductor o un nombre de lugar
+        if data.get('lat') is not None and data.get('lon') is not None:
+            olat, olon = float(data['lat']), float(data['lon'])
+        else:
+            olat, olon = get_coordinates(data.get('origin', '').strip())
+            if not olat or not olon:
+                olat, olon = 28.6353, -106.0886  # Centro por defecto
+        
+        dlat, dlon = get_coordinates(destination)
+        if not dlat or not dlon:
+            return jsonify({"status": "error", "message": "Destino no encontrado"}), 400
+        
+        now = time.time()
+        state = risk_snapshot.current()
+        trip = trips.Trip.new(generate_id('trip_'), data.get('user_id'), destination, dlat, dlon, avoid_risks, now)
+        route_trip(trip, olat, olon, state, now, fallback=True)
+        trip.last_lat, trip.last_lon = olat, olon
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        trips.prune(cursor, now)
+        trips.insert(cursor, trip)
+        conn.commit()
+        conn.close()
+        
+        return trip_response(trip, state, route_geometry={"type": "LineString", "coordinates": trip.coords})
+    
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/trips/<trip_id>/position', methods=['POST'])
+def update_trip_position(trip_id):
+    """Nueva posición: avanzar, recalificar solo lo que cambió y desviar si hace falta"""
+    try:
+        data = request.json
+        try:
+            lat, lon = float(data.get('lat')), float(data.get('lon'))
+        except (TypeError, ValueError):
+            return jsonify({"status": "error", "message": "Coordenadas inválidas"}), 400
+        
+        conn = get_db()
+        cursor = conn.cursor()
+        trip = trips.load(cursor, trip_id)
+        if trip is None:
+            conn.close()
+            return jsonify({"status": "error", "message": "Viaje no encontrado"}), 404
+        now = time.time()
+        if trip.status == 'active' and now - trip.updated_at > trips.IDLE_SECONDS:
+            trip.status = 'expired'
+        if trip.status != 'active':
+            conn.close()
+            return jsonify({"status": "error", "message": "El viaje ya terminó", "trip_status": trip.status}), 409
+        
+        state = risk_snapshot.current()
+        update = trips.advance(trip, lat, lon, state, now)
+        
+        # OSRM solo si se desvió o subió el riesgo de lo que falta
+        reroute = None
+        if not update.arrived:
+            if update.off_route:
+                reroute = 'off_route'
+            elif update.raised and trip.avoid_risks:
+                reroute = 'risk'
+        rerouted = bool(reroute) and route_trip(trip, lat, lon, state, now)
+        if rerouted:
+            trip.reroutes += 1
+        
+        trips.save(cursor, trip)
+        conn.commit()
+        conn.close()
+        
+        if update.arrived:
+            outcome = 'arrived'
+        elif rerouted:
+            outcome = 'rerouted'
+        else:
+            outcome = 'rescored' if update.rescored else 'unchanged'
+        metrics.TRIP_UPDATES.inc(outcome)
+        
+        extra = {"rerouted": rerouted, "rescored": update.rescored,
+                 "distance_from_route_km": round(update.distance_from_route, 3)}
+        if reroute:
+            extra["reroute_reason"] = reroute
+        if rerouted:
+            extra["route_geometry"] = {"type": "LineString", "coordinates": trip.coords}
+        return trip_response(trip, state, **extra)
     
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/trips/<trip_id>', methods=['GET'])
+def get_trip(trip_id):
+    """Estado de un viaje con su ruta vigente"""
+    try:
+        conn = get_db()
+        trip = trips.load(conn.cursor(), trip_id)
+        conn.close()
+        if trip is None:
+            return jsonify({"status": "error", "message": "Viaje no encontrado"}), 404
+        return trip_response(trip, risk_snapshot.current(),
+                             route_geometry={"type": "LineString", "coordinates": trip.coords})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/trips/<trip_id>/end', methods=['POST'])
+def end_trip(trip_id):
+    """Terminar un viaje; deja de aceptar posiciones"""
+    try:
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute("UPDATE trips SET status = 'finished', updated_at = ? WHERE id = ? AND status = 'active'",
+                       (time.time(), trip_id))
+        updated = cursor.rowcount
+        conn.commit()
+        conn.close()
+        if not updated:
+            return jsonify({"status": "error", "message": "Viaje no encontrado o ya terminado"}), 404
+        return jsonify({"status": "success", "trip_id": trip_id})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 # ==================== GEOCODIFICACIÓN ====================
 @app.route('/api/geocode/reverse', methods=['POST'])
 def reverse_geocode():
@@ -1380,20 +1765,28 @@ def reverse_geocode():
         
         address = "Ubicación desconocida"
         
-        if geolocator:
+        # Primero el índice local de calles y colonias; Nominatim solo si no hay calle cerca
+        local = local_geocoder.reverse(lat, lon)
+        if local and local.road:
+            metrics.GEOCODE_RESOLVED.inc('reverse', 'gazetteer')
+            address = local.label('Chihuahua')
+        else:
             try:
-                location = geolocator.reverse(f"{lat}, {lon}", language='es', timeout=10)
-                if location:
-                    addr = location.raw.get('address', {})
+                location = nominatim.get_json('/reverse', {"lat": lat, "lon": lon, "format": "json"},
+                                              operation='reverse')
+                if location and 'error' not in location:
+                    addr = location.get('address', {})
                     parts = [
                         addr.get('road', ''),
                         addr.get('suburb', ''),
                         addr.get('neighbourhood', ''),
                         addr.get('city', 'Chihuahua')
                     ]
-                    address = ", ".join([p for p in parts if p]) or location.address
-        except Exception as e:
-            print(f"Reverse geocoding error: {e}")
+                    address = ", ".join([p for p in parts if p]) or location.get('display_name', address)
+                    metrics.GEOCODE_RESOLVED.inc('reverse', 'nominatim')
+            except upstream.UpstreamError as e:
+                metrics.GEOCODE_RESOLVED.inc('reverse', 'unresolved')
+                print(f"Reverse geocoding error: {e}")
         
         return jsonify({
             "status": "success",
@@ -1408,48 +1801,127 @@ def reverse_geocode():
 # ==================== ENDPOINTS DE ZONAS ====================
 @app.route('/api/zones/risk', methods=['GET'])
 def get_risk_zones():
-    """Obtener zonas de riesgo activas"""
+    """Obtener zonas de riesgo activas
+
+    Con `?departure=` (ISO 8601, epoch o 'now') devuelve las zonas vigentes
+    a esa hora más las celdas de riesgo histórico de esa hora de la semana.
+    """
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+        try:
+            departure = risk_profile.parse_departure(request.args.get('departure'))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
         
-        cursor.execute('''
-            SELECT id, name, lat, lon, radius_km, level, type, color, description
-            FROM risk_zones
-            WHERE active = 1 AND (expires_at IS NULL OR expires_at > ?)
-            ORDER BY level DESC
-        ''', (datetime.now(),))
+        zones = [z.to_dict() for z in risk_snapshot.current().active_zones(departure)]
+        if departure is not None:
+            profile = risk_profiles.current()
+            if profile is not None:
+                zones.extend(profile.hotspots(departure))
         
-        zones = []
-        for row in cursor.fetchall():
-            zones.append({
-                "id": row[0],
-                "name": row[1],
-                "lat": row[2],
-                "lon": row[3],
-                "radius_km": row[4],
-                "level": row[5],
-                "type": row[6],
-                "color": row[7],
-                "description": row[8]
-            })
+        return jsonify({
+            "status": "success",
+            "zones": zones
+        })
+    
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# ==================== MAPA ====================
+@app.route('/api/map/clusters', methods=['GET'])
+def get_map_clusters():
+    """Marcadores agrupados para el bbox y zoom del mapa
+
+    `bbox=oeste,sur,este,norte`, `zoom` entero y `layer` = reports
+    (verificados de los últimos 30 días) o places. Cada grupo trae su
+    conteo y el desglose por gravedad (o tipo de lugar); los puntos
+    sueltos traen su id.
+    """
+    try:
+        layer = request.args.get('layer', 'reports')
+        if layer not in map_clusters.layers:
+            return jsonify({"status": "error", "message": "layer debe ser reports o places"}), 400
+        try:
+            bbox = clusters.parse_bbox(request.args.get('bbox'))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        try:
+            zoom = int(request.args.get('zoom', ''))
+        except ValueError:
+            return jsonify({"status": "error", "message": "zoom debe ser un entero"}), 400
         
-        conn.close()
+        groups = map_clusters.query(layer, bbox, zoom)
         
         return jsonify({
             "status": "success",
-            "zones": zones
+            "layer": layer,
+            "zoom": zoom,
+            "clusters": groups,
+            "total": sum(group["count"] for group in groups)
         })
     
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+# ==================== SINCRONIZACIÓN ====================
+@app.route('/api/sync', methods=['GET'])
+def sync_changes():
+    """Cambios desde un cursor para el modo offline (ver sync.py)
+
+    `since` es el cursor de la respuesta anterior (sin él, foto completa);
+    `entities` limita a reports, zones, disasters, places o reviews.
+    """
+    try:
+        try:
+            since = int(request.args['since']) if request.args.get('since') else None
+            limit = min(int(request.args.get('limit') or sync.DEFAULT_LIMIT), sync.MAX_LIMIT)
+        except ValueError:
+            return jsonify({"status": "error", "message": "since y limit deben ser enteros"}), 400
+        if limit < 1:
+            return jsonify({"status": "error", "message": "limit debe ser mayor que 0"}), 400
+        try:
+            entities = sync.parse_entities(request.args.get('entities'))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        conn = get_db()
+        try:
+            result = sync.changes(conn, since, entities, limit)
+        finally:
+            conn.close()
+        
+        return jsonify({"status": "success", **result})
+    
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/offline/bundle', methods=['GET'])
+def offline_bundle():
+    """Paquete binario (bundle.py) con lugares, zonas, desastres y gazetteer
+
+    El cursor de sync del paquete va en X-Zeta-Sync-Cursor: el cliente sigue
+    con /api/sync?since=<cursor>.
+    """
+    try:
+        path, gz_path, etag = offline_bundles.current()
+        gzipped = request.accept_encodings['gzip'] > 0
+        response = send_file(gz_path if gzipped else path, mimetype='application/octet-stream',
+                             download_name='zeta_offline.zetab', etag=f"{etag}-gz" if gzipped else etag,
+                             conditional=True, max_age=0)
+        if gzipped:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        response.headers['X-Zeta-Sync-Cursor'] = etag.split('-')[0]
+        return response
+    
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 # ==================== HEALTH CHECK ====================
 @app.route('/api/health', methods=['GET'])
 def health():
     """Estado del sistema"""
     try:
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute("SELECT COUNT(*) FROM users")
@@ -1485,6 +1957,108 @@ def health():
             "message": str(e)
         }), 500
 
+# ==================== MÉTRICAS ====================
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.inc()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get('request_start')
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint, request.method)
+        metrics.HTTP_REQUESTS.inc(endpoint, request.method, response.status_code)
+    return response
+
+@app.teardown_request
+def finish_request(exc):
+    if g.pop('request_start', None) is not None:
+        metrics.HTTP_IN_FLIGHT.dec()
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Métricas en formato Prometheus (suma de todos los workers)"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+# Profundidad de la cola: leída de SQLite al exportar, no por proceso
+@metrics.JOB_QUEUE_DEPTH.collector
+def job_queue_depth():
+    conn = get_db()
+    try:
+        return [((kind, state), count) for (kind, state), (count, _) in jobs.stats(conn).items()]
+    finally:
+        conn.close()
+
+@metrics.JOB_OLDEST_SECONDS.collector
+def job_oldest_ready():
+    conn = get_db()
+    try:
+        now = time.time()
+        return [((kind,), now - oldest) for (kind, state), (_, oldest) in jobs.stats(conn, now).items()
+                if state == 'ready']
+    finally:
+        conn.close()
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """Estado de un trabajo diferido (los ids vienen en las respuestas 202)"""
+    try:
+        conn = get_db()
+        job = jobs.status(conn, job_id)
+        conn.close()
+        if job is None:
+            return jsonify({"status": "error", "message": "Trabajo no encontrado"}), 404
+        return jsonify({"status": "success", "job": job})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# ==================== RATE LIMITING ====================
+# Después del timer de métricas: los 429 también se cuentan por ruta
+@app.before_request
+def enforce_rate_limit():
+    if not ratelimit.ENABLED or request.method == 'OPTIONS':
+        return None
+    allowed, retry_after = rate_limiter.hit(request.endpoint, request.remote_addr or 'unknown')
+    if allowed:
+        return None
+    metrics.RATE_LIMITED.inc(request.endpoint)
+    retry_after = max(1, math.ceil(retry_after))
+    response = jsonify({
+        "status": "error",
+        "message": f"Demasiadas solicitudes. Intenta de nuevo en {retry_after} s"
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+# ==================== PERFILADO ====================
+@app.before_request
+def start_profiling():
+    if profiler.enabled:
+        g.profile_session = profiler.begin(request.endpoint, request.headers.get(profiler.PROFILE_HEADER))
+
+@app.after_request
+def save_profile(response):
+    if g.pop('profile_session', None) is not None:
+        path = profiler.finish()
+        if path:
+            response.headers['X-Zeta-Profile-File'] = os.path.basename(path)
+    return response
+
+@app.teardown_request
+def discard_profile(exc):
+    # Si el request terminó con excepción no se llamó a after_request
+    if g.pop('profile_session', None) is not None:
+        profiler.finish()
+
+# ==================== RESPUESTAS ====================
+@app.after_request
+def compress_response(response):
+    """gzip/brotli para respuestas JSON grandes (ver responses.py)"""
+    return responses.compress_response(response, request.headers.get('Accept-Encoding'))
+
 # ==================== EJECUTAR APP ====================
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5002))
@@ -1495,4 +2069,5 @@ if __name__ == '__main__':
     ║   Puerto: {port}                         ║
     ╚══════════════════════════════════════╝
     """)
+    create_app()
     app.run(host='0.0.0.0', port=port, debug=False)
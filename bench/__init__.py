@@ -0,0 +1 @@
+"""Herramientas de benchmark y pruebas de carga de ZETA PRO (uso offline)."""
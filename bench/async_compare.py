@@ -0,0 +1,107 @@
+"""
+Comparación de carga: workers sync vs gevent
+
+Levanta el stub de Nominatim/OSRM con latencia fija, arranca gunicorn en
+cada modo con el mismo número de procesos y lanza una ráfaga de rutas
+mientras mide la latencia de /api/health (endpoint barato).
+
+Uso:
+    python -m bench.async_compare --workers 2 --routes 200 --latency 0.5
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench.common import percentile, start_backend, wait_ready
+from bench.stubs import StubServer
+
+
+def run_scenario(base_url, routes, concurrency):
+    """Ráfaga de rutas + sondeo de /api/health en paralelo"""
+    route_latencies, health_latencies = [], []
+    errors = 0
+    done = threading.Event()
+    session = requests.Session()
+
+    def one_route(i):
+        payload = {
+            "origin": "28.6353,-106.0886",
+            "destination": f"{28.64 + (i % 50) * 0.001:.4f},-106.1000",
+            "avoid_risks": True
+        }
+        start = time.perf_counter()
+        resp = requests.post(f"{base_url}/api/routes/calculate", json=payload, timeout=120)
+        route_latencies.append(time.perf_counter() - start)
+        return resp.status_code
+
+    def probe_health():
+        while not done.is_set():
+            start = time.perf_counter()
+            try:
+                session.get(f"{base_url}/api/health", timeout=120)
+                health_latencies.append(time.perf_counter() - start)
+            except requests.RequestException:
+                pass
+            time.sleep(0.05)
+
+    prober = threading.Thread(target=probe_health, daemon=True)
+    prober.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for status in pool.map(one_route, range(routes)):
+            if status != 200:
+                errors += 1
+    wall = time.perf_counter() - start
+    done.set()
+    prober.join()
+
+    return {
+        "wall_s": wall,
+        "routes_per_s": routes / wall,
+        "route_p50": percentile(route_latencies, 50),
+        "route_p95": percentile(route_latencies, 95),
+        "health_p50": percentile(health_latencies, 50),
+        "health_p95": percentile(health_latencies, 95),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compara workers sync y gevent')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--routes', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--modes', default='sync,gevent')
+    args = parser.parse_args()
+
+    results = {}
+    with StubServer(latency=args.latency) as stub, tempfile.TemporaryDirectory() as tmp:
+        for offset, mode in enumerate(args.modes.split(',')):
+            port = 5600 + offset
+            base_url = f"http://127.0.0.1:{port}"
+            proc = start_backend(mode, args.workers, port, stub, os.path.join(tmp, f'{mode}.db'))
+            try:
+                wait_ready(base_url)
+                results[mode] = run_scenario(base_url, args.routes, args.concurrency)
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+
+    print(f"\n{args.routes} rutas, {args.concurrency} clientes, {args.workers} workers, "
+          f"latencia upstream {args.latency}s")
+    print(f"{'modo':<8}{'total s':>9}{'rutas/s':>9}{'ruta p50':>10}{'ruta p95':>10}"
+          f"{'health p50':>12}{'health p95':>12}{'errores':>9}")
+    for mode, r in results.items():
+        print(f"{mode:<8}{r['wall_s']:>9.2f}{r['routes_per_s']:>9.1f}{r['route_p50']:>10.2f}"
+              f"{r['route_p95']:>10.2f}{r['health_p50'] * 1000:>10.1f}ms"
+              f"{r['health_p95'] * 1000:>10.1f}ms{r['errors']:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Utilidades compartidas por los benchmarks"""
+import os
+import subprocess
+import sys
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values):
+    """p50/p95/p99 y media de una lista de duraciones en segundos"""
+    return {
+        "n": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+    }
+
+
+def wait_ready(base_url, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/api/health", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"El backend no respondió en {base_url}")
+
+
+def start_backend(mode, workers, port, stub, db_file, extra_env=None):
+    """Arrancar gunicorn apuntando al stub y a una base de datos propia"""
+    env = dict(os.environ)
+    env.update(stub.backend_env())
+    env.update({
+        'ZETA_WORKER_CLASS': mode,
+        'WEB_CONCURRENCY': str(workers),
+        'PORT': str(port),
+        'ZETA_DB_FILE': db_file,
+        'ZETA_LOG_LEVEL': 'warning',
+        # Todo el tráfico del bench sale de una sola IP
+        'ZETA_RATELIMIT': '0',
+    })
+    env.update(extra_env or {})
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'backend:app'],
+        cwd=ROOT, env=env
+    )
@@ -0,0 +1,131 @@
+"""
+Filtro de contenido: patrón compilado contra las 8 expresiones originales
+
+Mide:
+
+- equivalencia: SPAM_FILTER.match y check_many contra re.search de cada
+  patrón original con re.IGNORECASE, sobre textos aleatorios armados con
+  las palabras de las reglas, mayúsculas, saltos de línea y las letras
+  que re.IGNORECASE trata aparte (İ ı ſ K Σ ς)
+- throughput en un corpus grande de reportes y reseñas (bench.datagen)
+  con una parte de spam: textos/s y MB/s
+- textos adversarios de largo creciente ("click " repetido sin cierre):
+  las expresiones originales crecen cuadrático
+
+Uso:
+    python -m bench.content_filter --texts 200000
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+
+from bench.common import ROOT
+from bench.datagen import REPORT_TEMPLATES, REVIEW_TEMPLATES, STREETS
+
+ORIGINAL_PATTERNS = [
+    r'https?://',
+    r'www\.',
+    r'\b(viagra|casino|lottery|prize|winner|congratulations)\b',
+    r'[A-Z]{15,}',
+    r'(.)\1{7,}',
+    r'\$\$\$',
+    r'!!!{5,}',
+    r'\b(click|here|now)\b.*\b(buy|win|free)\b'
+]
+PIECES = ['viagra', 'casino', 'lottery', 'prize', 'winner', 'congratulations', 'click', 'here',
+          'now', 'buy', 'win', 'free', 'http', 'https', '://', 'www', '.', '$', '!', ' ', ' ', '\n',
+          '_', '9', 'a', 'A', 'é', 'Ñ', 'İ', 'ı', 'ſ', 'K', 'Σ', 'ς', 'σ', 'I', 'S', 'k',
+          'ABCDEFG', 'HIJKLMN', 'aaaa', 'AAAA', 'iiii', 'ıııı', 'İİİİ', 'ſſſſ', 'ssss', '!!!', 'choque']
+
+
+def original_match(text):
+    """validate_text tal como estaba: un re.search por patrón"""
+    return any(re.search(pattern, text, re.IGNORECASE) for pattern in ORIGINAL_PATTERNS)
+
+
+FILLER = ['choque ', 'en la ', 'calle ', 'hay ', 'tráfico ', 'patrulla ', 'mucho ', 'ahorita ', 'Av. ', '10 ']
+
+
+def fuzz_text(rnd):
+    # Pocas piezas de las reglas entre palabras comunes: la mitad queda limpia
+    text = ''.join(rnd.choice(PIECES) if rnd.random() < 0.15 else rnd.choice(FILLER)
+                   for _ in range(rnd.randint(1, 40)))
+    return text.upper() if rnd.random() < 0.2 else text
+
+
+def corpus(rnd, n, spam_share=0.05):
+    spam = ['Congratulations! You are a WINNER, click here', 'Visita www.ofertas.mx', 'GANAAAAAAAA dinero $$$',
+            'click aquí para buy ya', 'Info en https://bit.ly/x', 'INCREIBLEOFERTAHOY solo hoy']
+    texts = []
+    for _ in range(n):
+        if rnd.random() < spam_share:
+            texts.append(rnd.choice(spam))
+        elif rnd.random() < 0.5:
+            texts.append(rnd.choice(REPORT_TEMPLATES).format(street=rnd.choice(STREETS)))
+        else:
+            texts.append(rnd.choice(REVIEW_TEMPLATES))
+    return texts
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Filtro de contenido compilado')
+    parser.add_argument('--texts', type=int, default=200000)
+    parser.add_argument('--fuzz', type=int, default=100000)
+    parser.add_argument('--json', default=None)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from content_filter import SPAM_FILTER
+
+    rnd = random.Random(45)
+    fuzz = [fuzz_text(rnd) for _ in range(args.fuzz)]
+    expected = [original_match(text) for text in fuzz]
+    single = sum((SPAM_FILTER.match(text) is not None) != e for text, e in zip(fuzz, expected))
+    bulk = sum((rule is not None) != e for rule, e in zip(SPAM_FILTER.check_many(fuzz), expected))
+
+    texts = corpus(rnd, args.texts)
+    megabytes = sum(len(t.encode('utf-8')) for t in texts) / 1e6
+    original_seconds, original_flags = timed(lambda: [original_match(t) for t in texts])
+    match_seconds, match_flags = timed(lambda: [SPAM_FILTER.match(t) for t in texts])
+    bulk_seconds, bulk_flags = timed(lambda: SPAM_FILTER.check_many(texts))
+    assert [f is not None for f in match_flags] == original_flags == [f is not None for f in bulk_flags]
+
+    adversarial = []
+    for length in (1000, 4000, 16000, 32000):
+        text = ("click " * (length // 6 + 1))[:length]
+        original, _ = timed(lambda: original_match(text))
+        compiled, _ = timed(lambda: SPAM_FILTER.match(text))
+        adversarial.append({"chars": length, "original": original, "compiled": compiled})
+
+    results = {
+        "fuzz": len(fuzz), "fuzz_flagged": sum(expected), "mismatches_match": single, "mismatches_bulk": bulk,
+        "corpus": {"texts": len(texts), "megabytes": megabytes, "flagged": sum(original_flags),
+                   "original_seconds": original_seconds, "match_seconds": match_seconds,
+                   "bulk_seconds": bulk_seconds},
+        "adversarial": adversarial,
+    }
+    print(f"Equivalencia: {single} diferencias (match) y {bulk} (check_many) en {len(fuzz)} textos "
+          f"({sum(expected)} marcados por las expresiones originales)")
+    print(f"Corpus: {len(texts)} textos, {megabytes:.1f} MB, {sum(original_flags)} marcados")
+    for label, seconds in (('8 re.search', original_seconds), ('match()', match_seconds),
+                           ('check_many()', bulk_seconds)):
+        print(f"  {label:13s} {seconds:6.2f} s  {len(texts) / seconds:9,.0f} textos/s  {megabytes / seconds:5.1f} MB/s")
+    for item in adversarial:
+        print(f"Adversario {item['chars']:6d} caracteres: originales {item['original'] * 1000:8.1f} ms | "
+              f"compilado {item['compiled'] * 1000:6.2f} ms")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
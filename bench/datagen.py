@@ -0,0 +1,323 @@
+"""
+Generador de datos sintéticos para benchmarks
+
+Llena una base SQLite con usuarios, reportes, zonas de riesgo, desastres,
+lugares y reseñas repartidos en la caja de Chihuahua. Con la misma semilla
+se obtiene siempre la misma base.
+
+Uso:
+    python -m bench.datagen --db bench.db --users 2000 --reports 20000 \\
+        --zones 300 --places 1500 --reviews 20000
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from io import BytesIO
+
+# Caja de Chihuahua (ciudad)
+LAT_MIN, LAT_MAX = 28.55, 28.75
+LON_MIN, LON_MAX = -106.20, -105.98
+
+CATEGORIES = ['security', 'traffic', 'infrastructure', 'general']
+SEVERITIES = ['low', 'medium', 'high']
+ZONE_LEVELS = ['low', 'medium', 'high', 'critical']
+PLACE_TYPES = ['Restaurante', 'Museo/Cultura', 'Centro Comercial', 'Recreación', 'Cafetería']
+DISASTER_TYPES = ['flood', 'fire', 'earthquake', 'storm', 'landslide']
+
+REPORT_TEMPLATES = [
+    "Asalto a mano armada cerca de la parada del camión en {street}",
+    "Choque entre dos vehículos sobre {street}, hay patrulla en el lugar",
+    "Robo de autopartes reportado por vecinos en {street} durante la noche",
+    "Bache enorme en {street}, varios carros se han ponchado hoy",
+    "Bloqueo por manifestación en {street}, tráfico detenido en ambos sentidos",
+    "Incendio de pastizal junto a {street}, bomberos trabajando en la zona",
+    "Semáforo descompuesto en el cruce de {street}, mucho peligro para peatones",
+    "Inundación en el paso a desnivel de {street} después de la lluvia",
+]
+REVIEW_TEMPLATES = [
+    "Muy buena atención y la comida llegó rápido, volvería sin dudarlo",
+    "El lugar está limpio y el personal es amable, precios razonables",
+    "Tuvimos que esperar bastante pero valió la pena por el sabor",
+    "Excelente ambiente para ir en familia, recomendable los fines de semana",
+    "No me gustó el servicio, la mesa estaba sucia y tardaron mucho",
+]
+STREETS = ['Av. Universidad', 'Av. Independencia', 'Calle 10a', 'Blvd. Ortiz Mena',
+           'Av. Tecnológico', 'Calle Aldama', 'Av. Juárez', 'Periférico de la Juventud',
+           'Av. Division del Norte', 'Calle Victoria', 'Av. Pacheco', 'Blvd. Fuentes Mares']
+
+
+def _point(rnd, hotspots):
+    """70% de los puntos alrededor de hotspots, el resto uniforme"""
+    if hotspots and rnd.random() < 0.7:
+        lat, lon = rnd.choice(hotspots)
+        return (min(LAT_MAX, max(LAT_MIN, rnd.gauss(lat, 0.006))),
+                min(LON_MAX, max(LON_MIN, rnd.gauss(lon, 0.006))))
+    return rnd.uniform(LAT_MIN, LAT_MAX), rnd.uniform(LON_MIN, LON_MAX)
+
+
+def sample_image(size=(1600, 1200), seed=0):
+    """Imagen JPEG base64 con gradiente y ruido (tamaño de foto de celular)"""
+    from PIL import Image
+
+    rnd = random.Random(seed)
+    width, height = size
+    pixels = bytes(
+        (x * 255 // width + rnd.randint(0, 40)) % 256
+        for y in range(0, height, 8) for x in range(0, width, 8) for _ in range(3)
+    )
+    small = Image.frombytes('RGB', (len(range(0, width, 8)), len(range(0, height, 8))), pixels)
+    img = small.resize(size)
+    out = BytesIO()
+    img.save(out, format='JPEG', quality=90)
+    return 'data:image/jpeg;base64,' + base64.b64encode(out.getvalue()).decode()
+
+
+def _stamp(dt):
+    return dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def generate(db_file, users=1000, reports=10000, zones=200, places=1000, reviews=10000,
+             disasters=10, image_ratio=0.1, seed=42):
+    """Crear el esquema (vía backend) y poblar la base"""
+    os.environ['ZETA_DB_FILE'] = db_file
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import backend
+    backend.setup()  # crea el esquema en db_file
+
+    rnd = random.Random(seed)
+    now = datetime.now()
+    hotspots = [(rnd.uniform(LAT_MIN, LAT_MAX), rnd.uniform(LON_MIN, LON_MAX)) for _ in range(15)]
+    image = sample_image(size=(320, 240), seed=seed) if image_ratio else None
+
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+
+    user_ids = [f"user_bench_{i}" for i in range(users)]
+    cursor.executemany('''
+        INSERT OR IGNORE INTO users (id, email, name, photo, phone, created_at, reports_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (uid, f"{uid}@bench.zeta", f"Usuario {i}",
+         image if image and rnd.random() < image_ratio else '',
+         '', _stamp(now - timedelta(days=rnd.randint(0, 365))), 0)
+        for i, uid in enumerate(user_ids)
+    ])
+
+    report_rows = []
+    for i in range(reports):
+        lat, lon = _point(rnd, hotspots)
+        verified = rnd.random() < 0.6
+        status = 'active' if verified else rnd.choice(['pending', 'pending', 'rejected'])
+        created = now - timedelta(seconds=rnd.randint(0, 30 * 86400))
+        images = [image] if image and rnd.random() < image_ratio else []
+        report_rows.append((
+            f"report_bench_{i}", rnd.choice(user_ids) if user_ids else None,
+            rnd.choice(REPORT_TEMPLATES).format(street=rnd.choice(STREETS)),
+            rnd.choice(CATEGORIES), rnd.choice(SEVERITIES), lat, lon,
+            f"{rnd.choice(STREETS)}, Chihuahua", json.dumps(images), _stamp(created),
+            int(verified), status, rnd.randint(0, 30), rnd.randint(0, 5)
+        ))
+    cursor.executemany('''
+        INSERT OR IGNORE INTO reports
+        (id, user_id, description, category, severity, lat, lon, address, images,
+         created_at, verified, status, upvotes, downvotes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', report_rows)
+
+    zone_rows = []
+    for i in range(zones):
+        lat, lon = _point(rnd, hotspots)
+        level = rnd.choice(ZONE_LEVELS)
+        expires = None if rnd.random() < 0.3 else _stamp(now + timedelta(hours=rnd.randint(-48, 72)))
+        zone_rows.append((
+            f"zone_bench_{i}", f"Zona {i}", lat, lon, round(rnd.uniform(0.3, 1.5), 2),
+            level, rnd.choice(['incident', 'historic']), '#ef4444', expires, 'bench'
+        ))
+    cursor.executemany('''
+        INSERT OR IGNORE INTO risk_zones
+        (id, name, lat, lon, radius_km, level, type, color, expires_at, source)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', zone_rows)
+
+    cursor.executemany('''
+        INSERT OR IGNORE INTO natural_disasters
+        (id, type, lat, lon, radius_km, severity, description, expires_at, source)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'bench')
+    ''', [
+        (f"disaster_bench_{i}", rnd.choice(DISASTER_TYPES), *_point(rnd, hotspots), 2.0,
+         rnd.choice(SEVERITIES), "Evento sintético de benchmark",
+         _stamp(now + timedelta(hours=rnd.randint(-24, 48))))
+        for i in range(disasters)
+    ])
+
+    place_ids = [f"p_bench_{i}" for i in range(places)]
+    cursor.executemany('''
+        INSERT OR IGNORE INTO places
+        (id, name, type, lat, lon, address, phone, description, rating, total_reviews, price_level)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (pid, f"{rnd.choice(['La', 'El', 'Los'])} {rnd.choice(['Fogón', 'Rincón', 'Patio', 'Mirador', 'Portal'])} {i}",
+         rnd.choice(PLACE_TYPES), *_point(rnd, hotspots), f"{rnd.choice(STREETS)} {rnd.randint(100, 9999)}",
+         '', "Lugar sintético generado para benchmarks", round(rnd.uniform(3.0, 5.0), 1),
+         rnd.randint(0, 3000), rnd.randint(1, 4))
+        for i, pid in enumerate(place_ids)
+    ])
+
+    if place_ids and user_ids:
+        cursor.executemany('''
+            INSERT OR IGNORE INTO reviews (id, place_id, user_id, rating, comment, images, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (f"review_bench_{i}", rnd.choice(place_ids), rnd.choice(user_ids), rnd.randint(1, 5),
+             rnd.choice(REVIEW_TEMPLATES),
+             json.dumps([image] if image and rnd.random() < image_ratio else []),
+             _stamp(now - timedelta(days=rnd.randint(0, 365))))
+            for i in range(reviews)
+        ])
+
+    conn.commit()
+    conn.close()
+
+
+# Extracto OSM sintético para gazetteer.py: cuadrícula de calles con
+# tramos, colonias rectangulares, números exteriores y puntos de interés
+STREET_NAMES = [
+    'Avenida Universidad', 'Avenida Independencia', 'Calle 10a', 'Bulevar Ortiz Mena',
+    'Avenida Tecnológico', 'Calle Aldama', 'Avenida Juárez', 'Periférico de la Juventud',
+    'Avenida División del Norte', 'Calle Victoria', 'Avenida Pacheco', 'Bulevar Fuentes Mares',
+    'Calle Morelos', 'Calle Hidalgo', 'Calle Allende', 'Calle Guerrero', 'Calle Ocampo',
+    'Calle Francisco Zarco', 'Calle Mina', 'Calle Simón Bolívar', 'Avenida Niños Héroes',
+    'Calle Cuauhtémoc', 'Avenida Zaragoza', 'Calle Libertad', 'Calle Escorza',
+    'Avenida Venustiano Carranza', 'Calle Coronado', 'Bulevar Díaz Ordaz', 'Calle Ángel Trías',
+    'Avenida Colón', 'Calle Jiménez', 'Calle Ojinaga', 'Calle Rosales', 'Avenida Madero',
+    'Calle Abasolo', 'Calle Terrazas', 'Avenida Teófilo Borunda', 'Calle Doctor Belisario Domínguez',
+    'Avenida Mirador', 'Calle Río Conchos', 'Calle Pascual Orozco', 'Avenida Vallarta',
+    'Calle Ramírez', 'Calle Vicente Guerrero', 'Privada de Jesús', 'Avenida de las Américas',
+    'Calle Santa Rita', 'Avenida Cantera', 'Calle Nogales', 'Bulevar Antonio Ortiz Mena Sur',
+]
+COLONIA_NAMES = [
+    'Centro', 'San Felipe', 'Campestre', 'Cerro de la Cruz', 'Santa Rosa', 'Las Granjas',
+    'Obrera', 'Dale', 'Altavista', 'Quintas del Sol', 'Magisterial', 'Panamericana',
+    'Mirador', 'Lomas del Santuario', 'Pacífico', 'Villa Juárez', 'Revolución', 'Cuauhtémoc',
+    'Santo Niño', 'Zarco', 'Bellavista', 'Rosario', 'Nombre de Dios', 'Industrial',
+]
+LANDMARK_NAMES = [
+    'Plaza de Armas', 'Catedral de Chihuahua', 'Museo Casa Chihuahua', 'Quinta Gameros',
+    'Palacio de Gobierno', 'Museo de la Revolución Mexicana', 'Hospital General',
+    'Estadio Olímpico Universitario', 'Parque El Palomar', 'Central Camionera',
+    'Fashion Mall', 'Plaza del Sol', 'Aeropuerto Internacional', 'Teatro de los Héroes',
+    'Museo Semilla', 'Hospital Ángeles', 'Mercado Juárez', 'Universidad Autónoma de Chihuahua',
+]
+
+
+def generate_extract(path, step=0.004, colonia_step=0.02, address_step=0.0004, seed=42):
+    """Escribir un GeoJSON secuencial con la forma de `osmium export`; devuelve conteos"""
+    rnd = random.Random(seed)
+    names = STREET_NAMES + [f"Calle {n}a" for n in range(1, 40) if n != 10] + \
+        [f"Calle {w} {n}" for w in ('Rivera', 'Norte', 'Poniente') for n in range(1, 30)]
+    rnd.shuffle(names)
+    names = iter(names * 4)
+    counts = {'street_ways': 0, 'streets': 0, 'colonias': 0, 'addresses': 0, 'landmarks': 0}
+
+    def feature(geometry, **props):
+        return json.dumps({'type': 'Feature', 'id': f"w{rnd.getrandbits(40)}",
+                           'geometry': geometry, 'properties': props}, ensure_ascii=False)
+
+    with open(path, 'w', encoding='utf-8') as out:
+        lines = []
+        lat = LAT_MIN + step / 2
+        while lat < LAT_MAX:
+            lines.append(('h', lat))
+            lat += step
+        lon = LON_MIN + step / 2
+        while lon < LON_MAX:
+            lines.append(('v', lon))
+            lon += step
+
+        seen = set()
+        for orientation, fixed in lines:
+            name = next(names)
+            while name in seen:
+                name = next(names)
+            seen.add(name)
+            counts['streets'] += 1
+            start, end = (LON_MIN, LON_MAX) if orientation == 'h' else (LAT_MIN, LAT_MAX)
+            highway = 'primary' if name.startswith(('Avenida', 'Bulevar')) else 'residential'
+            # Tramos de ~2 cuadras con vértices cada 0.001°
+            vertices = [start + i * 0.001 for i in range(int((end - start) / 0.001) + 1)]
+            for i in range(0, len(vertices) - 1, 8):
+                chunk = vertices[i:i + 9]
+                coords = [[v, fixed] if orientation == 'h' else [fixed, v] for v in chunk]
+                out.write(feature({'type': 'LineString', 'coordinates': coords},
+                                  name=name, highway=highway) + '\n')
+                counts['street_ways'] += 1
+            # Números exteriores: pares de un lado, nones del otro, 100 por cuadra
+            k = 0
+            pos = start
+            while pos < end:
+                number = 100 + k * int(100 * address_step / step) * 2
+                offset = 0.00008
+                for side, n in ((offset, number), (-offset, number + 1)):
+                    point = [pos, fixed + side] if orientation == 'h' else [fixed + side, pos]
+                    out.write(feature({'type': 'Point', 'coordinates': point},
+                                      **{'addr:housenumber': str(n), 'addr:street': name}) + '\n')
+                    counts['addresses'] += 1
+                pos += address_step
+                k += 1
+
+        colonia_names = iter(COLONIA_NAMES + [f"{a} {b}" for a in ('Villa', 'Lomas de', 'Jardines de', 'Fraccionamiento')
+                                              for b in ('Oriente', 'Poniente', 'Norte', 'Sur', 'Alamedas', 'San Jorge',
+                                                        'Los Pinos', 'El Saucito', 'Las Águilas')])
+        lat = LAT_MIN
+        while lat < LAT_MAX - 1e-9:
+            lon = LON_MIN
+            while lon < LON_MAX - 1e-9:
+                ring = [[lon, lat], [lon + colonia_step, lat], [lon + colonia_step, lat + colonia_step],
+                        [lon, lat + colonia_step], [lon, lat]]
+                name = next(colonia_names, None) or f"Colonia {counts['colonias']}"
+                out.write(feature({'type': 'Polygon', 'coordinates': [ring]},
+                                  name=name, place='neighbourhood') + '\n')
+                counts['colonias'] += 1
+                lon += colonia_step
+            lat += colonia_step
+
+        for name in LANDMARK_NAMES:
+            point = [rnd.uniform(LON_MIN, LON_MAX), rnd.uniform(LAT_MIN, LAT_MAX)]
+            out.write(feature({'type': 'Point', 'coordinates': point}, name=name, amenity='yes') + '\n')
+            counts['landmarks'] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generar base de datos sintética')
+    parser.add_argument('--db', default='bench.db')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--reports', type=int, default=10000)
+    parser.add_argument('--zones', type=int, default=200)
+    parser.add_argument('--places', type=int, default=1000)
+    parser.add_argument('--reviews', type=int, default=10000)
+    parser.add_argument('--disasters', type=int, default=10)
+    parser.add_argument('--image-ratio', type=float, default=0.1,
+                        help='fracción de filas con imagen adjunta')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--extract', default=None,
+                        help='además, escribir un extracto OSM sintético (GeoJSON secuencial)')
+    args = parser.parse_args()
+
+    if args.extract:
+        print(f"Extracto {args.extract}: {generate_extract(args.extract, seed=args.seed)}")
+
+    start = time.perf_counter()
+    generate(args.db, args.users, args.reports, args.zones, args.places, args.reviews,
+             args.disasters, args.image_ratio, args.seed)
+    print(f"Base {args.db} generada en {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
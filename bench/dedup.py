@@ -0,0 +1,212 @@
+"""
+Duplicados al enviar: LSH contra comparar con todos los reportes recientes
+
+Simula un flujo de envíos en las mismas horas: incidentes con varias
+versiones parafraseadas del mismo reporte (±200 m) mezclados con reportes
+sueltos; un 30% usa la versión corta de la plantilla ("Choque en
+{calle}"). Con --colocated, una parte de los incidentes ocurre en el mismo
+punto y la misma calle que uno anterior pero es de otra categoría (un
+asalto junto a un bache): la calle hace que el texto se parezca y no deben
+enlazarse. Para cada envío mide:
+
+- dedup.find_duplicate (bloque geohash + cubetas + bandas LSH)
+- fuerza bruta: leer de SQLite los reportes canónicos de las mismas horas
+  y calcular el Jaccard exacto de 4-gramas contra cada uno (lo que habría
+  que hacer sin índice)
+
+y compara lo que cada uno marca como duplicado con el incidente real.
+
+Uso:
+    python -m bench.dedup --db bench.db --submissions 5000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from bench.common import ROOT, summarize
+from bench.datagen import LAT_MAX, LAT_MIN, LON_MAX, LON_MIN, REPORT_TEMPLATES, SEVERITIES, STREETS, generate
+
+# Categoría de cada plantilla de bench.datagen, en el mismo orden, y su
+# versión corta: en ésas la calle es casi todo el texto
+TEMPLATE_CATEGORIES = ['security', 'traffic', 'security', 'infrastructure',
+                       'traffic', 'general', 'infrastructure', 'general']
+SHORT_TEMPLATES = [
+    "Asalto a mano armada en {street}", "Choque en {street}", "Robo de autopartes en {street}",
+    "Bache enorme en {street}", "Bloqueo en {street}", "Incendio en {street}",
+    "Semáforo descompuesto en {street}", "Inundación en {street}",
+]
+
+SYNONYMS = {'vehículos': 'carros', 'sobre': 'en', 'cerca de': 'junto a', 'reportado': 'visto',
+            'enorme': 'muy grande', 'hoy': 'esta mañana', 'lugar': 'sitio', 'mucho': 'bastante'}
+PREFIXES = ['', '', 'Urgente: ', 'Ojo, ', 'Cuidado, ']
+SUFFIXES = ['', '', ' ahorita', ' hace 10 minutos', ' tengan cuidado']
+
+
+def paraphrase(rnd, text):
+    for word, other in SYNONYMS.items():
+        if word in text and rnd.random() < 0.5:
+            text = text.replace(word, other)
+    words = text.split()
+    for _ in range(rnd.randint(0, 2)):
+        if len(words) > 6:
+            del words[rnd.randrange(len(words))]
+    if rnd.random() < 0.3:
+        i = rnd.randrange(len(words))
+        if len(words[i]) > 3:
+            j = rnd.randrange(len(words[i]) - 1)
+            w = words[i]
+            words[i] = w[:j] + w[j + 1] + w[j] + w[j + 2:]
+    return rnd.choice(PREFIXES) + ' '.join(words) + rnd.choice(SUFFIXES)
+
+
+def stream(rnd, submissions, incident_share=0.5, colocated=0.2, short=0.3):
+    """[(incidente, texto, lat, lon, categoría, severidad)] en orden de llegada"""
+    items, incident, places = [], 0, []
+    while len(items) < submissions:
+        template = rnd.randrange(len(REPORT_TEMPLATES))
+        if places and rnd.random() < colocated:
+            # Otro incidente en el mismo punto y la misma calle, de otra categoría
+            street, lat, lon, category = rnd.choice(places)
+            template = rnd.choice([i for i, other in enumerate(TEMPLATE_CATEGORIES) if other != category])
+        else:
+            street = rnd.choice(STREETS)
+            lat, lon = rnd.uniform(LAT_MIN, LAT_MAX), rnd.uniform(LON_MIN, LON_MAX)
+        templates = SHORT_TEMPLATES if rnd.random() < short else REPORT_TEMPLATES
+        base = templates[template].format(street=street)
+        category, severity = TEMPLATE_CATEGORIES[template], rnd.choice(SEVERITIES)
+        places.append((street, lat, lon, category))
+        size = rnd.randint(3, 15) if rnd.random() < incident_share else 1
+        for _ in range(size):
+            items.append((incident, paraphrase(rnd, base) if size > 1 else base,
+                          lat + rnd.gauss(0, 0.0012), lon + rnd.gauss(0, 0.0012), category, severity))
+        incident += 1
+    items = items[:submissions]
+    # Los reportes de un incidente llegan intercalados con los demás
+    rnd.shuffle(items)
+    return items
+
+
+def brute_force(dedup, conn, since, lat, lon, text, category, severity):
+    """Leer los canónicos recientes y comparar el texto con cada uno"""
+    wanted = dedup.shingles(text)
+    best, best_score = None, 0.0
+    for report_id, r_lat, r_lon, description, r_severity in conn.execute('''
+        SELECT id, lat, lon, description, severity FROM reports
+        WHERE created_at >= ? AND status != 'rejected' AND duplicate_of IS NULL AND category = ?
+    ''', (since, category)):
+        if dedup.SEVERITY_RANK[r_severity] < dedup.SEVERITY_RANK[severity]:
+            continue
+        shingles = dedup.shingles(description)
+        union = len(wanted | shingles)
+        score = len(wanted & shingles) / union if union else 0.0
+        if (score >= dedup.DUPLICATE_SIMILARITY and score > best_score
+                and dedup._distance_km(lat, lon, r_lat, r_lon) <= dedup.DUPLICATE_RADIUS_KM):
+            best, best_score = report_id, score
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Detección de duplicados con LSH')
+    parser.add_argument('--db', default=None)
+    parser.add_argument('--submissions', type=int, default=5000)
+    parser.add_argument('--colocated', type=float, default=0.2,
+                        help='fracción de incidentes en el mismo punto que otro, de otra categoría')
+    parser.add_argument('--brute-sample', type=int, default=500, help='envíos comparados también por fuerza bruta')
+    parser.add_argument('--json', default=None)
+    args = parser.parse_args()
+
+    source = args.db or os.path.join(ROOT, 'bench_micro.db')
+    if not os.path.exists(source):
+        generate(source)
+    sys.path.insert(0, ROOT)
+    import dedup
+    import migrations
+
+    rnd = random.Random(3)
+    items = stream(rnd, args.submissions, colocated=args.colocated)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'dedup.db')
+        shutil.copy(source, db_file)
+        conn = sqlite3.connect(db_file)
+        migrations.migrate(conn)
+        cursor = conn.cursor()
+        # Solo el flujo simulado: sin los reportes recientes de la base
+        cursor.execute("DELETE FROM report_lsh")
+        cursor.execute("DELETE FROM report_signatures")
+        now = time.time()
+        since = datetime.fromtimestamp((dedup.time_bucket(now) - 1) * dedup.WINDOW_SECONDS)
+
+        lsh_times, brute_times = [], []
+        canonical_incident = {}
+        lsh_links, brute_links, agree, compared = [], [], 0, 0
+        step = max(1, len(items) // args.brute_sample)
+        canonical_category = {}
+        cross_category = 0
+        for n, (incident, text, lat, lon, category, severity) in enumerate(items):
+            report_id = f"report_dedup_{n}"
+            start = time.perf_counter()
+            sig = dedup.signature(text)
+            duplicate_of, _ = dedup.find_duplicate(cursor, lat, lon, sig, category, severity, now=now)
+            lsh_times.append(time.perf_counter() - start)
+
+            expected = None
+            if n % step == 0:
+                start = time.perf_counter()
+                expected = brute_force(dedup, conn, since, lat, lon, text, category, severity)
+                brute_times.append(time.perf_counter() - start)
+                agree += (duplicate_of is None) == (expected is None)
+                compared += 1
+
+            cursor.execute('''
+                INSERT INTO reports (id, description, category, severity, lat, lon, created_at, status, duplicate_of)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (report_id, text, category, severity, lat, lon, datetime.fromtimestamp(now),
+                  'duplicate' if duplicate_of else 'pending', duplicate_of))
+            if duplicate_of is None:
+                dedup.index(cursor, report_id, lat, lon, sig, now)
+                canonical_incident[report_id] = incident
+                canonical_category[report_id] = category
+            else:
+                lsh_links.append(canonical_incident[duplicate_of] == incident)
+                cross_category += canonical_category[duplicate_of] != category
+            if expected is not None:
+                brute_links.append(canonical_incident.get(expected) == incident)
+        conn.commit()
+        conn.close()
+
+    sizes = {}
+    for incident, *_ in items:
+        sizes[incident] = sizes.get(incident, 0) + 1
+    possible = sum(size - 1 for size in sizes.values())
+    lsh_stats, brute_stats = summarize(lsh_times), summarize(brute_times)
+    results = {
+        "submissions": len(items), "incidents": len(sizes), "possible_links": possible,
+        "lsh": {**lsh_stats, "links": len(lsh_links), "correct": sum(lsh_links),
+                "cross_category": cross_category},
+        "brute_force": {**brute_stats, "links": len(brute_links), "correct": sum(brute_links)},
+        "brute_sample": compared, "agreement": agree / compared,
+    }
+    print(f"{len(items)} envíos, {len(sizes)} incidentes ({args.colocated:.0%} junto a otro de otra categoría), "
+          f"{possible} duplicados reales")
+    precision = sum(lsh_links) / len(lsh_links) if lsh_links else 0.0
+    print(f"LSH          p50 {lsh_stats['p50'] * 1000:7.2f} ms  p95 {lsh_stats['p95'] * 1000:7.2f} ms  "
+          f"{len(lsh_links)} enlazados, precisión {precision:.1%}, recall {sum(lsh_links) / possible:.1%}, "
+          f"{cross_category} entre categorías")
+    precision = sum(brute_links) / len(brute_links) if brute_links else 0.0
+    print(f"Fuerza bruta p50 {brute_stats['p50'] * 1000:7.2f} ms  p95 {brute_stats['p95'] * 1000:7.2f} ms  "
+          f"({compared} envíos) precisión {precision:.1%}")
+    print(f"Misma decisión (duplicado o no) en {agree / compared:.1%} de los {compared} comparados")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""
+Precisión y latencia del gazetteer local (gazetteer.py)
+
+Genera un extracto OSM sintético (bench.datagen.generate_extract), lo
+importa en una base temporal y mide:
+
+- Directa: direcciones como las escribiría un usuario (abreviaturas, sin
+  acentos, con un error de dedo y con número exterior). Es correcta si
+  resuelve el nombre esperado y, con número, cae a menos de 100 m del punto.
+- Inversa: puntos al azar; la calle y la colonia del STR-tree se comparan
+  contra una búsqueda exhaustiva sobre todos los tramos y polígonos.
+- Backfill: direcciones de reportes sintéticos por lote.
+
+Uso:
+    python -m bench.geocoder --queries 2000 --points 5000
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import unicodedata
+
+from bench.common import ROOT, summarize
+from bench.datagen import LAT_MAX, LAT_MIN, LON_MAX, LON_MIN, generate_extract
+
+ABBREVIATE = {'Avenida': 'Av.', 'Bulevar': 'Blvd.', 'Calle': 'C.', 'Privada': 'Priv.'}
+
+
+def _strip_accents(text):
+    return ''.join(ch for ch in unicodedata.normalize('NFKD', text) if not unicodedata.combining(ch))
+
+
+def _typo(rnd, text):
+    """Un error de dedo en la palabra más larga: cambio, omisión o transposición"""
+    words = text.split()
+    i = max(range(len(words)), key=lambda k: len(words[k]))
+    word = words[i]
+    if len(word) < 5 or not word.isalpha():
+        return text
+    pos = rnd.randint(1, len(word) - 2)
+    op = rnd.choice(['swap', 'drop', 'replace'])
+    if op == 'swap':
+        word = word[:pos] + word[pos + 1] + word[pos] + word[pos + 2:]
+    elif op == 'drop':
+        word = word[:pos] + word[pos + 1:]
+    else:
+        word = word[:pos] + rnd.choice('aeiourslnc') + word[pos + 1:]
+    words[i] = word
+    return ' '.join(words)
+
+
+def user_variant(rnd, name):
+    words = name.split()
+    if words[0] in ABBREVIATE and rnd.random() < 0.6:
+        words[0] = ABBREVIATE[words[0]]
+    elif words[0] in ABBREVIATE and rnd.random() < 0.5:
+        words = words[1:]
+    text = ' '.join(words)
+    if rnd.random() < 0.5:
+        text = _strip_accents(text)
+    if rnd.random() < 0.5:
+        text = text.lower()
+    if rnd.random() < 0.3:
+        text = _typo(rnd, text)
+    return text
+
+
+def _meters(a, b):
+    dlat = (a[0] - b[0]) * 111320
+    dlon = (a[1] - b[1]) * 111320 * math.cos(math.radians(a[0]))
+    return math.hypot(dlat, dlon)
+
+
+def build_queries(conn, n, seed=7):
+    rnd = random.Random(seed)
+    streets = [r[0] for r in conn.execute("SELECT DISTINCT name FROM gazetteer_features WHERE kind = 'street'")]
+    landmarks = [r[0] for r in conn.execute("SELECT name FROM gazetteer_features WHERE kind = 'landmark'")]
+    colonias = [r[0] for r in conn.execute("SELECT name FROM gazetteer_features WHERE kind = 'colonia'")]
+    addresses = conn.execute("SELECT street, number, lat, lon FROM gazetteer_addresses").fetchall()
+
+    queries = []
+    for _ in range(n):
+        roll = rnd.random()
+        if roll < 0.5:
+            street, number, lat, lon = rnd.choice(addresses)
+            sep = rnd.choice([' ', ' #', ' No. '])
+            queries.append((user_variant(rnd, street) + sep + number, street, (lat, lon)))
+        elif roll < 0.75:
+            name = rnd.choice(streets)
+            queries.append((user_variant(rnd, name), name, None))
+        elif roll < 0.9:
+            name = rnd.choice(landmarks)
+            queries.append((user_variant(rnd, name), name, None))
+        else:
+            name = rnd.choice(colonias)
+            queries.append((rnd.choice(['Col. ', 'colonia ', '']) + user_variant(rnd, name), name, None))
+    return queries
+
+
+def brute_force_reverse(index, lat, lon, gazetteer):
+    """Calle y colonia recorriendo todo, para validar el STR-tree"""
+    x, y = index.project(lat, lon)
+    best, best_distance = None, gazetteer.MAX_ROAD_METERS
+    for i in range(len(index)):
+        d = index._segment_distance(i, x, y)
+        if d < best_distance:
+            best, best_distance = i, d
+    road = index.names[index.seg_name[best]] if best is not None else None
+    colonia = next((name for name, polygon in index.colonias
+                    if gazetteer._in_polygon(lon, lat, polygon)), None)
+    return road, best_distance if best is not None else None, colonia
+
+
+def run_reverse(index, points, gazetteer, check=500):
+    durations, mismatches = [], 0
+    for i, (lat, lon) in enumerate(points):
+        start = time.perf_counter()
+        match = index.reverse(lat, lon)
+        durations.append(time.perf_counter() - start)
+        if i < check:
+            road, meters, colonia = brute_force_reverse(index, lat, lon, gazetteer)
+            got_meters = match.distance_m if match else None
+            # Empates de distancia entre tramos: basta con que la distancia coincida
+            same_road = (match.road if match else None) == road or (
+                meters is not None and got_meters is not None and abs(meters - got_meters) < 1e-6)
+            if not same_road or (match.colonia if match else None) != colonia:
+                mismatches += 1
+    return summarize(durations), mismatches, min(check, len(points))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del gazetteer local')
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--points', type=int, default=5000)
+    parser.add_argument('--json', default=None)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    import gazetteer
+    import migrations
+
+    with tempfile.TemporaryDirectory() as tmp:
+        extract = os.path.join(tmp, 'extract.geojsonseq')
+        db_file = os.path.join(tmp, 'gazetteer.db')
+        generate_extract(extract)
+        conn = sqlite3.connect(db_file)
+        migrations.migrate(conn)
+        start = time.perf_counter()
+        counts = gazetteer.import_extract(conn, extract)
+        import_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = gazetteer.load_index(conn)
+        load_seconds = time.perf_counter() - start
+
+        queries = build_queries(conn, args.queries)
+
+        start = time.perf_counter()
+        reverse_index = gazetteer.load_reverse_index(conn)
+        reverse_load_seconds = time.perf_counter() - start
+        rnd = random.Random(11)
+        points = [(rnd.uniform(LAT_MIN, LAT_MAX), rnd.uniform(LON_MIN, LON_MAX)) for _ in range(args.points)]
+        reverse_stats, reverse_mismatches, reverse_checked = run_reverse(reverse_index, points, gazetteer)
+
+        conn.executemany("INSERT INTO reports (id, description, category, severity, lat, lon, address) "
+                         "VALUES (?, 'Reporte importado', 'general', 'low', ?, ?, NULL)",
+                         [(f"import_{i}", lat, lon) for i, (lat, lon) in enumerate(points)])
+        conn.commit()
+        start = time.perf_counter()
+        backfill_seen, backfill_updated = gazetteer.backfill_report_addresses(conn, reverse_index)
+        backfill_seconds = time.perf_counter() - start
+        conn.close()
+
+    durations, resolved, correct, misses = [], 0, 0, []
+    for text, expected, point in queries:
+        start = time.perf_counter()
+        match = index.geocode(text)
+        durations.append(time.perf_counter() - start)
+        if match is None:
+            misses.append((text, expected, None))
+            continue
+        resolved += 1
+        ok = match.name == expected and (point is None or _meters(point, (match.lat, match.lon)) < 100)
+        correct += ok
+        if not ok:
+            misses.append((text, expected, match.name))
+
+    stats = summarize(durations)
+    results = {
+        "extract": counts, "import_seconds": import_seconds, "load_seconds": load_seconds,
+        "queries": len(queries), "resolved": resolved, "correct": correct, "latency": stats,
+        "reverse": {"load_seconds": reverse_load_seconds, "segments": len(reverse_index),
+                    "latency": reverse_stats, "checked": reverse_checked, "mismatches": reverse_mismatches},
+        "backfill": {"reports": backfill_seen, "updated": backfill_updated, "seconds": backfill_seconds},
+    }
+    print(f"Extracto: {counts}")
+    print(f"Importación {import_seconds:.2f}s, carga del índice {load_seconds * 1000:.0f} ms")
+    print(f"{len(queries)} consultas: {resolved / len(queries):.1%} resueltas, "
+          f"{correct / len(queries):.1%} correctas")
+    print(f"Latencia p50 {stats['p50'] * 1000:.3f} ms, p95 {stats['p95'] * 1000:.3f} ms, "
+          f"p99 {stats['p99'] * 1000:.3f} ms")
+    for text, expected, got in misses[:10]:
+        print(f"  fallo: {text!r} -> {got!r} (esperado {expected!r})")
+    print(f"\nInversa: {len(reverse_index)} tramos, carga {reverse_load_seconds * 1000:.0f} ms; "
+          f"p50 {reverse_stats['p50'] * 1e6:.0f} µs, p95 {reverse_stats['p95'] * 1e6:.0f} µs, "
+          f"p99 {reverse_stats['p99'] * 1e6:.0f} µs")
+    print(f"Contra búsqueda exhaustiva: {reverse_mismatches} diferencias en {reverse_checked} puntos")
+    print(f"Backfill: {backfill_updated} de {backfill_seen} reportes en {backfill_seconds:.2f}s "
+          f"({backfill_seen / backfill_seconds:,.0f} reportes/s)")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
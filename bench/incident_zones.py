@@ -0,0 +1,148 @@
+"""
+Zonas de incidentes: una zona por reporte contra zonas agrupadas
+
+Simula un día de reportes aprobados (severidad media o alta) concentrados
+en colonias conflictivas, en la caja de bench.datagen, y los aplica de dos
+formas sobre bases nuevas:
+
+- antes: un INSERT de una zona de 0.5 km por reporte (verify_report original)
+- ahora: incident_zones.add_reports en lotes de --batch (1 = un moderador
+  aprobando uno por uno)
+
+Mide zonas activas, costo por aprobación, zone_level_score (lo que
+recorren calculate_risk y cada punto de una ruta) y bytes de
+/api/zones/risk. Compara el nivel de zona en puntos de muestra: con las
+zonas agrupadas ningún punto puede bajar de nivel; se cuenta cuántos suben
+(área que cubre el círculo agrupado y ningún reporte).
+
+Uso:
+    python -m bench.incident_zones --reports 3000 --hotspots 20
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bench.common import ROOT, summarize
+from bench.datagen import LAT_MAX, LAT_MIN, LON_MAX, LON_MIN
+
+
+def approvals(rnd, n, hotspots, spread=0.004, scattered=0.2):
+    centers = [(rnd.uniform(LAT_MIN, LAT_MAX), rnd.uniform(LON_MIN, LON_MAX)) for _ in range(hotspots)]
+    reports = []
+    for i in range(n):
+        if rnd.random() < scattered:
+            lat, lon = rnd.uniform(LAT_MIN, LAT_MAX), rnd.uniform(LON_MIN, LON_MAX)
+        else:
+            lat, lon = rnd.choice(centers)
+            lat, lon = rnd.gauss(lat, spread), rnd.gauss(lon, spread)
+        severity = 'high' if rnd.random() < 0.4 else 'medium'
+        reports.append((f'report_{i}', lat, lon, severity, f'Incidente {i} en la colonia'))
+    return centers, reports
+
+
+def load_state(conn, read_model):
+    rows = conn.execute('''
+        SELECT id, name, lat, lon, radius_km, level, type, color, description,
+               source, created_at, expires_at
+        FROM risk_zones WHERE active = 1
+    ''').fetchall()
+    return read_model.RiskState([read_model.ZoneRecord(row) for row in rows], [], [], 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Agrupación de zonas de incidentes')
+    parser.add_argument('--reports', type=int, default=3000)
+    parser.add_argument('--hotspots', type=int, default=20)
+    parser.add_argument('--batch', type=int, default=1)
+    parser.add_argument('--points', type=int, default=4000)
+    parser.add_argument('--json', default=None)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    import incident_zones
+    import migrations
+    import read_model
+
+    rnd = random.Random(48)
+    centers, reports = approvals(rnd, args.reports, args.hotspots)
+    start_ts = time.time() - 23 * 3600
+    step = 23 * 3600 / len(reports)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = sqlite3.connect(os.path.join(tmp, 'before.db'))
+        after = sqlite3.connect(os.path.join(tmp, 'after.db'))
+        for conn in (before, after):
+            migrations.migrate(conn)
+
+        start = time.perf_counter()
+        for i, (report_id, lat, lon, severity, description) in enumerate(reports):
+            now = datetime.fromtimestamp(start_ts + i * step)
+            before.execute('''
+                INSERT INTO risk_zones
+                (id, name, lat, lon, radius_km, level, type, color, expires_at, source)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (f'zone_{i}', description[:50], lat, lon, 0.5, severity, 'incident', '#ef4444',
+                  now + timedelta(hours=24), f'report_{report_id}'))
+            before.commit()
+        before_seconds = time.perf_counter() - start
+
+        counter = iter(range(len(reports)))
+        start = time.perf_counter()
+        for offset in range(0, len(reports), args.batch):
+            cursor = after.cursor()
+            incident_zones.add_reports(cursor, reports[offset:offset + args.batch],
+                                       lambda: f'zone_{next(counter)}', start_ts + offset * step)
+            after.commit()
+        after_seconds = time.perf_counter() - start
+
+        states = {'before': load_state(before, read_model), 'after': load_state(after, read_model)}
+        before.close()
+        after.close()
+
+    # Mitad de los puntos en las colonias, mitad en toda la caja
+    points = []
+    for i in range(args.points):
+        if i % 2:
+            lat, lon = rnd.choice(centers)
+            points.append((rnd.gauss(lat, 0.006), rnd.gauss(lon, 0.006)))
+        else:
+            points.append((rnd.uniform(LAT_MIN, LAT_MAX), rnd.uniform(LON_MIN, LON_MAX)))
+    now = time.time()
+    results = {"reports": len(reports), "hotspots": args.hotspots, "batch": args.batch}
+    levels = {}
+    for name, state in states.items():
+        durations, found = [], []
+        for lat, lon in points:
+            t0 = time.perf_counter()
+            found.append(state.zone_level_score(lat, lon, now, max_score=0))
+            durations.append(time.perf_counter() - t0)
+        levels[name] = found
+        zones = [zone.to_dict() for zone in state.active_zones(now)]
+        results[name] = {"zones": len(zones), "zone_level_score": summarize(durations),
+                         "zones_risk_bytes": len(json.dumps({"status": "success", "zones": zones}))}
+    results["before"]["seconds_per_approval"] = before_seconds / len(reports)
+    results["after"]["seconds_per_approval"] = after_seconds / len(reports)
+    results["lowered"] = sum(a < b for a, b in zip(levels['after'], levels['before']))
+    results["raised"] = sum(a > b for a, b in zip(levels['after'], levels['before']))
+    results["points"] = len(points)
+
+    print(f"{len(reports)} aprobaciones en {args.hotspots} colonias (lotes de {args.batch}):")
+    for name, label in (('before', 'una zona por reporte'), ('after', 'agrupadas')):
+        item = results[name]
+        print(f"  {label:20s} {item['zones']:5d} zonas | aprobación {item['seconds_per_approval'] * 1000:6.2f} ms | "
+              f"zone_level_score p50 {item['zone_level_score']['p50'] * 1e6:7.1f} µs "
+              f"p95 {item['zone_level_score']['p95'] * 1e6:7.1f} µs | /api/zones/risk {item['zones_risk_bytes']:,} B")
+    print(f"Nivel de zona en {len(points)} puntos: {results['lowered']} bajan, {results['raised']} suben")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
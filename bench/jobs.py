@@ -0,0 +1,166 @@
+"""
+Cola de trabajos: latencia de los endpoints con y sin trabajo diferido
+
+Con el test client de Flask sobre una copia de la base y el stub de
+Nominatim (bench.stubs) con --latency, mide:
+
+- submit_report (con --images fotos y sin calle en el gazetteer),
+  add_review (con --images fotos) y register (con foto):
+  antes = el request más sus trabajos corridos en línea (lo que hacía el
+  handler: Pillow y Nominatim dentro del request); ahora = solo el request,
+  que encola y responde 202
+- costo de la cola por trabajo: enqueue + claim + complete con un handler
+  vacío
+- una ráfaga de --burst reportes con un hilo consumidor en el mismo
+  proceso: latencia de los requests y de encolado a terminado
+
+Uso:
+    python -m bench.jobs --db bench.db --iterations 30 --latency 0.1
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from bench.common import ROOT, summarize
+from bench.datagen import LAT_MAX, LAT_MIN, LON_MAX, LON_MIN, generate
+from bench.stubs import StubServer
+
+
+def photo(rnd, size=(1600, 1200)):
+    """JPEG con ruido (peor caso para el compresor), como data URL"""
+    from PIL import Image
+
+    img = Image.frombytes('RGB', size, rnd.randbytes(size[0] * size[1] * 3))
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=92)
+    return 'data:image/jpeg;base64,' + base64.b64encode(out.getvalue()).decode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cola de trabajos')
+    parser.add_argument('--db', default=None)
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--images', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--burst', type=int, default=50)
+    parser.add_argument('--json', default=None)
+    args = parser.parse_args()
+
+    source = args.db or os.path.join(ROOT, 'bench_micro.db')
+    if not os.path.exists(source):
+        generate(source)
+    stub = StubServer(latency=args.latency)
+    stub.thread.start()
+    rnd = random.Random(49)
+    images = [photo(rnd) for _ in range(args.images)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'jobs.db')
+        shutil.copy(source, db_file)
+        os.environ.update(stub.backend_env())
+        os.environ.update({'ZETA_DB_FILE': db_file, 'ZETA_VERIFIER': '0', 'ZETA_RATELIMIT': '0',
+                           'ZETA_JOB_WORKERS': '0'})
+        sys.path.insert(0, ROOT)
+        import backend
+        import jobs
+
+        client = backend.app.test_client()
+        client.get('/api/health')  # aplica migraciones
+        conn = backend.get_db()
+        conn.execute("DELETE FROM gazetteer_features")  # toda dirección va a Nominatim
+        conn.commit()
+        place_id = conn.execute("SELECT id FROM places LIMIT 1").fetchone()[0]
+        user_id = conn.execute("SELECT id FROM users LIMIT 1").fetchone()[0]
+        counter = iter(range(10 ** 6))
+
+        def submit():
+            return client.post('/api/reports/submit', json={
+                "user_id": user_id, "category": "accidente", "severity": "medium",
+                "description": f"Choque entre dos autos en el cruce número {next(counter)}, hay patrulla",
+                "lat": rnd.uniform(LAT_MIN, LAT_MAX), "lon": rnd.uniform(LON_MIN, min(LON_MAX, -106.0)),
+                "images": images,
+            })
+
+        def review():
+            return client.post(f'/api/places/{place_id}/reviews', json={
+                "user_id": user_id, "rating": 4, "comment": "Muy buen lugar para comer", "images": images,
+            })
+
+        def register():
+            return client.post('/api/auth/register', json={
+                "email": f"bench{next(counter)}@zeta.mx", "name": "Bench", "photo": images[0],
+            })
+
+        endpoints = {}
+        for name, call in (('submit_report', submit), ('add_review', review), ('register', register)):
+            before, after = [], []
+            for _ in range(args.iterations):
+                start = time.perf_counter()
+                response = call()
+                after.append(time.perf_counter() - start)
+                assert response.status_code == 202, (name, response.get_json())
+                backend.job_worker.run_pending()
+                before.append(time.perf_counter() - start)
+            endpoints[name] = {"before": summarize(before), "after": summarize(after)}
+        failed = conn.execute("SELECT COUNT(*) FROM jobs WHERE state != 'done'").fetchone()[0]
+        assert failed == 0, f"{failed} trabajos sin terminar"
+
+        # Costo de la cola sola
+        noop = jobs.JobWorker(backend.get_db, threads=0)
+        noop.handler('noop')(lambda conn, payload: None)
+        durations = []
+        for i in range(args.iterations * 10):
+            start = time.perf_counter()
+            jobs.enqueue(conn.cursor(), 'noop', {"i": i}, key=f'noop:{i}')
+            conn.commit()
+            noop.run_pending()
+            durations.append(time.perf_counter() - start)
+        overhead = summarize(durations)
+
+        # Ráfaga con un consumidor en el proceso
+        burst_start = time.time()
+        backend.job_worker.threads = 1
+        backend.job_worker.ensure_running()
+        durations = []
+        for _ in range(args.burst):
+            start = time.perf_counter()
+            assert submit().status_code == 202
+            durations.append(time.perf_counter() - start)
+        deadline = time.time() + 120
+        while conn.execute('''
+            SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND created_at >= ?
+        ''', (burst_start,)).fetchone()[0] and time.time() < deadline:
+            time.sleep(0.05)
+        drained = time.time() - burst_start
+        latencies = [row[0] for row in conn.execute('''
+            SELECT finished_at - created_at FROM jobs WHERE created_at >= ? AND state = 'done' AND kind LIKE 'report_%'
+        ''', (burst_start,))]
+        conn.close()
+
+    results = {"images": args.images, "nominatim_latency": args.latency, "endpoints": endpoints,
+               "queue_overhead": overhead,
+               "burst": {"reports": args.burst, "requests": summarize(durations),
+                         "job_latency": summarize(latencies), "drained_seconds": drained}}
+    print(f"{args.images} foto(s) de 1600x1200, Nominatim a {args.latency * 1000:.0f} ms (p50 / p95):")
+    for name, item in endpoints.items():
+        print(f"  {name:14s} antes {item['before']['p50'] * 1000:7.1f} / {item['before']['p95'] * 1000:7.1f} ms"
+              f" | ahora {item['after']['p50'] * 1000:6.1f} / {item['after']['p95'] * 1000:6.1f} ms")
+    print(f"Cola sola (enqueue + claim + complete): p50 {overhead['p50'] * 1000:.2f} ms")
+    burst = results["burst"]
+    print(f"Ráfaga de {args.burst} reportes con un consumidor: request p50 {burst['requests']['p50'] * 1000:.1f} ms, "
+          f"trabajo p50 {burst['job_latency']['p50']:.2f} s / p95 {burst['job_latency']['p95']:.2f} s, "
+          f"cola vacía en {drained:.1f} s")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
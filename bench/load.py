@@ -0,0 +1,179 @@
+"""
+Pruebas de carga end-to-end
+
+Arranca el stub de Nominatim/OSRM y gunicorn sobre una base sintética,
+lanza una mezcla ponderada de requests durante un tiempo fijo y reporta
+throughput y p50/p95/p99 por endpoint.
+
+Uso:
+    python -m bench.load --scenario mixed --duration 30 --concurrency 32
+    python -m bench.load --scenario read --mode gevent --json load.json
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+from bench.common import start_backend, summarize, wait_ready
+from bench.datagen import LAT_MAX, LAT_MIN, LON_MAX, LON_MIN, generate
+from bench.stubs import StubServer
+
+
+def _point(rnd):
+    return round(rnd.uniform(LAT_MIN, LAT_MAX), 5), round(rnd.uniform(LON_MIN, LON_MAX), 5)
+
+
+def req_health(s, base, rnd):
+    return s.get(f"{base}/api/health")
+
+
+def req_reports(s, base, rnd):
+    return s.get(f"{base}/api/reports/list?verified=true&days={rnd.choice([1, 7, 30])}")
+
+
+def req_zones(s, base, rnd):
+    return s.get(f"{base}/api/zones/risk")
+
+
+def req_disasters(s, base, rnd):
+    return s.get(f"{base}/api/disasters/list")
+
+
+def req_search(s, base, rnd):
+    return s.get(f"{base}/api/places/search?q={rnd.choice(['fogón', 'portal', 'mirador', 'casona'])}")
+
+
+def req_place(s, base, rnd):
+    return s.get(f"{base}/api/places/p_bench_{rnd.randint(0, 199)}")
+
+
+def req_route(s, base, rnd):
+    olat, olon = _point(rnd)
+    dlat, dlon = _point(rnd)
+    return s.post(f"{base}/api/routes/calculate", json={
+        "origin": f"{olat},{olon}", "destination": f"{dlat},{dlon}", "avoid_risks": True
+    })
+
+
+def req_reverse(s, base, rnd):
+    lat, lon = _point(rnd)
+    return s.post(f"{base}/api/geocode/reverse", json={"lat": lat, "lon": lon})
+
+
+def req_submit(s, base, rnd):
+    lat, lon = _point(rnd)
+    return s.post(f"{base}/api/reports/submit", json={
+        "user_id": f"user_bench_{rnd.randint(0, 99)}",
+        "description": "Choque entre dos vehículos, hay patrulla y ambulancia en el lugar",
+        "category": "traffic", "severity": rnd.choice(['low', 'medium', 'high']),
+        "lat": lat, "lon": lon, "images": []
+    })
+
+
+def req_vote(s, base, rnd):
+    return s.post(f"{base}/api/reports/vote/report_bench_{rnd.randint(0, 999)}", json={
+        "user_id": f"user_bench_{rnd.randint(0, 999)}", "vote_type": rnd.choice(['up', 'down'])
+    })
+
+
+SCENARIOS = {
+    "read": {req_health: 1, req_reports: 4, req_zones: 3, req_disasters: 2, req_search: 3, req_place: 3},
+    "route": {req_route: 1},
+    "write": {req_submit: 3, req_vote: 5, req_reverse: 2},
+    "mixed": {req_health: 1, req_reports: 4, req_zones: 3, req_disasters: 2, req_search: 3,
+              req_place: 3, req_route: 2, req_reverse: 1, req_submit: 1, req_vote: 2},
+}
+
+
+def run_load(base_url, scenario, duration, concurrency, seed=0):
+    weights = SCENARIOS[scenario]
+    funcs, w = list(weights), list(weights.values())
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(idx):
+        rnd = random.Random(seed * 1000 + idx)
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            fn = rnd.choices(funcs, w)[0]
+            name = fn.__name__[4:]
+            start = time.perf_counter()
+            try:
+                ok = fn(session, base_url, rnd).status_code < 500
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[name].append(elapsed)
+                if not ok:
+                    errors[name] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    results = {}
+    for name, values in sorted(latencies.items()):
+        stats = summarize(values)
+        stats["throughput"] = len(values) / wall
+        stats["errors"] = errors[name]
+        results[name] = stats
+    return results
+
+
+def print_results(results):
+    print(f"{'endpoint':<12}{'n':>7}{'req/s':>9}{'p50':>11}{'p95':>11}{'p99':>11}{'errores':>9}")
+    for name, r in results.items():
+        print(f"{name:<12}{r['n']:>7}{r['throughput']:>9.1f}"
+              f"{r['p50'] * 1000:>9.1f}ms{r['p95'] * 1000:>9.1f}ms{r['p99'] * 1000:>9.1f}ms{r['errors']:>9}")
+    total = sum(r['throughput'] for r in results.values())
+    print(f"{'total':<12}{sum(r['n'] for r in results.values()):>7}{total:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga end-to-end')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='mixed')
+    parser.add_argument('--mode', default='sync', help='sync o gevent')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.1, help='latencia del stub (s)')
+    parser.add_argument('--port', type=int, default=5650)
+    parser.add_argument('--reports', type=int, default=5000)
+    parser.add_argument('--json', default=None)
+    args = parser.parse_args()
+
+    with StubServer(latency=args.latency) as stub, tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'load.db')
+        generate(db_file, users=1000, reports=args.reports, zones=200, places=200, reviews=5000)
+        base_url = f"http://127.0.0.1:{args.port}"
+        proc = start_backend(args.mode, args.workers, args.port, stub, db_file)
+        try:
+            wait_ready(base_url)
+            results = run_load(base_url, args.scenario, args.duration, args.concurrency)
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    print(f"\nEscenario {args.scenario}: {args.mode} x{args.workers}, {args.concurrency} clientes, "
+          f"{args.duration}s, latencia upstream {args.latency}s")
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
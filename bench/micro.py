@@ -0,0 +1,107 @@
+"""
+Microbenchmarks de las funciones calientes del backend
+
+Mide calculate_risk, compress_image, validate_text y search_places sobre
+una base sintética (ver bench.datagen) con Nominatim apuntando al stub
+local, así que no hay tráfico de red real.
+
+Uso:
+    python -m bench.micro --db bench.db --iterations 200
+    python -m bench.micro --db bench.db --only calculate_risk --json micro.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from bench.common import ROOT, summarize
+from bench.datagen import LAT_MAX, LAT_MIN, LON_MAX, LON_MIN, generate, sample_image
+from bench.stubs import StubServer
+
+VALID_TEXTS = [
+    "Choque entre dos vehículos sobre Av. Universidad, hay patrulla en el lugar",
+    "Asalto a mano armada cerca de la parada del camión, la policía ya llegó",
+    "Muy buena atención y la comida llegó rápido, volvería sin dudarlo " * 3,
+]
+ADVERSARIAL_TEXTS = [
+    # Muchos inicios posibles para la regla click/buy sin cierre
+    "click " * 160,
+    # Corridas largas de caracteres casi repetidos
+    "aaaaaaab" * 120,
+    # Mayúsculas cortadas justo antes de 15
+    ("ABCDEFGHIJKLMN " * 66)[:1000],
+]
+
+
+def timed(fn, iterations):
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+def run(iterations, only=None):
+    import backend
+
+    rnd = random.Random(7)
+    client = backend.app.test_client()
+    big_image = sample_image(size=(1600, 1200), seed=1)
+    points = [(rnd.uniform(LAT_MIN, LAT_MAX), rnd.uniform(LON_MIN, LON_MAX)) for _ in range(iterations)]
+    point_iter = iter(points * 2)
+    queries = ['fogón', 'rincón 12', 'portal', 'casona', 'mall', 'museo', 'patio 3']
+    query_iter = iter(queries * (iterations // len(queries) + 2))
+
+    cases = {
+        "calculate_risk": lambda: backend.calculate_risk(*next(point_iter)),
+        "compress_image": lambda: backend.compress_image(big_image, max_size=(1200, 1200), quality=85),
+        "validate_text": lambda: [backend.validate_text(t, 15, 1000) for t in VALID_TEXTS],
+        "validate_text_adversarial": lambda: [backend.validate_text(t, 15, 1000) for t in ADVERSARIAL_TEXTS],
+        "search_places": lambda: client.get(f"/api/places/search?q={next(query_iter)}"),
+    }
+
+    results = {}
+    for name, fn in cases.items():
+        if only and name not in only:
+            continue
+        n = iterations if name != 'compress_image' else max(5, iterations // 10)
+        fn()  # calentamiento
+        results[name] = timed(fn, n)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmarks del backend')
+    parser.add_argument('--db', default=None, help='base existente (si no, se genera una temporal)')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--only', default='', help='lista separada por comas')
+    parser.add_argument('--json', default=None, help='guardar resultados en este archivo')
+    args = parser.parse_args()
+
+    db_file = args.db or os.path.join(ROOT, 'bench_micro.db')
+    if not os.path.exists(db_file):
+        generate(db_file)
+
+    with StubServer(latency=0.0) as stub:
+        os.environ.update(stub.backend_env())
+        os.environ['ZETA_DB_FILE'] = db_file
+        # search_places se llama cientos de veces desde el mismo cliente
+        os.environ.setdefault('ZETA_RATELIMIT', '0')
+        sys.path.insert(0, ROOT)
+        only = {o for o in args.only.split(',') if o}
+        results = run(args.iterations, only)
+
+    print(f"{'caso':<28}{'n':>6}{'media':>12}{'p50':>12}{'p95':>12}{'p99':>12}")
+    for name, r in results.items():
+        print(f"{name:<28}{r['n']:>6}" + ''.join(
+            f"{r[k] * 1000:>10.3f}ms" for k in ('mean', 'p50', 'p95', 'p99')))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
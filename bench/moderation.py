@@ -0,0 +1,141 @@
+"""
+Moderación en lote y cola de pendientes
+
+Mide, con el test client de Flask sobre una copia de la base:
+
+- moderar N reportes pendientes con N llamadas a /api/reports/verify/<id>
+  (una transacción y un commit cada una) contra una sola llamada a
+  /api/reports/moderate con las N decisiones (otros N reportes, misma
+  mezcla de aprobados y rechazados)
+- latencia de una página de /api/reports/pending al inicio de la cola y
+  cerca del final (cursor); en SQL, el cursor contra OFFSET
+
+Uso:
+    python -m bench.moderation --db bench.db --batch 500
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from bench.common import ROOT, summarize
+from bench.datagen import generate
+
+
+def timed_get(client, url, iterations):
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        response = client.get(url)
+        body = response.get_json()
+        durations.append(time.perf_counter() - start)
+        assert response.status_code == 200, (url, response.status_code)
+    return summarize(durations), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Moderación en lote')
+    parser.add_argument('--db', default=None)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--json', default=None)
+    args = parser.parse_args()
+
+    source = args.db or os.path.join(ROOT, 'bench_micro.db')
+    if not os.path.exists(source):
+        generate(source)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'moderation.db')
+        shutil.copy(source, db_file)
+        os.environ.update({'ZETA_DB_FILE': db_file, 'ZETA_VERIFIER': '0', 'ZETA_RATELIMIT': '0'})
+        sys.path.insert(0, ROOT)
+        import backend
+        import verifier
+
+        client = backend.app.test_client()
+        client.get('/api/health')  # aplica migraciones
+        conn = sqlite3.connect(db_file)
+        verifier.rescore(conn, verifier.KeywordScorer(), lambda cursor, report_ids, verified_by: None)
+        pending = [row[0] for row in conn.execute(
+            "SELECT id FROM reports WHERE status = 'pending' ORDER BY random()")]
+        if len(pending) < 2 * args.batch:
+            sys.exit(f"Se necesitan {2 * args.batch} pendientes y hay {len(pending)}")
+
+        # Páginas antes de moderar, con la cola completa
+        first_page, _ = timed_get(client, '/api/reports/pending?limit=50', args.iterations)
+        score, last_id = conn.execute('''
+            SELECT queue_score, id FROM reports WHERE status = 'pending'
+            ORDER BY queue_score, id LIMIT 1 OFFSET 60
+        ''').fetchone()
+        deep_page, _ = timed_get(client, f'/api/reports/pending?limit=50&cursor={score!r}:{last_id}',
+                                 args.iterations)
+        # La misma página solo en SQL: cursor contra OFFSET
+        page_sql = '''
+            SELECT r.id FROM reports r WHERE r.status = 'pending' {}
+            ORDER BY r.queue_score DESC, r.id DESC LIMIT 50 {}
+        '''
+        deep_sql = {
+            "cursor": (page_sql.format("AND (r.queue_score, r.id) < (?, ?)", ""), (score, last_id)),
+            "offset": (page_sql.format("", "OFFSET ?"), (len(pending) - 60,)),
+        }
+        for name, (sql, params) in deep_sql.items():
+            durations = []
+            for _ in range(args.iterations):
+                start = time.perf_counter()
+                conn.execute(sql, params).fetchall()
+                durations.append(time.perf_counter() - start)
+            deep_sql[name] = summarize(durations)
+
+        rnd = random.Random(47)
+        single_ids, batch_ids = pending[:args.batch], pending[args.batch:2 * args.batch]
+        approved = [rnd.random() < 0.7 for _ in range(args.batch)]
+
+        start = time.perf_counter()
+        for report_id, ok in zip(single_ids, approved):
+            response = client.post(f'/api/reports/verify/{report_id}',
+                                   json={"verified_by": "bench", "approved": ok})
+            assert response.status_code == 200
+        single_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        response = client.post('/api/reports/moderate', json={
+            "verified_by": "bench",
+            "decisions": [{"report_id": report_id, "approved": ok} for report_id, ok in zip(batch_ids, approved)],
+        })
+        batch_seconds = time.perf_counter() - start
+        body = response.get_json()
+        assert response.status_code == 200 and body["failed"] == 0, body
+
+        def statuses(ids):
+            return sorted(row[0] for row in conn.execute(
+                f"SELECT status FROM reports WHERE id IN ({', '.join('?' * len(ids))})", ids))
+        assert statuses(single_ids) == statuses(batch_ids)
+        conn.close()
+
+    results = {
+        "pending": len(pending), "batch": args.batch,
+        "moderate": {"single_seconds": single_seconds, "batch_seconds": batch_seconds,
+                     "approved": body["approved"], "rejected": body["rejected"]},
+        "pending_page": {"first": first_page, "deep": deep_page, "deep_sql": deep_sql},
+    }
+    print(f"{args.batch} decisiones ({body['approved']} aprobadas, {body['rejected']} rechazadas):")
+    print(f"  /api/reports/verify × {args.batch}   {single_seconds * 1000:8.0f} ms")
+    print(f"  /api/reports/moderate × 1  {batch_seconds * 1000:8.0f} ms")
+    print(f"Cola de {len(pending)} pendientes, páginas de 50:")
+    print(f"  primera página       p50 {first_page['p50'] * 1000:6.2f} ms")
+    print(f"  cerca del final      p50 {deep_page['p50'] * 1000:6.2f} ms")
+    print(f"  solo SQL, cursor     p50 {deep_sql['cursor']['p50'] * 1000:6.2f} ms")
+    print(f"  solo SQL, OFFSET     p50 {deep_sql['offset']['p50'] * 1000:6.2f} ms")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Paquete offline binario contra el mismo contenido en JSON
+
+Copia la base (--db) y, si se indica, el gazetteer de otra (--gazetteer),
+genera bundle.py y un JSON con exactamente los mismos registros y mide:
+
+- tamaño en disco y comprimido con gzip (lo que se descarga)
+- tiempo y memoria (tracemalloc) para abrir: mmap contra json.loads/orjson
+- consultas por bbox (~1 km) y por nombre: columnas mmap contra recorrer
+  las listas del JSON; ambos deben devolver lo mismo
+
+Uso:
+    python -m bench.offline_bundle --db bench.db --gazetteer gazetteer.db
+"""
+import argparse
+import gc
+import gzip
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench.common import ROOT, summarize
+from bench.datagen import LAT_MAX, LAT_MIN, LON_MAX, LON_MIN, generate
+
+
+def copy_gazetteer(conn, path):
+    conn.execute("ATTACH DATABASE ? AS src", (path,))
+    conn.execute("DELETE FROM gazetteer_features")
+    conn.execute("DELETE FROM gazetteer_addresses")
+    conn.execute("INSERT INTO gazetteer_features SELECT * FROM src.gazetteer_features")
+    conn.execute("INSERT INTO gazetteer_addresses SELECT * FROM src.gazetteer_addresses")
+    conn.execute("UPDATE data_versions SET version = version + 1 WHERE name = 'gazetteer'")
+    conn.commit()
+    conn.execute("DETACH DATABASE src")
+
+
+def export_json(bundle_mod, bundle):
+    """Mismos registros que el paquete, como los mandaría la API"""
+    data = {"cursor": bundle.cursor}
+    for table in ('places', 'zones', 'disasters'):
+        data[table] = [bundle.row(table, i) for i in range(bundle.count(table))]
+    data["features"] = []
+    for i in range(bundle.count('features')):
+        item = bundle.row('features', i, ('kind', 'name', 'lat', 'lon'))
+        parts = [[[lon, lat] for lat, lon in part] for part in bundle.geometry(i)]
+        item["geometry"] = {"type": "MultiLineString", "coordinates": parts}
+        data["features"].append(item)
+    data["addresses"] = [bundle.row('addresses', i) for i in range(bundle.count('addresses'))]
+    return data
+
+
+def measure_open(fn):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    value = fn()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return value, seconds, peak
+
+
+def json_bbox(data, bbox):
+    west, south, east, north = bbox
+    return [item["id"] for item in data["places"]
+            if south <= item["lat"] <= north and west <= item["lon"] <= east]
+
+
+def json_find(gazetteer, data, table, text):
+    wanted = [t for t in gazetteer.normalize(text) if t not in gazetteer._STOPWORDS]
+    found = []
+    for item in data[table]:
+        tokens = gazetteer.normalize(item["name"])
+        if all(any(t.startswith(w) for t in tokens) for w in wanted):
+            found.append(item["name"])
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Paquete offline binario contra JSON')
+    parser.add_argument('--db', default=None)
+    parser.add_argument('--gazetteer', default=None, help='base con gazetteer_features/addresses')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--json', default=None)
+    args = parser.parse_args()
+
+    source = args.db or os.path.join(ROOT, 'bench_micro.db')
+    if not os.path.exists(source):
+        generate(source)
+    sys.path.insert(0, ROOT)
+    import bundle as bundle_mod
+    import gazetteer
+    import migrations
+    import orjson
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'offline.db')
+        shutil.copy(source, db_file)
+        conn = sqlite3.connect(db_file)
+        migrations.migrate(conn)
+        if args.gazetteer:
+            copy_gazetteer(conn, args.gazetteer)
+
+        bundle_path, json_path = os.path.join(tmp, 'offline.zetab'), os.path.join(tmp, 'offline.json')
+        start = time.perf_counter()
+        stats = bundle_mod.build(conn, bundle_path)
+        build_seconds = time.perf_counter() - start
+        conn.close()
+
+        with bundle_mod.Bundle(bundle_path) as b:
+            data = export_json(bundle_mod, b)
+        with open(json_path, 'wb') as f:
+            f.write(orjson.dumps(data))
+
+        sizes = {}
+        for name, path in (('bundle', bundle_path), ('json', json_path)):
+            with open(path, 'rb') as f:
+                raw = f.read()
+            sizes[name] = {"bytes": len(raw), "gzip": len(gzip.compress(raw, 6))}
+
+        opened, open_seconds, open_peak = measure_open(lambda: bundle_mod.Bundle(bundle_path))
+
+        def load_json():
+            with open(json_path, 'rb') as f:
+                return json.loads(f.read())
+
+        def load_orjson():
+            with open(json_path, 'rb') as f:
+                return orjson.loads(f.read())
+
+        _, json_seconds, json_peak = measure_open(load_json)
+        data, orjson_seconds, orjson_peak = measure_open(load_orjson)
+
+        rnd = random.Random(11)
+        boxes = []
+        for _ in range(args.queries):
+            lat, lon = rnd.uniform(LAT_MIN, LAT_MAX), rnd.uniform(LON_MIN, LON_MAX)
+            boxes.append((lon - 0.005, lat - 0.0045, lon + 0.005, lat + 0.0045))
+        bbox_fast, bbox_slow, mismatches = [], [], 0
+        for bbox in boxes:
+            start = time.perf_counter()
+            fast = [item["id"] for item in opened.places_in_bbox(bbox)]
+            bbox_fast.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            slow = json_bbox(data, bbox)
+            bbox_slow.append(time.perf_counter() - start)
+            mismatches += sorted(fast) != sorted(slow)
+
+        names = [item["name"] for item in data["features"] if item["kind"] != 'colonia']
+        names += [item["name"] for item in data["places"]]
+        words = [w for w in (gazetteer.normalize(n)[-1] for n in names if gazetteer.normalize(n)) if len(w) > 3]
+        name_fast, name_slow = [], []
+        for _ in range(args.queries):
+            prefix = rnd.choice(words)[:4]
+            start = time.perf_counter()
+            fast = [item["name"] for item in opened.find_features(prefix, limit=None)]
+            name_fast.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            slow = json_find(gazetteer, data, 'features', prefix)
+            name_slow.append(time.perf_counter() - start)
+            mismatches += sorted(fast) != sorted(slow)
+        opened.close()
+
+    results = {"stats": stats, "build_seconds": build_seconds, "sizes": sizes,
+               "open": {"bundle": [open_seconds, open_peak], "json": [json_seconds, json_peak],
+                        "orjson": [orjson_seconds, orjson_peak]},
+               "bbox": {"bundle": summarize(bbox_fast), "json": summarize(bbox_slow)},
+               "names": {"bundle": summarize(name_fast), "json": summarize(name_slow)},
+               "mismatches": mismatches}
+    print(f"Paquete: {stats['places']} lugares, {stats['zones']} zonas, {stats['disasters']} desastres, "
+          f"{stats['features']} elementos, {stats['addresses']} direcciones en {build_seconds * 1000:.0f} ms")
+    for name, size in sizes.items():
+        print(f"{name:8s} {size['bytes']:>11,} B  gzip {size['gzip']:>10,} B")
+    for name, (seconds, peak) in results["open"].items():
+        print(f"abrir {name:7s} {seconds * 1000:8.2f} ms  pico {peak / 1e6:7.2f} MB")
+    for kind in ('bbox', 'names'):
+        fast, slow = results[kind]["bundle"], results[kind]["json"]
+        print(f"{kind:6s} paquete p50 {fast['p50'] * 1e6:8.1f} µs | JSON p50 {slow['p50'] * 1e6:8.1f} µs")
+    print(f"{mismatches} diferencias en {2 * args.queries} consultas")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
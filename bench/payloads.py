@@ -0,0 +1,114 @@
+"""
+Bytes y CPU de las respuestas grandes
+
+Para /api/reports/list, /api/places/<id> (completos y con fields=markers),
+/api/zones/risk y /api/map/clusters mide, con el test client de Flask, el
+tamaño enviado, el tiempo de CPU del proceso y el pico de memoria
+(tracemalloc) con:
+
+- json: proveedor JSON por defecto de Flask, sin compresión
+- orjson: FastJSONProvider, sin compresión
+- orjson+gzip / orjson+br: con Accept-Encoding (br solo si brotli está instalado)
+
+Uso:
+    python -m bench.payloads --db bench.db --iterations 30
+    ZETA_BENCH_ROOT=/ruta/a/otra/copia python -m bench.payloads   # comparar otra versión
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from bench.common import ROOT, percentile
+from bench.datagen import generate
+
+ENDPOINTS = [
+    ('reports', '/api/reports/list?verified=false&days=30'),
+    ('reports_markers', '/api/reports/list?verified=false&days=30&fields=markers'),
+    ('place', '/api/places/p_bench_1'),
+    ('place_markers', '/api/places/p_bench_1?fields=markers'),
+    ('zones', '/api/zones/risk'),
+    # Toda la ciudad a zoom 12 y una pantalla de 1280x800 px a zoom 14
+    ('clusters_z12', '/api/map/clusters?bbox=-106.20,28.55,-105.98,28.75&zoom=12&layer=reports'),
+    ('clusters_z14', '/api/map/clusters?bbox=-106.145,28.605,-106.035,28.695&zoom=14&layer=reports'),
+]
+
+
+def _fetch(client, url, headers):
+    # buffered=False: se consume el cuerpo sin juntarlo, como lo enviaría el servidor
+    response = client.get(url, headers=headers, buffered=False)
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    assert response.status_code == 200, (url, response.status_code)
+    return response, size
+
+
+def measure(client, url, accept_encoding, iterations):
+    headers = {'Accept-Encoding': accept_encoding}
+    _fetch(client, url, headers)  # calentamiento
+    cpu = []
+    for _ in range(iterations):
+        start = time.process_time()
+        response, size = _fetch(client, url, headers)
+        cpu.append(time.process_time() - start)
+
+    # Pico de memoria en una pasada aparte (tracemalloc infla el tiempo de CPU)
+    tracemalloc.start()
+    _fetch(client, url, headers)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"bytes": size, "encoding": response.headers.get('Content-Encoding', 'identity'),
+            "cpu_p50": percentile(cpu, 50), "peak_mem": peak}
+
+
+def run(iterations):
+    import backend
+    from flask.json.provider import DefaultJSONProvider
+
+    configs = [('json', DefaultJSONProvider(backend.app), 'identity')]
+    try:
+        import responses
+        fast = responses.FastJSONProvider(backend.app)
+        configs.append(('orjson', fast, 'identity'))
+        configs.append(('orjson+gzip', fast, 'gzip'))
+        if responses.brotli is not None:
+            configs.append(('orjson+br', fast, 'br, gzip'))
+    except ImportError:  # versión sin responses.py
+        configs.append(('json+gzip', configs[0][1], 'gzip'))
+
+    client = backend.app.test_client()
+    results = {}
+    for name, url in ENDPOINTS:
+        for label, provider, accept in configs:
+            backend.app.json = provider
+            results[f"{name}/{label}"] = measure(client, url, accept, iterations)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tamaño y CPU de respuestas grandes')
+    parser.add_argument('--db', default=None)
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--json', default=None)
+    args = parser.parse_args()
+
+    db_file = args.db or os.path.join(ROOT, 'bench_payloads.db')
+    if not os.path.exists(db_file):
+        generate(db_file, image_ratio=0.3)
+    os.environ['ZETA_DB_FILE'] = os.path.abspath(db_file)
+    sys.path.insert(0, os.environ.get('ZETA_BENCH_ROOT', ROOT))
+    results = run(args.iterations)
+
+    print(f"{'endpoint/config':<30}{'encoding':>10}{'bytes':>12}{'CPU p50':>12}{'pico mem':>12}")
+    for name, r in results.items():
+        print(f"{name:<30}{r['encoding']:>10}{r['bytes']:>12,}{r['cpu_p50'] * 1000:>10.2f}ms"
+              f"{r['peak_mem'] / 1024:>10,.0f}KB")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
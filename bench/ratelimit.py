@@ -0,0 +1,147 @@
+"""
+Rate limiting compartido: costo por revisión y exactitud entre procesos
+
+Mide:
+
+- costo de RateLimiter.hit (mmap + lock de rango) contra el mismo token
+  bucket guardado en una tabla SQLite (SELECT + UPSERT + commit), para
+  10,000 clientes distintos
+- exactitud con varios procesos: N procesos golpean el mismo (endpoint,
+  cliente) durante unos segundos. Con buckets compartidos el total
+  permitido debe ser ráfaga + tasa × segundos; con un dict por proceso
+  sería N veces eso.
+
+Uso:
+    python -m bench.ratelimit --processes 8 --seconds 3
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from bench.common import ROOT, summarize
+
+
+def sqlite_hit(conn, limit, endpoint, client, now):
+    """El mismo bucket en SQLite: lo que costaría sin memoria compartida"""
+    key = f"{endpoint}\0{client}"
+    with conn:
+        row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+        tokens, updated = row if row else (limit.burst, now)
+        tokens = min(limit.burst, tokens + max(0.0, now - updated) * limit.rate)
+        allowed = tokens >= 1.0
+        if allowed:
+            tokens -= 1.0
+        conn.execute('''
+            INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated
+        ''', (key, tokens, now))
+    return allowed
+
+
+def timed_calls(fn, calls):
+    durations = []
+    for args in calls:
+        start = time.perf_counter()
+        fn(*args)
+        durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+def hammer(path, limits, seconds, shared, queue):
+    import ratelimit
+
+    if shared:
+        limiter = ratelimit.RateLimiter(path, limits)
+        check = lambda: limiter.hit('submit_report', '203.0.113.7')[0]
+    else:
+        # Un dict por proceso: lo que haría un limitador en memoria local
+        limit, bucket = limits['submit_report'], {}
+
+        def check():
+            now = time.time()
+            tokens, updated = bucket.get('k', (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+            allowed = tokens >= 1.0
+            bucket['k'] = (tokens - 1.0 if allowed else tokens, now)
+            return allowed
+    allowed = checks = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        allowed += check()
+        checks += 1
+    queue.put((allowed, checks))
+
+
+def run_processes(path, limits, processes, seconds, shared):
+    queue = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=hammer, args=(path, limits, seconds, shared, queue))
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    results = [queue.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return sum(a for a, _ in results), sum(c for _, c in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rate limiting compartido')
+    parser.add_argument('--calls', type=int, default=100000)
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--json', default=None)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    import ratelimit
+
+    rnd = random.Random(46)
+    endpoints = ['submit_report', 'calculate_route', 'search_places']
+    clients = [f"10.{i // 65536}.{i // 256 % 256}.{i % 256}" for i in range(10000)]
+    with tempfile.TemporaryDirectory() as tmp:
+        limiter = ratelimit.RateLimiter(os.path.join(tmp, 'rl.bin'))
+        calls = [(rnd.choice(endpoints), rnd.choice(clients)) for _ in range(args.calls)]
+        limiter.hit(*calls[0])
+        mmap_stats = timed_calls(limiter.hit, calls)
+
+        conn = sqlite3.connect(os.path.join(tmp, 'rl.db'))
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+        sqlite_stats = timed_calls(
+            lambda endpoint, client: sqlite_hit(conn, ratelimit.LIMITS[endpoint], endpoint, client, time.time()),
+            calls[:max(1, args.calls // 10)])
+        conn.close()
+
+        limits = {'submit_report': ratelimit.Limit(100, 1, burst=50)}
+        expected = 50 + 100 * args.seconds
+        shared_allowed, shared_checks = run_processes(os.path.join(tmp, 'shared.bin'), limits,
+                                                      args.processes, args.seconds, True)
+        local_allowed, local_checks = run_processes(None, limits, args.processes, args.seconds, False)
+
+    results = {
+        "hit": {"mmap": mmap_stats, "sqlite": sqlite_stats},
+        "processes": args.processes, "seconds": args.seconds, "expected_allowed": expected,
+        "shared": {"allowed": shared_allowed, "checks": shared_checks},
+        "per_process": {"allowed": local_allowed, "checks": local_checks},
+    }
+    print(f"hit() mmap    p50 {mmap_stats['p50'] * 1e6:6.1f} µs  p99 {mmap_stats['p99'] * 1e6:6.1f} µs")
+    print(f"hit() SQLite  p50 {sqlite_stats['p50'] * 1e6:6.1f} µs  p99 {sqlite_stats['p99'] * 1e6:6.1f} µs")
+    print(f"{args.processes} procesos × {args.seconds:g} s contra 100/s con ráfaga de 50 "
+          f"(esperado ≈ {expected:.0f} permitidos):")
+    print(f"  compartido     {shared_allowed:6d} permitidos de {shared_checks:,} revisiones "
+          f"({shared_checks / args.seconds:,.0f}/s)")
+    print(f"  dict por proc. {local_allowed:6d} permitidos de {local_checks:,} revisiones")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Servidores locales que imitan a Nominatim y OSRM
+
+Responden con la misma forma JSON que los servicios reales después de una
+latencia configurable, para medir el backend sin depender de la red.
+
+Uso:
+    python -m bench.stubs --port 8089 --latency 0.5
+
+Y en el backend:
+    NOMINATIM_DOMAIN=127.0.0.1:8089 NOMINATIM_SCHEME=http \\
+    OSRM_URL=http://127.0.0.1:8089 gunicorn -c gunicorn.conf.py backend:app
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from bench.datagen import LAT_MAX, LAT_MIN, LON_MAX, LON_MIN, STREETS
+
+SUBURBS = ['Centro', 'San Felipe', 'Campestre', 'Cerro de la Cruz', 'Santa Rosa', 'Las Granjas']
+
+
+def _route_coordinates(olon, olat, dlon, dlat, points):
+    """Polilínea en zigzag entre origen y destino"""
+    coords = []
+    for i in range(points):
+        t = i / (points - 1)
+        jitter = 0.0005 if i % 2 else -0.0005
+        coords.append([olon + (dlon - olon) * t + jitter, olat + (dlat - olat) * t])
+    return coords
+
+
+def make_handler(latency, route_points=120):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, payload, status=200):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if latency:
+                time.sleep(latency)
+            url = urlsplit(self.path)
+            qs = parse_qs(url.query)
+            self.server.hits += 1
+
+            if url.path.startswith('/route/v1/'):
+                pair = unquote(url.path.rsplit("/", 1)[-1])
+                (olon, olat), (dlon, dlat) = [map(float, p.split(',')) for p in pair.split(';')]
+                routes = []
+                alternatives = 2 if qs.get('alternatives', ['false'])[0] == 'true' else 1
+                for alt in range(alternatives):
+                    coords = _route_coordinates(olon, olat + alt * 0.002, dlon, dlat, route_points)
+                    routes.append({
+                        "geometry": {"type": "LineString", "coordinates": coords},
+                        "duration": 600.0 + alt * 120,
+                        "distance": 5000.0 + alt * 800
+                    })
+                return self._send({"code": "Ok", "routes": routes})
+
+            if url.path.startswith('/search'):
+                query = qs.get('q', [''])[0]
+                rnd = random.Random(query)
+                limit = int(qs.get('limit', ['1'])[0])
+                results = []
+                for i in range(limit):
+                    lat = rnd.uniform(LAT_MIN, LAT_MAX)
+                    lon = rnd.uniform(LON_MIN, LON_MAX)
+                    road = rnd.choice(STREETS)
+                    results.append({
+                        "osm_id": rnd.randint(1, 10 ** 9),
+                        "lat": str(lat), "lon": str(lon),
+                        "display_name": f"{road}, Chihuahua, México",
+                        "address": {"road": road, "suburb": rnd.choice(SUBURBS)}
+                    })
+                return self._send(results)
+
+            if url.path.startswith('/reverse'):
+                lat = float(qs.get('lat', ['28.63'])[0])
+                lon = float(qs.get('lon', ['-106.08'])[0])
+                rnd = random.Random(f"{lat:.4f},{lon:.4f}")
+                road, suburb = rnd.choice(STREETS), rnd.choice(SUBURBS)
+                return self._send({
+                    "osm_id": rnd.randint(1, 10 ** 9),
+                    "lat": str(lat), "lon": str(lon),
+                    "display_name": f"{road}, {suburb}, Chihuahua, México",
+                    "address": {"road": road, "suburb": suburb, "city": "Chihuahua"}
+                })
+
+            self._send({"error": "not found"}, 404)
+
+    return StubHandler
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Ráfagas de cientos de conexiones simultáneas
+    request_queue_size = 1024
+
+
+class StubServer:
+    """Servidor stub en un hilo de fondo (Nominatim + OSRM en el mismo puerto)"""
+
+    def __init__(self, port=0, latency=0.0, route_points=120):
+        self.httpd = _StubHTTPServer(('127.0.0.1', port), make_handler(latency, route_points))
+        self.httpd.hits = 0
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def hits(self):
+        return self.httpd.hits
+
+    def backend_env(self):
+        """Variables de entorno que apuntan el backend a este stub"""
+        return {
+            'NOMINATIM_DOMAIN': f"127.0.0.1:{self.port}",
+            'NOMINATIM_SCHEME': 'http',
+            'OSRM_URL': self.url,
+        }
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stub local de Nominatim/OSRM')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.2, help='segundos por respuesta')
+    parser.add_argument('--route-points', type=int, default=120)
+    args = parser.parse_args()
+    with StubServer(args.port, args.latency, args.route_points) as stub:
+        print(f"Stub Nominatim/OSRM en {stub.url} (latencia {args.latency}s)")
+        try:
+            stub.thread.join()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,135 @@
+"""
+Riesgo por hora de salida: perfil precalculado contra recorrer reportes
+
+Sobre una base sintética (bench.datagen) mide:
+
+- rebuild: tiempo de recalcular risk_profile desde reports
+- carga completa de la rejilla y recarga incremental tras verificar reportes
+- consulta: RiskProfile.weight contra el mismo peso calculado recorriendo
+  en SQLite los reportes verificados del vecindario (lo que habría que
+  hacer sin el perfil); ambos deben coincidir
+
+Uso:
+    python -m bench.temporal_risk --db bench.db --points 2000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from bench.common import ROOT, summarize
+from bench.datagen import LAT_MAX, LAT_MIN, LON_MAX, LON_MIN, generate
+
+
+def brute_force_weight(conn, rp, lat, lon, departure, now):
+    """Peso suavizado recorriendo reports (misma fórmula que el perfil)"""
+    cell_lat, cell_lon = rp.cell_of(lat, lon)
+    how = rp.hour_of_week(departure)
+    rows = conn.execute('''
+        SELECT lat, lon, severity, created_at FROM reports
+        WHERE verified = 1 AND status = 'active' AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?
+    ''', ((cell_lat - 1) * rp.CELL_DEG, (cell_lat + 2) * rp.CELL_DEG,
+          (cell_lon - 1) * rp.CELL_DEG, (cell_lon + 2) * rp.CELL_DEG)).fetchall()
+    total = 0.0
+    for rlat, rlon, severity, created_at in rows:
+        ri, rj = rp.cell_of(rlat, rlon)
+        if abs(ri - cell_lat) > 1 or abs(rj - cell_lon) > 1:
+            continue
+        created_ts = rp.parse_created(created_at)
+        offset = (rp.hour_of_week(created_ts) - how + 84) % rp.HOURS_PER_WEEK - 84
+        if abs(offset) > 1:
+            continue
+        total += (rp.report_weight(severity, created_ts) * rp.SPATIAL_KERNEL[ri - cell_lat]
+                  * rp.SPATIAL_KERNEL[rj - cell_lon] * rp.HOUR_KERNEL[-offset])
+    return total * rp.decay_factor(now)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Perfil de riesgo por hora de la semana')
+    parser.add_argument('--db', default=None)
+    parser.add_argument('--points', type=int, default=2000)
+    parser.add_argument('--verify', type=int, default=200, help='reportes a verificar para la recarga incremental')
+    parser.add_argument('--json', default=None)
+    args = parser.parse_args()
+
+    source = args.db or os.path.join(ROOT, 'bench_micro.db')
+    if not os.path.exists(source):
+        generate(source)
+    sys.path.insert(0, ROOT)
+    import migrations
+    import risk_profile as rp
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'risk.db')
+        shutil.copy(source, db_file)
+        conn = sqlite3.connect(db_file)
+        migrations.migrate(conn)
+
+        start = time.perf_counter()
+        entries = rp.rebuild(conn)
+        rebuild_seconds = time.perf_counter() - start
+        version = conn.execute("SELECT version FROM data_versions WHERE name = 'risk_profile'").fetchone()[0]
+
+        start = time.perf_counter()
+        profile = rp.load_profile(conn, version)
+        load_seconds = time.perf_counter() - start
+
+        rnd = random.Random(5)
+        now = time.time()
+        queries = [(rnd.uniform(LAT_MIN, LAT_MAX), rnd.uniform(LON_MIN, LON_MAX),
+                    now + rnd.uniform(0, 7 * 86400)) for _ in range(args.points)]
+
+        fast, slow, mismatches = [], [], 0
+        for lat, lon, departure in queries:
+            start = time.perf_counter()
+            weight = profile.weight(lat, lon, rp.hour_of_week(departure), rp.decay_factor(now))
+            fast.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            expected = brute_force_weight(conn, rp, lat, lon, departure, now)
+            slow.append(time.perf_counter() - start)
+            if abs(weight - expected) > 1e-9 * max(1.0, expected):
+                mismatches += 1
+
+        pending = conn.execute('''
+            SELECT id, lat, lon, severity, created_at FROM reports WHERE verified = 0 LIMIT ?
+        ''', (args.verify,)).fetchall()
+        start = time.perf_counter()
+        cursor = conn.cursor()
+        for report_id, lat, lon, severity, created_at in pending:
+            cursor.execute("UPDATE reports SET verified = 1, status = 'active', verified_at = ? WHERE id = ?",
+                           (datetime.now(), report_id))
+            rp.add_report(cursor, lat, lon, severity, created_at)
+            conn.commit()
+        verify_seconds = time.perf_counter() - start
+        version = conn.execute("SELECT version FROM data_versions WHERE name = 'risk_profile'").fetchone()[0]
+        start = time.perf_counter()
+        rp.load_profile(conn, version, profile)
+        incremental_seconds = time.perf_counter() - start
+        conn.close()
+
+    fast_stats, slow_stats = summarize(fast), summarize(slow)
+    results = {"entries": entries, "cells": len(profile), "rebuild_seconds": rebuild_seconds,
+               "load_seconds": load_seconds, "lookup": fast_stats, "scan": slow_stats,
+               "checked": len(queries), "mismatches": mismatches,
+               "verified": len(pending), "verify_seconds": verify_seconds,
+               "incremental_seconds": incremental_seconds}
+    print(f"Rebuild: {entries} celdas×hora ({len(profile)} celdas) en {rebuild_seconds * 1000:.0f} ms; "
+          f"carga {load_seconds * 1000:.0f} ms")
+    print(f"Perfil:   p50 {fast_stats['p50'] * 1e6:.1f} µs, p95 {fast_stats['p95'] * 1e6:.1f} µs")
+    print(f"Reportes: p50 {slow_stats['p50'] * 1e6:.1f} µs, p95 {slow_stats['p95'] * 1e6:.1f} µs")
+    print(f"{mismatches} diferencias en {len(queries)} consultas")
+    print(f"{len(pending)} verificaciones con UPSERT en {verify_seconds * 1000:.0f} ms; "
+          f"recarga incremental {incremental_seconds * 1000:.1f} ms")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
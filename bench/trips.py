@@ -0,0 +1,149 @@
+"""
+Viajes en curso: posición incremental contra recalcular la ruta
+
+Con el test client de Flask sobre una copia de la base y el stub de OSRM
+(bench.stubs, --latency y --route-points), simula a un conductor que
+recorre la ruta en --updates posiciones. Cada --change-every posiciones
+cambia el riesgo: una zona alta lejos de la ruta (no debe recalificar
+nada) o una zona media sobre lo que falta (debe recalificar solo esas
+muestras y desviar si subió el riesgo). Mide por posición:
+
+- antes: /api/routes/calculate de la posición actual al destino (lo que
+  hace hoy la app al moverse)
+- ahora: /api/trips/<id>/position
+
+y después de cada posición compara los puntajes guardados de lo que falta
+contra recalificar todas esas muestras: deben ser idénticos.
+
+Uso:
+    python -m bench.trips --db bench.db --updates 200 --latency 0.1
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from bench.common import ROOT, summarize
+from bench.datagen import generate
+from bench.stubs import StubServer
+
+ORIGIN = (28.58, -106.17)
+DESTINATION = (28.72, -106.02)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Viajes en curso')
+    parser.add_argument('--db', default=None)
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--change-every', type=int, default=10)
+    parser.add_argument('--route-points', type=int, default=600)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--json', default=None)
+    args = parser.parse_args()
+
+    source = args.db or os.path.join(ROOT, 'bench_micro.db')
+    if not os.path.exists(source):
+        generate(source)
+    stub = StubServer(latency=args.latency, route_points=args.route_points)
+    stub.thread.start()
+    rnd = random.Random(50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'trips.db')
+        shutil.copy(source, db_file)
+        os.environ.update(stub.backend_env())
+        os.environ.update({'ZETA_DB_FILE': db_file, 'ZETA_VERIFIER': '0', 'ZETA_RATELIMIT': '0',
+                           'ZETA_JOB_WORKERS': '0'})
+        sys.path.insert(0, ROOT)
+        import backend
+        import trips
+
+        client = backend.app.test_client()
+        client.get('/api/health')  # aplica migraciones
+        conn = backend.get_db()
+        destination = f"{DESTINATION[0]}, {DESTINATION[1]}"
+
+        start = time.perf_counter()
+        response = client.post('/api/trips/start', json={"lat": ORIGIN[0], "lon": ORIGIN[1],
+                                                         "destination": destination})
+        start_seconds = time.perf_counter() - start
+        body = response.get_json()
+        assert response.status_code == 200, body
+        trip_id = body['trip']['id']
+        route = body['route_geometry']['coordinates']
+
+        before, after = [], []
+        outcomes, rescored, mismatches, ahead = Counter(), [], 0, []
+        zone_counter = iter(range(10 ** 6))
+        for i in range(1, args.updates + 1):
+            # Posición sobre la ruta vigente (cambia al desviarse), con ~5 m de ruido GPS
+            lon, lat = route[min(len(route) - 1, int(len(route) * i / (args.updates + 1)))][:2]
+            lat, lon = lat + rnd.gauss(0, 0.00005), lon + rnd.gauss(0, 0.00005)
+
+            if i % args.change_every == 0:
+                if (i // args.change_every) % 2:
+                    zlat, zlon, radius, level = 28.95, -106.9, 1.0, 'high'  # lejos de la ruta
+                else:
+                    zlon, zlat = route[min(len(route) - 1, int(len(route) * (i + 10) / (args.updates + 1)))][:2]
+                    radius, level = 0.4, 'medium'
+                conn.execute('''
+                    INSERT INTO risk_zones (id, name, lat, lon, radius_km, level, type, color, expires_at, source)
+                    VALUES (?, 'bench', ?, ?, ?, ?, 'incident', '#f59e0b', datetime('now', '+1 day'), 'bench')
+                ''', (f'zone_trip_{next(zone_counter)}', zlat, zlon, radius, level))
+                conn.commit()
+
+            t0 = time.perf_counter()
+            response = client.post('/api/routes/calculate', json={"origin": f"{lat}, {lon}",
+                                                                   "destination": destination})
+            before.append(time.perf_counter() - t0)
+            assert response.status_code == 200
+
+            t0 = time.perf_counter()
+            response = client.post(f'/api/trips/{trip_id}/position', json={"lat": lat, "lon": lon})
+            after.append(time.perf_counter() - t0)
+            body = response.get_json()
+            if response.status_code == 409:
+                break
+            assert response.status_code == 200, body
+            if body['rerouted']:
+                route = body['route_geometry']['coordinates']
+                outcomes['rerouted'] += 1
+            else:
+                outcomes['rescored' if body['rescored'] else 'unchanged'] += 1
+            rescored.append(body['rescored'])
+
+            # Puntajes guardados de lo que falta contra recalificarlo todo
+            trip = trips.load(conn.cursor(), trip_id)
+            state = backend.risk_snapshot.current()
+            now = time.time()
+            samples = list(trip.remaining_samples())
+            ahead.append(len(samples))
+            mismatches += sum(trip.scores[k] != trips.score_point(state, *trip.sample_point(k), now)
+                              for k in samples)
+        conn.close()
+
+    results = {"updates": len(after), "route_points": args.route_points, "osrm_latency": args.latency,
+               "start_seconds": start_seconds, "before": summarize(before), "after": summarize(after),
+               "outcomes": dict(outcomes), "mismatches": mismatches,
+               "rescored_per_change": sum(rescored) / max(1, outcomes['rescored'] + outcomes['rerouted']),
+               "samples_ahead_mean": sum(ahead) / max(1, len(ahead))}
+    print(f"{len(after)} posiciones, ruta de {args.route_points} puntos, OSRM a {args.latency * 1000:.0f} ms:")
+    print(f"  /api/routes/calculate por posición   p50 {results['before']['p50'] * 1000:7.1f} ms  "
+          f"p95 {results['before']['p95'] * 1000:7.1f} ms")
+    print(f"  /api/trips/<id>/position             p50 {results['after']['p50'] * 1000:7.1f} ms  "
+          f"p95 {results['after']['p95'] * 1000:7.1f} ms")
+    print(f"  inicio del viaje {start_seconds * 1000:.1f} ms | {dict(outcomes)} | "
+          f"{results['rescored_per_change']:.1f} muestras recalificadas por cambio "
+          f"(de {results['samples_ahead_mean']:.0f} por delante en promedio) | {mismatches} diferencias")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
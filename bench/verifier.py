@@ -0,0 +1,145 @@
+"""
+Verificador de fondo: calificador Aho-Corasick y recalificación por lotes
+
+Mide:
+
+- equivalencia: KeywordScorer contra la función original (un `in` por
+  palabra clave) sobre descripciones de bench.datagen y textos aleatorios
+- costo por reporte según el tamaño del léxico: `in` por palabra contra
+  una pasada del autómata (el léxico por defecto tiene 24 palabras; uno
+  más completo o un calificador propio puede tener cientos)
+- recalificar el backlog pendiente: un lote (verifier.rescore) contra un
+  UPDATE + commit por reporte
+
+Uso:
+    python -m bench.verifier --db bench.db
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import string
+import sys
+import tempfile
+import time
+
+from bench.common import ROOT
+from bench.datagen import REPORT_TEMPLATES, STREETS, generate
+
+
+def original_score(scorer, description, severity):
+    """verify_report_with_ai tal como estaba en backend.py"""
+    score = 0.5
+    desc_lower = description.lower()
+    for keyword in scorer.CREDIBLE:
+        if keyword in desc_lower:
+            score += 0.1
+    for keyword in scorer.SUSPICIOUS:
+        if keyword in desc_lower:
+            score -= 0.15
+    if len(description) > 100:
+        score += 0.1
+    if severity == 'high' and any(k in desc_lower for k in scorer.SEVERE):
+        score += 0.15
+    return min(1.0, max(0.0, score))
+
+
+def corpus(rnd, scorer, n):
+    words = scorer.CREDIBLE + scorer.SUSPICIOUS + scorer.SEVERE
+    filler = "el la de un en con por calle carro hay mucho tráfico desde hace rato".split()
+    texts = [t.format(street=s) for t in REPORT_TEMPLATES for s in STREETS]
+    while len(texts) < n:
+        sep = rnd.choice([' ', '', ', '])
+        text = sep.join(rnd.choice(words + filler) for _ in range(rnd.randint(1, 30)))
+        texts.append(text.upper() if rnd.random() < 0.3 else text)
+    return texts
+
+
+def per_call(fn, texts, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        elapsed = (time.perf_counter() - start) / len(texts)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verificador de fondo')
+    parser.add_argument('--db', default=None)
+    parser.add_argument('--texts', type=int, default=20000)
+    parser.add_argument('--json', default=None)
+    args = parser.parse_args()
+
+    source = args.db or os.path.join(ROOT, 'bench_micro.db')
+    if not os.path.exists(source):
+        generate(source)
+    sys.path.insert(0, ROOT)
+    os.environ['ZETA_VERIFIER'] = '0'
+    import migrations
+    import verifier
+
+    rnd = random.Random(9)
+    scorer = verifier.KeywordScorer()
+    texts = corpus(rnd, scorer, args.texts)
+    mismatches = sum(scorer.score(t, 'general', sev) != original_score(scorer, t, sev)
+                     for t in texts for sev in ('high', 'low'))
+
+    # Léxicos más grandes: palabras sintéticas de 5 a 10 letras
+    lexicon_results = []
+    sample = [t.lower() for t in rnd.sample(texts, 2000)]
+    for size in (24, 100, 400, 1600):
+        extra = [''.join(rnd.choice(string.ascii_lowercase) for _ in range(rnd.randint(5, 10)))
+                 for _ in range(max(0, size - 24))]
+        keywords = scorer.CREDIBLE + scorer.SUSPICIOUS + scorer.SEVERE + extra
+        automaton = verifier.AhoCorasick(keywords)
+        naive = per_call(lambda text: [k for k in keywords if k in text], sample)
+        compiled = per_call(automaton.find, sample)
+        lexicon_results.append({"keywords": len(keywords), "in_checks": naive, "aho_corasick": compiled})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, 'verifier.db')
+        shutil.copy(source, db_file)
+        conn = sqlite3.connect(db_file)
+        migrations.migrate(conn)
+        pending = conn.execute("SELECT COUNT(*) FROM reports WHERE status = 'pending'").fetchone()[0]
+
+        def no_promote(cursor, report_ids, verified_by):
+            pass
+
+        start = time.perf_counter()
+        scored, _ = verifier.rescore(conn, scorer, no_promote)
+        batch_seconds = time.perf_counter() - start
+
+        rows = conn.execute('''
+            SELECT id, description, category, severity FROM reports WHERE status = 'pending'
+        ''').fetchall()
+        start = time.perf_counter()
+        for report_id, description, category, severity in rows:
+            score = original_score(scorer, description, severity)
+            conn.execute("UPDATE reports SET verification_score = ?, scored_by = ? WHERE id = ?",
+                         (score, 'inline', report_id))
+            conn.commit()
+        row_seconds = time.perf_counter() - start
+        conn.close()
+
+    results = {"checked": 2 * len(texts), "mismatches": mismatches, "lexicon": lexicon_results,
+               "backlog": {"pending": pending, "scored": scored, "batch_seconds": batch_seconds,
+                           "per_row_seconds": row_seconds}}
+    print(f"Equivalencia: {mismatches} diferencias en {2 * len(texts)} calificaciones")
+    for item in lexicon_results:
+        print(f"{item['keywords']:5d} palabras: `in` {item['in_checks'] * 1e6:7.1f} µs | "
+              f"Aho-Corasick {item['aho_corasick'] * 1e6:6.1f} µs")
+    print(f"Backlog de {pending} pendientes: lote {batch_seconds * 1000:.0f} ms | "
+          f"UPDATE + commit por reporte {row_seconds * 1000:.0f} ms")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,553 @@
+"""
+Paquete binario offline: lugares, zonas y desastres activos y gazetteer
+
+Las apps móviles descargan un solo archivo que se abre con mmap y se
+consulta sin deserializarlo completo:
+
+    cabecera   MAGIC, FORMAT_VERSION, fecha, cursor de /api/sync,
+               versión del gazetteer y número de secciones
+    directorio por sección: nombre, tipo (código de `array`), elementos
+               y offset
+    secciones  columnas little-endian alineadas a 8 bytes
+
+Cada tabla (places, zones, disasters, features, addresses) es un grupo de
+columnas `tabla.columna` del mismo largo. Los textos van a una tabla de
+strings sin repetidos (`strings.offsets` + `strings.data`) y las columnas
+guardan su índice. Coordenadas en microgrados (int32, ~0.1 m).
+
+- Las tablas van ordenadas por latitud: un bbox son dos búsquedas
+  binarias sobre la columna mmap y un filtro por longitud.
+- `names.*` y `feature_names.*` son índices token -> filas, con tokens
+  normalizados como en gazetteer.py, para buscar por prefijo.
+- Las direcciones van ordenadas por el id de string de la calle, así
+  "Av. Universidad 2500" se resuelve sin decodificar textos.
+
+El `cursor` de la cabecera permite seguir con /api/sync?since=<cursor>.
+
+Uso:
+    python bundle.py build zeta_pro.db offline.zetab
+    python bundle.py info offline.zetab
+    python bundle.py find offline.zetab "museo"
+"""
+import bisect
+import gzip
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime
+
+import gazetteer
+from read_model import parse_timestamp
+
+MAGIC = b'ZETB'
+FORMAT_VERSION = 1
+# magic, versión, reservado, fecha (epoch), cursor, versión gazetteer, secciones
+_HEADER = struct.Struct('<4sHHdQII')
+# nombre (32 bytes), tipo, reservado, elementos, offset
+_ENTRY = struct.Struct('<32sc3xIQ')
+_ALIGN = 8
+GZIP_LEVEL = 9
+
+E6 = 1_000_000
+# Tipo de directorio para columnas de índices a la tabla de strings (uint32)
+STRING = 'S'
+_COORDINATES = {'lat', 'lon', 'min_lat', 'min_lon', 'max_lat', 'max_lon'}
+FEATURE_KINDS = ('street', 'colonia', 'landmark')
+NO_STRING = 0  # índice 0 de la tabla de strings = ''
+
+
+class BundleError(ValueError):
+    """Archivo que no es un paquete offline o de una versión no soportada"""
+
+
+def _e6(value):
+    return int(round(value * E6))
+
+
+def _epoch(value):
+    """Fecha de la base -> epoch; NaN = sin fecha"""
+    ts = parse_timestamp(value) if value is not None else None
+    return math.nan if ts is None else ts
+
+
+def _tokens(text):
+    return [t for t in gazetteer.normalize(text) if t not in gazetteer._STOPWORDS]
+
+
+# ==================== ESCRITURA ====================
+class _Writer:
+    def __init__(self):
+        self.sections = []
+        self._strings = {'': NO_STRING}
+        self._string_list = ['']
+
+    def string(self, value):
+        value = '' if value is None else str(value)
+        index = self._strings.get(value)
+        if index is None:
+            index = self._strings[value] = len(self._string_list)
+            self._string_list.append(value)
+        return index
+
+    def column(self, name, typecode, values):
+        storage = 'I' if typecode == STRING else typecode
+        data = values if isinstance(values, array) else array(storage, values)
+        self.sections.append((name, typecode, data))
+
+    def table(self, name, columns, rows, order=None):
+        """columns: [(nombre, tipo, función fila -> valor)]"""
+        if order is not None:
+            rows = sorted(rows, key=order)
+        for column, typecode, get in columns:
+            if typecode == STRING:
+                self.column(f"{name}.{column}", STRING, (self.string(get(row)) for row in rows))
+            else:
+                self.column(f"{name}.{column}", typecode, (get(row) for row in rows))
+        return rows
+
+    def name_index(self, name, texts):
+        """Índice token -> filas (postings ordenadas)"""
+        postings = {}
+        for row, text in enumerate(texts):
+            for token in set(_tokens(text)):
+                postings.setdefault(token, []).append(row)
+        tokens = sorted(postings)
+        self.column(f"{name}.token", STRING, (self.string(t) for t in tokens))
+        starts, flat = array('I', [0]), array('I')
+        for token in tokens:
+            flat.extend(postings[token])
+            starts.append(len(flat))
+        self.column(f"{name}.start", 'I', starts)
+        self.column(f"{name}.rows", 'I', flat)
+
+    def write(self, path, cursor, gazetteer_version):
+        data = bytearray()
+        offsets = array('I', [0])
+        for value in self._string_list:
+            data += value.encode('utf-8')
+            offsets.append(len(data))
+        sections = [('strings.offsets', 'I', offsets), ('strings.data', 'B', array('B', bytes(data)))]
+        sections += self.sections
+
+        start = _HEADER.size + _ENTRY.size * len(sections)
+        entries, blobs, position = [], [], start
+        for name, typecode, values in sections:
+            if sys.byteorder != 'little':
+                values = array(values.typecode, values)
+                values.byteswap()
+            blob = values.tobytes()
+            position += -position % _ALIGN
+            entries.append(_ENTRY.pack(name.encode(), typecode.encode(), len(values), position))
+            blobs.append((position, blob))
+            position += len(blob)
+
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, time.time(), cursor, gazetteer_version, len(sections)))
+            for entry in entries:
+                f.write(entry)
+            for offset, blob in blobs:
+                f.write(b'\0' * (offset - f.tell()))
+                f.write(blob)
+        os.replace(tmp, path)
+        return position
+
+
+def _geometry_parts(geometry):
+    """GeoJSON -> lista de partes [(lon, lat), ...] (líneas o anillos)"""
+    kind, coords = geometry['type'], geometry['coordinates']
+    if kind == 'Point':
+        return [[coords]]
+    if kind in ('LineString', 'MultiPoint'):
+        return [coords]
+    if kind in ('MultiLineString', 'Polygon'):
+        return coords
+    if kind == 'MultiPolygon':
+        return [ring for polygon in coords for ring in polygon]
+    return []
+
+
+def build(conn, path):
+    """Generar el paquete desde la base; devuelve conteos y bytes"""
+    import json
+
+    now = datetime.now()
+    writer = _Writer()
+    # Todo sale de una misma foto de la base
+    conn.execute("BEGIN")
+    try:
+        cursor = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        gazetteer_version = conn.execute(
+            "SELECT version FROM data_versions WHERE name = 'gazetteer'").fetchone()[0]
+        places = conn.execute('''
+            SELECT id, name, type, lat, lon, address, phone, website, description,
+                   rating, total_reviews, price_level
+            FROM places
+        ''').fetchall()
+        zones = conn.execute('''
+            SELECT id, name, lat, lon, radius_km, level, type, color, description, expires_at
+            FROM risk_zones WHERE active = 1 AND (expires_at IS NULL OR expires_at > ?)
+        ''', (now,)).fetchall()
+        disasters = conn.execute('''
+            SELECT id, type, lat, lon, radius_km, severity, description, created_at, expires_at
+            FROM natural_disasters WHERE active = 1 AND (expires_at IS NULL OR expires_at > ?)
+        ''', (now,)).fetchall()
+        features = conn.execute('''
+            SELECT kind, name, lat, lon, min_lat, min_lon, max_lat, max_lon, geometry
+            FROM gazetteer_features
+        ''').fetchall()
+        addresses = conn.execute("SELECT street, number, lat, lon FROM gazetteer_addresses").fetchall()
+    finally:
+        conn.rollback()
+
+    places = writer.table('places', [
+        ('id', STRING, lambda r: r[0]), ('name', STRING, lambda r: r[1]), ('type', STRING, lambda r: r[2]),
+        ('lat', 'i', lambda r: _e6(r[3])), ('lon', 'i', lambda r: _e6(r[4])),
+        ('address', STRING, lambda r: r[5]), ('phone', STRING, lambda r: r[6]), ('website', STRING, lambda r: r[7]),
+        ('description', STRING, lambda r: r[8]), ('rating', 'f', lambda r: r[9] or 0.0),
+        ('total_reviews', 'I', lambda r: r[10] or 0), ('price_level', 'B', lambda r: r[11] or 0),
+    ], places, order=lambda r: r[3])
+    writer.name_index('names', (r[1] for r in places))
+
+    writer.table('zones', [
+        ('id', STRING, lambda r: r[0]), ('name', STRING, lambda r: r[1]),
+        ('lat', 'i', lambda r: _e6(r[2])), ('lon', 'i', lambda r: _e6(r[3])),
+        ('radius_km', 'f', lambda r: r[4]), ('level', STRING, lambda r: r[5]), ('type', STRING, lambda r: r[6]),
+        ('color', STRING, lambda r: r[7]), ('description', STRING, lambda r: r[8]),
+        ('expires_at', 'd', lambda r: _epoch(r[9])),
+    ], zones, order=lambda r: r[2])
+    writer.table('disasters', [
+        ('id', STRING, lambda r: r[0]), ('type', STRING, lambda r: r[1]),
+        ('lat', 'i', lambda r: _e6(r[2])), ('lon', 'i', lambda r: _e6(r[3])),
+        ('radius_km', 'f', lambda r: r[4]), ('severity', STRING, lambda r: r[5]),
+        ('description', STRING, lambda r: r[6]), ('created_at', 'd', lambda r: _epoch(r[7])),
+        ('expires_at', 'd', lambda r: _epoch(r[8])),
+    ], disasters, order=lambda r: r[2])
+    max_radius = max((r[4] for r in zones + disasters), default=0.0)
+    writer.column('meta.max_radius_km', 'd', [max_radius])
+
+    # Gazetteer: partes y vértices en columnas planas
+    features = sorted(features, key=lambda r: r[4])
+    part_start, vertex_start, vlat, vlon = array('I', [0]), array('I', [0]), array('i'), array('i')
+    for row in features:
+        for part in _geometry_parts(json.loads(row[8])):
+            for lon, lat in part:
+                vlat.append(_e6(lat))
+                vlon.append(_e6(lon))
+            vertex_start.append(len(vlat))
+        part_start.append(len(vertex_start) - 1)
+    writer.table('features', [
+        ('kind', 'B', lambda r: FEATURE_KINDS.index(r[0])), ('name', STRING, lambda r: r[1]),
+        ('lat', 'i', lambda r: _e6(r[2])), ('lon', 'i', lambda r: _e6(r[3])),
+        ('min_lat', 'i', lambda r: _e6(r[4])), ('min_lon', 'i', lambda r: _e6(r[5])),
+        ('max_lat', 'i', lambda r: _e6(r[6])), ('max_lon', 'i', lambda r: _e6(r[7])),
+    ], features)
+    writer.column('features.part_start', 'I', part_start)
+    writer.column('parts.vertex_start', 'I', vertex_start)
+    writer.column('vertices.lat', 'i', vlat)
+    writer.column('vertices.lon', 'i', vlon)
+    writer.column('meta.max_feature_span', 'i', [max((_e6(r[6]) - _e6(r[4]) for r in features), default=0)])
+    writer.name_index('feature_names', (r[1] for r in features))
+
+    # Direcciones ordenadas por id de string de la calle (y número)
+    addresses = sorted(addresses, key=lambda r: (writer.string(r[0]), r[1]))
+    writer.table('addresses', [
+        ('street', STRING, lambda r: r[0]), ('number', STRING, lambda r: r[1]),
+        ('lat', 'i', lambda r: _e6(r[2])), ('lon', 'i', lambda r: _e6(r[3])),
+    ], addresses)
+
+    size = writer.write(path, cursor, gazetteer_version)
+    return {"places": len(places), "zones": len(zones), "disasters": len(disasters),
+            "features": len(features), "addresses": len(addresses),
+            "strings": len(writer._string_list), "bytes": size, "cursor": cursor}
+
+
+def _source_key(conn):
+    cursor = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+    gazetteer_version = conn.execute(
+        "SELECT version FROM data_versions WHERE name = 'gazetteer'").fetchone()[0]
+    return f"{cursor}-{gazetteer_version}"
+
+
+class BundleStore:
+    """Paquete vigente en disco para /api/offline/bundle
+
+    Se regenera cuando avanza change_log o cambia el gazetteer, o cada
+    MAX_AGE_SECONDS (zonas y desastres que vencen no escriben en la base).
+    Junto a cada paquete se guarda su versión gzip para servirla tal cual.
+    Varios workers pueden generar a la vez: se escribe a un temporal y se
+    renombra.
+    """
+
+    MAX_AGE_SECONDS = 3600
+
+    def __init__(self, directory, connect):
+        self.directory = directory
+        self._connect = connect
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"offline-{key}.zetab")
+
+    def current(self):
+        """(ruta, ruta .gz, etag) del paquete vigente, generándolo si falta"""
+        conn = self._connect()
+        try:
+            key = _source_key(conn)
+            path = self._path(key)
+            fresh = os.path.exists(f"{path}.gz") and time.time() - os.path.getmtime(path) < self.MAX_AGE_SECONDS
+            if not fresh:
+                with self._lock:
+                    fresh = os.path.exists(f"{path}.gz") and \
+                        time.time() - os.path.getmtime(path) < self.MAX_AGE_SECONDS
+                    if not fresh:
+                        os.makedirs(self.directory, exist_ok=True)
+                        build(conn, path)
+                        self._compress(path)
+                        self._cleanup(path)
+        finally:
+            conn.close()
+        return path, f"{path}.gz", f"{key}-{int(os.path.getmtime(path))}"
+
+    @staticmethod
+    def _compress(path):
+        with open(path, 'rb') as f:
+            data = gzip.compress(f.read(), GZIP_LEVEL)
+        with open(f"{path}.gz.tmp", 'wb') as f:
+            f.write(data)
+        os.replace(f"{path}.gz.tmp", f"{path}.gz")
+
+    def _cleanup(self, keep):
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('offline-') and path not in (keep, f"{keep}.gz"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+# ==================== LECTURA ====================
+class Bundle:
+    """Paquete abierto con mmap; las columnas son memoryviews sin copiar"""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise BundleError("Paquete vacío")
+        view = memoryview(self._mmap)
+        if len(view) < _HEADER.size:
+            self.close()
+            raise BundleError("Paquete truncado")
+        magic, version, _, self.created_at, self.cursor, self.gazetteer_version, count = \
+            _HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise BundleError(f"Formato no soportado: {magic!r} v{version}")
+        self._columns = {}
+        self._strings = set()
+        for i in range(count):
+            name, typecode, length, offset = _ENTRY.unpack_from(view, _HEADER.size + i * _ENTRY.size)
+            name, typecode = name.rstrip(b'\0').decode(), typecode.decode()
+            if typecode == STRING:
+                self._strings.add(name)
+                typecode = 'I'
+            size = array(typecode).itemsize * length
+            if offset + size > len(view):
+                self.close()
+                raise BundleError("Paquete truncado")
+            column = view[offset:offset + size].cast(typecode)
+            if sys.byteorder != 'little':
+                column = array(typecode, column)
+                column.byteswap()
+            self._columns[name] = column
+        self._string_offsets = self._columns['strings.offsets']
+        self._string_data = self._columns['strings.data']
+
+    def close(self):
+        columns, self._columns = getattr(self, '_columns', {}), {}
+        for column in columns.values():
+            if isinstance(column, memoryview):
+                column.release()
+        self._string_offsets = self._string_data = None
+        if getattr(self, '_mmap', None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def column(self, name):
+        return self._columns[name]
+
+    def count(self, table):
+        return len(self._columns[f"{table}.lat"])
+
+    def string(self, index):
+        offsets = self._string_offsets
+        return bytes(self._string_data[offsets[index]:offsets[index + 1]]).decode('utf-8')
+
+    def row(self, table, i, columns=None):
+        """Fila i de una tabla como dict (solo decodifica lo pedido)"""
+        prefix = f"{table}."
+        result = {}
+        for name, column in self._columns.items():
+            field = name[len(prefix):]
+            if not name.startswith(prefix) or field == 'part_start' or (columns and field not in columns):
+                continue
+            value = column[i]
+            if name in self._strings:
+                value = self.string(value)
+            elif field in _COORDINATES:
+                value = value / E6
+            elif column.format == 'd':
+                value = None if math.isnan(value) else datetime.fromtimestamp(value).isoformat()
+            elif column.format == 'f':
+                value = round(value, 3)
+            elif field == 'kind' and table == 'features':
+                value = FEATURE_KINDS[value]
+            result[field] = value
+        return result
+
+    # ---------- bbox ----------
+    def _lat_range(self, table, south, north, margin=0):
+        lats = self._columns[f"{table}.lat"]
+        return (bisect.bisect_left(lats, _e6(south) - margin),
+                bisect.bisect_right(lats, _e6(north) + margin))
+
+    def _rows_in_bbox(self, table, bbox, margin_km=0.0):
+        west, south, east, north = bbox
+        margin_lat = int(margin_km / 111.32 * E6)
+        start, end = self._lat_range(table, south, north, margin_lat)
+        lons = self._columns[f"{table}.lon"]
+        cos_lat = max(0.01, math.cos(math.radians(max(abs(south), abs(north)))))
+        margin_lon = int(margin_km / (111.32 * cos_lat) * E6)
+        w, e = _e6(west) - margin_lon, _e6(east) + margin_lon
+        return [i for i in range(start, end) if w <= lons[i] <= e]
+
+    def places_in_bbox(self, bbox):
+        return [self.row('places', i) for i in self._rows_in_bbox('places', bbox)]
+
+    def zones_in_bbox(self, bbox, now=None):
+        """Zonas cuyo círculo puede tocar el bbox y que siguen vigentes"""
+        now = time.time() if now is None else now
+        expires = self._columns['zones.expires_at']
+        margin = self._columns['meta.max_radius_km'][0]
+        return [self.row('zones', i) for i in self._rows_in_bbox('zones', bbox, margin)
+                if math.isnan(expires[i]) or expires[i] > now]
+
+    def disasters_in_bbox(self, bbox, now=None):
+        now = time.time() if now is None else now
+        expires = self._columns['disasters.expires_at']
+        margin = self._columns['meta.max_radius_km'][0]
+        return [self.row('disasters', i) for i in self._rows_in_bbox('disasters', bbox, margin)
+                if math.isnan(expires[i]) or expires[i] > now]
+
+    def features_in_bbox(self, bbox, kind=None):
+        """Elementos del gazetteer cuyo rectángulo toca el bbox"""
+        west, south, east, north = (_e6(v) for v in bbox)
+        min_lat = self._columns['features.min_lat']
+        span = self._columns['meta.max_feature_span'][0]
+        start = bisect.bisect_left(min_lat, south - span)
+        end = bisect.bisect_right(min_lat, north)
+        max_lat, min_lon, max_lon = (self._columns[f"features.{c}"] for c in ('max_lat', 'min_lon', 'max_lon'))
+        kinds = self._columns['features.kind']
+        code = FEATURE_KINDS.index(kind) if kind else None
+        return [i for i in range(start, end)
+                if max_lat[i] >= south and min_lon[i] <= east and max_lon[i] >= west
+                and (code is None or kinds[i] == code)]
+
+    def geometry(self, feature):
+        """Partes del elemento como listas de (lat, lon)"""
+        part_start, vertex_start = self._columns['features.part_start'], self._columns['parts.vertex_start']
+        vlat, vlon = self._columns['vertices.lat'], self._columns['vertices.lon']
+        return [[(vlat[v] / E6, vlon[v] / E6) for v in range(vertex_start[p], vertex_start[p + 1])]
+                for p in range(part_start[feature], part_start[feature + 1])]
+
+    # ---------- nombres ----------
+    def _token_range(self, index, prefix):
+        """Rango [lo, hi) de tokens del índice que empiezan con `prefix`"""
+        tokens = self._columns[f"{index}.token"]
+        lo, hi = 0, len(tokens)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.string(tokens[mid]) < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        end = lo
+        while end < len(tokens) and self.string(tokens[end]).startswith(prefix):
+            end += 1
+        return lo, end
+
+    def _lookup(self, index, text):
+        starts, postings = self._columns[f"{index}.start"], self._columns[f"{index}.rows"]
+        result = None
+        for token in _tokens(text):
+            lo, hi = self._token_range(index, token)
+            rows = set(postings[starts[lo]:starts[hi]])
+            result = rows if result is None else result & rows
+            if not result:
+                return []
+        return sorted(result or ())
+
+    def find_places(self, text, limit=20):
+        """Lugares cuyo nombre tiene todos los tokens (por prefijo)"""
+        return [self.row('places', i) for i in self._lookup('names', text)[:limit]]
+
+    def find_features(self, text, limit=20):
+        return [self.row('features', i) for i in self._lookup('feature_names', text)[:limit]]
+
+    def find_address(self, street, number):
+        """(lat, lon) de un número exterior de una calle con ese nombre exacto"""
+        street_ids = {self.column('features.name')[i] for i in self._lookup('feature_names', street)}
+        streets, numbers = self._columns['addresses.street'], self._columns['addresses.number']
+        for street_id in street_ids:
+            lo = bisect.bisect_left(streets, street_id)
+            hi = bisect.bisect_right(streets, street_id)
+            for i in range(lo, hi):
+                if self.string(numbers[i]) == str(number):
+                    return self._columns['addresses.lat'][i] / E6, self._columns['addresses.lon'][i] / E6
+        return None
+
+
+if __name__ == '__main__':
+    import json
+    import sqlite3
+
+    commands = ('build', 'info', 'find')
+    if len(sys.argv) < 3 or sys.argv[1] not in commands:
+        print(__doc__)
+        sys.exit(1)
+    command, args = sys.argv[1], sys.argv[2:]
+    if command == 'build':
+        import migrations
+
+        conn = sqlite3.connect(args[0])
+        migrations.migrate(conn)
+        start = time.perf_counter()
+        stats = build(conn, args[1])
+        conn.close()
+        print(f"Paquete en {time.perf_counter() - start:.2f}s: {stats}")
+    else:
+        with Bundle(args[0]) as b:
+            if command == 'info':
+                print(json.dumps({"created_at": datetime.fromtimestamp(b.created_at).isoformat(),
+                                  "cursor": b.cursor, "gazetteer_version": b.gazetteer_version,
+                                  **{t: b.count(t) for t in ('places', 'zones', 'disasters', 'features',
+                                                             'addresses')}}, ensure_ascii=False))
+            else:
+                for item in b.find_places(args[1]) + b.find_features(args[1]):
+                    print(json.dumps(item, ensure_ascii=False))
@@ -0,0 +1,289 @@
+"""
+Agrupación de marcadores del mapa por nivel de zoom
+
+Con el mapa alejado el frontend no necesita miles de puntos, sino cuántos
+hay en cada zona y de qué gravedad. Cada capa (reportes, lugares) guarda
+una jerarquía de rejillas en coordenadas Web Mercator, una por nivel de
+zoom entre MIN_ZOOM y MAX_ZOOM:
+
+- La celda del nivel z mide CLUSTER_RADIUS_PX píxeles de pantalla en ese
+  zoom; como cada nivel duplica la resolución, las celdas se anidan (la
+  celda de z es `x >> 1, y >> 1` de la de z + 1).
+- Insertar o quitar un punto actualiza una celda por nivel: contador,
+  suma de coordenadas (centroide) y conteo por tipo (gravedad o tipo de
+  lugar). No hay que reagrupar nada.
+- Consultar un bbox en un zoom solo toca las celdas visibles de ese nivel.
+  Arriba de MAX_ZOOM se devuelven los puntos sueltos.
+
+MapClusters mantiene las capas por proceso: cuando cambia la versión
+'risk' (triggers de la migración 3) o pasa REFRESH_SECONDS, relee los
+ids visibles y aplica solo la diferencia.
+"""
+import math
+import threading
+import time
+from datetime import datetime
+
+MIN_ZOOM = 8
+MAX_ZOOM = 16
+TILE_PX = 256
+CLUSTER_RADIUS_PX = 64
+# Bits por debajo de la rejilla de MIN_ZOOM: log2(TILE_PX / CLUSTER_RADIUS_PX)
+_CELL_BITS = int(math.log2(TILE_PX // CLUSTER_RADIUS_PX))
+_LEAF_SCALE = 1 << (MAX_ZOOM + _CELL_BITS)
+# Coordenadas en punto fijo (2^-32 del mundo ≈ 1 cm): las sumas de los
+# centroides son enteras y no acumulan error al insertar y quitar
+_FIXED_BITS = 32
+_FIXED_SCALE = 1 << _FIXED_BITS
+_LEAF_SHIFT = _FIXED_BITS - (MAX_ZOOM + _CELL_BITS)
+_MAX_LAT = 85.05112878
+
+REPORT_DAYS = 30
+REFRESH_SECONDS = 300
+
+REPORT_KINDS = ('high', 'medium', 'low')
+PLACE_KINDS = ('Restaurante', 'Museo/Cultura', 'Centro Comercial', 'Recreación', 'Cafetería', 'otro')
+
+
+def project(lat, lon):
+    """(lat, lon) -> (x, y) Web Mercator normalizado a [0, 1)"""
+    lat = max(-_MAX_LAT, min(_MAX_LAT, lat))
+    x = (lon + 180.0) / 360.0
+    sin_lat = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1.0 - 1e-12), min(max(y, 0.0), 1.0 - 1e-12)
+
+
+def unproject(x, y):
+    lon = x * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return lat, lon
+
+
+def parse_bbox(raw):
+    """'oeste,sur,este,norte' (toBBoxString de Leaflet) -> tupla de floats"""
+    try:
+        west, south, east, north = (float(v) for v in raw.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError("bbox debe ser oeste,sur,este,norte")
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        raise ValueError("bbox inválido")
+    return west, south, east, north
+
+
+class Cluster:
+    __slots__ = ('count', 'sx', 'sy', 'mix', 'point_id')
+
+    def __init__(self, kinds):
+        self.count = 0
+        self.sx = 0
+        self.sy = 0
+        self.mix = [0] * kinds
+        self.point_id = None
+
+
+class ClusterIndex:
+    """Jerarquía de rejillas de una capa; insert/remove O(niveles)"""
+
+    def __init__(self, kinds):
+        self.kinds = kinds
+        self._kind_slot = {kind: i for i, kind in enumerate(kinds)}
+        self.levels = {z: {} for z in range(MIN_ZOOM, MAX_ZOOM + 1)}
+        self.points = {}   # id -> (x, y, slot) en punto fijo
+        self.leaves = {}   # celda de MAX_ZOOM -> ids, para zoom > MAX_ZOOM
+
+    def __len__(self):
+        return len(self.points)
+
+    def _slot(self, kind):
+        return self._kind_slot.get(kind, len(self.kinds) - 1)
+
+    def insert(self, point_id, lat, lon, kind):
+        if point_id in self.points:
+            self.remove(point_id)
+        x, y = project(lat, lon)
+        x, y = int(x * _FIXED_SCALE), int(y * _FIXED_SCALE)
+        X, Y = x >> _LEAF_SHIFT, y >> _LEAF_SHIFT
+        slot = self._slot(kind)
+        self.points[point_id] = (x, y, slot)
+        for z, cells in self.levels.items():
+            shift = MAX_ZOOM - z
+            key = (X >> shift, Y >> shift)
+            cluster = cells.get(key)
+            if cluster is None:
+                cluster = cells[key] = Cluster(len(self.kinds))
+            cluster.count += 1
+            cluster.sx += x
+            cluster.sy += y
+            cluster.mix[slot] += 1
+            cluster.point_id = point_id if cluster.count == 1 else None
+        self.leaves.setdefault((X, Y), set()).add(point_id)
+
+    def remove(self, point_id):
+        entry = self.points.pop(point_id, None)
+        if entry is None:
+            return False
+        x, y, slot = entry
+        X, Y = x >> _LEAF_SHIFT, y >> _LEAF_SHIFT
+        for z, cells in self.levels.items():
+            shift = MAX_ZOOM - z
+            key = (X >> shift, Y >> shift)
+            cluster = cells[key]
+            cluster.count -= 1
+            if cluster.count == 0:
+                del cells[key]
+                continue
+            cluster.sx -= x
+            cluster.sy -= y
+            cluster.mix[slot] -= 1
+        members = self.leaves[(X, Y)]
+        members.discard(point_id)
+        if not members:
+            del self.leaves[(X, Y)]
+        # Celdas que quedaron con un solo punto: recuperar su id
+        for z, cells in self.levels.items():
+            shift = MAX_ZOOM - z
+            cluster = cells.get((X >> shift, Y >> shift))
+            if cluster is not None and cluster.count == 1 and cluster.point_id is None:
+                cluster.point_id = self._single_member(z, X >> shift, Y >> shift)
+        return True
+
+    def _single_member(self, z, cx, cy):
+        """Id del único punto bajo la celda (cx, cy) del nivel z"""
+        while z < MAX_ZOOM:
+            z += 1
+            cells = self.levels[z]
+            for child in ((2 * cx, 2 * cy), (2 * cx + 1, 2 * cy), (2 * cx, 2 * cy + 1), (2 * cx + 1, 2 * cy + 1)):
+                if child in cells:
+                    cx, cy = child
+                    break
+        return next(iter(self.leaves.get((cx, cy), ())), None)
+
+    def expansion_zoom(self, z, cx, cy):
+        """Primer zoom en el que el grupo se divide (como en supercluster)"""
+        while z < MAX_ZOOM:
+            z += 1
+            cells = self.levels[z]
+            children = [child for child in ((2 * cx, 2 * cy), (2 * cx + 1, 2 * cy),
+                                            (2 * cx, 2 * cy + 1), (2 * cx + 1, 2 * cy + 1))
+                        if child in cells]
+            if len(children) > 1:
+                return z
+            cx, cy = children[0]
+        return MAX_ZOOM + 1
+
+    def _cells_in(self, cells, shift_scale, bbox):
+        west, south, east, north = bbox
+        x0, y0 = (int(v * _FIXED_SCALE) for v in project(north, west))
+        x1, y1 = (int(v * _FIXED_SCALE) for v in project(south, east))
+        cx0, cy0 = x0 // (_FIXED_SCALE // shift_scale), y0 // (_FIXED_SCALE // shift_scale)
+        cx1, cy1 = x1 // (_FIXED_SCALE // shift_scale), y1 // (_FIXED_SCALE // shift_scale)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(cells):
+            # bbox enorme para este zoom: recorrer las celdas ocupadas
+            return [(key, c) for key, c in cells.items()
+                    if cx0 <= key[0] <= cx1 and cy0 <= key[1] <= cy1], (x0, y0, x1, y1)
+        found = []
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                cluster = cells.get((cx, cy))
+                if cluster is not None:
+                    found.append(((cx, cy), cluster))
+        return found, (x0, y0, x1, y1)
+
+    def query(self, bbox, zoom):
+        """Grupos (centroide dentro del bbox) del nivel `zoom`"""
+        zoom = max(MIN_ZOOM, int(zoom))
+        results = []
+        if zoom > MAX_ZOOM:
+            found, (x0, y0, x1, y1) = self._cells_in(self.leaves, _LEAF_SCALE, bbox)
+            for _, members in found:
+                for point_id in members:
+                    x, y, slot = self.points[point_id][:3]
+                    if x0 <= x <= x1 and y0 <= y <= y1:
+                        results.append(self._point_dict(point_id, x, y, slot))
+            return results
+
+        found, (x0, y0, x1, y1) = self._cells_in(self.levels[zoom], 1 << (zoom + _CELL_BITS), bbox)
+        for (cx, cy), cluster in found:
+            x, y = cluster.sx // cluster.count, cluster.sy // cluster.count
+            if not (x0 <= x <= x1 and y0 <= y <= y1):
+                continue
+            if cluster.count == 1:
+                results.append(self._point_dict(cluster.point_id, x, y, cluster.mix.index(1)))
+                continue
+            lat, lon = unproject(x / _FIXED_SCALE, y / _FIXED_SCALE)
+            results.append({
+                "key": f"{zoom}/{cx}/{cy}",
+                "lat": round(lat, 6),
+                "lon": round(lon, 6),
+                "count": cluster.count,
+                "mix": {kind: n for kind, n in zip(self.kinds, cluster.mix) if n},
+                "expansion_zoom": self.expansion_zoom(zoom, cx, cy)
+            })
+        return results
+
+    def _point_dict(self, point_id, x, y, slot):
+        lat, lon = unproject(x / _FIXED_SCALE, y / _FIXED_SCALE)
+        return {"id": point_id, "lat": round(lat, 6), "lon": round(lon, 6), "count": 1,
+                "mix": {self.kinds[slot]: 1}}
+
+
+class Layer:
+    """Capa con su consulta de puntos visibles y su índice"""
+
+    def __init__(self, kinds, sql, params=None):
+        self.index = ClusterIndex(kinds)
+        self.sql = sql
+        self.params = params or (lambda: ())
+        self.rows = {}  # id -> (lat, lon, tipo) tal como está en el índice
+        self.version = None
+        self.loaded_at = 0.0
+        self.lock = threading.Lock()
+
+    def sync(self, conn):
+        """Aplicar la diferencia entre lo visible en la base y el índice"""
+        visible = {point_id: (lat, lon, kind)
+                   for point_id, lat, lon, kind in conn.execute(self.sql, self.params())}
+        removed = [point_id for point_id in self.rows if point_id not in visible]
+        for point_id in removed:
+            self.index.remove(point_id)
+            del self.rows[point_id]
+        added = 0
+        for point_id, row in visible.items():
+            if self.rows.get(point_id) != row:
+                self.index.insert(point_id, *row)
+                self.rows[point_id] = row
+                added += 1
+        return added, len(removed)
+
+
+class MapClusters:
+    def __init__(self, connect, watcher):
+        self._connect = connect
+        self._watcher = watcher
+        self.layers = {
+            "reports": Layer(REPORT_KINDS, '''
+                SELECT id, lat, lon, severity FROM reports
+                WHERE verified = 1 AND status = 'active' AND created_at > ?
+            ''', lambda: (datetime.fromtimestamp(time.time() - REPORT_DAYS * 86400),)),
+            "places": Layer(PLACE_KINDS, "SELECT id, lat, lon, type FROM places"),
+        }
+
+    def layer(self, name):
+        layer = self.layers[name]
+        version = self._watcher.version('risk')
+        now = time.time()
+        if layer.version != version or version is None or now - layer.loaded_at > REFRESH_SECONDS:
+            conn = self._connect()
+            try:
+                with layer.lock:
+                    layer.sync(conn)
+                    layer.version, layer.loaded_at = version, now
+            finally:
+                conn.close()
+        return layer
+
+    def query(self, name, bbox, zoom):
+        layer = self.layer(name)
+        with layer.lock:
+            return layer.index.query(bbox, zoom)
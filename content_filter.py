@@ -0,0 +1,196 @@
+"""
+Filtro de contenido para textos de usuarios (reportes y reseñas)
+
+validate_text recorría 8 expresiones con re.search(..., re.IGNORECASE) por
+texto; la de click/buy (`\\b(click|here|now)\\b.*\\b(buy|win|free)\\b`) es
+cuadrática con muchos "click" sin cierre en la misma línea.
+
+Aquí las reglas se compilan en pocas búsquedas donde cada alternativa tiene
+largo acotado, así que revisar un texto cuesta O(largo × tamaño de las
+reglas) sin importar el contenido:
+
+- Palabras clave: todas las reglas `literal` y `words` y las palabras de
+  `sequences` en una sola alternancia que empieza siempre con un carácter
+  fijo; así re salta de golpe las posiciones que no pueden iniciar
+  ninguna. El \\b inicial y la condición "misma línea" de las secuencias
+  (en lugar de `.*`) se revisan en Python, solo en las coincidencias.
+- `letters`: una corrida de N letras, buscada solo desde el inicio de
+  cada corrida.
+- `repeated`: el mismo carácter N veces seguidas.
+
+Mayúsculas: el texto se pasa a minúsculas una vez (minúscula simple por
+carácter, como compara re.IGNORECASE) y las letras de las reglas se
+expanden a las variantes que re.IGNORECASE también acepta (ı con i, ſ con
+s). El resultado es el mismo que con las expresiones originales.
+
+En lote (check_many) los textos se unen con saltos de línea y cada
+búsqueda recorre todo de una vez; ninguna regla cruza un salto de línea.
+
+Uso:
+    python content_filter.py check "Gana dinero ya, click aquí y buy now"
+    python content_filter.py scan descripciones.txt
+"""
+import re
+from bisect import bisect_right
+
+# Además de la minúscula, re.IGNORECASE iguala estas letras
+_CASE_VARIANTS = {'i': 'ı', 's': 'ſ'}
+_CANONICAL = str.maketrans({variant: ch for ch, variant in _CASE_VARIANTS.items()})
+_LETTER = f"[a-z{''.join(_CASE_VARIANTS.values())}]"
+_word_char = re.compile(r'\w').match
+
+
+def _letters(text):
+    """Cadena de la regla a patrón, con las variantes de cada letra"""
+    return ''.join(f'[{ch}{_CASE_VARIANTS[ch]}]' if ch in _CASE_VARIANTS else re.escape(ch) for ch in text)
+
+
+def lowered(text):
+    """Minúscula simple por carácter, mismo largo que `text`
+
+    str.lower() usa la minúscula completa: İ da dos caracteres y Σ al final
+    de palabra da ς; re.IGNORECASE compara con la simple (i y σ).
+    """
+    return text.replace('İ', 'i').replace('Σ', 'σ').lower()
+
+
+class ContentFilter:
+    """Reglas compiladas en búsquedas de tiempo lineal"""
+
+    def __init__(self, rules, sequences=()):
+        self.rules = list(rules)
+        self.sequences = list(sequences)
+        # Palabra clave (en minúsculas, sin variantes) -> (tipo, regla, \b inicial)
+        self._keywords = {}
+        literals, words = [], []
+
+        def add(keyword, entry):
+            keyword = keyword.lower()
+            assert keyword not in self._keywords and '\n' not in keyword
+            self._keywords[keyword] = entry
+            (words if entry[2] else literals).append(keyword)
+
+        runs = []
+        for name, kind, arg in self.rules:
+            if kind == 'literal':
+                for keyword in arg:
+                    add(keyword, ('rule', name, False))
+            elif kind == 'words':
+                for keyword in arg:
+                    add(keyword, ('rule', name, True))
+            elif kind == 'letters':
+                runs.append((name, re.compile(f'(?<!{_LETTER}){_LETTER}{{{arg}}}').search))
+            elif kind == 'repeated':
+                runs.append((name, re.compile(f'([^\\n])\\1{{{arg - 1}}}').search))
+            else:
+                raise ValueError(f"Tipo de regla desconocido: {kind}")
+        for index, (name, first, then) in enumerate(self.sequences):
+            for keyword in first:
+                add(keyword, ('first', index, True))
+            for keyword in then:
+                add(keyword, ('then', index, True))
+
+        # Literales primero: si ganan la alternancia, ya son coincidencia
+        alternatives = [_letters(k) for k in literals] + [_letters(k) + r'\b' for k in words]
+        self._keyword_search = re.compile('|'.join(alternatives)).search if alternatives else None
+        self._passes = ([self._scan_keywords] if alternatives else []) + [
+            self._run_pass(name, search) for name, search in runs
+        ]
+
+    @staticmethod
+    def _run_pass(name, search):
+        def scan(text, pos, end):
+            match = search(text, pos, end)
+            return (name, match.start()) if match else None
+        return scan
+
+    def _scan_keywords(self, text, pos, end):
+        """(regla, posición) de la primera palabra clave que aplica, o None"""
+        search = self._keyword_search
+        open_until = {}  # secuencia -> fin de la línea donde apareció su primera palabra
+        while True:
+            match = search(text, pos, end)
+            if match is None:
+                return None
+            start = match.start()
+            # Se sigue desde el siguiente carácter: una coincidencia descartada
+            # no debe tapar otra que empiece dentro de ella
+            pos = start + 1
+            kind, value, boundary = self._keywords[match.group().translate(_CANONICAL)]
+            if boundary and start > 0 and _word_char(text, start - 1):
+                continue
+            if kind == 'rule':
+                return value, start
+            if kind == 'first':
+                if open_until.get(value, -1) < start:
+                    line_end = text.find('\n', start, end)
+                    open_until[value] = end if line_end < 0 else line_end
+            elif open_until.get(value, -1) > start:
+                return self.sequences[value][0], start
+
+    def match(self, text):
+        """Nombre de la regla que aplica a `text`, o None"""
+        text = lowered(text)
+        for scan in self._passes:
+            hit = scan(text, 0, len(text))
+            if hit:
+                return hit[0]
+        return None
+
+    def check_many(self, texts):
+        """match() de cada texto, con cada búsqueda pasando una vez por todos"""
+        texts = list(texts)
+        joined = lowered('\n'.join(texts))
+        starts, offset = [], 0
+        for text in texts:
+            starts.append(offset)
+            offset += len(text) + 1
+        results = [None] * len(texts)
+        for scan in self._passes:
+            pos = 0
+            while pos < len(joined):
+                hit = scan(joined, pos, len(joined))
+                if hit is None:
+                    break
+                index = bisect_right(starts, hit[1]) - 1
+                if results[index] is None:
+                    results[index] = hit[0]
+                # El resto de ese texto ya no importa
+                pos = starts[index + 1] if index + 1 < len(texts) else len(joined)
+        return results
+
+
+SPAM_FILTER = ContentFilter([
+    ('url', 'literal', ('http://', 'https://')),
+    ('www', 'literal', ('www.',)),
+    ('spam_words', 'words', ('viagra', 'casino', 'lottery', 'prize', 'winner', 'congratulations')),
+    ('shouting', 'letters', 15),
+    ('repeated_char', 'repeated', 8),
+    ('dollars', 'literal', ('$$$',)),
+    ('exclamations', 'literal', ('!' * 7,)),
+], sequences=[
+    ('click_bait', ('click', 'here', 'now'), ('buy', 'win', 'free')),
+])
+
+
+if __name__ == '__main__':
+    import json
+    import sys
+    import time
+    from collections import Counter
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ('check', 'scan'):
+        print(__doc__)
+        sys.exit(1)
+    if sys.argv[1] == 'check':
+        print(json.dumps({"rule": SPAM_FILTER.match(sys.argv[2])}))
+    else:
+        # Una línea por texto (como llegan de un export o importación masiva)
+        with open(sys.argv[2], encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        start = time.perf_counter()
+        results = SPAM_FILTER.check_many(lines)
+        elapsed = time.perf_counter() - start
+        counts = Counter(rule for rule in results if rule)
+        print(json.dumps({"texts": len(lines), "flagged": sum(counts.values()), "rules": dict(counts),
+                          "seconds": round(elapsed, 3)}))
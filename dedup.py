@@ -0,0 +1,254 @@
+"""
+Detección de reportes duplicados al enviarlos
+
+En un incidente grande llegan decenas de reportes del mismo evento. Cada
+uno pasaba por moderación y, al verificarse, creaba su propia zona de
+0.5 km. Al enviar un reporte se busca uno "canónico" del mismo evento:
+
+- Bloque espacio-temporal: celda geohash de GEOHASH_PRECISION (~0.6 × 1.1
+  km) más sus 8 vecinas, y cubetas de WINDOW_SECONDS (la actual y la
+  anterior).
+- Texto: firma MinHash de NUM_PERM valores sobre 4-gramas de caracteres
+  del texto normalizado (sin acentos ni mayúsculas, como gazetteer.py).
+  La firma se parte en BANDS bandas; cada banda + celda es una llave de
+  report_lsh. Solo se leen los reportes que comparten al menos una llave,
+  así que el costo no depende de cuántos reportes hay en la base.
+- Entre esos candidatos se toma el de mayor similitud estimada (fracción
+  de valores iguales en la firma) si es >= DUPLICATE_SIMILARITY, está a
+  menos de DUPLICATE_RADIUS_KM (y por las cubetas, se creó hace menos de
+  2 × WINDOW_SECONDS).
+- Solo cuentan los candidatos de la misma categoría y de severidad igual
+  o mayor. El nombre de la calle pesa mucho en los 4-gramas: "Asalto en
+  Av. Universidad" y "Bache en Av. Universidad" se parecen más que el
+  umbral, y un asalto alto no puede quedar como voto de un bache bajo.
+
+El duplicado se guarda con status 'duplicate' y duplicate_of = canónico
+(no entra a moderación ni crea zona). Quien lo envió cuenta como voto a
+favor del canónico y los votos posteriores al duplicado se cuentan en el
+canónico. Solo los canónicos se indexan; las filas de cubetas viejas se
+borran al indexar.
+
+Uso:
+    python dedup.py check zeta_pro.db 28.6353 -106.0886 traffic medium "Choque en Av. Universidad"
+"""
+import hashlib
+import math
+import random
+import time
+import zlib
+from array import array
+from datetime import datetime
+
+from gazetteer import normalize
+from read_model import parse_timestamp
+
+GEOHASH_PRECISION = 6
+WINDOW_SECONDS = 6 * 3600
+NUM_PERM = 60
+BANDS = 20
+ROWS = NUM_PERM // BANDS
+SHINGLE = 4
+# Con 20 bandas de 3, un par con similitud 0.5 es candidato el 93% de las
+# veces y uno con 0.6, el 99%
+DUPLICATE_SIMILARITY = 0.5
+DUPLICATE_RADIUS_KM = 0.5
+SEVERITY_RANK = {'low': 0, 'medium': 1, 'high': 2}
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_PRIME = (1 << 61) - 1
+_rnd = random.Random(20240611)
+_PERMUTATIONS = [(_rnd.randrange(1, _PRIME), _rnd.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+# ==================== FIRMAS ====================
+def geohash(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        target, interval = (lon, lon_range) if even else (lat, lat_range)
+        mid = (interval[0] + interval[1]) / 2
+        if target >= mid:
+            value = value * 2 + 1
+            interval[0] = mid
+        else:
+            value *= 2
+            interval[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def neighborhood(lat, lon, precision=GEOHASH_PRECISION):
+    """Celda del punto y sus 8 vecinas"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    dlat, dlon = 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+    return {geohash(max(-90.0, min(90.0, lat + i * dlat)), (lon + j * dlon + 180.0) % 360.0 - 180.0, precision)
+            for i in (-1, 0, 1) for j in (-1, 0, 1)}
+
+
+def time_bucket(ts):
+    return int(ts // WINDOW_SECONDS)
+
+
+def shingles(text):
+    joined = ' '.join(normalize(text))
+    if len(joined) <= SHINGLE:
+        return {joined} if joined else set()
+    return {joined[i:i + SHINGLE] for i in range(len(joined) - SHINGLE + 1)}
+
+
+def signature(text):
+    """Firma MinHash (array de NUM_PERM enteros)"""
+    hashes = [zlib.crc32(s.encode('utf-8')) for s in shingles(text)]
+    if not hashes:
+        return array('Q', [_PRIME] * NUM_PERM)
+    return array('Q', [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS])
+
+
+def similarity(sig_a, sig_b):
+    """Jaccard estimado entre dos firmas"""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_PERM
+
+
+def _band_keys(cell, sig):
+    keys = []
+    for band in range(BANDS):
+        chunk = sig[band * ROWS:(band + 1) * ROWS].tobytes()
+        digest = hashlib.blake2b(cell.encode() + bytes([band]) + chunk, digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+
+def _distance_km(lat_a, lon_a, lat_b, lon_b):
+    # Equirrectangular: sobra a escala de cientos de metros
+    x = math.radians(lon_b - lon_a) * math.cos(math.radians((lat_a + lat_b) / 2))
+    y = math.radians(lat_b - lat_a)
+    return 6371.0 * math.hypot(x, y)
+
+
+# ==================== ÍNDICE ====================
+def index(cursor, report_id, lat, lon, sig, created_ts):
+    """Registrar un reporte canónico; no hace commit"""
+    bucket = time_bucket(created_ts)
+    cursor.execute("DELETE FROM report_lsh WHERE time_bucket < ?", (bucket - 1,))
+    cursor.execute("DELETE FROM report_signatures WHERE time_bucket < ?", (bucket - 1,))
+    cursor.execute('''
+        INSERT OR REPLACE INTO report_signatures (report_id, time_bucket, signature) VALUES (?, ?, ?)
+    ''', (report_id, bucket, sig.tobytes()))
+    cursor.executemany('''
+        INSERT OR IGNORE INTO report_lsh (key, report_id, time_bucket) VALUES (?, ?, ?)
+    ''', [(key, report_id, bucket) for key in _band_keys(geohash(lat, lon), sig)])
+
+
+def find_duplicate(cursor, lat, lon, sig, category, severity, now=None):
+    """(id canónico, similitud) del mejor candidato, o (None, 0.0)
+
+    El canónico debe ser de la misma categoría y de severidad >= severity.
+    """
+    now = time.time() if now is None else now
+    keys = [key for cell in neighborhood(lat, lon) for key in _band_keys(cell, sig)]
+    # CROSS JOIN fija el orden: partir de las llaves, no de los reportes
+    # con duplicate_of IS NULL (casi todos)
+    cursor.execute(f'''
+        SELECT DISTINCT r.id, r.lat, r.lon, r.severity, s.signature
+        FROM report_lsh l
+        CROSS JOIN report_signatures s ON s.report_id = l.report_id
+        CROSS JOIN reports r ON r.id = l.report_id
+        WHERE l.key IN ({', '.join('?' * len(keys))}) AND l.time_bucket >= ?
+          AND r.status != 'rejected' AND r.duplicate_of IS NULL AND r.category = ?
+    ''', keys + [time_bucket(now) - 1, category])
+    rank = SEVERITY_RANK.get(severity, 0)
+    best, best_score = None, 0.0
+    for report_id, r_lat, r_lon, r_severity, blob in cursor.fetchall():
+        if SEVERITY_RANK.get(r_severity, 0) < rank:
+            continue
+        if _distance_km(lat, lon, r_lat, r_lon) > DUPLICATE_RADIUS_KM:
+            continue
+        score = similarity(sig, array('Q', blob))
+        if score >= DUPLICATE_SIMILARITY and score > best_score:
+            best, best_score = report_id, score
+    return best, best_score
+
+
+# ==================== FUSIÓN ====================
+def canonical_of(cursor, report_id):
+    row = cursor.execute("SELECT COALESCE(duplicate_of, id) FROM reports WHERE id = ?", (report_id,)).fetchone()
+    return row[0] if row else None
+
+
+def add_vote(cursor, report_id, user_id, vote_type='up'):
+    """Voto nuevo (si el usuario no había votado); True si se contó"""
+    cursor.execute('''
+        INSERT OR IGNORE INTO report_votes (report_id, user_id, vote_type) VALUES (?, ?, ?)
+    ''', (report_id, user_id, vote_type))
+    if cursor.rowcount != 1:
+        return False
+    column = 'upvotes' if vote_type == 'up' else 'downvotes'
+    cursor.execute(f"UPDATE reports SET {column} = {column} + 1 WHERE id = ?", (report_id,))
+    return True
+
+
+def merge(cursor, duplicate_id, canonical_id):
+    """Marcar duplicate_id como duplicado y pasar sus votos; no hace commit
+
+    Los votos de usuarios que ya habían votado en el canónico se descartan.
+    Devuelve cuántos votos se movieron.
+    """
+    votes = cursor.execute('''
+        SELECT user_id, vote_type FROM report_votes WHERE report_id = ?
+    ''', (duplicate_id,)).fetchall()
+    moved = sum(add_vote(cursor, canonical_id, user_id, vote_type) for user_id, vote_type in votes)
+    cursor.execute("DELETE FROM report_votes WHERE report_id = ?", (duplicate_id,))
+    cursor.execute('''
+        UPDATE reports SET duplicate_of = ?, status = 'duplicate', verified = 0, upvotes = 0, downvotes = 0
+        WHERE id = ?
+    ''', (canonical_id, duplicate_id))
+    # Los que apuntaban al duplicado ahora apuntan al canónico
+    cursor.execute("UPDATE reports SET duplicate_of = ? WHERE duplicate_of = ?", (canonical_id, duplicate_id))
+    cursor.execute("DELETE FROM report_lsh WHERE report_id = ?", (duplicate_id,))
+    cursor.execute("DELETE FROM report_signatures WHERE report_id = ?", (duplicate_id,))
+    return moved
+
+
+def backfill(conn, now=None):
+    """Indexar los reportes canónicos de las dos últimas cubetas"""
+    now = time.time() if now is None else now
+    cursor = conn.cursor()
+    since = time_bucket(now) - 1
+    rows = cursor.execute('''
+        SELECT id, lat, lon, description, created_at FROM reports
+        WHERE status != 'rejected' AND duplicate_of IS NULL AND created_at >= ?
+    ''', (datetime.fromtimestamp(since * WINDOW_SECONDS),)).fetchall()
+    indexed = 0
+    for report_id, lat, lon, description, created_at in rows:
+        created_ts = parse_timestamp(created_at)
+        if created_ts is None:
+            continue
+        index(cursor, report_id, lat, lon, signature(description), created_ts)
+        indexed += 1
+    return indexed
+
+
+if __name__ == '__main__':
+    import json
+    import sqlite3
+    import sys
+
+    import migrations
+
+    if len(sys.argv) < 8 or sys.argv[1] != 'check':
+        print(__doc__)
+        sys.exit(1)
+    conn = sqlite3.connect(sys.argv[2])
+    migrations.migrate(conn)
+    lat, lon = float(sys.argv[3]), float(sys.argv[4])
+    start = time.perf_counter()
+    duplicate_of, score = find_duplicate(conn.cursor(), lat, lon, signature(sys.argv[7]),
+                                               sys.argv[5], sys.argv[6])
+    print(json.dumps({"duplicate_of": duplicate_of, "similarity": round(score, 3),
+                      "ms": round((time.perf_counter() - start) * 1000, 2)}))
+    conn.close()
@@ -0,0 +1,805 @@
+"""
+Gazetteer local de calles, colonias y puntos de interés
+
+Se importa una vez desde un extracto offline de OpenStreetMap exportado a
+GeoJSON (por ejemplo con osmium) y queda en las tablas gazetteer_* de la
+base. Cada proceso arma en memoria un índice de trigramas sobre los nombres
+normalizados (sin acentos, abreviaturas expandidas) para resolver destinos
+con errores de dedo, y usa los puntos con número exterior (addr:housenumber)
+para ubicar direcciones como "Av. Universidad 2500".
+
+Para geocodificación inversa los tramos de calle y los polígonos de
+colonia van a dos STR-trees en metros (proyección local); una consulta
+devuelve la calle más cercana y la colonia que contiene el punto.
+
+Los índices se recargan solo cuando cambia la fila 'gazetteer' de
+data_versions, que incrementa el importador.
+
+Uso:
+    osmium export chihuahua.osm.pbf -f geojsonseq -o chihuahua.geojsonseq
+    python gazetteer.py import zeta_pro.db chihuahua.geojsonseq
+    python gazetteer.py geocode zeta_pro.db "av universidad 2500"
+    python gazetteer.py reverse zeta_pro.db 28.6353 -106.0886
+    python gazetteer.py backfill zeta_pro.db [--overwrite]
+"""
+import heapq
+import json
+import math
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+MIN_SCORE = 0.5
+# Errores de dedo: la distancia de edición solo cuenta desde esta similitud
+MIN_EDIT_SIMILARITY = 0.75
+CANDIDATES = 20
+
+STREET_HIGHWAYS = {
+    'motorway', 'trunk', 'primary', 'secondary', 'tertiary', 'unclassified', 'residential',
+    'living_street', 'pedestrian', 'service', 'road',
+    'motorway_link', 'trunk_link', 'primary_link', 'secondary_link', 'tertiary_link',
+}
+COLONIA_PLACES = {'neighbourhood', 'suburb', 'quarter'}
+LANDMARK_KEYS = ('amenity', 'tourism', 'shop', 'leisure', 'historic', 'building',
+                 'public_transport', 'railway', 'office', 'healthcare', 'man_made')
+
+_ABBREVIATIONS = {
+    'av': 'avenida', 'ave': 'avenida', 'avda': 'avenida',
+    'blvd': 'bulevar', 'blv': 'bulevar', 'boulevard': 'bulevar', 'bulevard': 'bulevar',
+    'c': 'calle', 'cll': 'calle', 'cjon': 'callejon', 'priv': 'privada',
+    'prol': 'prolongacion', 'perif': 'periferico', 'carr': 'carretera', 'cto': 'circuito',
+    'col': 'colonia', 'fracc': 'fraccionamiento', 'fracto': 'fraccionamiento',
+    'gral': 'general', 'lic': 'licenciado', 'ing': 'ingeniero', 'dr': 'doctor',
+    'sn': 'san', 'sta': 'santa', 'sto': 'santo', 'pte': 'poniente', 'ote': 'oriente',
+}
+STREET_WORDS = {'avenida', 'bulevar', 'calle', 'callejon', 'privada', 'prolongacion',
+                'periferico', 'carretera', 'circuito', 'andador', 'paseo', 'calzada'}
+COLONIA_WORDS = {'colonia', 'fraccionamiento', 'barrio', 'residencial'}
+_TYPE_WORDS = STREET_WORDS | COLONIA_WORDS
+_STOPWORDS = {'de', 'del', 'la', 'las', 'el', 'los', 'y'}
+# Partes de la consulta que no ayudan dentro de la ciudad
+_CITY_PARTS = {'chihuahua', 'chih', 'mexico', 'mx', 'chihuahua chihuahua', 'chihuahua mexico'}
+
+_EXPLICIT_NUMBER = re.compile(r'(?:#|\bno\.?|\bnum\.?|\bn[uú]mero)\s*(\d{1,5})\b', re.IGNORECASE)
+_TRAILING_NUMBER = re.compile(r'^(.*\S)\s+(\d{1,5})\s*$')
+_LEADING_NUMBER = re.compile(r'^\s*(\d{1,5})\s+(\D.*)$')
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+_DIGITS = re.compile(r'\d+')
+
+KIND_PRIORITY = {'landmark': 2, 'street': 1, 'colonia': 0}
+
+
+def normalize(text):
+    """Texto libre -> tokens sin acentos, en minúsculas y con abreviaturas expandidas"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    tokens = [_ABBREVIATIONS.get(token, token) for token in _NON_WORD.split(text) if token]
+    if len(tokens) > 1:
+        # "clle 10a", "colnoia centro": el tipo también puede venir con error de dedo
+        tokens[0] = _type_word(tokens[0])
+    return tokens
+
+
+def core_tokens(tokens):
+    """Tokens que identifican el nombre (sin tipo de vialidad ni artículos)"""
+    core = [t for t in tokens if t not in STREET_WORDS and t not in COLONIA_WORDS
+            and t not in _STOPWORDS]
+    return core or tokens
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_similarity(a, b, minimum=0.0):
+    """1 - distancia Damerau-Levenshtein (transposiciones adyacentes) / longitud mayor
+
+    Devuelve 0.0 en cuanto se sabe que el resultado quedará bajo `minimum`.
+    """
+    if a == b:
+        return 1.0
+    la, lb = len(a), len(b)
+    longest = max(la, lb)
+    if not la or not lb or 1.0 - abs(la - lb) / longest < minimum:
+        return 0.0
+    max_distance = int((1.0 - minimum) * longest + 1e-9)
+    before, previous = None, list(range(lb + 1))
+    for i in range(1, la + 1):
+        current = [i] + [0] * lb
+        for j in range(1, lb + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = previous[j - 1] + cost
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1] and before[j - 2] + 1 < value:
+                value = before[j - 2] + 1
+            current[j] = value
+        if min(current) > max_distance:
+            return 0.0
+        before, previous = previous, current
+    return 1.0 - previous[lb] / longest
+
+
+@lru_cache(maxsize=4096)
+def _type_word(token):
+    """Tipo de vialidad o colonia escrito con error de dedo -> forma canónica"""
+    if len(token) >= 4 and token not in _TYPE_WORDS:
+        for word in _TYPE_WORDS:
+            if edit_similarity(token, word, MIN_EDIT_SIMILARITY):
+                return word
+    return token
+
+
+def _representative_point(geometry):
+    """(lat, lon) representativo: vértice medio de una línea, centroide de vértices de un polígono"""
+    kind, coords = geometry['type'], geometry['coordinates']
+    if kind == 'Point':
+        return coords[1], coords[0]
+    if kind == 'LineString':
+        lon, lat = coords[len(coords) // 2]
+        return lat, lon
+    if kind == 'MultiLineString':
+        return _representative_point({'type': 'LineString', 'coordinates': max(coords, key=len)})
+    if kind == 'MultiPolygon':
+        coords = max(coords, key=lambda polygon: len(polygon[0]))
+    ring = coords[0]
+    if len(ring) > 1 and ring[0] == ring[-1]:
+        ring = ring[:-1]
+    return sum(p[1] for p in ring) / len(ring), sum(p[0] for p in ring) / len(ring)
+
+
+def _bbox(geometry):
+    points = []
+
+    def collect(coords):
+        if coords and isinstance(coords[0], (int, float)):
+            points.append(coords)
+        else:
+            for c in coords:
+                collect(c)
+
+    collect(geometry['coordinates'])
+    lons = [p[0] for p in points]
+    lats = [p[1] for p in points]
+    return min(lats), min(lons), max(lats), max(lons)
+
+
+# ==================== IMPORTACIÓN ====================
+def read_features(path):
+    """Features de un FeatureCollection o de un GeoJSON secuencial (una por línea)"""
+    with open(path, encoding='utf-8') as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        f.seek(0)
+        if head == '{':
+            first_line = f.readline()
+            try:
+                doc = json.loads(first_line)
+            except ValueError:
+                doc = None
+            if doc is None or doc.get('type') == 'FeatureCollection':
+                f.seek(0)
+                yield from json.load(f).get('features', [])
+                return
+            yield doc
+        for line in f:
+            line = line.strip().lstrip('\x1e')
+            if line:
+                yield json.loads(line)
+
+
+def classify(feature):
+    """Filas (tabla, valores) que aporta una feature OSM; puede ser más de una"""
+    props = feature.get('properties') or {}
+    geometry = feature.get('geometry')
+    if not geometry:
+        return []
+    osm_id = str(feature.get('id') or props.get('@id') or '')
+    name = (props.get('name') or '').strip()
+    gtype = geometry['type']
+    rows = []
+
+    if name and props.get('highway') in STREET_HIGHWAYS and gtype in ('LineString', 'MultiLineString'):
+        lines = geometry['coordinates'] if gtype == 'MultiLineString' else [geometry['coordinates']]
+        for line in lines:
+            if len(line) >= 2:
+                rows.append(('feature', (osm_id, 'street', name, {'type': 'LineString', 'coordinates': line})))
+        return rows
+
+    is_area = gtype in ('Polygon', 'MultiPolygon')
+    if name and (props.get('place') in COLONIA_PLACES
+                 or (is_area and props.get('boundary') == 'administrative'
+                     and str(props.get('admin_level')) in ('9', '10'))):
+        if is_area or gtype == 'Point':
+            rows.append(('feature', (osm_id, 'colonia', name, geometry)))
+        return rows
+
+    number, street = props.get('addr:housenumber'), props.get('addr:street')
+    if number and street and gtype in ('Point', 'Polygon', 'MultiPolygon'):
+        rows.append(('address', (street.strip(), str(number).strip(), *_representative_point(geometry))))
+
+    if name and any(props.get(key) for key in LANDMARK_KEYS) and gtype != 'LineString':
+        lat, lon = _representative_point(geometry)
+        rows.append(('feature', (osm_id, 'landmark', name, {'type': 'Point', 'coordinates': [lon, lat]})))
+    return rows
+
+
+def import_extract(conn, path):
+    """Reemplazar el gazetteer con el contenido del extracto; devuelve conteos por tipo"""
+    counts = Counter()
+    features, addresses = [], []
+    for feature in read_features(path):
+        for table, values in classify(feature):
+            if table == 'feature':
+                osm_id, kind, name, geometry = values
+                features.append((osm_id, kind, name, *_representative_point(geometry),
+                                 *_bbox(geometry), json.dumps(geometry, separators=(',', ':'))))
+                counts[kind] += 1
+            else:
+                addresses.append(values)
+                counts['address'] += 1
+
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM gazetteer_features")
+    cursor.execute("DELETE FROM gazetteer_addresses")
+    cursor.executemany('''
+        INSERT INTO gazetteer_features
+        (osm_id, kind, name, lat, lon, min_lat, min_lon, max_lat, max_lon, geometry)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', features)
+    cursor.executemany('''
+        INSERT INTO gazetteer_addresses (street, number, lat, lon) VALUES (?, ?, ?, ?)
+    ''', addresses)
+    cursor.execute("UPDATE data_versions SET version = version + 1 WHERE name = 'gazetteer'")
+    conn.commit()
+    return dict(counts)
+
+
+# ==================== ÍNDICE EN MEMORIA ====================
+class GeocodeMatch:
+    __slots__ = ('lat', 'lon', 'kind', 'name', 'score', 'number', 'precision')
+
+    def __init__(self, lat, lon, kind, name, score, number=None, precision='feature'):
+        self.lat = lat
+        self.lon = lon
+        self.kind = kind
+        self.name = name
+        self.score = score
+        self.number = number
+        # 'address' (número exacto), 'interpolated', 'feature' (punto del nombre)
+        self.precision = precision
+
+    def to_dict(self):
+        return {"lat": self.lat, "lon": self.lon, "kind": self.kind, "name": self.name,
+                "score": round(self.score, 3), "number": self.number, "precision": self.precision}
+
+
+class _Entry:
+    """Un nombre del gazetteer; las calles agrupan todos sus tramos"""
+    __slots__ = ('kind', 'name', 'key', 'type_words', 'lat', 'lon', 'parts', 'trigrams')
+
+    def __init__(self, kind, name, tokens):
+        self.kind = kind
+        self.name = name
+        self.key = ' '.join(core_tokens(tokens))
+        self.type_words = set(tokens) & _TYPE_WORDS
+        self.lat = self.lon = None
+        self.parts = []  # (lat, lon, n_vértices) de cada tramo / polígono
+        self.trigrams = trigrams(self.key)
+
+
+class GazetteerIndex:
+    """Índice inmutable de nombres + números exteriores por calle"""
+
+    def __init__(self, features, addresses, version=None):
+        self.version = version
+        self.entries = []
+        by_name = {}
+        for kind, name, lat, lon, vertices in features:
+            tokens = normalize(name)
+            if not tokens:
+                continue
+            ident = (kind, ' '.join(tokens))
+            entry = by_name.get(ident)
+            if entry is None:
+                entry = by_name[ident] = _Entry(kind, name, tokens)
+                self.entries.append(entry)
+            entry.parts.append((lat, lon, vertices))
+        for entry in self.entries:
+            # Punto por defecto: el tramo / polígono con más vértices
+            entry.lat, entry.lon, _ = max(entry.parts, key=lambda p: p[2])
+
+        self.exact = defaultdict(list)
+        self.postings = defaultdict(list)
+        for idx, entry in enumerate(self.entries):
+            self.exact[entry.key].append(idx)
+            for gram in entry.trigrams:
+                self.postings[gram].append(idx)
+
+        # Números exteriores: calle normalizada -> [(número, lat, lon)] ordenado
+        self.addresses = defaultdict(list)
+        street_keys = {}
+        for street, number, lat, lon in addresses:
+            digits = _DIGITS.match(number or '')
+            if digits:
+                key = street_keys.get(street)
+                if key is None:
+                    key = street_keys[street] = ' '.join(normalize(street))
+                self.addresses[key].append((int(digits.group()), lat, lon))
+        for numbers in self.addresses.values():
+            numbers.sort()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def search(self, text, kinds=None, limit=5):
+        """[(score, entry)] ordenado; score = Jaccard de trigramas (+ bonos menores)"""
+        tokens = normalize(text)
+        if not tokens:
+            return []
+        key = ' '.join(core_tokens(tokens))
+        type_words = set(tokens) & _TYPE_WORDS
+        query_grams = trigrams(key)
+
+        shared = Counter()
+        for idx in self.exact.get(key, ()):
+            if not kinds or self.entries[idx].kind in kinds:
+                shared[idx] = len(query_grams)
+        if not shared:
+            # Candidatos por trigramas compartidos; luego Jaccard y distancia de edición
+            for gram in query_grams:
+                for idx in self.postings.get(gram, ()):
+                    shared[idx] += 1
+            if kinds:
+                shared = Counter({idx: c for idx, c in shared.items() if self.entries[idx].kind in kinds})
+
+        scored = []
+        for idx, common in shared.most_common(CANDIDATES):
+            entry = self.entries[idx]
+            score = common / (len(query_grams) + len(entry.trigrams) - common)
+            if score < 1.0:
+                score = max(score, edit_similarity(key, entry.key, MIN_EDIT_SIMILARITY))
+            if type_words:
+                # "Col. Centro" prefiere la colonia; "Calle Centro" la calle
+                if type_words & entry.type_words:
+                    score += 0.05
+                elif entry.kind == 'colonia' and type_words & COLONIA_WORDS:
+                    score += 0.05
+                elif entry.kind == 'street' and type_words & STREET_WORDS:
+                    score += 0.02
+            scored.append((score, KIND_PRIORITY[entry.kind], len(entry.parts), entry))
+        scored.sort(key=lambda s: s[:3], reverse=True)
+        return [(s[0], s[3]) for s in scored[:limit]]
+
+    def _locate_number(self, entry, number):
+        """Punto del número exterior: exacto, interpolado entre vecinos o None"""
+        numbers = self.addresses.get(' '.join(normalize(entry.name)))
+        if not numbers:
+            return None
+        lo, hi = 0, len(numbers)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if numbers[mid][0] < number:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(numbers) and numbers[lo][0] == number:
+            return numbers[lo][1], numbers[lo][2], 'address'
+        below = numbers[lo - 1] if lo > 0 else None
+        above = numbers[lo] if lo < len(numbers) else None
+        if below and above:
+            t = (number - below[0]) / (above[0] - below[0])
+            return (below[1] + (above[1] - below[1]) * t,
+                    below[2] + (above[2] - below[2]) * t, 'interpolated')
+        nearest = below or above
+        return nearest[1], nearest[2], 'interpolated'
+
+    @staticmethod
+    def _nearest_part(entry, lat, lon):
+        return min(entry.parts, key=lambda p: (p[0] - lat) ** 2 + ((p[1] - lon) * math.cos(math.radians(lat))) ** 2)
+
+    def geocode(self, query):
+        """Texto libre -> GeocodeMatch o None"""
+        parts = [p.strip() for p in (query or '').split(',')]
+        parts = [p for p in parts if p and ' '.join(normalize(p)) not in _CITY_PARTS]
+        if not parts:
+            return None
+
+        # "..., Col. Centro" acota la calle a esa colonia
+        colonia = None
+        for part in parts[1:]:
+            tokens = normalize(part)
+            if tokens and tokens[0] in COLONIA_WORDS:
+                found = self.search(part, kinds={'colonia'}, limit=1)
+                if found and found[0][0] >= MIN_SCORE:
+                    colonia = found[0][1]
+                break
+        main = parts[0]
+
+        options = []
+        explicit = _EXPLICIT_NUMBER.search(main)
+        if explicit:
+            options.append((main[:explicit.start()] + main[explicit.end():], int(explicit.group(1))))
+        else:
+            options.append((main, None))
+            trailing = _TRAILING_NUMBER.match(main) or _LEADING_NUMBER.match(main)
+            if trailing:
+                name, number = ((trailing.group(1), trailing.group(2)) if trailing.re is _TRAILING_NUMBER
+                                else (trailing.group(2), trailing.group(1)))
+                options.append((name, int(number)))
+
+        best = None
+        for text, number in options:
+            kinds = {'street'} if number is not None else None
+            found = self.search(text, kinds=kinds, limit=1)
+            if found and found[0][0] >= MIN_SCORE and (best is None or found[0][0] > best[0]):
+                best = (found[0][0], found[0][1], number)
+        if best is None:
+            if colonia is not None:
+                return GeocodeMatch(colonia.lat, colonia.lon, 'colonia', colonia.name, 1.0)
+            return None
+
+        score, entry, number = best
+        lat, lon = entry.lat, entry.lon
+        if colonia is not None and entry.kind == 'street':
+            lat, lon, _ = self._nearest_part(entry, colonia.lat, colonia.lon)
+        precision = 'feature'
+        if number is not None:
+            located = self._locate_number(entry, number)
+            if located:
+                lat, lon, precision = located
+        return GeocodeMatch(lat, lon, entry.kind, entry.name, min(score, 1.0), number, precision)
+
+
+def load_index(conn, version=None):
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT kind, name, lat, lon, length(geometry) FROM gazetteer_features ORDER BY id
+    ''')
+    features = cursor.fetchall()
+    cursor.execute("SELECT street, number, lat, lon FROM gazetteer_addresses")
+    return GazetteerIndex(features, cursor.fetchall(), version)
+
+
+# ==================== GEOCODIFICACIÓN INVERSA ====================
+# Distancia máxima a la calle más cercana para considerarla "la calle"
+MAX_ROAD_METERS = 150.0
+_M_PER_DEG_LAT = 110574.0
+_M_PER_DEG_LON_EQUATOR = 111320.0
+
+
+class STRTree:
+    """R-tree estático empaquetado con Sort-Tile-Recursive
+
+    `boxes` es una lista de (minx, miny, maxx, maxy); las hojas guardan el
+    índice de cada caja. Cada nodo es (minx, miny, maxx, maxy, hijos, es_hoja).
+    """
+
+    def __init__(self, boxes, capacity=16):
+        self.boxes = boxes
+        self.root = None
+        level = [(b[0], b[1], b[2], b[3], i) for i, b in enumerate(boxes)]
+        is_leaf = True
+        while level:
+            nodes = [self._node(group, is_leaf) for group in self._pack(level, capacity)]
+            if len(nodes) == 1:
+                self.root = nodes[0]
+                break
+            level = [(n[0], n[1], n[2], n[3], n) for n in nodes]
+            is_leaf = False
+
+    @staticmethod
+    def _pack(entries, capacity):
+        pages = math.ceil(len(entries) / capacity)
+        per_slice = math.ceil(math.sqrt(pages)) * capacity
+        entries.sort(key=lambda e: e[0] + e[2])
+        groups = []
+        for i in range(0, len(entries), per_slice):
+            vertical = sorted(entries[i:i + per_slice], key=lambda e: e[1] + e[3])
+            groups.extend(vertical[j:j + capacity] for j in range(0, len(vertical), capacity))
+        return groups
+
+    @staticmethod
+    def _node(group, is_leaf):
+        return (min(e[0] for e in group), min(e[1] for e in group),
+                max(e[2] for e in group), max(e[3] for e in group),
+                [e[4] for e in group], is_leaf)
+
+    @staticmethod
+    def _box_distance(box, x, y):
+        dx = box[0] - x if x < box[0] else (x - box[2] if x > box[2] else 0.0)
+        dy = box[1] - y if y < box[1] else (y - box[3] if y > box[3] else 0.0)
+        return math.hypot(dx, dy)
+
+    def nearest(self, x, y, distance, max_distance=math.inf):
+        """(índice, distancia) del elemento más cercano según `distance(índice)`"""
+        if self.root is None:
+            return None, max_distance
+        best, best_distance = None, max_distance
+        box_distance = self._box_distance
+        heap = [(box_distance(self.root, x, y), 0, self.root)]
+        counter = 1
+        while heap:
+            bound, _, node = heapq.heappop(heap)
+            if bound >= best_distance:
+                break
+            if node[5]:
+                for idx in node[4]:
+                    if box_distance(self.boxes[idx], x, y) < best_distance:
+                        d = distance(idx)
+                        if d < best_distance:
+                            best, best_distance = idx, d
+            else:
+                for child in node[4]:
+                    d = box_distance(child, x, y)
+                    if d < best_distance:
+                        heapq.heappush(heap, (d, counter, child))
+                        counter += 1
+        return best, best_distance
+
+    def containing(self, x, y):
+        """Índices cuya caja contiene el punto"""
+        if self.root is None:
+            return []
+        found, stack = [], [self.root]
+        while stack:
+            node = stack.pop()
+            if not (node[0] <= x <= node[2] and node[1] <= y <= node[3]):
+                continue
+            if node[5]:
+                found.extend(idx for idx in node[4]
+                             if self.boxes[idx][0] <= x <= self.boxes[idx][2]
+                             and self.boxes[idx][1] <= y <= self.boxes[idx][3])
+            else:
+                stack.extend(node[4])
+        return found
+
+
+def _in_ring(x, y, ring):
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i]
+        xj, yj = ring[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def _in_polygon(x, y, polygon):
+    """polygon = [anillo exterior, huecos...] con puntos (lon, lat)"""
+    return _in_ring(x, y, polygon[0]) and not any(_in_ring(x, y, hole) for hole in polygon[1:])
+
+
+class ReverseMatch:
+    __slots__ = ('road', 'colonia', 'distance_m')
+
+    def __init__(self, road, colonia, distance_m):
+        self.road = road
+        self.colonia = colonia
+        self.distance_m = distance_m
+
+    def label(self, *extra):
+        """"Calle, Colonia[, extra...]" omitiendo partes vacías"""
+        return ", ".join(p for p in (self.road, self.colonia, *extra) if p)
+
+    def to_dict(self):
+        return {"road": self.road, "colonia": self.colonia,
+                "distance_m": None if self.distance_m is None else round(self.distance_m, 1)}
+
+
+class ReverseIndex:
+    """Tramos de calle y polígonos de colonia en STR-trees (metros, proyección local)"""
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        streets, colonias = [], []
+        for kind, name, geometry in rows:
+            geometry = json.loads(geometry)
+            if kind == 'street' and geometry['type'] == 'LineString':
+                streets.append((name, geometry['coordinates']))
+            elif kind == 'colonia' and geometry['type'] in ('Polygon', 'MultiPolygon'):
+                polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+                colonias.extend((name, polygon) for polygon in polygons)
+
+        lats = [lat for _, line in streets for _, lat in line] or [0.0]
+        self.lat0 = (min(lats) + max(lats)) / 2
+        self.kx = _M_PER_DEG_LON_EQUATOR * math.cos(math.radians(self.lat0))
+
+        # Segmentos en columnas paralelas: x1, y1, x2, y2 (m) + calle
+        self.names = []
+        self.seg = array('d')
+        self.seg_name = array('I')
+        boxes = []
+        name_ids = {}
+        for name, line in streets:
+            name_id = name_ids.get(name)
+            if name_id is None:
+                name_id = name_ids[name] = len(self.names)
+                self.names.append(name)
+            points = [self.project(lat, lon) for lon, lat in line]
+            for (x1, y1), (x2, y2) in zip(points, points[1:]):
+                self.seg.extend((x1, y1, x2, y2))
+                self.seg_name.append(name_id)
+                boxes.append((min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)))
+        self.streets = STRTree(boxes)
+
+        self.colonias = colonias
+        self.colonia_tree = STRTree([
+            (min(p[0] for p in polygon[0]), min(p[1] for p in polygon[0]),
+             max(p[0] for p in polygon[0]), max(p[1] for p in polygon[0]))
+            for _, polygon in colonias
+        ])
+
+    def __len__(self):
+        return len(self.seg_name)
+
+    def project(self, lat, lon):
+        return lon * self.kx, lat * _M_PER_DEG_LAT
+
+    def _segment_distance(self, idx, x, y):
+        seg = self.seg
+        x1, y1, x2, y2 = seg[4 * idx], seg[4 * idx + 1], seg[4 * idx + 2], seg[4 * idx + 3]
+        dx, dy = x2 - x1, y2 - y1
+        length2 = dx * dx + dy * dy
+        t = 0.0 if length2 == 0 else max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length2))
+        return math.hypot(x - (x1 + t * dx), y - (y1 + t * dy))
+
+    def nearest_road(self, lat, lon, max_meters=MAX_ROAD_METERS):
+        """(calle, metros) del tramo más cercano, o (None, None)"""
+        x, y = self.project(lat, lon)
+        idx, meters = self.streets.nearest(x, y, lambda i: self._segment_distance(i, x, y), max_meters)
+        if idx is None:
+            return None, None
+        return self.names[self.seg_name[idx]], meters
+
+    def colonia_at(self, lat, lon):
+        for idx in self.colonia_tree.containing(lon, lat):
+            name, polygon = self.colonias[idx]
+            if _in_polygon(lon, lat, polygon):
+                return name
+        return None
+
+    def reverse(self, lat, lon):
+        road, meters = self.nearest_road(lat, lon)
+        colonia = self.colonia_at(lat, lon)
+        if road is None and colonia is None:
+            return None
+        return ReverseMatch(road, colonia, meters)
+
+    def reverse_many(self, points):
+        """[(lat, lon)] -> [ReverseMatch | None], para procesos por lote"""
+        return [self.reverse(lat, lon) for lat, lon in points]
+
+
+def load_reverse_index(conn, version=None):
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT kind, name, geometry FROM gazetteer_features
+        WHERE kind IN ('street', 'colonia') ORDER BY id
+    ''')
+    return ReverseIndex(cursor.fetchall(), version)
+
+
+PLACEHOLDER_ADDRESSES = ('', 'Ubicación reportada')
+
+
+def backfill_report_addresses(conn, index, overwrite=False, batch_size=1000):
+    """Llenar reports.address con "Calle, Colonia" desde el índice local
+
+    Sin `overwrite` solo toca reportes sin dirección o con la genérica.
+    Devuelve (revisados, actualizados).
+    """
+    read = conn.cursor()
+    if overwrite:
+        read.execute("SELECT id, lat, lon FROM reports")
+    else:
+        read.execute('''
+            SELECT id, lat, lon FROM reports
+            WHERE address IS NULL OR address IN (?, ?)
+        ''', PLACEHOLDER_ADDRESSES)
+    seen = updated = 0
+    write = conn.cursor()
+    while True:
+        rows = read.fetchmany(batch_size)
+        if not rows:
+            break
+        seen += len(rows)
+        updates = []
+        for report_id, lat, lon in rows:
+            match = index.reverse(lat, lon)
+            if match and match.road:
+                updates.append((match.label(), report_id))
+        write.executemany("UPDATE reports SET address = ? WHERE id = ?", updates)
+        updated += len(updates)
+    conn.commit()
+    return seen, updated
+
+
+class LocalGeocoder:
+    """Índices del gazetteer por proceso; se recargan cuando el importador cambia la versión
+
+    El índice inverso (geometrías) se arma aparte y solo si se usa.
+    """
+
+    def __init__(self, connect, watcher):
+        self._connect = connect
+        self._watcher = watcher
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _get(self, loader):
+        version = self._watcher.version('gazetteer')
+        if version is None:
+            return None  # base sin migrar
+        index = self._indexes.get(loader)
+        if index is None or index.version != version:
+            with self._lock:
+                index = self._indexes.get(loader)
+                if index is None or index.version != version:
+                    conn = self._connect()
+                    try:
+                        index = self._indexes[loader] = loader(conn, version)
+                    finally:
+                        conn.close()
+        return index
+
+    def index(self):
+        return self._get(load_index)
+
+    def reverse_index(self):
+        return self._get(load_reverse_index)
+
+    def geocode(self, query):
+        index = self.index()
+        if not index:
+            return None
+        return index.geocode(query)
+
+    def reverse(self, lat, lon):
+        index = self.reverse_index()
+        if not index:
+            return None
+        try:
+            return index.reverse(float(lat), float(lon))
+        except (TypeError, ValueError):
+            return None
+
+
+if __name__ == '__main__':
+    import sqlite3
+    import sys
+    import time
+
+    import migrations
+
+    commands = ('import', 'geocode', 'reverse', 'backfill')
+    if len(sys.argv) < 3 or sys.argv[1] not in commands:
+        print(__doc__)
+        sys.exit(1)
+    command, db_file, args = sys.argv[1], sys.argv[2], sys.argv[3:]
+    conn = sqlite3.connect(db_file)
+    migrations.migrate(conn)
+    start = time.perf_counter()
+    if command == 'import':
+        counts = import_extract(conn, args[0])
+        print(f"Importado en {time.perf_counter() - start:.1f}s: {counts}")
+    elif command == 'geocode':
+        match = load_index(conn).geocode(args[0])
+        print(json.dumps(match.to_dict() if match else None, ensure_ascii=False))
+    elif command == 'reverse':
+        match = load_reverse_index(conn).reverse(float(args[0]), float(args[1]))
+        print(json.dumps(match.to_dict() if match else None, ensure_ascii=False))
+    else:
+        index = load_reverse_index(conn)
+        seen, updated = backfill_report_addresses(conn, index, overwrite='--overwrite' in args)
+        print(f"{updated} de {seen} reportes con dirección nueva en {time.perf_counter() - start:.1f}s")
+    conn.close()
@@ -0,0 +1,55 @@
+"""
+Configuración de Gunicorn para ZETA PRO
+
+Uso:
+    gunicorn -c gunicorn.conf.py backend:app
+
+Modos de servicio (variable ZETA_WORKER_CLASS):
+    sync   - un request por worker (comportamiento original)
+    gevent - workers cooperativos: las llamadas a Nominatim/OSRM ceden el
+             control mientras esperan la red, así que un solo proceso
+             atiende cientos de requests en vuelo
+"""
+import multiprocessing
+import os
+import tempfile
+
+worker_class = os.environ.get('ZETA_WORKER_CLASS', 'sync')
+
+if worker_class == 'gevent':
+    # Parchear sockets/threading antes de que se importe backend.py
+    # (necesario si se usa --preload; inofensivo si no)
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5002)}"
+
+if worker_class == 'gevent':
+    workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+    # Conexiones simultáneas por worker (greenlets)
+    worker_connections = int(os.environ.get('ZETA_WORKER_CONNECTIONS', 1000))
+else:
+    workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+# Nominatim/OSRM pueden tardar hasta 10 s; dejar margen antes de matar el worker
+timeout = int(os.environ.get('ZETA_WORKER_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = os.environ.get('ZETA_ACCESS_LOG', None)
+errorlog = '-'
+loglevel = os.environ.get('ZETA_LOG_LEVEL', 'info')
+
+# Métricas compartidas entre workers (ver metrics.py)
+if not os.environ.get('ZETA_METRICS_DIR'):
+    os.environ['ZETA_METRICS_DIR'] = tempfile.mkdtemp(prefix='zeta_metrics_')
+
+
+def on_starting(server):
+    import metrics
+    metrics.reset_dir()
+
+
+def child_exit(server, worker):
+    import metrics
+    metrics.mark_process_dead(worker.pid)
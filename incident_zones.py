@@ -0,0 +1,371 @@
+"""
+Agrupación de zonas de incidentes
+
+Cada reporte aprobado con severidad media o alta creaba su propia zona de
+ZONE_RADIUS_KM por 24 h. En una colonia con muchos incidentes se juntaban
+cientos de círculos encimados que calculate_risk, el cálculo de rutas y
+/api/zones/risk recorren uno por uno.
+
+Ahora un reporte aprobado se suma a la zona viva de incidentes de su
+mismo nivel que toca (los círculos se enciman) si el círculo que cubre a
+ambos no pasa de MAX_RADIUS_KM. La zona crece al menor círculo que
+contiene la zona anterior y el círculo del reporte, y vence cuando vence
+su reporte más reciente. Si hay varias candidatas, se elige la que crece
+menos. Si no hay ninguna, se crea una zona nueva como antes. Todo punto
+que quedaba dentro de la zona de un reporte sigue dentro de una zona de
+ese nivel. Solo se agrupan zonas del mismo nivel: con niveles mezclados,
+un reporte alto pintaría de alto todo el círculo de los medios.
+
+zone_reports guarda qué reportes vivos forman cada zona (migración 10). Si
+un reporte deja de contar (se marca como duplicado), su zona se ajusta al
+menor círculo que cubre a los reportes que le quedan o se desactiva.
+
+Las distancias son equirrectangulares (como dedup.py). read_model mide con
+geopy sobre el elipsoide; el círculo de cada reporte se agranda
+MARGIN_KM al agrupar para cubrir la diferencia (< 0.5% a estas escalas).
+
+Uso:
+    python incident_zones.py consolidate zeta_pro.db
+"""
+import math
+import time
+from datetime import datetime, timedelta
+
+from read_model import parse_timestamp
+
+ZONE_RADIUS_KM = 0.5
+MAX_RADIUS_KM = 1.5
+MARGIN_KM = 0.01
+ZONE_HOURS = 24
+ZONE_TYPE = 'incident'
+ZONE_COLOR = '#ef4444'
+
+def _distance_km(lat_a, lon_a, lat_b, lon_b):
+    x = math.radians(lon_b - lon_a) * math.cos(math.radians((lat_a + lat_b) / 2))
+    y = math.radians(lat_b - lat_a)
+    return 6371.0 * math.hypot(x, y)
+
+
+def enclose(a, b):
+    """Menor círculo (lat, lon, radio_km) que contiene a los círculos a y b"""
+    lat_a, lon_a, r_a = a
+    lat_b, lon_b, r_b = b
+    d = _distance_km(lat_a, lon_a, lat_b, lon_b)
+    if d + r_b <= r_a:
+        return a
+    if d + r_a <= r_b:
+        return b
+    radius = (d + r_a + r_b) / 2
+    t = (radius - r_a) / d
+    return (lat_a + (lat_b - lat_a) * t, lon_a + (lon_b - lon_a) * t, radius)
+
+
+def _member_circle(lat, lon):
+    return (lat, lon, ZONE_RADIUS_KM + MARGIN_KM)
+
+
+def _contains(circle, point):
+    return math.dist(circle[0], point) <= circle[1] + 1e-9
+
+
+def _circumcircle(a, b, c):
+    d = 2 * (a[0] * (b[1] - c[1]) + b[0] * (c[1] - a[1]) + c[0] * (a[1] - b[1]))
+    if d == 0:
+        # Colineales: el círculo de los dos más lejanos
+        pairs = [(a, b), (a, c), (b, c)]
+        p, q = max(pairs, key=lambda pair: math.dist(*pair))
+        return _diameter(p, q)
+    ux = sum((p[0] ** 2 + p[1] ** 2) * (q[1] - r[1]) for p, q, r in ((a, b, c), (b, c, a), (c, a, b))) / d
+    uy = sum((p[0] ** 2 + p[1] ** 2) * (r[0] - q[0]) for p, q, r in ((a, b, c), (b, c, a), (c, a, b))) / d
+    return ((ux, uy), math.dist((ux, uy), a))
+
+
+def _diameter(a, b):
+    return (((a[0] + b[0]) / 2, (a[1] + b[1]) / 2), math.dist(a, b) / 2)
+
+
+def _smallest_circle(points):
+    """Menor círculo que contiene los puntos (incremental de Welzl)"""
+    circle = (points[0], 0.0)
+    for i, p in enumerate(points):
+        if _contains(circle, p):
+            continue
+        circle = (p, 0.0)
+        for j in range(i):
+            q = points[j]
+            if _contains(circle, q):
+                continue
+            circle = _diameter(p, q)
+            for k in range(j):
+                if not _contains(circle, points[k]):
+                    circle = _circumcircle(p, q, points[k])
+    return circle
+
+
+def fit(members):
+    """Menor círculo de zona que cubre el círculo de cada reporte [(lat, lon), ...]"""
+    if len(members) == 1:
+        lat, lon = members[0]
+        return (lat, lon, ZONE_RADIUS_KM)
+    # Plano local en km alrededor del primer reporte
+    lat0, lon0 = members[0]
+    km_lat = 6371.0 * math.pi / 180
+    km_lon = km_lat * math.cos(math.radians(lat0))
+    points = [((lon - lon0) * km_lon, (lat - lat0) * km_lat) for lat, lon in members]
+    (x, y), radius = _smallest_circle(points)
+    return (lat0 + y / km_lat, lon0 + x / km_lon, radius + ZONE_RADIUS_KM + MARGIN_KM)
+
+
+class Zone:
+    """Zona de incidentes viva en memoria mientras se agrupa"""
+    __slots__ = ('id', 'name', 'circle', 'level', 'expires_ts', 'members', 'is_new', 'changed')
+
+    def __init__(self, zone_id, name, circle, level, expires_ts, is_new=False):
+        self.id = zone_id
+        self.name = name
+        self.circle = circle
+        self.level = level
+        self.expires_ts = expires_ts
+        self.members = {}  # report_id -> (lat, lon, level, expires_ts)
+        self.is_new = is_new
+        self.changed = is_new
+
+    def absorb(self, circle, expires_ts):
+        self.circle = circle
+        self.expires_ts = max(self.expires_ts, expires_ts)
+        self.changed = True
+
+    def description(self):
+        return f"Agrupa {len(self.members)} reportes" if len(self.members) > 1 else None
+
+
+def best_zone(zones, circle, level):
+    """(zona, círculo combinado) de la zona de `level` que crece menos al
+    sumar `circle`, o (None, None) si ninguna lo toca sin pasar de
+    MAX_RADIUS_KM"""
+    lat, lon, radius = circle
+    padded = (lat, lon, radius + MARGIN_KM)
+    best, best_circle = None, None
+    for zone in zones:
+        if zone.level != level:
+            continue
+        z_lat, z_lon, z_radius = zone.circle
+        # Prefiltro en grados: 1° de latitud > 110 km
+        if abs(z_lat - lat) * 110.0 > z_radius + radius:
+            continue
+        if _distance_km(z_lat, z_lon, lat, lon) > z_radius + radius:
+            continue
+        combined = enclose(zone.circle, padded)
+        if combined[2] > MAX_RADIUS_KM:
+            continue
+        if best is None or combined[2] < best_circle[2]:
+            best, best_circle = zone, combined
+    return best, best_circle
+
+
+# ==================== LECTURA Y ESCRITURA ====================
+def load_live_zones(cursor, now, bbox=None, zone_id=None):
+    """Zonas de incidentes activas y sin vencer que tienen reportes
+
+    bbox (lat_min, lat_max, lon_min, lon_max) limita a las zonas con algún
+    reporte dentro de la caja; zone_id, a una sola zona.
+    """
+    moment = datetime.fromtimestamp(now)
+    query = '''
+        SELECT z.id, z.name, z.lat, z.lon, z.radius_km, z.level, z.expires_at,
+               m.report_id, m.lat, m.lon, m.level, m.expires_at
+        FROM zone_reports m
+        JOIN risk_zones z ON z.id = m.zone_id
+        WHERE z.active = 1 AND z.type = ? AND z.expires_at > ? AND m.expires_at > ?
+    '''
+    params = [ZONE_TYPE, moment, moment]
+    if bbox is not None:
+        query += ''' AND m.zone_id IN (
+            SELECT zone_id FROM zone_reports WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?
+        )'''
+        params.extend(bbox)
+    if zone_id is not None:
+        query += " AND m.zone_id = ?"
+        params.append(zone_id)
+    cursor.execute(query + " ORDER BY m.expires_at", params)
+    zones = {}
+    for row in cursor.fetchall():
+        zone = zones.get(row[0])
+        if zone is None:
+            zone = zones[row[0]] = Zone(row[0], row[1], row[2:5], row[5], parse_timestamp(row[6]) or now)
+        zone.members[row[7]] = (row[8], row[9], row[10], parse_timestamp(row[11]) or now)
+    return zones
+
+
+def _refit(zone):
+    """Ajustar la zona a los reportes que le quedan"""
+    members = list(zone.members.values())
+    zone.circle = fit([(lat, lon) for lat, lon, _, _ in members])
+    zone.expires_ts = max(expires for _, _, _, expires in members)
+    zone.changed = True
+
+
+def _save(cursor, zones, retired=()):
+    """Insertar las zonas nuevas, actualizar las que cambiaron y desactivar `retired`"""
+    rows = [zone for zone in zones if zone.changed]
+    cursor.executemany('''
+        INSERT INTO risk_zones
+        (id, name, lat, lon, radius_km, level, type, color, expires_at, source, description)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(zone.id, zone.name, *zone.circle, zone.level, ZONE_TYPE, ZONE_COLOR,
+           datetime.fromtimestamp(zone.expires_ts), f'report_{next(iter(zone.members))}', zone.description())
+          for zone in rows if zone.is_new])
+    cursor.executemany('''
+        UPDATE risk_zones SET lat = ?, lon = ?, radius_km = ?, level = ?, expires_at = ?, description = ?
+        WHERE id = ?
+    ''', [(*zone.circle, zone.level, datetime.fromtimestamp(zone.expires_ts), zone.description(), zone.id)
+          for zone in rows if not zone.is_new])
+    cursor.executemany("UPDATE risk_zones SET active = 0 WHERE id = ?", [(zone_id,) for zone_id in retired])
+
+
+# ==================== AGRUPACIÓN ====================
+def add_reports(cursor, reports, new_id, now=None):
+    """Sumar reportes aprobados a sus zonas; no hace commit
+
+    reports: [(report_id, lat, lon, severity, description)]. new_id() da el
+    id de cada zona nueva. Devuelve {report_id: (zone_id, agrupado)}.
+    """
+    if not reports:
+        return {}
+    now = time.time() if now is None else now
+    expires_ts = (datetime.fromtimestamp(now) + timedelta(hours=ZONE_HOURS)).timestamp()
+    # Los reportes vencidos ya no dan forma a ninguna zona
+    cursor.execute("DELETE FROM zone_reports WHERE expires_at <= ?", (datetime.fromtimestamp(now),))
+    # Una zona que toca a un reporte tiene todos sus reportes a menos de
+    # 2 × MAX_RADIUS_KM + ZONE_RADIUS_KM de él
+    reach = 2 * MAX_RADIUS_KM + ZONE_RADIUS_KM
+    lats = [lat for _, lat, _, _, _ in reports]
+    lons = [lon for _, _, lon, _, _ in reports]
+    dlat = reach / 110.5
+    dlon = reach / (111.3 * max(0.01, math.cos(math.radians(max(abs(lat) for lat in lats) + 1.0))))
+    bbox = (min(lats) - dlat, max(lats) + dlat, min(lons) - dlon, max(lons) + dlon)
+    zones = list(load_live_zones(cursor, now, bbox).values())
+    owner = {report_id: zone for zone in zones for report_id in zone.members}
+    retired = set()
+
+    results = {}
+    for report_id, lat, lon, severity, description in reports:
+        previous = owner.pop(report_id, None)
+        if previous is not None:
+            # Aprobado de nuevo: vuelve a entrar con 24 h nuevas
+            del previous.members[report_id]
+            if previous.members:
+                _refit(previous)
+            else:
+                zones.remove(previous)
+                if not previous.is_new:
+                    retired.add(previous.id)
+        circle = (lat, lon, ZONE_RADIUS_KM)
+        zone, combined = best_zone(zones, circle, severity)
+        if zone is None:
+            zone = Zone(new_id(), description[:50], circle, severity, expires_ts, is_new=True)
+            zones.append(zone)
+        else:
+            zone.absorb(combined, expires_ts)
+        zone.members[report_id] = (lat, lon, severity, expires_ts)
+        owner[report_id] = zone
+        results[report_id] = (zone.id, len(zone.members) > 1)
+
+    _save(cursor, zones, retired)
+    cursor.executemany('''
+        INSERT OR REPLACE INTO zone_reports (report_id, zone_id, lat, lon, level, expires_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(report_id, owner[report_id].id, lat, lon, severity, datetime.fromtimestamp(expires_ts))
+          for report_id, lat, lon, severity, _ in reports if report_id in owner])
+    return results
+
+
+def remove_report(cursor, report_id, now=None):
+    """Sacar un reporte de su zona (ajustarla o desactivarla); no hace commit"""
+    now = time.time() if now is None else now
+    row = cursor.execute("SELECT zone_id FROM zone_reports WHERE report_id = ?", (report_id,)).fetchone()
+    # Zonas de antes de la migración 10 o de un reporte ya vencido
+    cursor.execute('''
+        UPDATE risk_zones SET active = 0 WHERE source = ? AND active = 1
+          AND id NOT IN (SELECT zone_id FROM zone_reports)
+    ''', (f'report_{report_id}',))
+    if row is None:
+        return None
+    cursor.execute("DELETE FROM zone_reports WHERE report_id = ?", (report_id,))
+    zone = load_live_zones(cursor, now, zone_id=row[0]).get(row[0])
+    if zone is None:
+        _save(cursor, (), retired=[row[0]])
+        return None
+    _refit(zone)
+    _save(cursor, [zone])
+    return zone.id
+
+
+def consolidate(conn, now=None):
+    """Agrupar las zonas de incidentes vivas que ya se enciman; no hace commit
+
+    Las zonas se recorren en orden de creación y cada una se suma a la
+    agrupación que toca, con las mismas reglas que add_reports. Las que se
+    suman a otra se desactivan. Devuelve (zonas antes, zonas después).
+    """
+    now = time.time() if now is None else now
+    cursor = conn.cursor()
+    moment = datetime.fromtimestamp(now)
+    cursor.execute("DELETE FROM zone_reports WHERE expires_at <= ?", (moment,))
+    # Zonas creadas por reportes antes de zone_reports: un reporte cada una
+    cursor.execute('''
+        INSERT OR IGNORE INTO zone_reports (report_id, zone_id, lat, lon, level, expires_at)
+        SELECT substr(source, 8), id, lat, lon, level, expires_at FROM risk_zones
+        WHERE active = 1 AND type = ? AND expires_at > ? AND source LIKE 'report\\_%' ESCAPE '\\'
+          AND id NOT IN (SELECT zone_id FROM zone_reports)
+    ''', (ZONE_TYPE, moment))
+    live = load_live_zones(cursor, now)
+    cursor.execute('''
+        SELECT id FROM risk_zones WHERE active = 1 AND type = ? AND expires_at > ?
+        ORDER BY created_at, id
+    ''', (ZONE_TYPE, moment))
+    ordered = [live[zone_id] for (zone_id,) in cursor.fetchall() if zone_id in live]
+
+    # Una zona que creció puede tocar otras que antes no: repetir hasta que
+    # una pasada no agrupe nada
+    clusters, moves = ordered, []
+    while True:
+        merged = []
+        for zone in clusters:
+            target, combined = best_zone(merged, zone.circle, zone.level)
+            if target is None:
+                merged.append(zone)
+                continue
+            target.absorb(combined, zone.expires_ts)
+            target.members.update(zone.members)
+            moves.append((target.id, zone.id))
+        # Ajustar al menor círculo: puede dejar espacio para otra agrupación
+        for zone in merged:
+            if zone.changed:
+                zone.circle = fit([(lat, lon) for lat, lon, _, _ in zone.members.values()])
+        if len(merged) == len(clusters):
+            break
+        clusters = merged
+    _save(cursor, clusters, retired=[zone_id for _, zone_id in moves])
+    cursor.executemany("UPDATE zone_reports SET zone_id = ? WHERE zone_id = ?", moves)
+    return len(ordered), len(clusters)
+
+
+if __name__ == '__main__':
+    import json
+    import sqlite3
+    import sys
+
+    import migrations
+
+    if len(sys.argv) < 3 or sys.argv[1] != 'consolidate':
+        print(__doc__)
+        sys.exit(1)
+    conn = sqlite3.connect(sys.argv[2])
+    migrations.migrate(conn)
+    start = time.perf_counter()
+    before, after = consolidate(conn)
+    conn.commit()
+    print(json.dumps({"zones_before": before, "zones_after": after,
+                      "ms": round((time.perf_counter() - start) * 1000, 2)}))
+    conn.close()
@@ -0,0 +1,324 @@
+"""
+Cola de trabajos durable en SQLite
+
+Los efectos lentos de un request (comprimir imágenes con Pillow, la
+dirección por Nominatim) ya no corren dentro del handler: el handler
+inserta el trabajo en `jobs` en la misma transacción que sus datos (si el
+request falla, el trabajo tampoco existe), responde, y un JobWorker lo
+procesa después.
+
+- Reclamar: un UPDATE ... RETURNING dentro de BEGIN IMMEDIATE toma el
+  siguiente trabajo visible y lo oculta hasta visible_at = ahora +
+  VISIBILITY_SECONDS. Si el proceso muere a media tarea, el trabajo vuelve
+  a ser visible al vencer ese plazo y otro consumidor lo retoma: la
+  entrega es al menos una vez y los handlers deben ser idempotentes.
+- Reintentos: si el handler lanza una excepción, el trabajo se reprograma
+  con backoff exponencial con jitter (RETRY_BASE_SECONDS · 2^(intento-1),
+  hasta RETRY_MAX_SECONDS); al agotar max_attempts queda 'failed' con el
+  último error, hasta `python jobs.py retry`.
+- Idempotencia: `enqueue(..., key=...)` no duplica un trabajo con la
+  misma llave (UNIQUE) y devuelve el id del existente.
+
+Un handler recibe (conn, payload): hace lo lento primero y escribe al
+final; sus escrituras y el 'done' del trabajo van en la misma transacción.
+
+Cada worker de gunicorn corre WORKERS hilos consumidores (ZETA_JOB_WORKERS;
+0 = ninguno). Para sacar el trabajo pesado de los procesos web (y con
+workers gevent, donde Pillow bloquearía el loop) se corren procesos
+dedicados con `python jobs.py work`. Varios consumidores no se estorban:
+el reclamo es atómico.
+
+Uso:
+    python jobs.py work zeta_pro.db
+    python jobs.py stats zeta_pro.db
+    python jobs.py retry zeta_pro.db
+"""
+import json
+import os
+import random
+import socket
+import threading
+import time
+
+WORKERS = int(os.environ.get('ZETA_JOB_WORKERS', '1'))
+INTERVAL_SECONDS = float(os.environ.get('ZETA_JOB_INTERVAL', '1'))
+VISIBILITY_SECONDS = float(os.environ.get('ZETA_JOB_VISIBILITY', '60'))
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 2.0
+RETRY_MAX_SECONDS = 300.0
+# Los 'done' se borran pasado este tiempo (y con ellos su llave)
+DONE_RETENTION_SECONDS = 24 * 3600
+
+
+class Job:
+    __slots__ = ('id', 'kind', 'payload', 'attempts', 'max_attempts', 'created_at')
+
+    def __init__(self, row):
+        self.id, self.kind, payload, self.attempts, self.max_attempts, self.created_at = row
+        self.payload = json.loads(payload)
+
+
+# ==================== COLA ====================
+def enqueue(cursor, kind, payload, key=None, delay=0.0, max_attempts=MAX_ATTEMPTS, now=None):
+    """Agregar un trabajo (sin commit: va en la transacción del llamador)
+
+    Con `key`, si ya existe un trabajo con esa llave no se agrega otro; en
+    ambos casos devuelve el id del trabajo.
+    """
+    now = time.time() if now is None else now
+    cursor.execute('''
+        INSERT INTO jobs (kind, payload, idempotency_key, max_attempts, visible_at, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(idempotency_key) DO NOTHING
+    ''', (kind, json.dumps(payload), key, max_attempts, now + delay, now))
+    if cursor.rowcount:
+        return cursor.lastrowid
+    return cursor.execute("SELECT id FROM jobs WHERE idempotency_key = ?", (key,)).fetchone()[0]
+
+
+def claim(conn, worker_id, kinds, now=None, visibility=VISIBILITY_SECONDS):
+    """Tomar el siguiente trabajo visible de `kinds`; None si no hay"""
+    now = time.time() if now is None else now
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(f'''
+            UPDATE jobs SET attempts = attempts + 1, locked_by = ?, visible_at = ?
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE state = 'queued' AND visible_at <= ? AND kind IN ({', '.join('?' * len(kinds))})
+                ORDER BY visible_at LIMIT 1
+            )
+            RETURNING id, kind, payload, attempts, max_attempts, created_at
+        ''', (worker_id, now + visibility, now, *kinds)).fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return Job(row) if row else None
+
+
+def complete(cursor, job, worker_id, now=None):
+    """Marcar 'done' si el trabajo sigue siendo nuestro; no hace commit
+
+    Si el plazo de visibilidad venció y otro consumidor lo reclamó
+    (attempts cambió), no se toca: ese consumidor lo terminará.
+    """
+    now = time.time() if now is None else now
+    cursor.execute('''
+        UPDATE jobs SET state = 'done', finished_at = ?, locked_by = NULL
+        WHERE id = ? AND locked_by = ? AND attempts = ?
+    ''', (now, job.id, worker_id, job.attempts))
+    return cursor.rowcount == 1
+
+
+def retry_delay(attempts):
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def fail(cursor, job, worker_id, error, now=None):
+    """Reprogramar con backoff o, sin intentos restantes, dejar 'failed'
+
+    Devuelve 'retry' o 'failed' ('lost' si el trabajo ya no era nuestro);
+    no hace commit.
+    """
+    now = time.time() if now is None else now
+    if job.attempts >= job.max_attempts:
+        outcome = 'failed'
+        cursor.execute('''
+            UPDATE jobs SET state = 'failed', finished_at = ?, locked_by = NULL, last_error = ?
+            WHERE id = ? AND locked_by = ? AND attempts = ?
+        ''', (now, error, job.id, worker_id, job.attempts))
+    else:
+        outcome = 'retry'
+        cursor.execute('''
+            UPDATE jobs SET visible_at = ?, locked_by = NULL, last_error = ?
+            WHERE id = ? AND locked_by = ? AND attempts = ?
+        ''', (now + retry_delay(job.attempts), error, job.id, worker_id, job.attempts))
+    return outcome if cursor.rowcount == 1 else 'lost'
+
+
+def next_visible(conn, kinds):
+    """visible_at del próximo trabajo de `kinds` (lectura, sin lock)"""
+    return conn.execute(f'''
+        SELECT MIN(visible_at) FROM jobs
+        WHERE state = 'queued' AND kind IN ({', '.join('?' * len(kinds))})
+    ''', kinds).fetchone()[0]
+
+
+def prune(conn, now=None):
+    """Borrar los 'done' más viejos que DONE_RETENTION_SECONDS"""
+    now = time.time() if now is None else now
+    conn.execute("DELETE FROM jobs WHERE state = 'done' AND finished_at < ?", (now - DONE_RETENTION_SECONDS,))
+    conn.commit()
+
+
+def stats(conn, now=None):
+    """{(kind, estado): (cantidad, created_at más viejo)} sin contar 'done'
+
+    Estados: ready (visible, esperando consumidor), running (reclamado y
+    dentro del plazo), delayed (esperando su reintento) y failed.
+    """
+    now = time.time() if now is None else now
+    rows = conn.execute('''
+        SELECT kind,
+               CASE WHEN state = 'failed' THEN 'failed'
+                    WHEN visible_at <= ? THEN 'ready'
+                    WHEN locked_by IS NOT NULL THEN 'running'
+                    ELSE 'delayed' END AS bucket,
+               COUNT(*), MIN(created_at)
+        FROM jobs WHERE state IN ('queued', 'failed')
+        GROUP BY kind, bucket
+    ''', (now,)).fetchall()
+    return {(kind, bucket): (count, oldest) for kind, bucket, count, oldest in rows}
+
+
+def status(conn, job_id):
+    row = conn.execute('''
+        SELECT id, kind, state, attempts, max_attempts, last_error, created_at, finished_at
+        FROM jobs WHERE id = ?
+    ''', (job_id,)).fetchone()
+    if row is None:
+        return None
+    keys = ('id', 'kind', 'state', 'attempts', 'max_attempts', 'last_error', 'created_at', 'finished_at')
+    return dict(zip(keys, row))
+
+
+def retry_failed(conn, now=None):
+    """Devolver a la cola los 'failed' con intentos nuevos; devuelve cuántos"""
+    now = time.time() if now is None else now
+    count = conn.execute('''
+        UPDATE jobs SET state = 'queued', attempts = 0, visible_at = ?, finished_at = NULL
+        WHERE state = 'failed'
+    ''', (now,)).rowcount
+    conn.commit()
+    return count
+
+
+# ==================== WORKER ====================
+class JobWorker:
+    """Hilos consumidores de la cola en este proceso"""
+
+    def __init__(self, connect, threads=WORKERS, interval=INTERVAL_SECONDS):
+        self._connect = connect
+        self.handlers = {}
+        self.threads = threads
+        self.interval = interval
+        self._wake = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._last_prune = 0.0
+        self.done = 0
+        self.failed = 0
+
+    def handler(self, kind):
+        """Decorador: registrar `fn(conn, payload)` para los trabajos `kind`"""
+        def register(fn):
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    def ensure_running(self):
+        if len(self._threads) == self.threads and all(t.is_alive() for t in self._threads):
+            return
+        with self._start_lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.threads:
+                thread = threading.Thread(target=self.run_forever, name=f'zeta-jobs-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def notify(self):
+        """Hay trabajos nuevos: no esperar al siguiente intervalo"""
+        self._wake.set()
+
+    def run_job(self, conn, job, worker_id):
+        """Ejecutar un trabajo reclamado; devuelve 'done', 'retry', 'failed' o 'lost'"""
+        import metrics
+
+        handler = self.handlers[job.kind]
+        start = time.perf_counter()
+        try:
+            handler(conn, job.payload)
+            outcome = 'done' if complete(conn.cursor(), job, worker_id) else 'lost'
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"⚠️ Trabajo {job.id} ({job.kind}), intento {job.attempts}: {e}")
+            outcome = fail(conn.cursor(), job, worker_id, f"{type(e).__name__}: {e}")
+            conn.commit()
+        metrics.JOB_SECONDS.observe(time.perf_counter() - start, job.kind)
+        metrics.JOBS.inc(job.kind, outcome)
+        if outcome in ('done', 'failed'):
+            metrics.JOB_LATENCY_SECONDS.observe(time.time() - job.created_at, job.kind, outcome)
+        return outcome
+
+    def run_pending(self, worker_id=None):
+        """Procesar todo lo visible ahora; devuelve cuántos trabajos corrió"""
+        worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+        kinds = sorted(self.handlers)
+        conn = self._connect()
+        count = 0
+        try:
+            while kinds:
+                job = claim(conn, worker_id, kinds)
+                if job is None:
+                    break
+                outcome = self.run_job(conn, job, worker_id)
+                self.done += outcome == 'done'
+                self.failed += outcome == 'failed'
+                count += 1
+            if time.time() - self._last_prune > 3600:
+                self._last_prune = time.time()
+                prune(conn)
+        finally:
+            conn.close()
+        return count
+
+    def _wait_seconds(self):
+        """Hasta el próximo reintento programado, sin pasar del intervalo"""
+        conn = self._connect()
+        try:
+            upcoming = next_visible(conn, sorted(self.handlers)) if self.handlers else None
+        finally:
+            conn.close()
+        if upcoming is None:
+            return self.interval
+        return min(self.interval, max(0.0, upcoming - time.time()))
+
+    def run_forever(self):
+        while True:
+            wait = self.interval
+            try:
+                self.run_pending()
+                wait = self._wait_seconds()
+            except Exception as e:
+                print(f"⚠️ Cola de trabajos: {e}")
+            self._wake.wait(wait)
+            self._wake.clear()
+
+
+if __name__ == '__main__':
+    import sqlite3
+    import sys
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ('work', 'stats', 'retry'):
+        print(__doc__)
+        sys.exit(1)
+    db_file = sys.argv[2]
+    if sys.argv[1] == 'work':
+        # Los handlers viven en backend.py; sin hilos consumidores propios
+        os.environ.update({'ZETA_DB_FILE': db_file, 'ZETA_JOB_WORKERS': '0'})
+        import backend
+
+        backend.setup()
+        print(f"Consumiendo {', '.join(sorted(backend.job_worker.handlers))} de {db_file} (pid {os.getpid()})")
+        backend.job_worker.run_forever()
+    conn = sqlite3.connect(db_file)
+    if sys.argv[1] == 'stats':
+        now = time.time()
+        for (kind, bucket), (count, oldest) in sorted(stats(conn, now).items()):
+            print(f"{kind:16s} {bucket:8s} {count:6d}  más viejo hace {now - oldest:,.0f}s")
+    else:
+        print(f"{retry_failed(conn)} trabajos reencolados")
+    conn.close()
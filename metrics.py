@@ -0,0 +1,523 @@
+"""
+Métricas en formato Prometheus para ZETA PRO
+
+Cada proceso escribe sus valores en un archivo mmap propio dentro de
+ZETA_METRICS_DIR; /metrics suma los archivos de todos los workers de
+gunicorn. Registrar un valor es un lookup en dict + struct.pack_into,
+sin locks entre procesos ni llamadas al sistema.
+"""
+import glob
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+# mkdtemp solo si falta la variable: los workers la heredan ya puesta
+METRICS_DIR = os.environ.get('ZETA_METRICS_DIR') or tempfile.mkdtemp(prefix='zeta_metrics_')
+os.environ['ZETA_METRICS_DIR'] = METRICS_DIR
+os.makedirs(METRICS_DIR, exist_ok=True)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Buckets por defecto (segundos): de 1 ms a 10 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+_INITIAL_SIZE = 64 * 1024
+
+
+class MmapValues:
+    """Diccionario clave -> float respaldado por un archivo mmap de un solo escritor
+
+    Formato: [uint32 bytes usados][4 bytes relleno] y luego entradas
+    [uint32 largo][clave utf-8 alineada a 8][float64 valor].
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._positions = {}
+        fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        try:
+            if os.fstat(fd).st_size == 0:
+                os.ftruncate(fd, _INITIAL_SIZE)
+            self._capacity = os.fstat(fd).st_size
+            self._m = mmap.mmap(fd, self._capacity)
+        finally:
+            os.close(fd)
+        self._used = struct.unpack_from('I', self._m, 0)[0] or 8
+        for key, _, pos in _iter_entries(self._m, self._used):
+            self._positions[key] = pos
+
+    def _grow(self, needed):
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        self._m.close()
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            os.ftruncate(fd, capacity)
+            self._m = mmap.mmap(fd, capacity)
+        finally:
+            os.close(fd)
+        self._capacity = capacity
+
+    def _init_key(self, key):
+        encoded = key.encode('utf-8')
+        padded = encoded + b' ' * (8 - (len(encoded) + 4) % 8)
+        entry_size = 4 + len(padded) + 8
+        if self._used + entry_size > self._capacity:
+            self._grow(self._used + entry_size)
+        struct.pack_into(f'I{len(padded)}sd', self._m, self._used, len(encoded), padded, 0.0)
+        pos = self._used + 4 + len(padded)
+        self._used += entry_size
+        struct.pack_into('I', self._m, 0, self._used)
+        self._positions[key] = pos
+        return pos
+
+    def inc(self, key, amount=1.0):
+        with self._lock:
+            pos = self._positions.get(key)
+            if pos is None:
+                pos = self._init_key(key)
+            value = struct.unpack_from('d', self._m, pos)[0]
+            struct.pack_into('d', self._m, pos, value + amount)
+
+    def set(self, key, value):
+        with self._lock:
+            pos = self._positions.get(key)
+            if pos is None:
+                pos = self._init_key(key)
+            struct.pack_into('d', self._m, pos, value)
+
+    def close(self):
+        self._m.close()
+
+
+def _iter_entries(buf, used):
+    pos = 8
+    while pos < used:
+        length = struct.unpack_from('I', buf, pos)[0]
+        padded = length + (8 - (length + 4) % 8)
+        key = bytes(buf[pos + 4:pos + 4 + length]).decode('utf-8')
+        value_pos = pos + 4 + padded
+        yield key, struct.unpack_from('d', buf, value_pos)[0], value_pos
+        pos = value_pos + 8
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < 8:
+        return []
+    used = struct.unpack_from('I', data, 0)[0]
+    return [(key, value) for key, value, _ in _iter_entries(data, used)]
+
+
+# ==================== ARCHIVOS POR PROCESO ====================
+_files = {}
+_files_lock = threading.Lock()
+
+
+def _after_fork():
+    # Cada worker abre sus propios archivos (no escribir en los del master)
+    global _files_lock
+    _files.clear()
+    _files_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _values(kind):
+    """Archivo mmap de este proceso para un tipo ('counter' o 'gauge')"""
+    values = _files.get(kind)
+    if values is None:
+        with _files_lock:
+            values = _files.get(kind)
+            if values is None:
+                values = MmapValues(os.path.join(METRICS_DIR, f'{kind}_{os.getpid()}.db'))
+                _files[kind] = values
+    return values
+
+
+def mark_process_dead(pid):
+    """Descartar los gauges de un worker muerto (hook child_exit de gunicorn)"""
+    for path in glob.glob(os.path.join(METRICS_DIR, f'gauge_{pid}.db')):
+        os.remove(path)
+
+
+def reset_dir():
+    """Borrar archivos de una ejecución anterior (hook on_starting de gunicorn)"""
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.db')):
+        os.remove(path)
+
+
+# ==================== TIPOS DE MÉTRICA ====================
+_registry = []
+
+
+def _key(sample, labelnames, labelvalues):
+    return json.dumps([sample, dict(zip(labelnames, map(str, labelvalues)))], sort_keys=True)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.type = 'counter'
+        self._keys = {}
+        _registry.append(self)
+
+    def _key(self, labelvalues):
+        key = self._keys.get(labelvalues)
+        if key is None:
+            key = self._keys[labelvalues] = _key(self.name, self.labelnames, labelvalues)
+        return key
+
+    def inc(self, *labelvalues, amount=1.0):
+        _values('counter').inc(self._key(labelvalues), amount)
+
+
+class Gauge(Counter):
+    """Gauge sumado entre procesos vivos (p. ej. requests en vuelo)"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.type = 'gauge'
+
+    def inc(self, *labelvalues, amount=1.0):
+        _values('gauge').inc(self._key(labelvalues), amount)
+
+    def dec(self, *labelvalues, amount=1.0):
+        _values('gauge').inc(self._key(labelvalues), -amount)
+
+    def set(self, value, *labelvalues):
+        _values('gauge').set(self._key(labelvalues), value)
+
+
+class CollectedGauge:
+    """Gauge calculado al exportar (p. ej. con una consulta a SQLite)
+
+    Es un valor global, no por proceso: no se suma entre workers. La
+    función registrada con `collector` devuelve [(labelvalues, valor)].
+    """
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.type = 'gauge'
+        self.collect = None
+        _registry.append(self)
+
+    def collector(self, fn):
+        self.collect = fn
+        return fn
+
+    def samples(self):
+        if self.collect is None:
+            return []
+        try:
+            return [(dict(zip(self.labelnames, map(str, labelvalues))), value)
+                    for labelvalues, value in self.collect()]
+        except Exception as e:
+            print(f"⚠️ Métrica {self.name}: {e}")
+            return []
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.type = 'histogram'
+        self._bucket_keys = {}
+        _registry.append(self)
+
+    def _keys(self, labelvalues):
+        keys = self._bucket_keys.get(labelvalues)
+        if keys is None:
+            bucket_keys = [
+                _key(f'{self.name}_bucket', self.labelnames + ('le',), labelvalues + (_fmt(b),))
+                for b in self.buckets + (float('inf'),)
+            ]
+            keys = (
+                bucket_keys,
+                _key(f'{self.name}_sum', self.labelnames, labelvalues),
+                _key(f'{self.name}_count', self.labelnames, labelvalues),
+            )
+            self._bucket_keys[labelvalues] = keys
+        return keys
+
+    def observe(self, value, *labelvalues):
+        bucket_keys, sum_key, count_key = self._keys(labelvalues)
+        values = _values('counter')
+        # Se guarda el conteo por bucket; se acumula al exportar
+        values.inc(bucket_keys[bisect_left(self.buckets, value)])
+        values.inc(sum_key, value)
+        values.inc(count_key)
+
+    def time(self, *labelvalues):
+        return _Timer(self, labelvalues)
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labelvalues', 'start')
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+
+
+def _fmt(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+# ==================== EXPORTACIÓN ====================
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_sample(sample, labels, value):
+    text = str(int(value)) if float(value).is_integer() else repr(value)
+    if labels:
+        label_str = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        return f'{sample}{{{label_str}}} {text}'
+    return f'{sample} {text}'
+
+
+def render():
+    """Texto Prometheus con la suma de todos los procesos"""
+    totals = {}
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.db')):
+        try:
+            for key, value in _read_file(path):
+                totals[key] = totals.get(key, 0.0) + value
+        except (OSError, struct.error, UnicodeDecodeError):
+            continue
+
+    samples = {}
+    for key, value in totals.items():
+        sample, labels = json.loads(key)
+        samples.setdefault(sample, []).append((labels, value))
+
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        if isinstance(metric, CollectedGauge):
+            for labels, value in metric.samples():
+                lines.append(_format_sample(metric.name, labels, value))
+            continue
+        if metric.type != 'histogram':
+            for labels, value in sorted(samples.get(metric.name, []), key=lambda s: sorted(s[0].items())):
+                lines.append(_format_sample(metric.name, labels, value))
+            continue
+
+        # Acumular buckets por combinación de labels
+        series = {}
+        for labels, value in samples.get(f'{metric.name}_bucket', []):
+            le = labels.pop('le')
+            series.setdefault(tuple(sorted(labels.items())), {})[le] = value
+        for label_items, buckets in sorted(series.items()):
+            cumulative = 0.0
+            for bound in metric.buckets + (float('inf'),):
+                cumulative += buckets.get(_fmt(bound), 0.0)
+                lines.append(_format_sample(
+                    f'{metric.name}_bucket', dict(label_items, le=_fmt(bound)), cumulative
+                ))
+            for suffix in ('_sum', '_count'):
+                for labels, value in samples.get(f'{metric.name}{suffix}', []):
+                    if tuple(sorted(labels.items())) == label_items:
+                        lines.append(_format_sample(f'{metric.name}{suffix}', labels, value))
+    return '\n'.join(lines) + '\n'
+
+
+# ==================== MÉTRICAS DE ZETA PRO ====================
+HTTP_REQUEST_SECONDS = Histogram(
+    'zeta_http_request_duration_seconds', 'Latencia de requests por ruta Flask',
+    ('endpoint', 'method')
+)
+HTTP_REQUESTS = Counter(
+    'zeta_http_requests_total', 'Requests atendidos por ruta y código de estado',
+    ('endpoint', 'method', 'status')
+)
+HTTP_IN_FLIGHT = Gauge(
+    'zeta_http_requests_in_flight', 'Requests en proceso en este momento'
+)
+UPSTREAM_SECONDS = Histogram(
+    'zeta_upstream_request_duration_seconds', 'Latencia de llamadas a Nominatim y OSRM',
+    ('dependency', 'operation')
+)
+UPSTREAM_ERRORS = Counter(
+    'zeta_upstream_errors_total', 'Errores en llamadas a Nominatim y OSRM',
+    ('dependency', 'operation')
+)
+UPSTREAM_RETRIES = Counter(
+    'zeta_upstream_retries_total', 'Reintentos de llamadas a Nominatim y OSRM',
+    ('dependency', 'operation')
+)
+UPSTREAM_SHORT_CIRCUITED = Counter(
+    'zeta_upstream_short_circuited_total', 'Llamadas rechazadas por circuito abierto',
+    ('dependency', 'operation')
+)
+UPSTREAM_COALESCED = Counter(
+    'zeta_upstream_coalesced_total', 'Llamadas ahorradas al compartir una idéntica en curso',
+    ('dependency', 'operation')
+)
+GEOCODE_RESOLVED = Counter(
+    'zeta_geocode_resolved_total', 'Geocodificaciones por método que las resolvió',
+    ('operation', 'source')
+)
+REPORTS_SCORED = Counter(
+    'zeta_reports_scored_total', 'Reportes calificados por el verificador de fondo',
+    ('outcome',)
+)
+CONTENT_REJECTED = Counter(
+    'zeta_content_rejected_total', 'Textos rechazados por el filtro de contenido',
+    ('rule',)
+)
+INCIDENT_ZONES = Counter(
+    'zeta_incident_zones_total', 'Reportes aprobados por zona de incidentes creada o agrupada',
+    ('outcome',)
+)
+RATE_LIMITED = Counter(
+    'zeta_rate_limited_total', 'Requests rechazados con 429 por rate limiting',
+    ('endpoint',)
+)
+TRIP_UPDATES = Counter(
+    'zeta_trip_updates_total', 'Posiciones de viajes por resultado (unchanged, rescored, rerouted, arrived)',
+    ('outcome',)
+)
+JOBS = Counter(
+    'zeta_jobs_total', 'Trabajos ejecutados por tipo y resultado (done, retry, failed, lost)',
+    ('kind', 'outcome')
+)
+JOB_SECONDS = Histogram(
+    'zeta_job_duration_seconds', 'Tiempo de ejecución de un trabajo por tipo',
+    ('kind',)
+)
+JOB_LATENCY_SECONDS = Histogram(
+    'zeta_job_latency_seconds', 'De encolado a terminado (done o failed) por tipo',
+    ('kind', 'outcome'), buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+)
+JOB_QUEUE_DEPTH = CollectedGauge(
+    'zeta_job_queue_depth', 'Trabajos sin terminar por tipo y estado (ready, running, delayed, failed)',
+    ('kind', 'state')
+)
+JOB_OLDEST_SECONDS = CollectedGauge(
+    'zeta_job_oldest_ready_seconds', 'Antigüedad del trabajo visible más viejo por tipo',
+    ('kind',)
+)
+IMAGE_COMPRESS_SECONDS = Histogram(
+    'zeta_image_compress_duration_seconds', 'Tiempo de compresión de imágenes con Pillow'
+)
+DB_QUERY_SECONDS = Histogram(
+    'zeta_db_query_duration_seconds', 'Tiempo de execute() por sitio de consulta SQLite',
+    ('site',), buckets=DB_BUCKETS
+)
+DB_FETCH_SECONDS = Histogram(
+    'zeta_db_fetch_duration_seconds',
+    'Tiempo de lectura de filas (fetch* o iterar el cursor) por sitio de consulta SQLite',
+    ('site',), buckets=DB_BUCKETS
+)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor que mide cada consulta etiquetada con la función que la ejecuta
+
+    fetchall/fetchone/fetchmany se miden por llamada. Iterar el cursor (las
+    respuestas en streaming, sync) suma el tiempo de cada fila y lo observa
+    una vez por consulta: al agotarse, al ejecutar otra o al cerrarlo.
+    """
+
+    _site = 'unknown'
+    _iter_seconds = 0.0
+
+    def _observe_iteration(self):
+        if self._iter_seconds:
+            DB_FETCH_SECONDS.observe(self._iter_seconds, self._site)
+            self._iter_seconds = 0.0
+
+    def _run(self, site, run, sql, parameters):
+        self._observe_iteration()
+        start = time.perf_counter()
+        try:
+            return run(self, sql, parameters)
+        finally:
+            self._site = site
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, site)
+
+    def execute(self, sql, parameters=()):
+        return self._run(sys._getframe(1).f_code.co_name, sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(sys._getframe(1).f_code.co_name, sqlite3.Cursor.executemany, sql, seq_of_parameters)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        DB_FETCH_SECONDS.observe(time.perf_counter() - start, self._site)
+        return rows
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        DB_FETCH_SECONDS.observe(time.perf_counter() - start, self._site)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        DB_FETCH_SECONDS.observe(time.perf_counter() - start, self._site)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._iter_seconds += time.perf_counter() - start
+            self._observe_iteration()
+            raise
+        self._iter_seconds += time.perf_counter() - start
+        return row
+
+    def close(self):
+        self._observe_iteration()
+        super().close()
+
+    def __del__(self):
+        # Iteración abandonada a medias (p. ej. el cliente cortó el stream)
+        self._observe_iteration()
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # conn.execute(...) de sqlite3 crea un Cursor simple: pasar por TimedCursor
+    def execute(self, sql, parameters=()):
+        return self.cursor()._run(sys._getframe(1).f_code.co_name, sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor()._run(sys._getframe(1).f_code.co_name, sqlite3.Cursor.executemany,
+                                  sql, seq_of_parameters)
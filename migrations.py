@@ -0,0 +1,457 @@
+"""
+Migraciones versionadas del esquema SQLite
+
+La versión aplicada se guarda en `PRAGMA user_version`. Cada migración se
+ejecuta en su propia transacción junto con el cambio de versión, así que
+una base a medio migrar nunca queda marcada como actualizada.
+
+Para cambiar el esquema agrega una entrada al final de MIGRATIONS; nunca
+edites una migración ya publicada.
+"""
+import sqlite3
+
+# Migración 1: esquema original (IF NOT EXISTS para bases creadas antes
+# de que existieran las migraciones)
+INITIAL_SCHEMA = [
+    # Tabla de usuarios
+    '''
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            email TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            photo TEXT,
+            phone TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP,
+            reports_count INTEGER DEFAULT 0,
+            verified BOOLEAN DEFAULT 0,
+            rating REAL DEFAULT 5.0
+        )
+    ''',
+    # Tabla de reportes con sistema de verificación
+    '''
+        CREATE TABLE IF NOT EXISTS reports (
+            id TEXT PRIMARY KEY,
+            user_id TEXT,
+            description TEXT NOT NULL,
+            category TEXT NOT NULL,
+            severity TEXT NOT NULL,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            address TEXT,
+            images TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            verified BOOLEAN DEFAULT 0,
+            verified_by TEXT,
+            verified_at TIMESTAMP,
+            status TEXT DEFAULT 'pending',
+            upvotes INTEGER DEFAULT 0,
+            downvotes INTEGER DEFAULT 0,
+            news_source TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''',
+    # Tabla de lugares (restaurantes, museos, etc.)
+    '''
+        CREATE TABLE IF NOT EXISTS places (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            address TEXT,
+            phone TEXT,
+            website TEXT,
+            description TEXT,
+            images TEXT,
+            rating REAL DEFAULT 0,
+            total_reviews INTEGER DEFAULT 0,
+            price_level INTEGER DEFAULT 2,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    # Tabla de reseñas de lugares
+    '''
+        CREATE TABLE IF NOT EXISTS reviews (
+            id TEXT PRIMARY KEY,
+            place_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            rating INTEGER NOT NULL,
+            comment TEXT,
+            images TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            helpful_count INTEGER DEFAULT 0,
+            FOREIGN KEY (place_id) REFERENCES places(id),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''',
+    # Tabla de zonas de riesgo dinámicas
+    '''
+        CREATE TABLE IF NOT EXISTS risk_zones (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            radius_km REAL NOT NULL,
+            level TEXT NOT NULL,
+            type TEXT NOT NULL,
+            color TEXT NOT NULL,
+            active BOOLEAN DEFAULT 1,
+            expires_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            source TEXT,
+            description TEXT
+        )
+    ''',
+    # Tabla de desastres naturales
+    '''
+        CREATE TABLE IF NOT EXISTS natural_disasters (
+            id TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            radius_km REAL NOT NULL,
+            severity TEXT NOT NULL,
+            description TEXT,
+            active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP,
+            source TEXT
+        )
+    ''',
+    # Tabla de votos en reportes
+    '''
+        CREATE TABLE IF NOT EXISTS report_votes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            report_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            vote_type TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(report_id, user_id),
+            FOREIGN KEY (report_id) REFERENCES reports(id),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''',
+]
+
+# Migración 2: índices para las consultas calientes
+HOT_PATH_INDEXES = [
+    # get_reports: WHERE created_at > ? ORDER BY created_at DESC
+    "CREATE INDEX IF NOT EXISTS idx_reports_created_at ON reports(created_at)",
+    # calculate_risk: WHERE verified = 1 AND status = 'active' AND created_at > ?
+    "CREATE INDEX IF NOT EXISTS idx_reports_verified_status_created ON reports(verified, status, created_at)",
+    # get_place_details / add_review: WHERE place_id = ? ORDER BY created_at DESC
+    "CREATE INDEX IF NOT EXISTS idx_reviews_place_created ON reviews(place_id, created_at)",
+    # calculate_risk / get_risk_zones: WHERE active = 1 AND expires_at ...
+    "CREATE INDEX IF NOT EXISTS idx_risk_zones_active_expires ON risk_zones(active, expires_at)",
+    # get_disasters / calculate_route: WHERE active = 1 AND expires_at ...
+    "CREATE INDEX IF NOT EXISTS idx_disasters_active_expires ON natural_disasters(active, expires_at)",
+]
+
+# Migración 3: contador de versión de los datos de riesgo (read_model.py).
+# Los triggers lo incrementan en la misma transacción que el cambio.
+_BUMP_RISK = "UPDATE data_versions SET version = version + 1 WHERE name = 'risk';"
+
+RISK_DATA_VERSION = [
+    """
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """,
+    "INSERT OR IGNORE INTO data_versions (name, version) VALUES ('risk', 0)",
+] + [
+    f"CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.split()[0].lower()}_risk_version "
+    f"AFTER {event} ON {table} {condition}BEGIN {_BUMP_RISK} END"
+    for table, event, condition in [
+        ('risk_zones', 'INSERT', ''),
+        ('risk_zones', 'UPDATE', ''),
+        ('risk_zones', 'DELETE', ''),
+        ('natural_disasters', 'INSERT', ''),
+        ('natural_disasters', 'UPDATE', ''),
+        ('natural_disasters', 'DELETE', ''),
+        ('reports', 'INSERT', "WHEN NEW.verified = 1 "),
+        ('reports', 'UPDATE OF verified, status, severity, lat, lon, created_at', ''),
+        ('reports', 'DELETE', "WHEN OLD.verified = 1 "),
+    ]
+]
+
+# Migración 4: gazetteer offline (gazetteer.py). Las geometrías se guardan
+# como GeoJSON; el importador reemplaza todo e incrementa 'gazetteer'.
+GAZETTEER = [
+    """
+        CREATE TABLE IF NOT EXISTS gazetteer_features (
+            id INTEGER PRIMARY KEY,
+            osm_id TEXT,
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            min_lat REAL NOT NULL,
+            min_lon REAL NOT NULL,
+            max_lat REAL NOT NULL,
+            max_lon REAL NOT NULL,
+            geometry TEXT NOT NULL
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS gazetteer_addresses (
+            id INTEGER PRIMARY KEY,
+            street TEXT NOT NULL,
+            number TEXT NOT NULL,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL
+        )
+    """,
+    "INSERT OR IGNORE INTO data_versions (name, version) VALUES ('gazetteer', 0)",
+]
+
+
+def _rebuild_risk_profile(conn):
+    import risk_profile
+    risk_profile.rebuild(conn, commit=False)
+
+
+# Migración 5: perfiles de riesgo por celda × hora de la semana
+# (risk_profile.py). 'risk_profile' cambia con cada reporte verificado o
+# rechazado; 'risk_profile_base' marca la última reconstrucción completa.
+RISK_PROFILE = [
+    """
+        CREATE TABLE IF NOT EXISTS risk_profile (
+            cell_lat INTEGER NOT NULL,
+            cell_lon INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            weight REAL NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (cell_lat, cell_lon, hour)
+        ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_risk_profile_version ON risk_profile(version)",
+    "INSERT OR IGNORE INTO data_versions (name, version) VALUES ('risk_profile', 0)",
+    "INSERT OR IGNORE INTO data_versions (name, version) VALUES ('risk_profile_base', 0)",
+    _rebuild_risk_profile,
+]
+
+# Migración 6: registro de cambios para /api/sync (sync.py). Cada
+# escritura sobre una tabla sincronizada agrega (seq, entidad, id) en la
+# misma transacción; AUTOINCREMENT garantiza que seq nunca se reutiliza.
+CHANGE_LOG = [
+    """
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_id TEXT NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    "INSERT OR IGNORE INTO data_versions (name, version) VALUES ('change_log_floor', 0)",
+] + [
+    f"CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_change_log "
+    f"AFTER {event} ON {table} BEGIN "
+    f"INSERT INTO change_log (entity, entity_id) VALUES ('{entity}', {'OLD' if event == 'DELETE' else 'NEW'}.id); END"
+    for table, entity in [
+        ('reports', 'reports'),
+        ('risk_zones', 'zones'),
+        ('natural_disasters', 'disasters'),
+        ('places', 'places'),
+        ('reviews', 'reviews'),
+    ]
+    for event in ('INSERT', 'UPDATE', 'DELETE')
+]
+
+def _backfill_report_dedup(conn):
+    import dedup
+    dedup.backfill(conn)
+
+
+# Migración 7: detección de duplicados al enviar (dedup.py). report_lsh
+# guarda (llave de banda MinHash + celda geohash, reporte, cubeta de
+# tiempo); report_signatures, la firma completa para estimar similitud.
+REPORT_DEDUP = [
+    "ALTER TABLE reports ADD COLUMN duplicate_of TEXT",
+    "CREATE INDEX IF NOT EXISTS idx_reports_duplicate_of ON reports(duplicate_of)",
+    """
+        CREATE TABLE IF NOT EXISTS report_signatures (
+            report_id TEXT PRIMARY KEY,
+            time_bucket INTEGER NOT NULL,
+            signature BLOB NOT NULL
+        ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_report_signatures_bucket ON report_signatures(time_bucket)",
+    """
+        CREATE TABLE IF NOT EXISTS report_lsh (
+            key INTEGER NOT NULL,
+            report_id TEXT NOT NULL,
+            time_bucket INTEGER NOT NULL,
+            PRIMARY KEY (key, report_id)
+        ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_report_lsh_bucket ON report_lsh(time_bucket)",
+    _backfill_report_dedup,
+]
+
+# Migración 8: calificación del verificador de fondo (verifier.py).
+# scored_by es la versión del calificador; NULL = falta calificar.
+VERIFICATION_SCORES = [
+    "ALTER TABLE reports ADD COLUMN verification_score REAL",
+    "ALTER TABLE reports ADD COLUMN scored_by TEXT",
+    "CREATE INDEX IF NOT EXISTS idx_reports_status_scored ON reports(status, scored_by, created_at)",
+]
+
+# Migración 9: cola de moderación (/api/reports/pending) ordenada por
+# calificación, sin calificar al final. queue_score es una columna virtual
+# para que el cursor (queue_score, id) < (?, ?) sea un rango del índice; con
+# la expresión ifnull(...) directa SQLite solo usa status=? y filtra.
+PENDING_QUEUE = [
+    """
+        ALTER TABLE reports ADD COLUMN queue_score REAL
+        GENERATED ALWAYS AS (ifnull(verification_score, -1.0)) VIRTUAL
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_reports_pending_score ON reports(status, queue_score, id)",
+]
+
+
+def _consolidate_incident_zones(conn):
+    import incident_zones
+    incident_zones.consolidate(conn)
+
+
+# Migración 10: agrupación de zonas de incidentes (incident_zones.py).
+# zone_reports guarda los reportes vivos de cada zona con su posición,
+# nivel y vencimiento; las zonas que ya se enciman se agrupan al migrar.
+ZONE_REPORTS = [
+    """
+        CREATE TABLE IF NOT EXISTS zone_reports (
+            report_id TEXT PRIMARY KEY,
+            zone_id TEXT NOT NULL,
+            lat REAL NOT NULL,
+            lon REAL NOT NULL,
+            level TEXT NOT NULL,
+            expires_at TIMESTAMP NOT NULL
+        ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_zone_reports_zone ON zone_reports(zone_id)",
+    "CREATE INDEX IF NOT EXISTS idx_zone_reports_expires ON zone_reports(expires_at)",
+    _consolidate_incident_zones,
+]
+
+# Migración 11: cola de trabajos durable (jobs.py). visible_at es a la vez
+# la hora programada de un trabajo en cola y el fin del plazo de uno
+# reclamado: el reclamo solo busca state = 'queued' AND visible_at <= ahora.
+JOB_QUEUE = [
+    """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            idempotency_key TEXT UNIQUE,
+            state TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5,
+            visible_at REAL NOT NULL,
+            locked_by TEXT,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            finished_at REAL
+        )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_jobs_state_visible ON jobs(state, visible_at)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs(state, finished_at)",
+]
+
+# Migración 12: viajes en curso (trips.py). `route` guarda la polilínea y
+# las distancias acumuladas; `scores`, el puntaje por muestra; `footprint`,
+# las zonas, reportes y desastres con que se calificó el resto del viaje.
+TRIPS = [
+    """
+        CREATE TABLE IF NOT EXISTS trips (
+            id TEXT PRIMARY KEY,
+            user_id TEXT,
+            status TEXT NOT NULL DEFAULT 'active',
+            destination TEXT,
+            dest_lat REAL NOT NULL,
+            dest_lon REAL NOT NULL,
+            avoid_risks INTEGER NOT NULL DEFAULT 1,
+            route TEXT NOT NULL,
+            scores TEXT NOT NULL,
+            footprint TEXT NOT NULL,
+            risk_version INTEGER,
+            next_expiry REAL,
+            progress INTEGER NOT NULL DEFAULT 0,
+            offset_km REAL NOT NULL DEFAULT 0,
+            last_lat REAL,
+            last_lon REAL,
+            reroutes INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_trips_updated ON trips(updated_at)",
+]
+
+# Migración 13: el perfil se armaba leyendo created_at (UTC) como hora
+# local del servidor; se reconstruye con las horas en risk_profile.TIMEZONE.
+RISK_PROFILE_TIMEZONE = [
+    _rebuild_risk_profile,
+]
+
+MIGRATIONS = [
+    (1, "esquema inicial", INITIAL_SCHEMA),
+    (2, "índices de consultas calientes", HOT_PATH_INDEXES),
+    (3, "versión de datos de riesgo", RISK_DATA_VERSION),
+    (4, "gazetteer offline", GAZETTEER),
+    (5, "perfiles de riesgo por hora de la semana", RISK_PROFILE),
+    (6, "registro de cambios para sincronización", CHANGE_LOG),
+    (7, "detección de reportes duplicados", REPORT_DEDUP),
+    (8, "calificación automática de reportes", VERIFICATION_SCORES),
+    (9, "cola de moderación por calificación", PENDING_QUEUE),
+    (10, "agrupación de zonas de incidentes", ZONE_REPORTS),
+    (11, "cola de trabajos", JOB_QUEUE),
+    (12, "viajes en curso", TRIPS),
+    (13, "perfil de riesgo en la zona horaria del servicio", RISK_PROFILE_TIMEZONE),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Aplicar en orden las migraciones pendientes; devuelve la versión final"""
+    previous_isolation = conn.isolation_level
+    conn.isolation_level = None  # transacciones explícitas
+    try:
+        for version, description, steps in MIGRATIONS:
+            if version <= current_version(conn):
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Releer dentro del lock: otro proceso pudo migrar mientras esperábamos
+                if version <= current_version(conn):
+                    conn.execute("COMMIT")
+                    continue
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(step)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            print(f"Migración {version} aplicada: {description}")
+        return current_version(conn)
+    finally:
+        conn.isolation_level = previous_isolation
+
+
+if __name__ == '__main__':
+    import sys
+
+    db_file = sys.argv[1] if len(sys.argv) > 1 else 'zeta_pro.db'
+    conn = sqlite3.connect(db_file)
+    print(f"{db_file}: versión {current_version(conn)} -> {migrate(conn)}")
+    conn.close()
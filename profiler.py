@@ -0,0 +1,145 @@
+"""
+Perfilador por muestreo para requests lentos de ZETA PRO
+
+Un hilo de fondo toma la pila de los hilos con requests perfilados cada
+ZETA_PROFILE_INTERVAL_MS y guarda el resultado en formato collapsed-stack
+(`func;func;func N`), listo para flamegraph.pl o speedscope.
+
+Activación (todo apagado por defecto, sin costo más allá de un `if`):
+    ZETA_PROFILE_TOKEN=secreto    header `X-Zeta-Profile: secreto` perfila ese request
+    ZETA_PROFILE_SLOW_MS=1500     muestrea todos los requests y guarda los que superen el umbral
+    ZETA_PROFILE_ENDPOINTS=calculate_route,submit_report   perfila siempre esos endpoints
+    ZETA_PROFILE_DIR=profiles     directorio de salida
+
+Solo funciona con workers sync (hilos reales); con gevent se desactiva.
+"""
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+PROFILE_HEADER = 'X-Zeta-Profile'
+PROFILE_DIR = os.environ.get('ZETA_PROFILE_DIR', 'profiles')
+PROFILE_TOKEN = os.environ.get('ZETA_PROFILE_TOKEN', '')
+SLOW_THRESHOLD_MS = float(os.environ.get('ZETA_PROFILE_SLOW_MS', 0))
+INTERVAL_MS = float(os.environ.get('ZETA_PROFILE_INTERVAL_MS', 5))
+ALWAYS_ENDPOINTS = {e.strip() for e in os.environ.get('ZETA_PROFILE_ENDPOINTS', '').split(',') if e.strip()}
+
+enabled = bool(PROFILE_TOKEN or SLOW_THRESHOLD_MS or ALWAYS_ENDPOINTS)
+
+
+def _gevent_patched():
+    gevent_monkey = sys.modules.get('gevent.monkey')
+    return bool(gevent_monkey and gevent_monkey.is_module_patched('threading'))
+
+
+class ProfileSession:
+    """Muestras acumuladas de un request"""
+    __slots__ = ('endpoint', 'forced', 'start', 'stacks', 'samples')
+
+    def __init__(self, endpoint, forced):
+        self.endpoint = endpoint
+        self.forced = forced
+        self.start = time.perf_counter()
+        self.stacks = {}
+        self.samples = 0
+
+
+class Sampler:
+    def __init__(self, interval_ms=INTERVAL_MS):
+        self.interval = interval_ms / 1000.0
+        self._sessions = {}
+        self._labels = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_running(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='zeta-profiler', daemon=True)
+                    self._thread.start()
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            if not self._sessions:
+                continue
+            frames = sys._current_frames()
+            for thread_id, session in list(self._sessions.items()):
+                if thread_id == own_id:
+                    continue
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                key = ';'.join(reversed(stack))
+                session.stacks[key] = session.stacks.get(key, 0) + 1
+                session.samples += 1
+
+    def begin(self, endpoint, forced=False):
+        session = ProfileSession(endpoint, forced)
+        self._sessions[threading.get_ident()] = session
+        self._ensure_running()
+        return session
+
+    def end(self):
+        return self._sessions.pop(threading.get_ident(), None)
+
+
+_sampler = Sampler()
+
+
+def should_profile(endpoint, header_value):
+    """(perfilar, forzado) para el request actual"""
+    if PROFILE_TOKEN and header_value == PROFILE_TOKEN:
+        return True, True
+    if endpoint in ALWAYS_ENDPOINTS:
+        return True, True
+    return bool(SLOW_THRESHOLD_MS), False
+
+
+def begin(endpoint, header_value=None):
+    profile, forced = should_profile(endpoint, header_value)
+    if profile:
+        return _sampler.begin(endpoint, forced)
+    return None
+
+
+def finish():
+    """Cerrar la sesión del hilo actual; devuelve la ruta del archivo si se guardó"""
+    session = _sampler.end()
+    if session is None:
+        return None
+    elapsed_ms = (time.perf_counter() - session.start) * 1000
+    if not session.forced and elapsed_ms < SLOW_THRESHOLD_MS:
+        return None
+    return write_collapsed(session, elapsed_ms)
+
+
+def write_collapsed(session, elapsed_ms):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    name = f"{stamp}_{session.endpoint or 'unknown'}_{int(elapsed_ms)}ms_{os.getpid()}.folded"
+    path = os.path.join(PROFILE_DIR, name)
+    with open(path, 'w') as f:
+        for stack, count in sorted(session.stacks.items(), key=lambda item: -item[1]):
+            f.write(f"{stack} {count}\n")
+    return path
+
+
+if enabled and _gevent_patched():
+    print("Perfilador desactivado: no es compatible con workers gevent")
+    enabled = False
@@ -0,0 +1,96 @@
+"""
+Proyecciones `fields=` para endpoints de lista y detalle
+
+Cada endpoint declara sus campos públicos con las columnas SQL que los
+alimentan. El cliente pide un subconjunto (`fields=id,lat,lon`) o un nombre
+de proyección (`fields=markers`) y el SELECT se arma solo con esas
+columnas, así que las columnas pesadas (imágenes, fotos) ni se leen ni se
+decodifican. Sin `fields` se devuelven todos los campos, como siempre.
+"""
+import json
+
+
+class ProjectionError(ValueError):
+    """Campo o proyección desconocida en `fields=`"""
+
+
+class Field:
+    __slots__ = ('columns', 'convert', 'join')
+
+    def __init__(self, *columns, convert=None, join=None):
+        self.columns = columns
+        self.convert = convert
+        self.join = join  # nombre del JOIN que necesita la columna, si alguno
+
+
+def json_list(value):
+    return json.loads(value) if value else []
+
+
+class Projection:
+    def __init__(self, fields, projections=None, nested=None):
+        """fields: {nombre: Field}; projections: {alias: [campos]};
+        nested: {nombre: Projection} para campos con sublista (p. ej. reviews)"""
+        self.fields = fields
+        self.projections = projections or {}
+        self.nested = nested or {}
+
+    def parse(self, raw):
+        """'a,b,reviews.c' -> (campos propios, {anidado: campos}); None = todo"""
+        if raw is None or not raw.strip():
+            return list(self.fields), {name: list(p.fields) for name, p in self.nested.items()}
+        names, nested, unknown = [], {}, []
+        for item in (part.strip() for part in raw.split(',')):
+            if not item:
+                continue
+            if item in self.projections:
+                for name in self.projections[item]:
+                    if name in self.nested:
+                        nested.setdefault(name, list(self.nested[name].fields))
+                    elif name not in names:
+                        names.append(name)
+                continue
+            head, _, sub = item.partition('.')
+            if head in self.nested:
+                child = self.nested[head]
+                if not sub:
+                    nested[head] = list(child.fields)
+                elif sub in child.fields:
+                    if sub not in nested.setdefault(head, []):
+                        nested[head].append(sub)
+                else:
+                    unknown.append(item)
+            elif item in self.fields:
+                if item not in names:
+                    names.append(item)
+            else:
+                unknown.append(item)
+        if unknown:
+            raise ProjectionError(f"Campos inválidos: {', '.join(unknown)}")
+        if not names and not nested:
+            raise ProjectionError("fields no puede estar vacío")
+        return names, nested
+
+    def columns(self, names, always=()):
+        """Lista de columnas del SELECT; `always` agrega columnas internas al inicio"""
+        columns = list(always)
+        for name in names:
+            columns.extend(self.fields[name].columns)
+        return ', '.join(columns)
+
+    def joins(self, names):
+        return {self.fields[name].join for name in names if self.fields[name].join}
+
+    def to_dict(self, names, row, offset=0):
+        result = {}
+        i = offset
+        for name in names:
+            field = self.fields[name]
+            width = len(field.columns)
+            values = row[i:i + width]
+            i += width
+            if field.convert is not None:
+                result[name] = field.convert(*values)
+            else:
+                result[name] = values[0]
+        return result
@@ -0,0 +1,196 @@
+"""
+Rate limiting por cliente y endpoint, compartido entre workers de gunicorn
+
+Cada combinación (endpoint, cliente) tiene un token bucket: hasta `burst`
+requests de golpe y después `rate` por segundo. Los buckets viven en una
+tabla de tamaño fijo dentro de un archivo mmap (ZETA_RATELIMIT_FILE) que
+todos los workers mapean, así que el límite es por servidor y no por
+proceso. Revisar un request es un hash, un lock de rango con fcntl sobre
+las ranuras del bucket y un par de struct.unpack/pack: microsegundos, sin
+tocar SQLite.
+
+Formato: [8s MAGIC][uint32 ranuras][4 bytes relleno] y luego ranuras
+[uint64 llave][float64 tokens][float64 actualizado]. La llave es un hash
+de 64 bits de (endpoint, cliente); 0 = ranura libre. Cada llave se busca
+en PROBE ranuras seguidas; si no hay libre se reemplaza la que lleva más
+tiempo sin uso (para entonces su bucket ya estaba lleno).
+
+Límites por nombre de vista de Flask, en ZETA_RATE_LIMITS:
+    submit_report=10/60:5,calculate_route=30/60
+es 10 requests cada 60 s con ráfagas de 5 (sin `:` la ráfaga es el total).
+
+Uso:
+    python ratelimit.py check submit_report 203.0.113.7
+"""
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+ENABLED = os.environ.get('ZETA_RATELIMIT', '1') != '0'
+SLOTS = int(os.environ.get('ZETA_RATELIMIT_SLOTS', '65536'))
+PROBE = 8
+
+MAGIC = b'ZETARL01'
+_HEADER = struct.Struct('<8sI4x')
+_SLOT = struct.Struct('<Qdd')
+
+
+class Limit:
+    """`count` requests cada `period` segundos, con ráfagas de `burst`"""
+
+    def __init__(self, count, period, burst=None):
+        self.count = count
+        self.period = period
+        self.rate = count / period
+        self.burst = float(burst if burst is not None else count)
+
+    def __repr__(self):
+        return f"{self.count}/{self.period:g}:{self.burst:g}"
+
+
+DEFAULT_LIMITS = {
+    # Pillow y validaciones por request
+    'submit_report': Limit(10, 60, burst=5),
+    'add_review': Limit(10, 60, burst=5),
+    'report_disaster': Limit(5, 60, burst=3),
+    'register': Limit(5, 60),
+    'vote_report': Limit(30, 60, burst=10),
+    # Llamadas a OSRM y Nominatim
+    'calculate_route': Limit(30, 60, burst=10),
+    'start_trip': Limit(30, 60, burst=10),
+    # Una posición por segundo; OSRM solo al desviarse o subir el riesgo
+    'update_trip_position': Limit(60, 60, burst=20),
+    'reverse_geocode': Limit(60, 60, burst=20),
+    'search_places': Limit(60, 60, burst=20),
+}
+
+
+def parse_limits(spec, base=None):
+    """'vista=N/segundos[:ráfaga],...' sobre los límites `base`"""
+    limits = dict(DEFAULT_LIMITS if base is None else base)
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        endpoint, _, value = item.partition('=')
+        rate, _, burst = value.partition(':')
+        count, _, period = rate.partition('/')
+        if int(count) <= 0:
+            limits.pop(endpoint.strip(), None)
+            continue
+        limits[endpoint.strip()] = Limit(int(count), float(period or 1), float(burst) if burst else None)
+    return limits
+
+
+LIMITS = parse_limits(os.environ.get('ZETA_RATE_LIMITS', ''))
+
+
+def _key(endpoint, client):
+    digest = hashlib.blake2b(f"{endpoint}\0{client}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+
+class RateLimiter:
+    """Tabla de token buckets en un archivo mmap compartido"""
+
+    def __init__(self, path, limits=None, slots=SLOTS):
+        self.path = path
+        self.limits = LIMITS if limits is None else limits
+        self.slots = slots
+        self._size = _HEADER.size + slots * _SLOT.size
+        self._lock = threading.Lock()
+        self._fd = None
+        self._m = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # El mapeo y el fd sirven en el hijo; el lock de hilos no
+        self._lock = threading.Lock()
+
+    def _open(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if fcntl is not None:
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(fd, _HEADER.size, 0)
+            if len(header) < _HEADER.size or _HEADER.unpack(header) != (MAGIC, self.slots):
+                # Archivo nuevo o de otra configuración: empezar vacío
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self._size)
+                os.pwrite(fd, _HEADER.pack(MAGIC, self.slots), 0)
+            m = mmap.mmap(fd, self._size)
+        finally:
+            if fcntl is not None:
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+        self._fd, self._m = fd, m
+
+    def hit(self, endpoint, client, now=None):
+        """(permitido, segundos para reintentar) y consume un token si hay
+
+        Endpoints sin límite siempre pasan.
+        """
+        limit = self.limits.get(endpoint)
+        if limit is None:
+            return True, 0.0
+        now = time.time() if now is None else now
+        key = _key(endpoint, client)
+        first = key % (self.slots - PROBE + 1)
+        offset = _HEADER.size + first * _SLOT.size
+        length = PROBE * _SLOT.size
+        with self._lock:
+            if self._m is None:
+                self._open()
+            m = self._m
+            if fcntl is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX, length, offset)
+            try:
+                target, tokens, updated = None, limit.burst, now
+                oldest = None
+                for pos in range(offset, offset + length, _SLOT.size):
+                    slot_key, slot_tokens, slot_updated = _SLOT.unpack_from(m, pos)
+                    if slot_key == key:
+                        target, tokens, updated = pos, slot_tokens, slot_updated
+                        break
+                    if slot_key == 0:
+                        # Las ranuras no se liberan: después de una libre no hay llaves
+                        target = pos
+                        break
+                    if oldest is None or slot_updated < oldest[1]:
+                        oldest = (pos, slot_updated)
+                if target is None:
+                    target = oldest[0]
+                # Relojes que retroceden no regalan tokens
+                tokens = min(limit.burst, tokens + max(0.0, now - updated) * limit.rate)
+                allowed = tokens >= 1.0
+                if allowed:
+                    tokens -= 1.0
+                _SLOT.pack_into(m, target, key, tokens, max(now, updated))
+            finally:
+                if fcntl is not None:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+        return allowed, 0.0 if allowed else (1.0 - tokens) / limit.rate
+
+    def reset(self):
+        """Vaciar todos los buckets"""
+        with self._lock:
+            if self._m is None:
+                self._open()
+            self._m[_HEADER.size:] = bytes(self._size - _HEADER.size)
+
+
+if __name__ == '__main__':
+    import json
+    import sys
+
+    if len(sys.argv) < 4 or sys.argv[1] != 'check':
+        print(__doc__)
+        sys.exit(1)
+    path = os.environ.get('ZETA_RATELIMIT_FILE', f"{os.environ.get('ZETA_DB_FILE', 'zeta_pro.db')}.ratelimit")
+    allowed, retry_after = RateLimiter(path).hit(sys.argv[2], sys.argv[3])
+    print(json.dumps({"endpoint": sys.argv[2], "limit": repr(LIMITS.get(sys.argv[2])),
+                      "allowed": allowed, "retry_after": round(retry_after, 2)}))
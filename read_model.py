@@ -0,0 +1,329 @@
+"""
+Modelo de lectura en memoria de los datos de riesgo activos
+
+Zonas de riesgo activas, reportes verificados recientes y desastres
+activos son pocos pero se leen en cada cálculo de riesgo y de ruta. Cada
+proceso guarda una copia compacta (arrays + registros con __slots__) y la
+recarga solo cuando cambian esas tablas:
+
+1. `PRAGMA data_version` (sobre una conexión propia que nunca escribe)
+   indica si hubo algún commit desde la última consulta.
+2. Solo entonces se lee la fila 'risk' de `data_versions`, que los
+   triggers de la migración 3 incrementan al tocar zonas, desastres o el
+   estado de verificación de un reporte. Un voto no provoca recarga.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from datetime import datetime
+
+RECENT_REPORT_DAYS = 7
+NEARBY_REPORT_KM = 0.5
+# Celda de la rejilla de reportes: 0.01° ≈ 1.1 km > NEARBY_REPORT_KM
+REPORT_CELL_DEG = 0.01
+
+LEVEL_SPANISH = {"critical": "Crítico", "high": "Alto", "medium": "Medio", "low": "Bajo"}
+RISK_SCORES = {"Crítico": 4, "Alto": 3, "Medio": 2, "Bajo": 1}
+SCORE_LEVELS = {score: level for level, score in RISK_SCORES.items()}
+
+# Cotas inferiores de km por grado: el prefiltro nunca descarta un punto
+# que la distancia geodésica consideraría dentro
+_KM_PER_DEG_LAT = 110.5
+_KM_PER_DEG_LON_EQUATOR = 111.3
+
+
+def parse_timestamp(value):
+    """Texto de SQLite -> epoch; None si no hay fecha (nunca expira)"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return None
+
+
+class ZoneRecord:
+    __slots__ = ('id', 'name', 'lat', 'lon', 'radius_km', 'level', 'type', 'color',
+                 'description', 'source', 'created_at', 'expires_at', 'expires_ts')
+
+    def __init__(self, row):
+        (self.id, self.name, self.lat, self.lon, self.radius_km, self.level, self.type,
+         self.color, self.description, self.source, self.created_at, self.expires_at) = row
+        self.expires_ts = parse_timestamp(self.expires_at)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "lat": self.lat,
+            "lon": self.lon,
+            "radius_km": self.radius_km,
+            "level": self.level,
+            "type": self.type,
+            "color": self.color,
+            "description": self.description
+        }
+
+
+class DisasterRecord:
+    __slots__ = ('id', 'type', 'lat', 'lon', 'radius_km', 'severity', 'description',
+                 'created_at', 'expires_at', 'expires_ts')
+
+    def __init__(self, row):
+        (self.id, self.type, self.lat, self.lon, self.radius_km, self.severity,
+         self.description, self.created_at, self.expires_at) = row
+        self.expires_ts = parse_timestamp(self.expires_at)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "type": self.type,
+            "lat": self.lat,
+            "lon": self.lon,
+            "radius_km": self.radius_km,
+            "severity": self.severity,
+            "description": self.description,
+            "created_at": self.created_at,
+            "expires_at": self.expires_at
+        }
+
+
+def _km_box(lat, radius_km):
+    """Medio ancho en grados (lat, lon) que cubre radius_km"""
+    cos_lat = max(0.01, math.cos(math.radians(abs(lat) + 1.0)))
+    return radius_km / _KM_PER_DEG_LAT, radius_km / (_KM_PER_DEG_LON_EQUATOR * cos_lat)
+
+
+def _geodesic_km(point_a, point_b):
+    from geopy.distance import geodesic
+    return geodesic(point_a, point_b).kilometers
+
+
+class RiskState:
+    """Foto inmutable del conjunto activo; se reemplaza completa al recargar"""
+
+    def __init__(self, zones, reports, disasters, version):
+        self.version = version
+        # Orden de get_risk_zones: ORDER BY level DESC (texto)
+        self.zones = sorted(zones, key=lambda z: z.level, reverse=True)
+        self.zone_lat = array('d', (z.lat for z in self.zones))
+        self.zone_lon = array('d', (z.lon for z in self.zones))
+        self.zone_radius = array('d', (z.radius_km for z in self.zones))
+        self.zone_score = array('b', (RISK_SCORES[LEVEL_SPANISH.get(z.level, "Bajo")] for z in self.zones))
+        self.zone_expires = array('d', (z.expires_ts if z.expires_ts is not None else math.inf
+                                        for z in self.zones))
+
+        # Reportes verificados recientes: columnas paralelas + rejilla
+        self.report_lat = array('d')
+        self.report_lon = array('d')
+        self.report_ts = array('d')
+        self.report_high = array('b')
+        self.report_cells = {}
+        for lat, lon, severity, created_at in reports:
+            idx = len(self.report_lat)
+            self.report_lat.append(lat)
+            self.report_lon.append(lon)
+            self.report_ts.append(parse_timestamp(created_at) or 0.0)
+            self.report_high.append(1 if severity == 'high' else 0)
+            self.report_cells.setdefault(self._cell(lat, lon), []).append(idx)
+
+        # get_disasters: ORDER BY created_at DESC
+        self.disasters = sorted(disasters, key=lambda d: str(d.created_at or ''), reverse=True)
+
+    @staticmethod
+    def _cell(lat, lon):
+        return int(math.floor(lat / REPORT_CELL_DEG)), int(math.floor(lon / REPORT_CELL_DEG))
+
+    def active_zones(self, now=None):
+        now = time.time() if now is None else now
+        return [z for z in self.zones if z.expires_ts is None or z.expires_ts > now]
+
+    def active_disasters(self, now=None, require_expiry=False):
+        """require_expiry replica `expires_at > ?` (excluye desastres sin fecha)"""
+        now = time.time() if now is None else now
+        return [d for d in self.disasters
+                if (d.expires_ts is None and not require_expiry)
+                or (d.expires_ts is not None and d.expires_ts > now)]
+
+    def zone_level_score(self, lat, lon, now=None, max_score=1):
+        """Puntaje de la zona activa más grave que contiene el punto"""
+        now = time.time() if now is None else now
+        point = (lat, lon)
+        for i in range(len(self.zone_lat)):
+            score = self.zone_score[i]
+            if score <= max_score or self.zone_expires[i] <= now:
+                continue
+            radius = self.zone_radius[i]
+            dlat, dlon = _km_box(lat, radius)
+            if abs(lat - self.zone_lat[i]) > dlat or abs(lon - self.zone_lon[i]) > dlon:
+                continue
+            if _geodesic_km(point, (self.zone_lat[i], self.zone_lon[i])) <= radius:
+                max_score = score
+        return max_score
+
+    def risk_level(self, lat, lon, now=None):
+        """Mismo resultado que el calculate_risk original, sin tocar SQLite"""
+        now = time.time() if now is None else now
+        point = (lat, lon)
+        max_score = self.zone_level_score(lat, lon, now)
+
+        cutoff = now - RECENT_REPORT_DAYS * 86400
+        dlat, dlon = _km_box(lat, NEARBY_REPORT_KM)
+        cell_lat, cell_lon = self._cell(lat, lon)
+        nearby_reports = 0
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                for idx in self.report_cells.get((cell_lat + di, cell_lon + dj), ()):
+                    if self.report_ts[idx] <= cutoff:
+                        continue
+                    rlat, rlon = self.report_lat[idx], self.report_lon[idx]
+                    if abs(lat - rlat) > dlat or abs(lon - rlon) > dlon:
+                        continue
+                    if _geodesic_km(point, (rlat, rlon)) <= NEARBY_REPORT_KM:
+                        nearby_reports += 1
+                        if self.report_high[idx] and max_score < RISK_SCORES["Alto"]:
+                            max_score = RISK_SCORES["Alto"]
+
+        # Ajustar por densidad de reportes
+        if nearby_reports >= 5 and max_score == 1:
+            max_score = RISK_SCORES["Medio"]
+
+        return SCORE_LEVELS[max_score]
+
+    def influences(self, south, west, north, east, now=None):
+        """Todo lo que puede cambiar risk_level o los avisos dentro de la caja
+
+        Tuplas (tipo, id, puntaje, lat, lon, radio_km, vence): zonas que
+        suben el nivel (> Bajo), reportes verificados recientes (radio
+        NEARBY_REPORT_KM; id = su created_at) y desastres con vencimiento,
+        como en calculate_route. `vence` es None si no expira. Dos huellas
+        iguales garantizan el mismo risk_level en la caja (ver trips.py).
+        """
+        now = time.time() if now is None else now
+        items = []
+        for i, zone in enumerate(self.zones):
+            score, radius = self.zone_score[i], self.zone_radius[i]
+            if score <= 1 or self.zone_expires[i] <= now:
+                continue
+            dlat, dlon = _km_box(zone.lat, radius)
+            if zone.lat + dlat < south or zone.lat - dlat > north or zone.lon + dlon < west or zone.lon - dlon > east:
+                continue
+            items.append(('zone', zone.id, score, zone.lat, zone.lon, radius, zone.expires_ts))
+
+        cutoff = now - RECENT_REPORT_DAYS * 86400
+        dlat, dlon = _km_box(max(abs(south), abs(north)), NEARBY_REPORT_KM)
+        (cell_south, cell_west), (cell_north, cell_east) = (self._cell(south - dlat, west - dlon),
+                                                            self._cell(north + dlat, east + dlon))
+        for ci in range(cell_south, cell_north + 1):
+            for cj in range(cell_west, cell_east + 1):
+                for idx in self.report_cells.get((ci, cj), ()):
+                    ts = self.report_ts[idx]
+                    if ts <= cutoff:
+                        continue
+                    lat, lon = self.report_lat[idx], self.report_lon[idx]
+                    if lat + dlat < south or lat - dlat > north or lon + dlon < west or lon - dlon > east:
+                        continue
+                    items.append(('report', ts, self.report_high[idx], lat, lon, NEARBY_REPORT_KM,
+                                  ts + RECENT_REPORT_DAYS * 86400))
+
+        for disaster in self.active_disasters(now, require_expiry=True):
+            radius = disaster.radius_km or 0.0
+            dlat, dlon = _km_box(disaster.lat, radius)
+            if (disaster.lat + dlat < south or disaster.lat - dlat > north
+                    or disaster.lon + dlon < west or disaster.lon - dlon > east):
+                continue
+            items.append(('disaster', disaster.id, RISK_SCORES["Crítico"], disaster.lat, disaster.lon,
+                          radius, disaster.expires_ts))
+        return items
+
+
+class DataVersionWatcher:
+    """Versiones de `data_versions`, consultadas solo cuando hubo commits
+
+    `PRAGMA data_version` cambia cuando otra conexión hace commit; por eso
+    el watcher usa una conexión propia que nunca escribe.
+    """
+
+    def __init__(self, connect):
+        self._connect = connect
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._conn = None
+        self._data_version = None
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def version(self, name):
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect(check_same_thread=False)
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                try:
+                    self._versions = dict(self._conn.execute("SELECT name, version FROM data_versions"))
+                except sqlite3.OperationalError:
+                    # Base sin migrar todavía: volver a intentar en la próxima llamada
+                    return None
+                self._data_version = data_version
+            return self._versions.get(name)
+
+
+class ActiveRiskSnapshot:
+    def __init__(self, connect, watcher=None):
+        self._connect = connect
+        self._watcher = watcher or DataVersionWatcher(connect)
+        self._state = None
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def _load(self, version):
+        now = datetime.now()
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, name, lat, lon, radius_km, level, type, color, description,
+                       source, created_at, expires_at
+                FROM risk_zones
+                WHERE active = 1 AND (expires_at IS NULL OR expires_at > ?)
+            ''', (now,))
+            zones = [ZoneRecord(row) for row in cursor.fetchall()]
+
+            cutoff = now.timestamp() - RECENT_REPORT_DAYS * 86400
+            cursor.execute('''
+                SELECT lat, lon, severity, created_at FROM reports
+                WHERE verified = 1 AND created_at > ? AND status = 'active'
+            ''', (datetime.fromtimestamp(cutoff),))
+            reports = cursor.fetchall()
+
+            cursor.execute('''
+                SELECT id, type, lat, lon, radius_km, severity, description, created_at, expires_at
+                FROM natural_disasters
+                WHERE active = 1 AND (expires_at IS NULL OR expires_at > ?)
+            ''', (now,))
+            disasters = [DisasterRecord(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+        return RiskState(zones, reports, disasters, version)
+
+    def current(self):
+        """Estado vigente; recarga si cambiaron los datos de riesgo"""
+        version = self._watcher.version('risk')
+        state = self._state
+        if state is None or version is None or state.version != version:
+            with self._lock:
+                state = self._state
+                if state is None or version is None or state.version != version:
+                    state = self._state = self._load(version)
+                    self.refreshes += 1
+        return state
+
+    def invalidate(self):
+        self._state = None
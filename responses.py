@@ -0,0 +1,184 @@
+"""
+Serialización JSON rápida y compresión de respuestas
+
+- FastJSONProvider: proveedor JSON de Flask sobre orjson (si está instalado).
+  Lo usan jsonify y request.json sin cambiar los endpoints.
+- compress_response: gzip o brotli según Accept-Encoding, solo para
+  respuestas de texto/JSON que superan un umbral de tamaño.
+- stream_json: arma un objeto JSON con una lista grande elemento por
+  elemento (y comprime al vuelo), para no tener la respuesta completa en
+  memoria.
+"""
+import gzip
+import json
+import os
+import zlib
+
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: se usa el json estándar
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: solo gzip
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get('ZETA_COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('ZETA_GZIP_LEVEL', '5'))
+BROTLI_QUALITY = int(os.environ.get('ZETA_BROTLI_QUALITY', '4'))
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+STREAM_CHUNK_BYTES = 64 * 1024
+
+_ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+
+def dumps(obj, default=DefaultJSONProvider.default):
+    """obj -> bytes JSON compacto (orjson si está disponible)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=_ORJSON_OPTIONS)
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify / request.json sobre orjson; mismo resultado que el proveedor por defecto"""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj, self.default).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj, self.default), mimetype=self.mimetype)
+
+
+# ==================== COMPRESIÓN ====================
+def negotiate(accept_encoding):
+    """'br', 'gzip' o None según Accept-Encoding (respeta q=0)"""
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    wildcard = accepted.get('*', 0.0)
+    candidates = (['br'] if brotli is not None else []) + ['gzip']
+    best, best_q = None, 0.0
+    for encoding in candidates:
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _compressible(response):
+    return any(response.mimetype.startswith(t) for t in COMPRESSIBLE_TYPES)
+
+
+def compress_response(response, accept_encoding):
+    """Comprimir en su lugar una respuesta ya armada si conviene"""
+    if (response.direct_passthrough or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers or not _compressible(response)):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.is_streamed:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = negotiate(accept_encoding)
+    if encoding is None:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+class _StreamCompressor:
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self._obj = brotli.Compressor(quality=BROTLI_QUALITY)
+            self.compress, self.flush = self._obj.process, self._obj.finish
+        else:
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 = formato gzip
+            self.compress, self.flush = self._obj.compress, self._obj.flush
+
+
+def stream_json(head, key, items, tail=None, accept_encoding=None, on_close=None):
+    """Respuesta {**head, key: [items...], **tail} generada elemento por elemento
+
+    `items` puede ser un generador (p. ej. sobre un cursor SQLite); `tail`
+    puede ser una función que se evalúa al terminar (p. ej. para el total).
+    `on_close` se llama una sola vez: al terminar el cuerpo o al cerrar la
+    respuesta, aunque el servidor la descarte antes de empezar a leerla.
+    """
+    encoding = negotiate(accept_encoding)
+    closed = []
+
+    def close():
+        if on_close is not None and not closed:
+            closed.append(True)
+            on_close()
+
+    def chunks():
+        try:
+            prefix = dumps(head)[:-1]
+            buffer = bytearray(prefix + (b',' if head else b'') + dumps(key) + b':[')
+            first = True
+            for item in items:
+                if not first:
+                    buffer += b','
+                buffer += dumps(item)
+                first = False
+                if len(buffer) >= STREAM_CHUNK_BYTES:
+                    yield bytes(buffer)
+                    buffer.clear()
+            end = tail() if callable(tail) else (tail or {})
+            buffer += b']'
+            if end:
+                buffer += b',' + dumps(end)[1:]
+            else:
+                buffer += b'}'
+            yield bytes(buffer)
+        finally:
+            close()
+
+    def compressed(source):
+        compressor = _StreamCompressor(encoding)
+        for chunk in source:
+            out = compressor.compress(chunk)
+            if out:
+                yield out
+        yield compressor.flush()
+
+    body = compressed(chunks()) if encoding else chunks()
+    response = Response(body, mimetype='application/json')
+    # Un generador que nunca arrancó no ejecuta su finally al cerrarse
+    response.call_on_close(close)
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
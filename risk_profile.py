@@ -0,0 +1,335 @@
+"""
+Perfiles de riesgo por hora de la semana
+
+El riesgo en el centro un sábado a las 3 a.m. no es el de un martes al
+mediodía. La tabla risk_profile acumula los reportes verificados en una
+rejilla espacial (celdas de CELL_DEG) × 168 horas de la semana, con
+decaimiento exponencial (vida media HALF_LIFE_DAYS):
+
+- Los pesos se guardan en la escala de EPOCH: un reporte de fecha t suma
+  severidad · 2^((t - EPOCH) / vida media). Así agregar un reporte nuevo
+  es un solo UPSERT y el decaimiento de todo lo demás es un factor común
+  que se aplica al consultar.
+- verify_report suma (o resta, al rechazar uno ya verificado) en la misma
+  transacción; `rebuild` recalcula todo desde reports (alta inicial o
+  después de cambiar CELL_DEG / HALF_LIFE_DAYS).
+- Cada proceso guarda la rejilla en memoria y solo relee las filas con
+  versión mayor a la suya; consultar el riesgo para una hora de salida son
+  9 lecturas de diccionario, sin recorrer reportes.
+- created_at es CURRENT_TIMESTAMP de SQLite (UTC). Reportes y hora de
+  salida se llevan a la hora de la semana en TIMEZONE, la del servicio y
+  no la del servidor; una salida ISO sin zona se lee en TIMEZONE.
+
+Uso:
+    python risk_profile.py rebuild zeta_pro.db
+    python risk_profile.py query zeta_pro.db 28.6353 -106.0886 2026-10-24T03:00
+"""
+import math
+import os
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from read_model import RISK_SCORES, SCORE_LEVELS
+
+HOURS_PER_WEEK = 168
+# Celda de 0.005° ≈ 550 m; el vecindario 3×3 cubre ~1.6 km
+CELL_DEG = 0.005
+HALF_LIFE_DAYS = float(os.environ.get('ZETA_RISK_HALF_LIFE_DAYS', '60'))
+# Zona de las horas de la semana (cambiarla requiere `rebuild`)
+TIMEZONE = ZoneInfo(os.environ.get('ZETA_TIMEZONE', 'America/Chihuahua'))
+EPOCH = datetime(2024, 1, 1).timestamp()
+
+SEVERITY_WEIGHTS = {"high": 1.0, "medium": 0.5, "low": 0.25}
+# Kernel de suavizado: vecinos espaciales y horas contiguas pesan la mitad
+SPATIAL_KERNEL = {-1: 0.5, 0: 1.0, 1: 0.5}
+HOUR_KERNEL = {-1: 0.5, 0: 1.0, 1: 0.5}
+# Umbrales en "reportes graves equivalentes" ya decaídos y suavizados
+MEDIUM_WEIGHT = 1.0
+HIGH_WEIGHT = 3.0
+
+LEVEL_COLORS = {"high": "#ef4444", "medium": "#f59e0b"}
+_CELL_RADIUS_KM = CELL_DEG * 111.32 * math.sqrt(2) / 2
+
+
+def cell_of(lat, lon):
+    return int(math.floor(lat / CELL_DEG)), int(math.floor(lon / CELL_DEG))
+
+
+def hour_of_week(ts):
+    """Epoch -> 0..167 en TIMEZONE, lunes 00:00 = 0"""
+    moment = datetime.fromtimestamp(ts, TIMEZONE)
+    return moment.weekday() * 24 + moment.hour
+
+
+def parse_created(value):
+    """created_at de SQLite (CURRENT_TIMESTAMP, UTC) -> epoch; None si no hay"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        try:
+            moment = datetime.fromisoformat(str(value))
+        except ValueError:
+            return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def parse_departure(value):
+    """'now', epoch o fecha ISO 8601 -> epoch; None si no se pidió"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip()
+    if text.lower() == 'now':
+        return time.time()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        moment = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Hora de salida inválida: {value}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=TIMEZONE)
+    return moment.timestamp()
+
+
+def report_weight(severity, created_ts):
+    """Aporte de un reporte en la escala de EPOCH"""
+    return SEVERITY_WEIGHTS.get(severity, SEVERITY_WEIGHTS["low"]) * 2.0 ** (
+        (created_ts - EPOCH) / (HALF_LIFE_DAYS * 86400))
+
+
+def decay_factor(now=None):
+    """Factor para pasar de la escala de EPOCH a pesos vigentes"""
+    now = time.time() if now is None else now
+    return 2.0 ** (-(now - EPOCH) / (HALF_LIFE_DAYS * 86400))
+
+
+# ==================== ESCRITURA ====================
+def _bump(cursor, name):
+    cursor.execute("UPDATE data_versions SET version = version + 1 WHERE name = ?", (name,))
+    return cursor.execute("SELECT version FROM data_versions WHERE name = ?", (name,)).fetchone()[0]
+
+
+def add_report(cursor, lat, lon, severity, created_at, sign=1):
+    """Sumar (sign=1) o restar (sign=-1) un reporte; no hace commit
+
+    Se llama dentro de la transacción que cambia el estado del reporte.
+    """
+    return add_reports(cursor, [(lat, lon, severity, created_at)], sign) > 0
+
+
+def add_reports(cursor, reports, sign=1):
+    """add_report para varios (lat, lon, severity, created_at) con una sola
+    versión y un executemany; devuelve cuántos contaron"""
+    totals = {}
+    counted = 0
+    for lat, lon, severity, created_at in reports:
+        created_ts = parse_created(created_at)
+        if created_ts is None or lat is None or lon is None:
+            continue
+        key = cell_of(lat, lon) + (hour_of_week(created_ts),)
+        totals[key] = totals.get(key, 0.0) + report_weight(severity, created_ts)
+        counted += 1
+    if not totals:
+        return 0
+    version = _bump(cursor, 'risk_profile')
+    if sign > 0:
+        cursor.executemany('''
+            INSERT INTO risk_profile (cell_lat, cell_lon, hour, weight, version)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (cell_lat, cell_lon, hour) DO UPDATE
+            SET weight = weight + excluded.weight, version = excluded.version
+        ''', [key + (weight, version) for key, weight in totals.items()])
+    else:
+        # Restar la suma de una vez da lo mismo que restar uno por uno con max(0, ...)
+        cursor.executemany('''
+            UPDATE risk_profile SET weight = max(0.0, weight - ?), version = ?
+            WHERE cell_lat = ? AND cell_lon = ? AND hour = ?
+        ''', [(weight, version) + key for key, weight in totals.items()])
+    return counted
+
+
+def rebuild(conn, commit=True):
+    """Recalcular la tabla completa desde los reportes verificados activos"""
+    totals = {}
+    cursor = conn.cursor()
+    cursor.execute("SELECT lat, lon, severity, created_at FROM reports WHERE verified = 1 AND status = 'active'")
+    for lat, lon, severity, created_at in cursor:
+        created_ts = parse_created(created_at)
+        if created_ts is None:
+            continue
+        key = cell_of(lat, lon) + (hour_of_week(created_ts),)
+        totals[key] = totals.get(key, 0.0) + report_weight(severity, created_ts)
+
+    version = _bump(cursor, 'risk_profile')
+    cursor.execute("DELETE FROM risk_profile")
+    cursor.executemany('''
+        INSERT INTO risk_profile (cell_lat, cell_lon, hour, weight, version) VALUES (?, ?, ?, ?, ?)
+    ''', [key + (weight, version) for key, weight in totals.items()])
+    # Los procesos que ya tienen la rejilla deben releerla completa
+    cursor.execute("UPDATE data_versions SET version = ? WHERE name = 'risk_profile_base'", (version,))
+    if commit:
+        conn.commit()
+    return len(totals)
+
+
+# ==================== LECTURA ====================
+def _smooth_hours(raw):
+    """Suavizado circular sobre las 168 horas"""
+    out = array('d', bytes(8 * HOURS_PER_WEEK))
+    for hour in range(HOURS_PER_WEEK):
+        weight = raw[hour]
+        if not weight:
+            continue
+        for offset, k in HOUR_KERNEL.items():
+            out[(hour + offset) % HOURS_PER_WEEK] += weight * k
+    return out
+
+
+class RiskProfile:
+    """Rejilla celda -> array de 168 pesos (escala de EPOCH, suavizado en horas)"""
+
+    def __init__(self, version, raw=None, hours=None):
+        self.version = version
+        self.raw = raw if raw is not None else {}
+        self.hours = hours if hours is not None else {}
+
+    def __len__(self):
+        return len(self.raw)
+
+    def updated(self, version, rows):
+        """Copia con las filas (cell_lat, cell_lon, hour, weight) aplicadas"""
+        raw, hours = dict(self.raw), dict(self.hours)
+        changed = set()
+        for cell_lat, cell_lon, hour, weight in rows:
+            cell = (cell_lat, cell_lon)
+            if cell not in changed:
+                raw[cell] = array('d', raw[cell]) if cell in raw else array('d', bytes(8 * HOURS_PER_WEEK))
+                changed.add(cell)
+            raw[cell][hour] = weight
+        for cell in changed:
+            hours[cell] = _smooth_hours(raw[cell])
+        return RiskProfile(version, raw, hours)
+
+    def weight(self, lat, lon, how, factor):
+        """Peso vigente en (lat, lon) a la hora de la semana `how`"""
+        cell_lat, cell_lon = cell_of(lat, lon)
+        total = 0.0
+        for di, ki in SPATIAL_KERNEL.items():
+            for dj, kj in SPATIAL_KERNEL.items():
+                values = self.hours.get((cell_lat + di, cell_lon + dj))
+                if values is not None:
+                    total += values[how] * ki * kj
+        return total * factor
+
+    @staticmethod
+    def score(weight):
+        if weight >= HIGH_WEIGHT:
+            return RISK_SCORES["Alto"]
+        if weight >= MEDIUM_WEIGHT:
+            return RISK_SCORES["Medio"]
+        return RISK_SCORES["Bajo"]
+
+    def risk_score(self, lat, lon, departure, now=None):
+        return self.score(self.weight(lat, lon, hour_of_week(departure), decay_factor(now)))
+
+    def hotspots(self, departure, now=None):
+        """Celdas con riesgo Medio o más a la hora de salida, como zonas"""
+        how, factor = hour_of_week(departure), decay_factor(now)
+        zones = []
+        for cell_lat, cell_lon in self.hours:
+            lat, lon = (cell_lat + 0.5) * CELL_DEG, (cell_lon + 0.5) * CELL_DEG
+            weight = self.weight(lat, lon, how, factor)
+            if weight < MEDIUM_WEIGHT:
+                continue
+            level = "high" if weight >= HIGH_WEIGHT else "medium"
+            zones.append((weight, {
+                "id": f"profile_{cell_lat}_{cell_lon}_{how}",
+                "name": "Riesgo histórico",
+                "lat": round(lat, 6),
+                "lon": round(lon, 6),
+                "radius_km": round(_CELL_RADIUS_KM, 3),
+                "level": level,
+                "type": "historical",
+                "color": LEVEL_COLORS[level],
+                "description": f"Reportes verificados a esta hora de la semana (peso {weight:.1f})"
+            }))
+        zones.sort(key=lambda item: item[0], reverse=True)
+        return [zone for _, zone in zones]
+
+
+def load_profile(conn, version, previous=None):
+    """Rejilla completa, o solo las filas nuevas si `previous` sigue vigente"""
+    base = conn.execute("SELECT version FROM data_versions WHERE name = 'risk_profile_base'").fetchone()
+    if previous is not None and previous.version is not None and base and base[0] <= previous.version:
+        rows = conn.execute('''
+            SELECT cell_lat, cell_lon, hour, weight FROM risk_profile WHERE version > ?
+        ''', (previous.version,)).fetchall()
+        return previous.updated(version, rows)
+    rows = conn.execute("SELECT cell_lat, cell_lon, hour, weight FROM risk_profile").fetchall()
+    return RiskProfile(version).updated(version, rows)
+
+
+class RiskProfileCache:
+    """Perfil por proceso; se actualiza cuando cambia la fila 'risk_profile'"""
+
+    def __init__(self, connect, watcher):
+        self._connect = connect
+        self._watcher = watcher
+        self._profile = None
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def current(self):
+        version = self._watcher.version('risk_profile')
+        if version is None:
+            return None  # base sin migrar
+        profile = self._profile
+        if profile is None or profile.version != version:
+            with self._lock:
+                profile = self._profile
+                if profile is None or profile.version != version:
+                    conn = self._connect()
+                    try:
+                        profile = self._profile = load_profile(conn, version, profile)
+                    finally:
+                        conn.close()
+                    self.refreshes += 1
+        return profile
+
+
+if __name__ == '__main__':
+    import json
+    import sqlite3
+    import sys
+
+    import migrations
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ('rebuild', 'query'):
+        print(__doc__)
+        sys.exit(1)
+    command, db_file, args = sys.argv[1], sys.argv[2], sys.argv[3:]
+    conn = sqlite3.connect(db_file)
+    migrations.migrate(conn)
+    start = time.perf_counter()
+    if command == 'rebuild':
+        entries = rebuild(conn)
+        print(f"{entries} celdas×hora en {time.perf_counter() - start:.1f}s")
+    else:
+        profile = load_profile(conn, None)
+        departure = parse_departure(args[2] if len(args) > 2 else 'now')
+        lat, lon = float(args[0]), float(args[1])
+        weight = profile.weight(lat, lon, hour_of_week(departure), decay_factor())
+        print(json.dumps({"hour_of_week": hour_of_week(departure), "weight": round(weight, 3),
+                          "level": SCORE_LEVELS[profile.score(weight)]}, ensure_ascii=False))
+    conn.close()
@@ -0,0 +1,174 @@
+"""
+Sincronización incremental para el modo offline
+
+Los triggers de la migración 6 agregan una fila a change_log (seq
+creciente, entidad, id) en la misma transacción de cada escritura sobre
+reportes, zonas, desastres, lugares y reseñas. /api/sync?since=<cursor>
+devuelve solo lo que cambió desde ese cursor:
+
+- upserts: el estado actual de cada entidad tocada que sigue visible
+- deletes: ids tocados que ya no están visibles (borrados, rechazados,
+  desactivados) para que el cliente los quite
+
+Sin cursor (o con uno anterior al último `prune` o posterior al último
+seq) se responde una foto completa con reset=true. El cliente guarda el
+`cursor` de la respuesta y sigue pidiendo mientras `has_more` sea true.
+Reportes con más de REPORT_DAYS y zonas vencidas no generan escritura: el
+cliente los descarta por su `created_at` / `expires_at`.
+
+Uso:
+    python sync.py prune zeta_pro.db 30     # borrar entradas de más de 30 días
+"""
+import time
+from datetime import datetime
+
+REPORT_DAYS = 30
+DEFAULT_LIMIT = 5000
+MAX_LIMIT = 20000
+_IN_CHUNK = 500
+
+
+def _now():
+    return datetime.now()
+
+
+def _report_cutoff():
+    return datetime.fromtimestamp(time.time() - REPORT_DAYS * 86400)
+
+
+class Entity:
+    """Tabla sincronizada: columnas enviadas y condición de visibilidad"""
+
+    def __init__(self, table, columns, visible=None, params=None, convert=None):
+        self.table = table
+        self.columns = columns
+        self.visible = visible
+        self.params = params or (lambda: ())
+        self.convert = convert or {}
+
+    def to_dict(self, row):
+        item = dict(zip(self.columns, row))
+        for column, fn in self.convert.items():
+            item[column] = fn(item[column])
+        return item
+
+    def _select(self, extra=''):
+        where = ' AND '.join(part for part in (self.visible, extra) if part)
+        return f"SELECT {', '.join(self.columns)} FROM {self.table}" + (f" WHERE {where}" if where else '')
+
+    def snapshot(self, conn):
+        return [self.to_dict(row) for row in conn.execute(self._select(), self.params())]
+
+    def fetch(self, conn, ids):
+        """(visibles, ids que ya no existen o no son visibles)"""
+        found = {}
+        for start in range(0, len(ids), _IN_CHUNK):
+            chunk = ids[start:start + _IN_CHUNK]
+            sql = self._select(f"id IN ({', '.join('?' * len(chunk))})")
+            for row in conn.execute(sql, tuple(self.params()) + tuple(chunk)):
+                found[row[0]] = self.to_dict(row)
+        return list(found.values()), [entity_id for entity_id in ids if entity_id not in found]
+
+
+ENTITIES = {
+    "reports": Entity(
+        "reports",
+        ("id", "user_id", "description", "category", "severity", "lat", "lon", "address",
+         "created_at", "verified", "status", "upvotes", "downvotes"),
+        "verified = 1 AND status = 'active' AND created_at > ?", lambda: (_report_cutoff(),),
+        convert={"verified": bool}),
+    "zones": Entity(
+        "risk_zones",
+        ("id", "name", "lat", "lon", "radius_km", "level", "type", "color", "description", "expires_at"),
+        "active = 1 AND (expires_at IS NULL OR expires_at > ?)", lambda: (_now(),)),
+    "disasters": Entity(
+        "natural_disasters",
+        ("id", "type", "lat", "lon", "radius_km", "severity", "description", "created_at", "expires_at"),
+        "active = 1 AND (expires_at IS NULL OR expires_at > ?)", lambda: (_now(),)),
+    "places": Entity(
+        "places",
+        ("id", "name", "type", "lat", "lon", "address", "phone", "website", "description",
+         "rating", "total_reviews", "price_level")),
+    "reviews": Entity(
+        "reviews",
+        ("id", "place_id", "user_id", "rating", "comment", "created_at", "helpful_count")),
+}
+
+
+def parse_entities(raw):
+    """'reports,zones' -> lista; None = todas"""
+    if not raw:
+        return list(ENTITIES)
+    names = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in names if name not in ENTITIES]
+    if unknown or not names:
+        raise ValueError(f"Entidades inválidas: {', '.join(unknown) or raw}")
+    return names
+
+
+def floor(conn):
+    """Último seq borrado por prune; cursores anteriores necesitan reset"""
+    row = conn.execute("SELECT version FROM data_versions WHERE name = 'change_log_floor'").fetchone()
+    return row[0] if row else 0
+
+
+def changes(conn, since, entities=None, limit=DEFAULT_LIMIT):
+    """Respuesta de /api/sync (sin "status") para el cursor `since`"""
+    entities = entities or list(ENTITIES)
+    # Transacción de lectura: el cursor y las filas salen de la misma foto
+    conn.execute("BEGIN")
+    try:
+        head = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        if since is None or since < floor(conn) or since > head:
+            return {"cursor": head, "reset": True, "has_more": False, "changes": {
+                name: {"upserts": ENTITIES[name].snapshot(conn), "deletes": []} for name in entities
+            }}
+
+        rows = conn.execute('''
+            SELECT seq, entity, entity_id FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?
+        ''', (since, limit + 1)).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        cursor = rows[-1][0] if rows else since
+
+        touched = {name: {} for name in entities}
+        for _, entity, entity_id in rows:
+            if entity in touched:
+                touched[entity][entity_id] = True
+        result = {"cursor": cursor, "reset": False, "has_more": has_more, "changes": {}}
+        for name, ids in touched.items():
+            upserts, deletes = ENTITIES[name].fetch(conn, list(ids))
+            result["changes"][name] = {"upserts": upserts, "deletes": deletes}
+        return result
+    finally:
+        conn.rollback()
+
+
+def prune(conn, days):
+    """Borrar entradas de más de `days` días; devuelve cuántas"""
+    cursor = conn.cursor()
+    last = cursor.execute('''
+        SELECT MAX(seq) FROM change_log WHERE changed_at < datetime('now', ?)
+    ''', (f"-{int(days)} days",)).fetchone()[0]
+    if last is None:
+        return 0
+    cursor.execute("DELETE FROM change_log WHERE seq <= ?", (last,))
+    deleted = cursor.rowcount
+    cursor.execute("UPDATE data_versions SET version = ? WHERE name = 'change_log_floor'", (last,))
+    conn.commit()
+    return deleted
+
+
+if __name__ == '__main__':
+    import sqlite3
+    import sys
+
+    import migrations
+
+    if len(sys.argv) < 4 or sys.argv[1] != 'prune':
+        print(__doc__)
+        sys.exit(1)
+    conn = sqlite3.connect(sys.argv[2])
+    migrations.migrate(conn)
+    print(f"{prune(conn, sys.argv[3])} entradas borradas; floor = {floor(conn)}")
+    conn.close()
@@ -0,0 +1,11 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Sin hilos de fondo ni rate limiting en los tests
+os.environ.setdefault('ZETA_VERIFIER', '0')
+os.environ.setdefault('ZETA_RATELIMIT', '0')
+os.environ.setdefault('ZETA_JOB_WORKERS', '0')
@@ -0,0 +1,112 @@
+"""
+Planes de consulta en las rutas calientes
+
+Ejecuta get_reports, calculate_risk (con y sin hora de salida),
+get_place_details, vote_report y las demás lecturas frecuentes sobre una
+base sintética, captura el SQL real que emite cada conexión (también las
+de los índices en memoria de read_model y risk_profile) y falla si el
+EXPLAIN QUERY PLAN de alguna sentencia hace un SCAN completo de tabla.
+"""
+import sqlite3
+
+import pytest
+
+from bench.datagen import generate
+
+HOT_REQUESTS = [
+    ('GET', '/api/reports/list?verified=true&days=7', None),
+    ('GET', '/api/reports/list?verified=false&days=30', None),
+    ('GET', '/api/reports/list?verified=true&days=7&category=security', None),
+    ('GET', '/api/reports/list?verified=true&days=7&fields=markers', None),
+    ('GET', '/api/places/p_bench_1?fields=markers', None),
+    ('GET', '/api/places/p_bench_1', None),
+    ('GET', '/api/sync?since=0&limit=500', None),
+    ('GET', '/api/reports/pending?limit=50', None),
+    ('GET', '/api/reports/pending?limit=50&cursor=0.5:report_bench_5000&fields=id,verification_score', None),
+    ('POST', '/api/reports/vote/report_bench_1', {"user_id": "user_bench_2", "vote_type": "up"}),
+    ('POST', '/api/reports/vote/report_bench_1', {"user_id": "user_bench_2", "vote_type": "down"}),
+]
+
+# Lecturas que por diseño traen la tabla completa: data_versions tiene una
+# fila por conjunto de datos, y la carga completa del perfil solo ocurre al
+# arrancar o tras un rebuild (la recarga incremental va por versión)
+WHOLE_TABLE_READS = {
+    'SELECT name, version FROM data_versions',
+    'SELECT cell_lat, cell_lon, hour, weight FROM risk_profile',
+}
+
+
+def full_scans(conn, sql):
+    """Líneas del plan que recorren una tabla completa"""
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    return [row[3] for row in plan
+            if row[3].startswith('SCAN ') and not row[3].startswith('SCAN CONSTANT ROW')]
+
+
+@pytest.fixture(scope='module')
+def statements(tmp_path_factory):
+    db_file = str(tmp_path_factory.mktemp('plans') / 'plans.db')
+    generate(db_file, users=200, reports=2000, zones=50, places=100, reviews=1000, image_ratio=0)
+
+    import backend
+    import read_model
+    import risk_profile
+
+    captured = []
+    connect = sqlite3.connect
+
+    def traced_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(captured.append)
+        return conn
+
+    with pytest.MonkeyPatch.context() as mp:
+        # Toda conexión nueva, incluidas las que abren los índices en memoria
+        mp.setattr(sqlite3, 'connect', traced_connect)
+        # Índices nuevos: cargan desde cero con conexiones trazadas
+        watcher = read_model.DataVersionWatcher(backend.get_db)
+        mp.setattr(backend, 'data_watcher', watcher)
+        mp.setattr(backend, 'risk_snapshot', read_model.ActiveRiskSnapshot(backend.get_db, watcher))
+        mp.setattr(backend, 'risk_profiles', risk_profile.RiskProfileCache(backend.get_db, watcher))
+
+        client = backend.app.test_client()
+        for method, url, body in HOT_REQUESTS:
+            response = client.open(url, method=method, json=body)
+            assert response.status_code == 200, (url, response.status_code)
+        backend.calculate_risk(28.6353, -106.0886)
+        departure = risk_profile.parse_departure('2026-10-24T03:00')
+        backend.calculate_risk(28.6353, -106.0886, departure)
+        # Un reporte verificado más: recarga incremental del perfil
+        conn = backend.get_db()
+        risk_profile.add_report(conn.cursor(), 28.6353, -106.0886, 'high', '2026-10-24 09:00:00')
+        conn.commit()
+        conn.close()
+        backend.calculate_risk(28.6353, -106.0886, departure)
+
+    seen = []
+    for sql in captured:
+        head = sql.lstrip().split(None, 1)[0].upper()
+        if head in ('SELECT', 'UPDATE', 'DELETE') and sql not in seen:
+            seen.append(sql)
+    return db_file, seen
+
+
+def test_calculate_risk_queries_are_traced(statements):
+    _, seen = statements
+    assert any('risk_zones' in sql for sql in seen)
+    assert any('FROM risk_profile WHERE version > ' in ' '.join(sql.split()) for sql in seen)
+
+
+def test_hot_paths_have_no_full_scans(statements):
+    db_file, seen = statements
+    conn = sqlite3.connect(db_file)
+    try:
+        failures = {}
+        for sql in seen:
+            normalized = ' '.join(sql.split())
+            scans = full_scans(conn, sql)
+            if scans and normalized not in WHOLE_TABLE_READS:
+                failures[normalized] = scans
+    finally:
+        conn.close()
+    assert not failures
@@ -0,0 +1,319 @@
+"""
+Viajes en curso: re-calificación incremental de la ruta restante
+
+/api/routes/calculate repite todo en cada llamada: geocodificar, pedir la
+ruta a OSRM y calificar cada SAMPLE_STEP puntos de cada alternativa. Un
+conductor que vuelve a pedir la ruta mientras avanza paga eso en cada
+posición. Un viaje (/api/trips) guarda la ruta elegida en `trips`
+(migración 12), con el puntaje de cada muestra y la huella de riesgo con
+que se calificó. Con cada posición:
+
+1. Avanza sobre la polilínea: proyecta la posición en los segmentos desde
+   el último avance (primero SNAP_WINDOW segmentos, luego el resto). A
+   más de OFF_ROUTE_KM de la ruta, el conductor se desvió.
+2. Si la versión 'risk' (read_model) es la misma y no venció nada de la
+   huella, el riesgo del resto es el guardado: no se califica nada.
+3. Si no, compara la huella guardada con la actual (RiskState.influences
+   sobre la caja de las muestras restantes). Solo las muestras dentro del
+   círculo de algo que apareció, desapareció o cambió se vuelven a
+   calificar; en las demás risk_level no puede haber cambiado.
+4. Pide ruta nueva a OSRM solo si el conductor se desvió, o si subió el
+   puntaje de alguna muestra restante o apareció un desastre sobre el
+   resto (lo decide el endpoint, ver backend.py).
+"""
+import functools
+import json
+import math
+import time
+from collections import Counter
+
+from read_model import RISK_SCORES, SCORE_LEVELS
+
+# Como calculate_route: una muestra cada 10 puntos de la polilínea
+SAMPLE_STEP = 10
+OFF_ROUTE_KM = 0.15
+ARRIVED_KM = 0.05
+SNAP_WINDOW = 50
+# Holgura sobre el radio al buscar muestras afectadas (equirectangular
+# contra geodésica en risk_level)
+MARGIN_KM = 0.05
+# Viajes sin posiciones en este tiempo dejan de aceptar actualizaciones
+IDLE_SECONDS = 6 * 3600
+
+
+def _distance_km(lat_a, lon_a, lat_b, lon_b):
+    x = math.radians(lon_b - lon_a) * math.cos(math.radians((lat_a + lat_b) / 2))
+    y = math.radians(lat_b - lat_a)
+    return 6371.0 * math.hypot(x, y)
+
+
+def _project(lat, lon, a, b):
+    """(distancia_km, fracción) del punto al segmento a-b ([lon, lat])"""
+    kx = math.cos(math.radians(lat))
+    ax, ay = (a[0] - lon) * kx, a[1] - lat
+    dx, dy = (b[0] - a[0]) * kx, b[1] - a[1]
+    length2 = dx * dx + dy * dy
+    t = 0.0 if length2 == 0 else max(0.0, min(1.0, -(ax * dx + ay * dy) / length2))
+    return 6371.0 * math.radians(math.hypot(ax + t * dx, ay + t * dy)), t
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_route(text):
+    """La ruta no cambia entre posiciones: se parsea una vez por proceso"""
+    route = json.loads(text)
+    return route['coordinates'], route['cumulative'], route['duration']
+
+
+class Trip:
+    __slots__ = ('id', 'user_id', 'status', 'destination', 'dest_lat', 'dest_lon', 'avoid_risks',
+                 'route_text', 'coords', 'cumulative', 'duration_s', 'scores', 'footprint', 'risk_version',
+                 'next_expiry', 'progress', 'offset_km', 'last_lat', 'last_lon', 'reroutes',
+                 'created_at', 'updated_at', 'dirty')
+
+    # Una posición sin cambios de riesgo solo reescribe POSITION_COLUMNS
+    POSITION_COLUMNS = ('status', 'progress', 'offset_km', 'last_lat', 'last_lon', 'reroutes', 'updated_at')
+    RISK_COLUMNS = ('scores', 'footprint', 'risk_version', 'next_expiry')
+    COLUMNS = ('id', 'user_id', 'destination', 'dest_lat', 'dest_lon', 'avoid_risks', 'created_at',
+               'route') + RISK_COLUMNS + POSITION_COLUMNS
+
+    @classmethod
+    def new(cls, trip_id, user_id, destination, dest_lat, dest_lon, avoid_risks, now):
+        trip = cls()
+        trip.id, trip.user_id, trip.status = trip_id, user_id, 'active'
+        trip.destination, trip.dest_lat, trip.dest_lon = destination, dest_lat, dest_lon
+        trip.avoid_risks = bool(avoid_risks)
+        trip.last_lat = trip.last_lon = None
+        trip.reroutes = 0
+        trip.created_at = trip.updated_at = now
+        trip.dirty = set()
+        return trip
+
+    @classmethod
+    def from_row(cls, row):
+        trip = cls()
+        (trip.id, trip.user_id, trip.destination, trip.dest_lat, trip.dest_lon, avoid_risks, trip.created_at,
+         trip.route_text, scores, footprint, trip.risk_version, trip.next_expiry,
+         trip.status, trip.progress, trip.offset_km, trip.last_lat, trip.last_lon, trip.reroutes,
+         trip.updated_at) = row
+        trip.avoid_risks = bool(avoid_risks)
+        trip.coords, trip.cumulative, trip.duration_s = _parse_route(trip.route_text)
+        trip.scores = json.loads(scores)
+        trip.footprint = [tuple(item) for item in json.loads(footprint)]
+        trip.dirty = set()
+        return trip
+
+    def values(self, columns):
+        values = {
+            'id': self.id, 'user_id': self.user_id, 'destination': self.destination,
+            'dest_lat': self.dest_lat, 'dest_lon': self.dest_lon, 'avoid_risks': int(self.avoid_risks),
+            'created_at': self.created_at, 'route': self.route_text,
+            'status': self.status, 'progress': self.progress, 'offset_km': self.offset_km,
+            'last_lat': self.last_lat, 'last_lon': self.last_lon, 'reroutes': self.reroutes,
+            'updated_at': self.updated_at,
+        }
+        if 'scores' in columns:
+            values.update(scores=json.dumps(self.scores), footprint=json.dumps(self.footprint),
+                          risk_version=self.risk_version, next_expiry=self.next_expiry)
+        return tuple(values[column] for column in columns)
+
+    # Posición sobre la ruta
+    @property
+    def distance_km(self):
+        return self.cumulative[-1]
+
+    @property
+    def travelled_km(self):
+        return self.cumulative[self.progress] + self.offset_km
+
+    @property
+    def remaining_km(self):
+        return max(0.0, self.distance_km - self.travelled_km)
+
+    def remaining_samples(self):
+        """Índices de las muestras todavía por delante"""
+        return range(self.progress // SAMPLE_STEP + 1, len(self.scores))
+
+    def sample_point(self, k):
+        lon, lat = self.coords[k * SAMPLE_STEP][:2]
+        return lat, lon
+
+    def disasters_ahead(self):
+        """Desastres de la huella que tocan alguna muestra restante"""
+        samples = [self.sample_point(k) for k in self.remaining_samples()]
+        return [item for item in self.footprint if item[0] == 'disaster'
+                and any(_distance_km(lat, lon, item[3], item[4]) <= item[5] + MARGIN_KM for lat, lon in samples)]
+
+
+# ==================== CALIFICACIÓN ====================
+def sample_points(coords):
+    """(lat, lon) de cada SAMPLE_STEP puntos de una polilínea [[lon, lat], ...]"""
+    return [(coord[1], coord[0]) for coord in coords[::SAMPLE_STEP]]
+
+
+def _bbox(points):
+    lats = [lat for lat, _ in points]
+    lons = [lon for _, lon in points]
+    return min(lats), min(lons), max(lats), max(lons)
+
+
+def _footprint(state, points, now):
+    if not points:
+        return []
+    return state.influences(*_bbox(points), now)
+
+
+def _next_expiry(footprint):
+    return min((item[6] for item in footprint if item[6] is not None), default=None)
+
+
+def set_route(trip, coords, scores, duration_s, state, now):
+    """Guardar una ruta nueva ya calificada (puntajes por muestra) con `state`"""
+    cumulative = [0.0]
+    for a, b in zip(coords, coords[1:]):
+        cumulative.append(cumulative[-1] + _distance_km(a[1], a[0], b[1], b[0]))
+    trip.coords, trip.cumulative, trip.scores = coords, cumulative, list(scores)
+    trip.duration_s = duration_s
+    trip.route_text = json.dumps({"coordinates": coords, "cumulative": cumulative, "duration": duration_s})
+    trip.progress, trip.offset_km = 0, 0.0
+    trip.footprint = _footprint(state, sample_points(coords), now)
+    trip.risk_version = state.version
+    trip.next_expiry = _next_expiry(trip.footprint)
+    trip.dirty.update(('route', 'risk'))
+
+
+def rescore(trip, state, now):
+    """Recalificar lo que cambió por delante; devuelve (muestras recalificadas, ¿subió el riesgo?)
+
+    `state.risk_level` de una muestra solo depende de lo que su huella
+    alcanza: si nada de eso cambió, el puntaje guardado sigue siendo exacto.
+    """
+    if trip.risk_version == state.version and (trip.next_expiry is None or now < trip.next_expiry):
+        return 0, False
+    ahead = list(trip.remaining_samples())
+    points = [trip.sample_point(k) for k in ahead]
+    footprint = _footprint(state, points, now)
+    old, new = Counter(trip.footprint), Counter(footprint)
+    changed = [item for item in (old - new) + (new - old) if item[0] != 'disaster']
+    new_disasters = {item[1] for item in footprint if item[0] == 'disaster'} - \
+                    {item[1] for item in trip.footprint if item[0] == 'disaster'}
+
+    raised = False
+    rescored = 0
+    for k, (lat, lon) in zip(ahead, points):
+        if not any(_distance_km(lat, lon, item[3], item[4]) <= item[5] + MARGIN_KM for item in changed):
+            continue
+        score = score_point(state, lat, lon, now)
+        raised = raised or score > trip.scores[k]
+        trip.scores[k] = score
+        rescored += 1
+
+    trip.footprint = footprint
+    trip.risk_version = state.version
+    trip.next_expiry = _next_expiry(footprint)
+    trip.dirty.add('risk')
+    if new_disasters:
+        raised = raised or any(item[1] in new_disasters for item in trip.disasters_ahead())
+    return rescored, raised
+
+
+def score_point(state, lat, lon, now):
+    """Puntaje de una muestra (misma escala que calculate_route)"""
+    return RISK_SCORES[state.risk_level(lat, lon, now)]
+
+
+# ==================== AVANCE ====================
+class Update:
+    __slots__ = ('off_route', 'distance_from_route', 'rescored', 'raised', 'arrived')
+
+
+def snap(trip, lat, lon):
+    """(distancia_km, segmento, fracción) más cercano desde el avance actual"""
+    last = len(trip.coords) - 1
+    lon_p, lat_p = trip.coords[trip.progress][:2]
+    best = (_distance_km(lat, lon, lat_p, lon_p), trip.progress, 0.0)
+    for start, stop in ((trip.progress, min(last, trip.progress + SNAP_WINDOW)),
+                        (min(last, trip.progress + SNAP_WINDOW), last)):
+        for i in range(start, stop):
+            distance, t = _project(lat, lon, trip.coords[i], trip.coords[i + 1])
+            if distance < best[0]:
+                best = (distance, i, t)
+        if best[0] <= OFF_ROUTE_KM:
+            break
+    return best
+
+
+def advance(trip, lat, lon, state, now):
+    """Mover el viaje a (lat, lon) y recalificar lo que cambió por delante"""
+    update = Update()
+    distance, segment, t = snap(trip, lat, lon)
+    update.distance_from_route = distance
+    update.off_route = distance > OFF_ROUTE_KM
+    if not update.off_route:
+        seg_km = trip.cumulative[segment + 1] - trip.cumulative[segment] if segment + 1 < len(trip.coords) else 0.0
+        trip.progress, trip.offset_km = segment, t * seg_km
+    trip.last_lat, trip.last_lon = lat, lon
+    trip.updated_at = now
+    update.rescored, update.raised = rescore(trip, state, now)
+    update.arrived = _distance_km(lat, lon, trip.dest_lat, trip.dest_lon) <= ARRIVED_KM or \
+        (not update.off_route and trip.remaining_km <= ARRIVED_KM)
+    if update.arrived:
+        trip.status = 'arrived'
+    return update
+
+
+def summary(trip, state):
+    """Estado del viaje para la API (avisos con los desastres de `state`)"""
+    ahead = [trip.scores[k] for k in trip.remaining_samples()]
+    remaining = trip.remaining_km
+    disasters = {d.id: d for d in state.disasters}
+    warnings = []
+    for item in trip.disasters_ahead():
+        disaster = disasters.get(item[1])
+        if disaster is not None:
+            warnings.append({"type": "disaster", "message": f"⚠️ {disaster.type.title()}: {disaster.description}",
+                             "severity": "critical"})
+    return {
+        "id": trip.id,
+        "status": trip.status,
+        "destination": {"lat": trip.dest_lat, "lon": trip.dest_lon, "name": trip.destination},
+        "distance_km": round(trip.distance_km, 2),
+        "remaining_km": round(remaining, 2),
+        "remaining_min": int(trip.duration_s / 60 * remaining / trip.distance_km) if trip.distance_km else 0,
+        "risk_level": SCORE_LEVELS[max(ahead, default=1)],
+        "risk_score": sum(ahead),
+        "warnings": warnings,
+        "reroutes": trip.reroutes,
+        "avoid_risks": trip.avoid_risks,
+    }
+
+
+# ==================== ALMACENAMIENTO ====================
+def insert(cursor, trip):
+    cursor.execute(f'''
+        INSERT INTO trips ({', '.join(Trip.COLUMNS)}) VALUES ({', '.join('?' * len(Trip.COLUMNS))})
+    ''', trip.values(Trip.COLUMNS))
+    trip.dirty.clear()
+
+
+def save(cursor, trip):
+    """Escribir la posición y, si cambiaron, la ruta y los puntajes"""
+    columns = Trip.POSITION_COLUMNS
+    if 'risk' in trip.dirty:
+        columns += Trip.RISK_COLUMNS
+    if 'route' in trip.dirty:
+        columns += ('route',)
+    cursor.execute(f'''
+        UPDATE trips SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?
+    ''', trip.values(columns) + (trip.id,))
+    trip.dirty.clear()
+
+
+def load(cursor, trip_id):
+    row = cursor.execute(f"SELECT {', '.join(Trip.COLUMNS)} FROM trips WHERE id = ?", (trip_id,)).fetchone()
+    return Trip.from_row(row) if row else None
+
+
+def prune(cursor, now=None):
+    """Borrar viajes sin actividad en una semana"""
+    now = time.time() if now is None else now
+    cursor.execute("DELETE FROM trips WHERE updated_at < ?", (now - 7 * 86400,))
@@ -0,0 +1,223 @@
+"""
+Cliente HTTP compartido para Nominatim y OSRM
+
+Cada dependencia tiene su propia requests.Session con pool de conexiones
+keep-alive, timeouts propios, reintentos acotados con jitter (solo ante
+errores de conexión y HTTP 429/5xx, nunca tras un timeout de lectura) y
+un circuit breaker. Cuando el servicio está lento o caído el breaker se
+abre y las llamadas fallan al instante con UpstreamError, para que el
+backend use su fallback (línea recta, datos locales) en lugar de esperar
+10 s.
+
+Las llamadas idénticas concurrentes dentro de un proceso (misma ruta y
+mismos parámetros normalizados) comparten una sola petición en curso
+(single-flight). Con workers gevent es lo habitual cuando muchos usuarios
+piden la misma dirección o el mismo destino a la vez.
+"""
+import random
+import threading
+import time
+
+import metrics
+
+
+class UpstreamError(Exception):
+    """La dependencia no respondió correctamente"""
+
+
+class CircuitOpenError(UpstreamError):
+    """El breaker está abierto: no se intentó la llamada"""
+
+
+class CircuitBreaker:
+    """closed -> open tras N fallas seguidas -> half_open tras reset_timeout"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._trial_in_flight = False
+            if self.state == 'half_open' and not self._trial_in_flight:
+                # Una sola llamada de prueba a la vez
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Ejecuta fn una sola vez por clave entre llamadas concurrentes"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Devuelve (resultado, compartido); los seguidores reciben el mismo error"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+
+def _normalize(value):
+    """Valor de parámetro -> forma canónica para la clave de single-flight"""
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    if isinstance(value, str):
+        return ' '.join(value.split()).casefold()
+    return str(value)
+
+
+class Dependency:
+    """Servicio HTTP externo con pool, timeouts, reintentos y breaker"""
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, name, base_url, timeout=(2.0, 5.0), retries=1, backoff=0.2,
+                 headers=None, pool_size=32, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.headers = headers or {}
+        self.pool_size = pool_size
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.flight = SingleFlight()
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        # requests se importa en el primer uso (arranque rápido de workers)
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    session.headers.update(self.headers)
+                    self._session = session
+        return self._session
+
+    def get_json(self, path, params=None, operation='get', timeout=None):
+        """GET idempotente; devuelve el JSON o lanza UpstreamError
+
+        El resultado puede compartirse entre requests: no modificarlo.
+        """
+        key = (path, tuple(sorted((k, _normalize(v)) for k, v in (params or {}).items())))
+        result, shared = self.flight.do(key, lambda: self._fetch(path, params, operation, timeout))
+        if shared:
+            metrics.UPSTREAM_COALESCED.inc(self.name, operation)
+        return result
+
+    def _fetch(self, path, params, operation, timeout):
+        if not self.breaker.allow():
+            metrics.UPSTREAM_SHORT_CIRCUITED.inc(self.name, operation)
+            raise CircuitOpenError(f"{self.name}: circuito abierto")
+
+        import requests
+
+        session = self.session
+        url = f"{self.base_url}{path}"
+        last_error = None
+        recorded = False
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    # Backoff exponencial con jitter completo
+                    metrics.UPSTREAM_RETRIES.inc(self.name, operation)
+                    time.sleep(random.uniform(0, self.backoff * (2 ** (attempt - 1))))
+                try:
+                    with metrics.UPSTREAM_SECONDS.time(self.name, operation):
+                        response = session.get(url, params=params, timeout=timeout or self.timeout)
+                    if response.status_code in self.RETRY_STATUS:
+                        last_error = UpstreamError(f"{self.name}: HTTP {response.status_code}")
+                        continue
+                    if response.status_code != 200:
+                        # Error del cliente: reintentar no cambia nada
+                        recorded = True
+                        self.breaker.record_success()
+                        raise UpstreamError(f"{self.name}: HTTP {response.status_code}")
+                    data = response.json()
+                except requests.ConnectionError as e:
+                    # No se pudo conectar (incluye ConnectTimeout): reintentar
+                    # cuesta a lo más otro timeout de conexión
+                    last_error = UpstreamError(f"{self.name}: {e}")
+                    continue
+                except (requests.RequestException, ValueError) as e:
+                    # ReadTimeout, ChunkedEncodingError, JSON inválido...: un
+                    # servicio lento no se reintenta (sería otra espera completa)
+                    last_error = UpstreamError(f"{self.name}: {e}")
+                    break
+                recorded = True
+                self.breaker.record_success()
+                return data
+        except BaseException:
+            # Una excepción inesperada no puede dejar la llamada de prueba
+            # en curso: el breaker quedaría half_open para siempre
+            if not recorded:
+                recorded = True
+                self.breaker.record_failure()
+                metrics.UPSTREAM_ERRORS.inc(self.name, operation)
+            raise
+
+        self.breaker.record_failure()
+        metrics.UPSTREAM_ERRORS.inc(self.name, operation)
+        raise last_error
@@ -0,0 +1,315 @@
+"""
+Verificación automática de reportes en segundo plano
+
+submit_report ya no califica el reporte dentro del request: lo guarda como
+'pending' y un hilo de fondo (VerificationWorker) toma los pendientes sin
+calificar en lotes de BATCH_SIZE y, en una sola transacción por lote:
+
+- guarda verification_score y scored_by (la versión del calificador)
+- aprueba los que llegan a AUTO_VERIFY_SCORE (como verify_report, con
+  verified_by = AUTO_VERIFIED_BY: zona de riesgo y perfil histórico)
+
+Los demás siguen esperando a un moderador, ahora con su calificación.
+
+El calificador es intercambiable: cualquier objeto con `version` y
+`score(description, category, severity) -> 0..1`, indicado con
+ZETA_VERIFIER_SCORER=modulo:atributo. Cuando cambia la versión, el primer
+ciclo del worker recalifica todo el backlog pendiente en un solo lote
+(también `python verifier.py rescore`).
+
+El calificador por defecto (KeywordScorer) es el de verify_report_with_ai,
+con todas las palabras clave en un solo autómata Aho-Corasick: una pasada
+por el texto en lugar de un `in` por palabra.
+
+Con varios workers de gunicorn solo trabaja el que tiene el lock de
+archivo; si muere, otro lo toma en el siguiente ciclo.
+
+Uso:
+    python verifier.py score "Choque con patrulla en el lugar" high
+    python verifier.py rescore zeta_pro.db
+"""
+import importlib
+import os
+import threading
+import time
+from collections import deque
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+AUTO_VERIFY_SCORE = float(os.environ.get('ZETA_AUTO_VERIFY_SCORE', '0.9'))
+REVIEW_SCORE = 0.7
+BATCH_SIZE = int(os.environ.get('ZETA_VERIFIER_BATCH', '500'))
+INTERVAL_SECONDS = float(os.environ.get('ZETA_VERIFIER_INTERVAL', '5'))
+SCORER_SPEC = os.environ.get('ZETA_VERIFIER_SCORER', '')
+ENABLED = os.environ.get('ZETA_VERIFIER', '1') != '0'
+AUTO_VERIFIED_BY = 'auto-verifier'
+
+
+# ==================== CALIFICADOR ====================
+class AhoCorasick:
+    """Autómata para encontrar varias subcadenas en una sola pasada"""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        goto, output = [{}], [set()]
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                following = goto[state].get(ch)
+                if following is None:
+                    following = goto[state][ch] = len(goto)
+                    goto.append({})
+                    output.append(set())
+                state = following
+            output[state].add(index)
+
+        # Enlaces de falla en orden BFS; con ellos cada estado recibe su
+        # transición completa para cada carácter del alfabeto (un DFA): al
+        # recorrer el texto es una sola lectura de diccionario por carácter
+        fail = [0] * len(goto)
+        order = list(goto[0].values())
+        queue = deque(order)
+        while queue:
+            state = queue.popleft()
+            for ch, following in goto[state].items():
+                queue.append(following)
+                order.append(following)
+                link = fail[state]
+                while link and ch not in goto[link]:
+                    link = fail[link]
+                fail[following] = goto[link].get(ch, 0)
+                output[following] |= output[fail[following]]
+
+        delta = [dict(goto[0])] + [None] * (len(goto) - 1)
+        for state in order:
+            transitions = dict(delta[fail[state]])
+            transitions.update(goto[state])
+            delta[state] = transitions
+        self._delta = delta
+        self._output = [frozenset(o) for o in output]
+
+    def find(self, text):
+        """Índices de los patrones que aparecen en `text`"""
+        delta, output = self._delta, self._output
+        found = set()
+        state = 0
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+
+class KeywordScorer:
+    """Puntaje por palabras clave (mismas reglas que verify_report_with_ai)"""
+
+    version = 'keywords-1'
+
+    CREDIBLE = [
+        'policía', 'patrulla', 'ambulancia', 'bomberos',
+        'accidente', 'choque', 'incendio', 'robo', 'asalto',
+        'inundación', 'bloqueo', 'manifestación'
+    ]
+    SUSPICIOUS = [
+        'creo', 'tal vez', 'parece', 'supongo', 'dicen que',
+        'me contaron', 'escuché', 'alguien dijo'
+    ]
+    SEVERE = ['peligro', 'grave', 'urgente', 'rápido']
+
+    def __init__(self):
+        self._automaton = AhoCorasick(self.CREDIBLE + self.SUSPICIOUS + self.SEVERE)
+        self._suspicious_start = len(self.CREDIBLE)
+        self._severe_start = self._suspicious_start + len(self.SUSPICIOUS)
+
+    def score(self, description, category, severity):
+        found = self._automaton.find(description.lower())
+        score = 0.5
+        # Mismo orden de sumas que el original: el resultado es idéntico
+        for index in sorted(found):
+            if index < self._suspicious_start:
+                score += 0.1
+        for index in sorted(found):
+            if self._suspicious_start <= index < self._severe_start:
+                score -= 0.15
+        if len(description) > 100:
+            score += 0.1
+        if severity == 'high' and any(index >= self._severe_start for index in found):
+            score += 0.15
+        return min(1.0, max(0.0, score))
+
+
+def load_scorer(spec=SCORER_SPEC):
+    """'modulo:atributo' (clase o instancia); vacío = KeywordScorer"""
+    if not spec:
+        return KeywordScorer()
+    module_name, _, attr = spec.partition(':')
+    scorer = getattr(importlib.import_module(module_name), attr or 'scorer')
+    return scorer() if isinstance(scorer, type) else scorer
+
+
+# ==================== LOTES ====================
+def score_batch(conn, scorer, promote, rows):
+    """Guardar calificaciones de `rows` y aprobar las altas; no hace commit
+
+    `rows` son (id, description, category, severity) todavía pendientes;
+    `promote(cursor, report_ids, verified_by)` aprueba los altos en lote.
+    Devuelve (calificados, aprobados).
+    """
+    cursor = conn.cursor()
+    scores = [(scorer.score(description, category, severity), report_id)
+              for report_id, description, category, severity in rows]
+    cursor.executemany('''
+        UPDATE reports SET verification_score = ?, scored_by = ? WHERE id = ? AND status = 'pending'
+    ''', [(score, scorer.version, report_id) for score, report_id in scores])
+    promoted = [report_id for score, report_id in scores if score >= AUTO_VERIFY_SCORE]
+    if promoted:
+        promote(cursor, promoted, AUTO_VERIFIED_BY)
+    return len(scores), len(promoted)
+
+
+def run_once(conn, scorer, promote, batch_size=BATCH_SIZE):
+    """Un lote de pendientes sin calificar; devuelve (calificados, aprobados)"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute('''
+            SELECT id, description, category, severity FROM reports
+            WHERE status = 'pending' AND scored_by IS NULL
+            ORDER BY created_at LIMIT ?
+        ''', (batch_size,)).fetchall()
+        result = score_batch(conn, scorer, promote, rows) if rows else (0, 0)
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def needs_rescore(conn, scorer):
+    return conn.execute('''
+        SELECT 1 FROM reports WHERE status = 'pending' AND scored_by IS NOT NULL AND scored_by != ? LIMIT 1
+    ''', (scorer.version,)).fetchone() is not None
+
+
+def rescore(conn, scorer, promote):
+    """Recalificar todo el backlog pendiente en un solo lote"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute('''
+            SELECT id, description, category, severity FROM reports WHERE status = 'pending'
+        ''').fetchall()
+        result = score_batch(conn, scorer, promote, rows)
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+
+
+# ==================== WORKER ====================
+class VerificationWorker:
+    """Hilo de fondo por proceso; solo trabaja el que tiene el lock"""
+
+    def __init__(self, connect, promote, scorer=None, lock_path=None, interval=INTERVAL_SECONDS):
+        self._connect = connect
+        self._promote = promote
+        self.scorer = scorer or load_scorer()
+        self._lock_path = lock_path
+        self._lock_file = None
+        self.interval = interval
+        self._wake = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._checked_version = None
+        self.scored = 0
+        self.promoted = 0
+
+    def ensure_running(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='zeta-verifier', daemon=True)
+                    self._thread.start()
+
+    def notify(self):
+        """Hay reportes nuevos: no esperar al siguiente intervalo"""
+        self._wake.set()
+
+    def _is_leader(self):
+        if fcntl is None or self._lock_path is None:
+            return True
+        if self._lock_file is None:
+            lock_file = open(self._lock_path, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+        return True
+
+    def run_pending(self):
+        """Calificar todo lo pendiente; devuelve (calificados, aprobados)"""
+        import metrics
+
+        conn = self._connect()
+        scored = promoted = 0
+        try:
+            if self._checked_version != self.scorer.version:
+                if needs_rescore(conn, self.scorer):
+                    scored, promoted = rescore(conn, self.scorer, self._promote)
+                self._checked_version = self.scorer.version
+            while True:
+                batch, batch_promoted = run_once(conn, self.scorer, self._promote)
+                scored += batch
+                promoted += batch_promoted
+                if batch < BATCH_SIZE:
+                    break
+        finally:
+            conn.close()
+        if scored:
+            metrics.REPORTS_SCORED.inc('auto_verified', amount=promoted)
+            metrics.REPORTS_SCORED.inc('pending', amount=scored - promoted)
+        self.scored += scored
+        self.promoted += promoted
+        return scored, promoted
+
+    def _run(self):
+        while True:
+            try:
+                if self._is_leader():
+                    self.run_pending()
+            except Exception as e:
+                print(f"⚠️ Verificador: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+if __name__ == '__main__':
+    import json
+    import sqlite3
+    import sys
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ('score', 'rescore'):
+        print(__doc__)
+        sys.exit(1)
+    scorer = load_scorer()
+    if sys.argv[1] == 'score':
+        severity = sys.argv[3] if len(sys.argv) > 3 else 'low'
+        score = scorer.score(sys.argv[2], 'general', severity)
+        print(json.dumps({"scorer": scorer.version, "score": round(score, 3),
+                          "auto_verified": score >= AUTO_VERIFY_SCORE}))
+    else:
+        os.environ['ZETA_DB_FILE'] = sys.argv[2]
+        import backend
+        import migrations
+
+        conn = sqlite3.connect(sys.argv[2])
+        migrations.migrate(conn)
+        start = time.perf_counter()
+        scored, promoted = rescore(conn, scorer, backend.approve_reports)
+        conn.close()
+        print(f"{scored} reportes calificados con {scorer.version} ({promoted} aprobados) "
+              f"en {time.perf_counter() - start:.2f}s")